@@ -55,7 +55,7 @@ class Job(object):
 
   WORKDIR_PREFIX = '/usr/local/google/tmp/automation'
 
-  def __init__(self, label, command, timeout=4 * 60 * 60):
+  def __init__(self, label, command, timeout=4 * 60 * 60, priority=0):
     self._state = JobStateMachine(STATUS_NOT_EXECUTED)
     self.predecessors = set()
     self.successors = set()
@@ -69,12 +69,17 @@ class Job(object):
     self.dry_run = None
     self.label = label
     self.timeout = timeout
+    # Ready jobs of higher priority are executed first.
+    self.priority = priority
+    # Revision of the last change of the job, see Touch.
+    self.revision = 0
 
   def _StateGet(self):
     return self._state
 
   def _StateSet(self, new_state):
     self._state.Change(new_state)
+    self.Touch()
 
   status = property(_StateGet, _StateSet)
 
@@ -82,6 +87,13 @@ class Job(object):
   def timeline(self):
     return self._state.timeline
 
+  def Touch(self):
+    """Records a change of the job, which is a change of its group too."""
+    if self.group is None:
+      state_machine.NextRevision(self)
+    else:
+      state_machine.NextRevision(self, self.group)
+
   def __repr__(self):
     return '{%s: %s}' % (self.__class__.__name__, self.id)
 
@@ -5,6 +5,7 @@ import getpass
 import os
 
 from automation.common.state_machine import BasicStateMachine
+from automation.common.state_machine import NextRevision
 
 STATUS_NOT_EXECUTED = 'NOT_EXECUTED'
 STATUS_EXECUTING = 'EXECUTING'
@@ -37,6 +38,11 @@ class JobGroup(object):
     self.cleanup_on_completion = cleanup_on_completion
     self.cleanup_on_failure = cleanup_on_failure
     self.description = description
+    # Revision of the last change of the group or of one of its jobs.
+    self.revision = 0
+    # Brief summaries of the jobs moved to the archive of the server, see
+    # JobManager.
+    self.archived_jobs = []
 
     if jobs:
       for job in jobs:
@@ -47,6 +53,7 @@ class JobGroup(object):
 
   def _StateSet(self, new_state):
     self._state.Change(new_state)
+    NextRevision(self)
 
   status = property(_StateGet, _StateSet)
 
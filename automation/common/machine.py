@@ -4,6 +4,13 @@ __author__ = 'asharif@google.com (Ahmad Sharif)'
 
 from fnmatch import fnmatch
 
+# Characters that make a pattern match more than one string, see fnmatch.
+WILDCARDS = '*?['
+
+
+def HasWildcards(pattern):
+  return any(char in pattern for char in WILDCARDS)
+
 
 class Machine(object):
   """Stores information related to machine and its state."""
@@ -61,9 +68,8 @@ class MachineSpecification(object):
                       % self.os, 'Lock required: %s' % self.lock_required])
 
   def IsMatch(self, machine):
-    return all([not machine.locked, fnmatch(machine.hostname, self.hostname),
-                fnmatch(machine.label, self.label), fnmatch(machine.os,
-                                                            self.os)])
+    return (not machine.locked and fnmatch(machine.hostname, self.hostname) and
+            fnmatch(machine.label, self.label) and fnmatch(machine.os, self.os))
 
   def AddPreferredMachine(self, hostname):
     if hostname not in self.preferred_machines:
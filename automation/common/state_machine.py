@@ -5,8 +5,40 @@
 
 __author__ = 'kbaclawski@google.com (Krystian Baclawski)'
 
+import itertools
+import threading
+
 from automation.common import events
 
+_revision_counter = itertools.count(1)
+_revision_lock = threading.Lock()
+_last_revision = 0
+
+
+def NextRevision(*versioned):
+  """Returns a process-wide increasing number to version changes of state.
+
+  The revision is also set as the revision attribute of the versioned objects,
+  under the same lock, so that their revisions never go backwards and no
+  revision is seen before the objects it versions carry it.
+  """
+  global _last_revision
+  with _revision_lock:
+    _last_revision = next(_revision_counter)
+    for obj in versioned:
+      obj.revision = _last_revision
+    return _last_revision
+
+
+def CurrentRevision():
+  """Returns the last revision returned by NextRevision, 0 if none was.
+
+  All the changes up to this revision are visible once it is read, since
+  state is changed before the change is given its revision.
+  """
+  with _revision_lock:
+    return _last_revision
+
 
 class BasicStateMachine(object):
   """Generic class for constructing state machines.
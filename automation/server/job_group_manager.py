@@ -10,13 +10,22 @@ from automation.common import logger
 from automation.common.command_executer import CommandExecuter
 from automation.common import job
 from automation.common import job_group
+from automation.server import status
 from automation.server.job_manager import IdProducerPolicy
 
 
 class JobGroupManager(object):
+  """Keeps track of the job groups.
+
+  Once all the jobs of a finished group were archived by the JobManager, the
+  group is archived as well: its summary with jobs is stored in the archive of
+  the JobManager and only its summary without jobs is kept in memory.
+  """
 
   def __init__(self, job_manager):
     self.all_job_groups = []
+    self._job_groups_by_id = {}
+    self._archived_group_summaries = []
 
     self.job_manager = job_manager
     self.job_manager.AddListener(self)
@@ -31,17 +40,59 @@ class JobGroupManager(object):
     self._logger = logging.getLogger(self.__class__.__name__)
 
   def GetJobGroup(self, group_id):
-    with self._lock:
-      for group in self.all_job_groups:
-        if group.id == group_id:
-          return group
+    """Returns a job group that is still in memory, or None if there is none.
 
-      return None
+    Raises:
+      LookupError: The group was archived, only its summary is left, see
+        GetJobGroupSummary.
+    """
+    with self._lock:
+      group = self._job_groups_by_id.get(group_id)
+    if group is None and self.job_manager.archive.Contains('job-group-%d' %
+                                                           group_id):
+      raise LookupError('Job group %d was archived, use GetJobGroupSummary to '
+                        'get its summary.' % group_id)
+    return group
+
+  def GetJobGroupSummary(self, group_id):
+    """Returns the summary of a job group with its jobs, or None."""
+    with self._lock:
+      group = self._job_groups_by_id.get(group_id)
+      if group is not None:
+        return status.JobGroupSummary(group, with_jobs=True)
+    return self.job_manager.archive.Load('job-group-%d' % group_id)
 
   def GetAllJobGroups(self):
     with self._lock:
       return copy.deepcopy(self.all_job_groups)
 
+  def GetJobGroupList(self):
+    """Returns all the job groups, in the order they were added.
+
+    Groups in memory are returned themselves, without copying them, archived
+    groups by their summaries.
+    """
+    with self._lock:
+      self._ArchiveReleasedJobGroups()
+      return sorted(self._archived_group_summaries + self.all_job_groups,
+                    key=lambda group: group['id'] if isinstance(
+                        group, dict) else group.id)
+
+  def _ArchiveReleasedJobGroups(self):
+    """Archives the finished groups whose jobs were all archived."""
+    released_groups = [
+        group for group in self.all_job_groups
+        if not group.jobs and
+        group.status in job_group.JobGroupStateMachine.final_states
+    ]
+    for group in released_groups:
+      self.job_manager.archive.Store('job-group-%d' % group.id,
+                                     status.JobGroupSummary(group,
+                                                            with_jobs=True))
+      self._archived_group_summaries.append(status.JobGroupSummary(group))
+      self.all_job_groups.remove(group)
+      del self._job_groups_by_id[group.id]
+
   def AddJobGroup(self, group):
     with self._lock:
       group.id = self._id_producer.GetNextId()
@@ -52,7 +103,9 @@ class JobGroupManager(object):
         cmd.RmTree(group.home_dir), cmd.MakeDir(group.home_dir)))
 
     with self._lock:
+      self._ArchiveReleasedJobGroups()
       self.all_job_groups.append(group)
+      self._job_groups_by_id[group.id] = group
 
       for job_ in group.jobs:
         self.job_manager.AddJob(job_)
@@ -67,7 +120,7 @@ class JobGroupManager(object):
     with self._lock:
       self._logger.debug('Killing all jobs that belong to %r.', group)
 
-      for job_ in group.jobs:
+      for job_ in list(group.jobs):
         self.job_manager.KillJob(job_)
 
       self._logger.debug('Waiting for jobs to quit.')
@@ -82,6 +135,10 @@ class JobGroupManager(object):
     self._logger.debug('Handling %r completion event.', job_)
 
     group = job_.group
+    if group is None:
+      # The job was archived as soon as it finished, because its group had
+      # already finished.
+      return
 
     with self._lock:
       # We need to perform an action only if the group hasn't already failed.
@@ -90,7 +147,9 @@ class JobGroupManager(object):
           # We have a failed job, abort the job group
           group.status = job_group.STATUS_FAILED
           if group.cleanup_on_failure:
-            for job_ in group.jobs:
+            # Cleaning up a job may archive it, which removes it from the
+            # group.
+            for job_ in list(group.jobs):
               # TODO(bjanakiraman): We should probably only kill dependent jobs
               # instead of the whole job group.
               self.job_manager.KillJob(job_)
@@ -112,7 +171,7 @@ class JobGroupManager(object):
             # STATUS_SUCCEEDED. Need to address that bug in near future.
             group.status = job_group.STATUS_SUCCEEDED
             if group.cleanup_on_completion:
-              for job_ in group.jobs:
+              for job_ in list(group.jobs):
                 self.job_manager.CleanUpJob(job_)
 
         self._job_group_finished.notifyAll()
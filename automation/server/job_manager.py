@@ -1,13 +1,20 @@
 # Copyright 2010 Google Inc. All Rights Reserved.
 #
 
+import collections
+import heapq
+import itertools
+import json
 import logging
 import os
 import re
+import tempfile
 import threading
 
 from automation.common import job
+from automation.common import job_group
 from automation.common import logger
+from automation.server import status
 from automation.server.job_executer import JobExecuter
 
 
@@ -57,14 +64,125 @@ class IdProducerPolicy(object):
     return new_id
 
 
+class ReadyJobQueue(object):
+  """Jobs ready to be executed, ordered by priority.
+
+  Jobs of higher priority are popped first, jobs of the same priority in the
+  order they were pushed. Jobs can be looked up and removed by id.
+  """
+
+  def __init__(self):
+    # Heap of (-priority, sequence number, job id). Entries of removed jobs
+    # are left in the heap and skipped when popped.
+    self._heap = []
+    self._jobs = {}
+    self._counter = itertools.count()
+
+  def __len__(self):
+    return len(self._jobs)
+
+  def __contains__(self, job_):
+    return job_.id in self._jobs
+
+  def Push(self, job_, sequence=None):
+    if job_.id in self._jobs:
+      return
+    if sequence is None:
+      sequence = next(self._counter)
+    self._jobs[job_.id] = (job_, sequence)
+    heapq.heappush(self._heap, (-job_.priority, sequence, job_.id))
+
+  def Pop(self):
+    """Removes the first job from the queue.
+
+    Returns:
+      A (job, sequence) pair. The sequence number can be passed to Push to
+      put the job back at its place.
+    """
+    while self._heap:
+      _, sequence, job_id = heapq.heappop(self._heap)
+      entry = self._jobs.get(job_id)
+      if entry and entry[1] == sequence:
+        del self._jobs[job_id]
+        return entry
+    raise IndexError('pop from empty ReadyJobQueue')
+
+  def Remove(self, job_id):
+    return self._jobs.pop(job_id, None) is not None
+
+
+class JobArchive(object):
+  """Stores the summaries of finished jobs and job groups on disk.
+
+  Summaries are the flat dictionaries of the status module, which refer to
+  other jobs and groups by id, so they are small and are written without
+  following the graph of the jobs.
+  """
+
+  def __init__(self, archive_dir):
+    self._archive_dir = archive_dir
+
+  def _GetPath(self, name):
+    return os.path.join(self._archive_dir, '%s.json' % name)
+
+  def Store(self, name, summary):
+    if not os.path.isdir(self._archive_dir):
+      os.makedirs(self._archive_dir)
+
+    # Write to a temporary file first, so a crash never leaves a partially
+    # written summary behind.
+    fd, tmp_path = tempfile.mkstemp(dir=self._archive_dir)
+    with os.fdopen(fd, 'w') as tmp_file:
+      json.dump(summary, tmp_file)
+    os.rename(tmp_path, self._GetPath(name))
+
+  def Contains(self, name):
+    return os.path.exists(self._GetPath(name))
+
+  def Load(self, name):
+    try:
+      with open(self._GetPath(name)) as summary_file:
+        return json.load(summary_file)
+    except IOError:
+      return None
+
+
 class JobManager(threading.Thread):
+  """Schedules jobs on the machines and keeps track of them.
+
+  Finished jobs are kept in memory up to a limit. Beyond it, the oldest
+  finished jobs whose job group has finished as well are moved to an on-disk
+  archive: their summaries are stored, and the jobs are released from their
+  group and from the jobs depending on them, so they can be freed.
+  GetJobSummary still returns the summaries of archived jobs.
+  """
+
+  ARCHIVE_DIR = os.path.join(job.Job.WORKDIR_PREFIX, 'archive')
 
-  def __init__(self, machine_manager):
+  # Number of finished jobs kept in memory.
+  MAX_FINISHED_JOBS = 1000
+
+  # Number of job completions between checks of which job groups have
+  # finished, so their jobs can be archived.
+  GROUP_SCAN_INTERVAL = 100
+
+  def __init__(self, machine_manager, archive_dir=None,
+               max_finished_jobs=MAX_FINISHED_JOBS):
     threading.Thread.__init__(self, name=self.__class__.__name__)
-    self.all_jobs = []
-    self.ready_jobs = []
+    self.all_jobs = {}
+    self.ready_jobs = ReadyJobQueue()
     self.job_executer_mapping = {}
 
+    # Finished jobs still in memory that can be archived, in the order they
+    # finished, with their summaries, and those whose job group hasn't
+    # finished yet, by group.
+    self._finished_jobs = collections.deque()
+    self._finished_group_jobs = collections.OrderedDict()
+    self._num_finished_jobs = 0
+    self._max_finished_jobs = max_finished_jobs
+    self._completions_since_group_scan = 0
+    self.archive = JobArchive(archive_dir or self.ARCHIVE_DIR)
+
     self.machine_manager = machine_manager
 
     self._lock = threading.Lock()
@@ -90,8 +208,8 @@ class JobManager(threading.Thread):
     self._logger.info('Shutdown request received.')
 
     with self._lock:
-      for job_ in self.all_jobs:
-        self._KillJob(job_.id)
+      for job_id in self.all_jobs.keys():
+        self._KillJob(job_id)
 
       # Signal to die
       self._exit_request = True
@@ -110,29 +228,47 @@ class JobManager(threading.Thread):
       self._KillJob(job_id)
 
   def GetJob(self, job_id):
-    for job_ in self.all_jobs:
-      if job_.id == job_id:
-        return job_
-    return None
+    """Returns a job that is still in memory, or None if there is no such job.
+
+    Raises:
+      LookupError: The job was archived, only its summary is left, see
+        GetJobSummary.
+    """
+    with self._lock:
+      job_ = self.all_jobs.get(job_id)
+    if job_ is None and self.archive.Contains('job-%d' % job_id):
+      raise LookupError('Job %d was archived, use GetJobSummary to get its '
+                        'summary.' % job_id)
+    return job_
+
+  def GetJobSummary(self, job_id):
+    """Returns the summary of a job, see status.JobSummary.
+
+    Returns None if there is no such job, in memory or in the archive.
+    """
+    with self._lock:
+      job_ = self.all_jobs.get(job_id)
+      if job_ is not None:
+        return status.JobSummary(job_)
+    return self.archive.Load('job-%d' % job_id)
 
   def _KillJob(self, job_id):
     self._logger.info('Killing [Job: %d].', job_id)
 
     if job_id in self.job_executer_mapping:
       self.job_executer_mapping[job_id].Kill()
-    for job_ in self.ready_jobs:
-      if job_.id == job_id:
-        self.ready_jobs.remove(job_)
-        break
+    self.ready_jobs.Remove(job_id)
 
   def AddJob(self, job_):
     with self._lock:
       job_.id = self._id_producer.GetNextId()
+      # Revisions of the job are numbered by the server from now on.
+      job_.Touch()
 
-      self.all_jobs.append(job_)
+      self.all_jobs[job_.id] = job_
       # Only queue a job as ready if it has no dependencies
       if job_.is_ready:
-        self.ready_jobs.append(job_)
+        self.ready_jobs.Push(job_)
 
       self._jobs_available.notifyAll()
 
@@ -143,7 +279,72 @@ class JobManager(threading.Thread):
       if job_.id in self.job_executer_mapping:
         self.job_executer_mapping[job_.id].CleanUpWorkDir()
         del self.job_executer_mapping[job_.id]
-      # TODO(raymes): remove job from self.all_jobs
+      self._ArchiveFinishedJobs(job_)
+
+  def _AddFinishedJob(self, job_):
+    self._num_finished_jobs += 1
+    self._completions_since_group_scan += 1
+    if job_.group is None:
+      self._finished_jobs.append((job_, status.JobSummary(job_)))
+    else:
+      self._finished_group_jobs.setdefault(job_.group, []).append(job_)
+
+  def _ArchiveFinishedJobs(self, job_=None):
+    """Moves the oldest finished jobs beyond the limit to the archive.
+
+    The jobs of a group that hasn't finished may still be killed or cleaned up
+    by the JobGroupManager, so they are kept until the group finishes.
+
+    Args:
+      job_: The job whose group may just have finished.
+    """
+    excess = self._num_finished_jobs - self._max_finished_jobs
+    if excess <= 0:
+      return
+
+    if job_ is not None and job_.group in self._finished_group_jobs:
+      groups = [job_.group]
+    else:
+      groups = []
+    if (len(self._finished_jobs) < excess and
+        self._completions_since_group_scan >= self.GROUP_SCAN_INTERVAL):
+      groups = self._finished_group_jobs.keys()
+      self._completions_since_group_scan = 0
+
+    # The summaries are taken before any job of the group is released, so
+    # they still list all the dependencies of the jobs.
+    for group in groups:
+      if group.status in job_group.JobGroupStateMachine.final_states:
+        self._finished_jobs.extend(
+            (group_job, status.JobSummary(group_job))
+            for group_job in self._finished_group_jobs.pop(group))
+
+    while (self._finished_jobs and
+           self._num_finished_jobs > self._max_finished_jobs):
+      job_, summary = self._finished_jobs.popleft()
+      self.archive.Store('job-%d' % job_.id, summary)
+      self._ReleaseJob(job_)
+      self._num_finished_jobs -= 1
+
+  def _ReleaseJob(self, job_):
+    """Drops all the references of the server to an archived job."""
+    del self.all_jobs[job_.id]
+    self.job_executer_mapping.pop(job_.id, None)
+
+    for pred in job_.predecessors:
+      pred.successors.discard(job_)
+    # Jobs that haven't run yet keep their link to the job, since it decides
+    # whether they are ready.
+    for succ in job_.successors:
+      if succ.status in job.JobStateMachine.final_states:
+        succ.predecessors.discard(job_)
+    job_.predecessors.clear()
+    job_.successors.clear()
+
+    if job_.group is not None:
+      job_.group.archived_jobs.append(status.JobBriefSummary(job_))
+      job_.group.jobs.remove(job_)
+      job_.group = None
 
   def NotifyJobComplete(self, job_):
     self.machine_manager.ReturnMachines(job_.machines)
@@ -154,14 +355,48 @@ class JobManager(threading.Thread):
       if job_.status == job.STATUS_SUCCEEDED:
         for succ in job_.successors:
           if succ.is_ready:
-            if succ not in self.ready_jobs:
-              self.ready_jobs.append(succ)
+            self.ready_jobs.Push(succ)
+
+      if job_.id in self.all_jobs:
+        self._AddFinishedJob(job_)
+        self._ArchiveFinishedJobs(job_)
 
       self._jobs_available.notifyAll()
 
   def AddListener(self, listener):
     self.listeners.append(listener)
 
+  def _PlaceReadyJobs(self):
+    """Acquires the machines of as many ready jobs as possible.
+
+    Jobs whose machines are not available stay in the queue at their place,
+    but don't hold back the jobs after them.
+
+    Returns:
+      The (job, machines) pairs of the jobs to execute.
+    """
+    placed_jobs = []
+    blocked_jobs = []
+    while self.ready_jobs:
+      ready_job, sequence = self.ready_jobs.Pop()
+
+      required_machines = ready_job.machine_dependencies
+      for pred in ready_job.predecessors:
+        required_machines[0].AddPreferredMachine(
+            pred.primary_machine.hostname)
+
+      machines = self.machine_manager.GetMachines(required_machines)
+      if machines:
+        placed_jobs.append((ready_job, machines))
+      else:
+        # If we can't get the necessary machines right now, the job waits for
+        # some jobs to complete.
+        blocked_jobs.append((ready_job, sequence))
+
+    for ready_job, sequence in blocked_jobs:
+      self.ready_jobs.Push(ready_job, sequence)
+    return placed_jobs
+
   @logger.HandleUncaughtExceptions
   def run(self):
     self._logger.info('Started.')
@@ -171,24 +406,10 @@ class JobManager(threading.Thread):
         # Get the next ready job, block if there are none
         self._jobs_available.wait()
 
-        while self.ready_jobs:
-          ready_job = self.ready_jobs.pop()
-
-          required_machines = ready_job.machine_dependencies
-          for pred in ready_job.predecessors:
-            required_machines[0].AddPreferredMachine(
-                pred.primary_machine.hostname)
-
-          machines = self.machine_manager.GetMachines(required_machines)
-          if not machines:
-            # If we can't get the necessary machines right now, simply wait
-            # for some jobs to complete
-            self.ready_jobs.insert(0, ready_job)
-            break
-          else:
-            # Mark as executing
-            executer = JobExecuter(ready_job, machines, self.listeners)
-            executer.start()
-            self.job_executer_mapping[ready_job.id] = executer
+        for ready_job, machines in self._PlaceReadyJobs():
+          # Mark as executing
+          executer = JobExecuter(ready_job, machines, self.listeners)
+          executer.start()
+          self.job_executer_mapping[ready_job.id] = executer
 
     self._logger.info('Stopped.')
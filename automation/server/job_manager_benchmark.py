@@ -0,0 +1,137 @@
+#!/usr/bin/python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+"""Measures the JobManager and MachineManager under load.
+
+Submits --jobs jobs, in job groups of chained jobs, to a JobManager with a pool
+of --machines machines, then schedules and completes them the way the
+JobManager thread and the JobExecuters do (without running any command), and
+looks the jobs up by id. Prints the time each phase takes and the number of
+jobs still alive, which the JobManager hasn't released to the archive.
+
+Example:
+  python -m automation.server.job_manager_benchmark --jobs=10000
+"""
+
+import gc
+import optparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from automation.common import job
+from automation.common import job_group
+from automation.common import machine
+from automation.server import job_manager
+from automation.server import machine_manager
+
+LABELS = ['pc-workstation', 'cr48', 'lumpy', 'daisy']
+
+
+def _CreateMachines(num_machines):
+  return [machine.Machine('host%d.example.com' % i, LABELS[i % len(LABELS)],
+                          'core2duo', 8, 'chromeos' if i % len(LABELS) else
+                          'linux', 'user') for i in range(num_machines)]
+
+
+def _CreateJobGroups(num_jobs, group_size):
+  groups = []
+  for group_num in range(0, num_jobs, group_size):
+    jobs = []
+    for num in range(min(group_size, num_jobs - group_num)):
+      job_ = job.Job('job-%d' % (group_num + num), 'true',
+                     priority=random.randint(0, 2))
+      job_.DependsOnMachine(machine.MachineSpecification(
+          label=random.choice(LABELS), lock_required=True))
+      if jobs:
+        job_.DependsOn(jobs[-1])
+      jobs.append(job_)
+    groups.append(job_group.JobGroup('group-%d' % group_num, jobs))
+  return groups
+
+
+def _FinishJob(manager, job_, machines):
+  job_.machines = machines
+  for state in [job.STATUS_SETUP, job.STATUS_COPYING, job.STATUS_RUNNING,
+                job.STATUS_SUCCEEDED]:
+    job_.status = state
+  manager.NotifyJobComplete(job_)
+
+  group = job_.group
+  if all(other.status == job.STATUS_SUCCEEDED for other in group.jobs):
+    group.status = job_group.STATUS_SUCCEEDED
+    # Cleaning up a job may archive it, which removes it from the group.
+    for other in list(group.jobs):
+      manager.CleanUpJob(other)
+
+
+def _Schedule(manager):
+  """Runs every job, taking ready jobs off the queue like JobManager.run."""
+  ready_jobs = manager.ready_jobs
+  while ready_jobs:
+    ready_job, _ = ready_jobs.Pop()
+    machines = manager.machine_manager.GetMachines(
+        ready_job.machine_dependencies)
+    assert machines
+    _FinishJob(manager, ready_job, machines)
+
+
+def _Time(name, function, *args):
+  start = time.time()
+  result = function(*args)
+  print '%-10s %10.3f s' % (name, time.time() - start)
+  return result
+
+
+def Main(argv):
+  parser = optparse.OptionParser()
+  parser.add_option('--jobs', type='int', default=10000,
+                    help='Number of jobs to submit.')
+  parser.add_option('--group_size', type='int', default=10,
+                    help='Number of chained jobs per job group.')
+  parser.add_option('--machines', type='int', default=200,
+                    help='Number of machines in the pool.')
+  parser.add_option('--lookups', type='int', default=10000,
+                    help='Number of jobs to look up by id.')
+  options = parser.parse_args(argv)[0]
+
+  archive_dir = tempfile.mkdtemp()
+  try:
+    manager = job_manager.JobManager(
+        machine_manager.MachineManager(_CreateMachines(options.machines)),
+        archive_dir=archive_dir)
+    groups = _CreateJobGroups(options.jobs, options.group_size)
+
+    def _Submit():
+      job_ids = []
+      for group in groups:
+        group.status = job_group.STATUS_EXECUTING
+        for job_ in group.jobs:
+          job_ids.append(manager.AddJob(job_))
+      return job_ids
+
+    job_ids = _Time('submit', _Submit)
+    # Only the manager may keep the jobs alive from now on.
+    del groups[:]
+
+    _Time('schedule', _Schedule, manager)
+
+    def _Lookup():
+      for job_id in random.sample(job_ids, min(options.lookups, len(job_ids))):
+        assert manager.GetJobSummary(job_id)
+
+    _Time('lookup', _Lookup)
+
+    gc.collect()
+    alive_jobs = sum(1 for obj in gc.get_objects() if isinstance(obj, job.Job))
+    print '%d jobs submitted, %d alive, %d in the index of the manager' % (
+        len(job_ids), alive_jobs, len(manager.all_jobs))
+  finally:
+    shutil.rmtree(archive_dir)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(Main(sys.argv[1:]))
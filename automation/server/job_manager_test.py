@@ -0,0 +1,168 @@
+#!/usr/bin/python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+"""Job manager unittest.
+
+JobManagerTest tests the job indexes, ready queue and archive of JobManager.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from automation.common import job
+from automation.common import job_group
+from automation.common import machine
+from automation.server import job_manager
+from automation.server import machine_manager
+
+
+def _FinishJob(job_, status=job.STATUS_SUCCEEDED):
+  for state in [job.STATUS_SETUP, job.STATUS_COPYING, job.STATUS_RUNNING,
+                status]:
+    job_.status = state
+
+
+class JobManagerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.archive_dir = tempfile.mkdtemp()
+    self.job_manager = job_manager.JobManager(
+        machine_manager.MachineManager.FromMachineListFile(
+            machine_manager.DEFAULT_MACHINES_FILE),
+        archive_dir=self.archive_dir,
+        max_finished_jobs=2)
+
+  def tearDown(self):
+    shutil.rmtree(self.archive_dir)
+
+  def testGetJob(self):
+    jobs = [job.Job('job-%d' % i, 'true') for i in range(10)]
+    for job_ in jobs:
+      self.job_manager.AddJob(job_)
+
+    for job_ in jobs:
+      self.assertIs(self.job_manager.GetJob(job_.id), job_)
+    self.assertIsNone(self.job_manager.GetJob(jobs[-1].id + 1))
+
+  def testReadyJobsPriority(self):
+    low = job.Job('low', 'true')
+    high = job.Job('high', 'true', priority=5)
+    killed = job.Job('killed', 'true', priority=5)
+    last = job.Job('last', 'true')
+    for job_ in [low, high, killed, last]:
+      self.job_manager.AddJob(job_)
+    self.job_manager.KillJob(killed.id)
+
+    ready_jobs = self.job_manager.ready_jobs
+    self.assertEqual(len(ready_jobs), 3)
+    self.assertNotIn(killed, ready_jobs)
+
+    first, sequence = ready_jobs.Pop()
+    self.assertIs(first, high)
+    # A job put back, e.g. for lack of machines, keeps its place.
+    ready_jobs.Push(first, sequence)
+    self.assertEqual([ready_jobs.Pop()[0] for _ in range(3)], [high, low, last])
+    self.assertRaises(IndexError, ready_jobs.Pop)
+
+  def testBlockedJobDoesNotStallQueue(self):
+    blocked = job.Job('blocked', 'true', priority=5)
+    blocked.DependsOnMachine(machine.MachineSpecification(
+        hostname='missing.example.com'))
+    placeable = [job.Job('placeable-%d' % i, 'true') for i in range(2)]
+    for job_ in placeable:
+      job_.DependsOnMachine(machine.MachineSpecification(label='cr48'))
+    ready_jobs = self.job_manager.ready_jobs
+
+    # pylint: disable=protected-access
+    for job_ in [blocked, placeable[0]]:
+      self.job_manager.AddJob(job_)
+    placed_jobs = self.job_manager._PlaceReadyJobs()
+    self.assertEqual([job_ for job_, _ in placed_jobs], placeable[:1])
+
+    # The jobs queued later are placed too, on every attempt.
+    self.job_manager.AddJob(placeable[1])
+    placed_jobs = self.job_manager._PlaceReadyJobs()
+    self.assertEqual([job_ for job_, _ in placed_jobs], placeable[1:])
+
+    # The blocked job keeps its place at the head of the queue.
+    self.assertEqual(len(ready_jobs), 1)
+    self.assertIs(ready_jobs.Pop()[0], blocked)
+
+  def testSuccessorBecomesReady(self):
+    pred = job.Job('pred', 'true')
+    succ = job.Job('succ', 'true')
+    succ.DependsOn(pred)
+    self.job_manager.AddJob(pred)
+    self.job_manager.AddJob(succ)
+
+    self.assertIn(pred, self.job_manager.ready_jobs)
+    self.assertNotIn(succ, self.job_manager.ready_jobs)
+
+    self.job_manager.ready_jobs.Pop()
+    _FinishJob(pred)
+    self.job_manager.NotifyJobComplete(pred)
+    self.job_manager.NotifyJobComplete(pred)
+    self.assertEqual(len(self.job_manager.ready_jobs), 1)
+    self.assertIs(self.job_manager.ready_jobs.Pop()[0], succ)
+
+  def _RunJobGroup(self, group):
+    group.status = job_group.STATUS_EXECUTING
+    for job_ in group.jobs:
+      self.job_manager.AddJob(job_)
+
+    for job_ in group.jobs:
+      _FinishJob(job_)
+      self.job_manager.NotifyJobComplete(job_)
+
+  def testArchiveFinishedJobs(self):
+    jobs = [job.Job('job-%d' % i, 'true') for i in range(5)]
+    group = job_group.JobGroup('group', jobs)
+    self._RunJobGroup(group)
+
+    # The jobs of a group being executed are kept.
+    self.assertEqual(len(self.job_manager.all_jobs), 5)
+
+    group.status = job_group.STATUS_SUCCEEDED
+    for job_ in jobs:
+      self.job_manager.CleanUpJob(job_)
+
+    self.assertEqual(sorted(self.job_manager.all_jobs),
+                     [job_.id for job_ in jobs[3:]])
+    # The archived jobs are released from their group.
+    self.assertEqual(group.jobs, jobs[3:])
+    self.assertEqual([job_['id'] for job_ in group.archived_jobs],
+                     [job_.id for job_ in jobs[:3]])
+    self.assertIsNone(jobs[0].group)
+
+    for job_ in jobs:
+      summary = self.job_manager.GetJobSummary(job_.id)
+      self.assertEqual(summary['id'], job_.id)
+      self.assertEqual(summary['label'], job_.label)
+      self.assertEqual(summary['status'], job.STATUS_SUCCEEDED)
+    self.assertRaises(LookupError, self.job_manager.GetJob, jobs[0].id)
+    self.assertIs(self.job_manager.GetJob(jobs[-1].id), jobs[-1])
+    self.assertIsNone(self.job_manager.GetJobSummary(jobs[-1].id + 1))
+
+  def testArchiveJobChain(self):
+    jobs = [job.Job('job-%d' % i, 'true') for i in range(1000)]
+    for pred, succ in zip(jobs, jobs[1:]):
+      succ.DependsOn(pred)
+    group = job_group.JobGroup('group', jobs)
+    self._RunJobGroup(group)
+    group.status = job_group.STATUS_SUCCEEDED
+    for job_ in jobs:
+      self.job_manager.CleanUpJob(job_)
+
+    # The summaries refer to the neighbours of a job by id, instead of
+    # holding the whole chain.
+    summary = self.job_manager.GetJobSummary(jobs[500].id)
+    self.assertEqual(summary['predecessors'],
+                     [{'id': jobs[499].id, 'label': jobs[499].label}])
+    self.assertEqual(summary['successors'],
+                     [{'id': jobs[501].id, 'label': jobs[501].label}])
+    self.assertFalse(jobs[500].predecessors or jobs[500].successors)
+    self.assertEqual(jobs[-2].predecessors, set())
+
+if __name__ == '__main__':
+  unittest.main()
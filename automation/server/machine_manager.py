@@ -3,6 +3,7 @@
 __author__ = 'asharif@google.com (Ahmad Sharif)'
 
 from operator import attrgetter
+import collections
 import copy
 import csv
 import threading
@@ -29,8 +30,32 @@ class MachineManager(object):
     self._machine_pool = machines
     self._lock = threading.RLock()
 
+    # Indexes of the pool by the attributes a specification can match exactly.
+    self._indexes = {}
+    for attr in ['hostname', 'label', 'os']:
+      index = collections.defaultdict(list)
+      for mach in machines:
+        index[getattr(mach, attr)].append(mach)
+      self._indexes[attr] = index
+
+  def _GetCandidates(self, mach_spec):
+    """Returns the smallest part of the pool that can match the spec.
+
+    A spec attribute without wildcards matches only the machines indexed under
+    it, otherwise the whole pool has to be checked.
+    """
+    candidates = self._machine_pool
+    for attr, index in self._indexes.iteritems():
+      pattern = getattr(mach_spec, attr)
+      if not machine.HasWildcards(pattern):
+        indexed = index.get(pattern, [])
+        if len(indexed) < len(candidates):
+          candidates = indexed
+    return candidates
+
   def _GetMachine(self, mach_spec):
-    available_pool = [m for m in self._machine_pool if mach_spec.IsMatch(m)]
+    available_pool = [m for m in self._GetCandidates(mach_spec)
+                      if mach_spec.IsMatch(m)]
 
     if available_pool:
       # find a machine with minimum uses
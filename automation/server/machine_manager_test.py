@@ -12,7 +12,8 @@ from automation.server import machine_manager
 class MachineManagerTest(unittest.TestCase):
 
   def setUp(self):
-    self.machine_manager = machine_manager.MachineManager()
+    self.machine_manager = machine_manager.MachineManager.FromMachineListFile(
+        machine_manager.DEFAULT_MACHINES_FILE)
 
   def testPrint(self):
     print self.machine_manager
@@ -27,6 +28,24 @@ class MachineManagerTest(unittest.TestCase):
     machines = self.machine_manager.GetMachines(mach_spec_list)
     self.assertTrue(machines)
 
+  def testGetMachineByLabel(self):
+    mach_spec_list = [machine.MachineSpecification(label='cr48',
+                                                   lock_required=True)] * 2
+    machines = self.machine_manager.GetMachines(mach_spec_list)
+    self.assertEqual(sorted(m.hostname for m in machines),
+                     ['chromeos-test1.mtv.corp.google.com',
+                      'chromeos-test2.mtv.corp.google.com'])
+
+    # Both cr48 machines are locked now.
+    machines = self.machine_manager.GetMachines(mach_spec_list[:1])
+    self.assertFalse(machines)
+
+  def testGetMachineByPattern(self):
+    mach_spec_list = [machine.MachineSpecification(hostname='chromeos-*',
+                                                   os='chromeos')]
+    machines = self.machine_manager.GetMachines(mach_spec_list)
+    self.assertEqual(machines[0].os, 'chromeos')
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -4,10 +4,11 @@
 __author__ = 'kbaclawski@google.com (Krystian Baclawski)'
 
 from collections import namedtuple
+import datetime
 import glob
-import gzip
+import json
 import os.path
-import pickle
+import threading
 import time
 import xmlrpclib
 
@@ -19,6 +20,12 @@ from django.views import static
 
 Link = namedtuple('Link', 'href name')
 
+# Number of job groups shown on a page of the job group list.
+JOB_GROUPS_PER_PAGE = 50
+
+# Number of bytes of a log shown on a page of the log.
+LOG_BYTES_PER_PAGE = 64 * 1024
+
 
 def GetServerConnection():
   return xmlrpclib.Server('http://localhost:8000')
@@ -35,104 +42,107 @@ def MakeDefaultContext(*args):
   return context
 
 
+def FormatElapsed(seconds):
+  if seconds is None:
+    return None
+  return datetime.timedelta(seconds=seconds)
+
+
 class JobInfo(object):
 
   def __init__(self, job_id):
-    self._job = pickle.loads(GetServerConnection().GetJob(job_id))
+    self._job = json.loads(GetServerConnection().GetJobSummary(job_id))
 
   def GetAttributes(self):
     job = self._job
 
-    group = [Link('/job-group/%d' % job.group.id, job.group.label)]
+    group = [Link('/job-group/%d' % job['group']['id'], job['group']['label'])]
 
-    predecessors = [Link('/job/%d' % pred.id, pred.label)
-                    for pred in job.predecessors]
+    predecessors = [Link('/job/%d' % pred['id'], pred['label'])
+                    for pred in job['predecessors']]
 
-    successors = [Link('/job/%d' % succ.id, succ.label)
-                  for succ in job.successors]
+    successors = [Link('/job/%d' % succ['id'], succ['label'])
+                  for succ in job['successors']]
 
-    machines = [Link('/machine/%s' % mach.hostname, mach.hostname)
-                for mach in job.machines]
+    machines = [Link('/machine/%s' % hostname, hostname)
+                for hostname in job['machines']]
 
-    logs = [Link('/job/%d/log' % job.id, 'Log')]
+    logs = [Link('/job/%d/log' % job['id'], 'Log')]
 
-    commands = enumerate(job.PrettyFormatCommand().split('\n'), start=1)
+    commands = enumerate(job['command'].split('\n'), start=1)
 
-    return {'text': [('Label', job.label), ('Directory', job.work_dir)],
+    return {'text': [('Label', job['label']), ('Directory', job['work_dir'])],
             'link': [('Group', group), ('Predecessors', predecessors),
                      ('Successors', successors), ('Machines', machines),
                      ('Logs', logs)],
             'code': [('Command', commands)]}
 
   def GetTimeline(self):
-    return [{'started': evlog.GetTimeStartedFormatted(),
-             'state_from': evlog.event.from_,
-             'state_to': evlog.event.to_,
-             'elapsed': evlog.GetTimeElapsedRounded()}
-            for evlog in self._job.timeline.GetTransitionEventHistory()]
+    return [dict(evlog, elapsed=FormatElapsed(evlog['elapsed']))
+            for evlog in self._job['timeline']]
 
-  def GetLog(self):
-    log_path = os.path.join(self._job.logs_dir,
-                            '%s.gz' % self._job.log_filename_prefix)
 
-    try:
-      log = gzip.open(log_path, 'r')
-    except IOError:
-      content = []
-    else:
-      # There's a good chance that file is not closed yet, so EOF handling
-      # function and CRC calculation will fail, thus we need to monkey patch the
-      # _read_eof method.
-      log._read_eof = lambda: None
+class JobLogInfo(object):
+  """A page of the log of a job, read from the server."""
+
+  def __init__(self, job_id, offset=0):
+    self._log = json.loads(GetServerConnection().GetJobLog(
+        job_id, offset, LOG_BYTES_PER_PAGE))
 
-      def SplitLine(line):
-        prefix, msg = line.split(': ', 1)
-        datetime, stream = prefix.rsplit(' ', 1)
+  @staticmethod
+  def _SplitLine(line):
+    prefix, msg = line.split(': ', 1)
+    datetime_, stream = prefix.rsplit(' ', 1)
 
-        return datetime, stream, msg
+    return datetime_, stream, msg
 
-      content = map(SplitLine, log.readlines())
-    finally:
-      log.close()
+  def GetLog(self):
+    if not self._log:
+      return []
+    return map(self._SplitLine, self._log['lines'])
 
-    return content
+  def GetNextOffset(self):
+    """The offset of the next page of the log, None if this is the last one."""
+    if not self._log or self._log['eof']:
+      return None
+    return self._log['next_offset']
 
 
 class JobGroupInfo(object):
 
   def __init__(self, job_group_id):
-    self._job_group = pickle.loads(GetServerConnection().GetJobGroup(
+    self._job_group = json.loads(GetServerConnection().GetJobGroupSummary(
         job_group_id))
 
   def GetAttributes(self):
     group = self._job_group
 
-    home_dir = [Link('/job-group/%d/files/' % group.id, group.home_dir)]
+    home_dir = [Link('/job-group/%d/files/' % group['id'], group['home_dir'])]
 
-    return {'text': [('Label', group.label),
-                     ('Time submitted', time.ctime(group.time_submitted)),
-                     ('State', group.status),
-                     ('Cleanup on completion', group.cleanup_on_completion),
-                     ('Cleanup on failure', group.cleanup_on_failure)],
+    return {'text': [('Label', group['label']),
+                     ('Time submitted', time.ctime(group['time_submitted'])),
+                     ('State', group['status']),
+                     ('Cleanup on completion', group['cleanup_on_completion']),
+                     ('Cleanup on failure', group['cleanup_on_failure'])],
             'link': [('Directory', home_dir)]}
 
   def _GetJobStatus(self, job):
     status_map = {'SUCCEEDED': 'success', 'FAILED': 'failure'}
-    return status_map.get(str(job.status), None)
+    return status_map.get(job['status'], None)
 
   def GetJobList(self):
-    return [{'id': job.id,
-             'label': job.label,
-             'state': job.status,
+    return [{'id': job['id'],
+             'label': job['label'],
+             'state': job['status'],
              'status': self._GetJobStatus(job),
-             'elapsed': job.timeline.GetTotalTime()}
-            for job in self._job_group.jobs]
+             'elapsed': FormatElapsed(job['elapsed'])}
+            for job in self._job_group['jobs']]
 
   def GetHomeDirectory(self):
-    return self._job_group.home_dir
+    return self._job_group['home_dir']
 
   def GetReportList(self):
-    job_dir_pattern = os.path.join(self._job_group.home_dir, 'job-*')
+    job_dir_pattern = os.path.join(self._job_group['home_dir'], 'job-*')
 
     filenames = []
 
@@ -154,28 +164,76 @@ class JobGroupInfo(object):
     return reports
 
 
-class JobGroupListInfo(object):
+class _JobGroupCache(object):
+  """The summaries of all the job groups seen so far, by group id.
+
+  Only the groups changed since the revision of the last update are fetched
+  from the server.
+  """
 
   def __init__(self):
-    self._all_job_groups = pickle.loads(GetServerConnection().GetAllJobGroups())
+    self._lock = threading.Lock()
+    self._groups = {}
+    self._labels = []
+    self._revision = 0
+
+  def Update(self):
+    with self._lock:
+      summaries = json.loads(GetServerConnection().GetJobGroupSummaries(
+          self._revision))
+
+      for group in summaries['groups']:
+        self._groups[group['id']] = group
+      self._labels = summaries['labels']
+      self._revision = summaries['revision']
+
+      # Newest first.
+      return ([self._groups[group_id]
+               for group_id in sorted(self._groups, reverse=True)],
+              self._labels)
+
+
+_job_group_cache = _JobGroupCache()
+
+
+class JobGroupListInfo(object):
+
+  def __init__(self, label=None, page=0):
+    all_groups, self._labels = _job_group_cache.Update()
+
+    if label:
+      all_groups = [group for group in all_groups if group['label'] == label]
+
+    self._num_pages = max(
+        (len(all_groups) + JOB_GROUPS_PER_PAGE - 1) // JOB_GROUPS_PER_PAGE, 1)
+    self._page = min(max(page, 0), self._num_pages - 1)
+    offset = self._page * JOB_GROUPS_PER_PAGE
+    self._job_groups = all_groups[offset:offset + JOB_GROUPS_PER_PAGE]
 
   def _GetJobGroupState(self, group):
-    return str(group.status)
+    return group['status']
 
   def _GetJobGroupStatus(self, group):
     status_map = {'SUCCEEDED': 'success', 'FAILED': 'failure'}
     return status_map.get(self._GetJobGroupState(group), None)
 
   def GetList(self):
-    return [{'id': group.id,
-             'label': group.label,
-             'submitted': time.ctime(group.time_submitted),
+    return [{'id': group['id'],
+             'label': group['label'],
+             'submitted': time.ctime(group['time_submitted']),
              'state': self._GetJobGroupState(group),
              'status': self._GetJobGroupStatus(group)}
-            for group in self._all_job_groups]
+            for group in self._job_groups]
 
   def GetLabelList(self):
-    return sorted(set(group.label for group in self._all_job_groups))
+    return self._labels
+
+  def GetPages(self):
+    """The current page and the previous and next pages, None if none."""
+    return {'current': self._page + 1,
+            'count': self._num_pages,
+            'previous': self._page - 1 if self._page > 0 else None,
+            'next': self._page + 1 if self._page + 1 < self._num_pages else None}
 
 
 def JobPageHandler(request, job_id):
@@ -190,10 +248,19 @@ def JobPageHandler(request, job_id):
   return render_to_response('job.html', ctx)
 
 
+def _GetIntParam(request, name):
+  try:
+    return max(int(request.GET.get(name, 0)), 0)
+  except ValueError:
+    return 0
+
+
 def LogPageHandler(request, job_id):
-  job = JobInfo(int(job_id))
+  log = JobLogInfo(int(job_id), _GetIntParam(request, 'offset'))
 
-  ctx = MakeDefaultContext({'job_id': job_id, 'log_lines': job.GetLog()})
+  ctx = MakeDefaultContext({'job_id': job_id,
+                            'log_lines': log.GetLog(),
+                            'next_offset': log.GetNextOffset()})
 
   return render_to_response('job_log.html', ctx)
 
@@ -225,31 +292,30 @@ class FilterJobGroupsForm(forms.Form):
 
 
 def JobGroupListPageHandler(request):
-  groups = JobGroupListInfo()
-  group_list = groups.GetList()
+  if request.method == 'POST':
+    label = request.POST.get('label', '*')
+  else:
+    label = request.GET.get('label', '*')
+
+  groups = JobGroupListInfo(label if label != '*' else None,
+                            _GetIntParam(request, 'page'))
 
   field = FilterJobGroupsForm.base_fields['label']
   field.choices = [('*', '--- no filtering ---')]
-  field.choices.extend([(label, label) for label in groups.GetLabelList()])
+  field.choices.extend([(l, l) for l in groups.GetLabelList()])
 
-  if request.method == 'POST':
-    form = FilterJobGroupsForm(request.POST)
-
-    if form.is_valid():
-      label = form.cleaned_data['label']
-
-      if label != '*':
-        group_list = [group for group in group_list if group['label'] == label]
-  else:
-    form = FilterJobGroupsForm({'initial': '*'})
+  form = FilterJobGroupsForm({'label': label})
 
-  ctx = MakeDefaultContext({'filter': form, 'groups': group_list})
+  ctx = MakeDefaultContext({'filter': form,
+                            'label': label,
+                            'groups': groups.GetList(),
+                            'pages': groups.GetPages()})
 
   return render_to_response('job_group_list.html', ctx)
 
 
 def MachineListPageHandler(request):
-  machine_list = pickle.loads(GetServerConnection().GetMachineList())
+  machine_list = json.loads(GetServerConnection().GetMachineSummaries())
 
   return render_to_response('machine_list.html',
                             MakeDefaultContext({'machines': machine_list}))
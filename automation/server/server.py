@@ -2,6 +2,7 @@
 #
 # Copyright 2010 Google Inc. All Rights Reserved.
 
+import json
 import logging
 import optparse
 import pickle
@@ -12,6 +13,7 @@ import sys
 from automation.common import logger
 from automation.common.command_executer import CommandExecuter
 from automation.server import machine_manager
+from automation.server import status
 from automation.server.job_group_manager import JobGroupManager
 from automation.server.job_manager import JobManager
 
@@ -53,6 +55,9 @@ class Server(object):
     self._logger.info('Received KillJobGroup(%d) request.', job_group_id)
     self.job_group_manager.KillJobGroup(pickle.loads(job_group_id))
 
+  # The pickles of archived job groups and jobs can't be returned, the clients
+  # get an error pointing them to GetJobGroupSummary and GetJobSummary.
+
   def GetJobGroup(self, job_group_id):
     self._logger.info('Received GetJobGroup(%d) request.', job_group_id)
 
@@ -68,6 +73,43 @@ class Server(object):
 
     return pickle.dumps(self.job_manager.machine_manager.GetMachineList())
 
+  # The methods below return JSON summaries of the state of the server, see the
+  # status module, rather than pickles of whole object graphs.
+
+  def GetJobGroupSummaries(self, since_revision=0, offset=0, limit=0, label=''):
+    self._logger.info('Received GetJobGroupSummaries(%d, %d, %d, %r) request.',
+                      since_revision, offset, limit, label)
+
+    return json.dumps(status.JobGroupListSummary(
+        self.job_group_manager.GetJobGroupList(), since_revision, offset, limit,
+        label))
+
+  def GetJobGroupSummary(self, job_group_id):
+    self._logger.info('Received GetJobGroupSummary(%d) request.', job_group_id)
+
+    return json.dumps(self.job_group_manager.GetJobGroupSummary(job_group_id))
+
+  def GetJobSummary(self, job_id):
+    self._logger.info('Received GetJobSummary(%d) request.', job_id)
+
+    return json.dumps(self.job_manager.GetJobSummary(job_id))
+
+  def GetMachineSummaries(self):
+    self._logger.info('Received GetMachineSummaries() request.')
+
+    return json.dumps(
+        [status.MachineSummary(mach)
+         for mach in self.job_manager.machine_manager.GetMachineList()])
+
+  def GetJobLog(self, job_id, offset=0, max_bytes=status.MAX_LOG_CHUNK):
+    self._logger.info('Received GetJobLog(%d, %d, %d) request.', job_id, offset,
+                      max_bytes)
+
+    summary = self.job_manager.GetJobSummary(job_id)
+    if not summary or not summary['log_path']:
+      return json.dumps(None)
+    return json.dumps(status.ReadLog(summary['log_path'], offset, max_bytes))
+
   def StartServer(self):
     self.job_manager.StartJobManager()
 
@@ -0,0 +1,183 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+"""Compact, versioned summaries of the state of the automation server.
+
+The summaries are plain dictionaries of strings, numbers and lists, so they
+are sent to the dashboard as JSON instead of pickled object graphs. Every job
+and job group carries the revision of its last change (see Job.Touch), which
+lets a client ask only for the job groups changed since the revision it has
+seen last.
+"""
+
+import gzip
+import os.path
+
+from automation.common import state_machine
+
+# Bumped whenever a field is removed from or changes its meaning in a summary.
+STATUS_API_VERSION = 1
+
+# The most bytes of a log returned by a single ReadLog call.
+MAX_LOG_CHUNK = 256 * 1024
+
+
+def _Seconds(time_delta):
+  if time_delta is None:
+    return None
+  return time_delta.days * 24 * 60 * 60 + time_delta.seconds
+
+
+def _JobRef(job_):
+  return {'id': job_.id, 'label': job_.label}
+
+
+def JobSummary(job_):
+  """Describes a job, with its command, dependencies and timeline."""
+  # The command can be formatted only once the job was given its machines.
+  if job_.machines:
+    command = job_.PrettyFormatCommand()
+  else:
+    command = str(job_.command)
+
+  return {'id': job_.id,
+          'label': job_.label,
+          'status': str(job_.status),
+          'revision': job_.revision,
+          'group': _JobRef(job_.group) if job_.group else None,
+          'predecessors': sorted(_JobRef(pred) for pred in job_.predecessors),
+          'successors': sorted(_JobRef(succ) for succ in job_.successors),
+          'machines': [mach.hostname for mach in job_.machines],
+          'work_dir': job_.work_dir,
+          'command': command,
+          'elapsed': _Seconds(job_.timeline.GetTotalTime()),
+          'log_path': JobLogPath(job_) if job_.group else None,
+          'timeline': [{'started': evlog.GetTimeStartedFormatted(),
+                        'state_from': evlog.event.from_,
+                        'state_to': evlog.event.to_,
+                        'elapsed': _Seconds(evlog.GetTimeElapsedRounded())}
+                       for evlog in
+                       job_.timeline.GetTransitionEventHistory()]}
+
+
+def JobBriefSummary(job_):
+  """Describes a job in the list of the jobs of its group."""
+  return {'id': job_.id,
+          'label': job_.label,
+          'status': str(job_.status),
+          'elapsed': _Seconds(job_.timeline.GetTotalTime())}
+
+
+def JobGroupSummary(group, with_jobs=False):
+  """Describes a job group, and the state of its jobs if with_jobs is set."""
+  summary = {'id': group.id,
+             'label': group.label,
+             'status': str(group.status),
+             'revision': group.revision,
+             'time_submitted': group.time_submitted,
+             'home_dir': group.home_dir,
+             'cleanup_on_completion': group.cleanup_on_completion,
+             'cleanup_on_failure': group.cleanup_on_failure}
+
+  if with_jobs:
+    # The jobs moved to the archive are only known by their brief summaries.
+    summary['jobs'] = sorted(group.archived_jobs + [JobBriefSummary(job_)
+                                                    for job_ in group.jobs],
+                             key=lambda job_: job_['id'])
+
+  return summary
+
+
+def MachineSummary(mach):
+  return {'hostname': mach.hostname,
+          'label': mach.label,
+          'cpu': mach.cpu,
+          'cores': mach.cores,
+          'os': mach.os,
+          'uses': mach.uses,
+          'locked': mach.locked}
+
+
+def JobGroupListSummary(groups, since_revision=0, offset=0, limit=0, label=''):
+  """Describes a page of the job groups, newest first.
+
+  Args:
+    groups: All the job groups, oldest first. The groups that were archived
+      are given by their summaries, see JobGroupSummary.
+    since_revision: Only the groups changed after this revision are listed.
+    offset: Number of matching groups to skip.
+    limit: Maximum number of groups listed, 0 for no limit.
+    label: If set, only the groups with this label are listed.
+
+  Returns:
+    A dictionary with the groups listed, the number of matching groups, the
+    labels of all the groups and the latest revision, to be passed as
+    since_revision by the next call.
+  """
+  # The groups may change while they are summarized, so the revision returned
+  # is the one before the first summary: a group changed during the pass is
+  # listed again by the next call, instead of being skipped.
+  revision = state_machine.CurrentRevision()
+  summaries = [group if isinstance(group, dict) else JobGroupSummary(group)
+               for group in groups]
+  matching = [summary for summary in reversed(summaries)
+              if summary['revision'] > since_revision and
+              (not label or summary['label'] == label)]
+  page = matching[offset:offset + limit] if limit else matching[offset:]
+
+  return {'version': STATUS_API_VERSION,
+          'revision': revision,
+          'total': len(matching),
+          'labels': sorted(set(summary['label'] for summary in summaries)),
+          'groups': page}
+
+
+def ReadLog(path, offset=0, max_bytes=MAX_LOG_CHUNK):
+  """Reads a chunk of whole lines of a gzipped log, which may still be written.
+
+  Args:
+    path: The gzipped log file.
+    offset: The offset in the uncompressed log to read from, usually the
+      next_offset of the previous call.
+    max_bytes: Maximum number of bytes read, capped by MAX_LOG_CHUNK.
+
+  Returns:
+    A dictionary with the lines read, the offset to read the next chunk from
+    and whether the end of the log, as written so far, was reached.
+  """
+  max_bytes = min(max_bytes, MAX_LOG_CHUNK) if max_bytes > 0 else MAX_LOG_CHUNK
+
+  try:
+    log = gzip.open(path, 'r')
+  except IOError:
+    return {'lines': [], 'offset': offset, 'next_offset': offset, 'eof': True}
+
+  # There's a good chance that file is not closed yet, so EOF handling function
+  # and CRC calculation will fail, thus we need to monkey patch the _read_eof
+  # method.
+  log._read_eof = lambda: None
+
+  try:
+    try:
+      log.seek(offset)
+      # Read a byte more to tell if the end of the log was reached.
+      data = log.read(max_bytes + 1)
+    except (EOFError, IOError):
+      data = ''
+  finally:
+    log.close()
+
+  eof = len(data) <= max_bytes
+  data = data[:max_bytes]
+  # Cut the chunk at a line boundary, so that a line that is being written or
+  # does not fit is read whole by the next call, unless it is the only line.
+  end = data.rfind('\n') + 1
+  if end:
+    data = data[:end]
+
+  return {'lines': data.splitlines(),
+          'offset': offset,
+          'next_offset': offset + len(data),
+          'eof': eof}
+
+
+def JobLogPath(job_):
+  return os.path.join(job_.logs_dir, '%s.gz' % job_.log_filename_prefix)
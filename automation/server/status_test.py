@@ -0,0 +1,174 @@
+#!/usr/bin/python
+#
+# Copyright 2017 Google Inc. All Rights Reserved.
+"""Status API unittest.
+
+StatusTest tests the summaries, revisions and log reads of the status module.
+"""
+
+import gzip
+import json
+import os.path
+import shutil
+import tempfile
+import threading
+import unittest
+
+from automation.common import job
+from automation.common import job_group
+from automation.server import status
+
+
+def _CreateJobGroup(label, num_jobs=2):
+  jobs = [job.Job('%s-job-%d' % (label, i), 'true') for i in range(num_jobs)]
+  for pred, succ in zip(jobs, jobs[1:]):
+    succ.DependsOn(pred)
+  return job_group.JobGroup(label, jobs)
+
+
+class StatusTest(unittest.TestCase):
+
+  def setUp(self):
+    self.groups = []
+    for num in range(5):
+      group = _CreateJobGroup('label-%d' % (num % 2))
+      group.id = num
+      group.status = job_group.STATUS_EXECUTING
+      for job_num, job_ in enumerate(group.jobs):
+        job_.id = num * 10 + job_num
+        job_.Touch()
+      self.groups.append(group)
+
+  def testJobSummary(self):
+    summary = json.loads(json.dumps(status.JobSummary(self.groups[0].jobs[1])))
+
+    self.assertEqual(summary['id'], 1)
+    self.assertEqual(summary['status'], job.STATUS_NOT_EXECUTED)
+    self.assertEqual(summary['group'], {'id': 0, 'label': 'label-0'})
+    self.assertEqual(summary['predecessors'], [{'id': 0,
+                                                'label': 'label-0-job-0'}])
+    self.assertEqual(summary['successors'], [])
+    self.assertEqual(summary['command'], 'true')
+
+  def testJobGroupSummary(self):
+    summary = json.loads(json.dumps(status.JobGroupSummary(self.groups[3],
+                                                           with_jobs=True)))
+
+    self.assertEqual(summary['status'], job_group.STATUS_EXECUTING)
+    self.assertEqual([job_['id'] for job_ in summary['jobs']], [30, 31])
+    self.assertNotIn('jobs', status.JobGroupSummary(self.groups[3]))
+
+  def testChangedSinceRevision(self):
+    summaries = status.JobGroupListSummary(self.groups)
+    self.assertEqual(summaries['version'], status.STATUS_API_VERSION)
+    self.assertEqual([group['id'] for group in summaries['groups']],
+                     [4, 3, 2, 1, 0])
+    self.assertEqual(summaries['labels'], ['label-0', 'label-1'])
+
+    revision = summaries['revision']
+    self.assertEqual(
+        status.JobGroupListSummary(self.groups, revision)['groups'], [])
+
+    self.groups[1].jobs[0].status = job.STATUS_SETUP
+    summaries = status.JobGroupListSummary(self.groups, revision)
+    self.assertEqual([group['id'] for group in summaries['groups']], [1])
+    self.assertGreater(summaries['revision'], revision)
+
+  def testConcurrentTouches(self):
+    group = _CreateJobGroup('concurrent', num_jobs=8)
+
+    def _Touch(job_):
+      for _ in range(200):
+        job_.Touch()
+
+    threads = [threading.Thread(target=_Touch, args=(job_,))
+               for job_ in group.jobs]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    # The group carries the revision of the last change of its jobs.
+    self.assertEqual(group.revision, max(job_.revision for job_ in group.jobs))
+
+  def testChangedDuringSummary(self):
+    revision = status.JobGroupListSummary(self.groups)['revision']
+
+    def _GroupsChangedDuringPass():
+      # Group 1 is summarized, then changed together with group 2, which is
+      # summarized after its change.
+      yield self.groups[1]
+      self.groups[1].jobs[0].status = job.STATUS_SETUP
+      self.groups[2].jobs[0].status = job.STATUS_SETUP
+      yield self.groups[2]
+
+    summaries = status.JobGroupListSummary(_GroupsChangedDuringPass(),
+                                           revision)
+    self.assertEqual([group['id'] for group in summaries['groups']], [2])
+    # The change of group 1 is listed by the next call.
+    summaries = status.JobGroupListSummary(self.groups, summaries['revision'])
+    self.assertIn(1, [group['id'] for group in summaries['groups']])
+
+  def testPagination(self):
+    summaries = status.JobGroupListSummary(self.groups, offset=1, limit=2)
+    self.assertEqual(summaries['total'], 5)
+    self.assertEqual([group['id'] for group in summaries['groups']], [3, 2])
+
+    summaries = status.JobGroupListSummary(self.groups, label='label-0')
+    self.assertEqual(summaries['total'], 3)
+    self.assertEqual([group['id'] for group in summaries['groups']], [4, 2, 0])
+
+  def testArchivedGroups(self):
+    groups = [status.JobGroupSummary(group) for group in self.groups[:2]]
+    summaries = status.JobGroupListSummary(groups + self.groups[2:],
+                                           label='label-1')
+    self.assertEqual([group['id'] for group in summaries['groups']], [3, 1])
+
+
+class ReadLogTest(unittest.TestCase):
+
+  def setUp(self):
+    self.log_dir = tempfile.mkdtemp()
+    self.log_path = os.path.join(self.log_dir, 'job-1.log.gz')
+
+  def tearDown(self):
+    shutil.rmtree(self.log_dir)
+
+  def testMissingLog(self):
+    log = status.ReadLog(self.log_path)
+    self.assertEqual(log['lines'], [])
+    self.assertTrue(log['eof'])
+
+  def testRangedReads(self):
+    lines = ['line %d' % num for num in range(100)]
+    with gzip.open(self.log_path, 'w') as log:
+      log.write(''.join(line + '\n' for line in lines))
+
+    read_lines = []
+    offset = 0
+    while True:
+      log = status.ReadLog(self.log_path, offset, 50)
+      read_lines.extend(log['lines'])
+      offset = log['next_offset']
+      if log['eof']:
+        break
+      # Only whole lines are returned.
+      self.assertTrue(log['lines'])
+
+    self.assertEqual(read_lines, lines)
+
+  def testLogBeingWritten(self):
+    log_file = gzip.open(self.log_path, 'w')
+    log_file.write('first line\nsecond li')
+    log_file.flush()
+
+    try:
+      log = status.ReadLog(self.log_path)
+      self.assertEqual(log['lines'], ['first line'])
+      self.assertEqual(log['next_offset'], len('first line\n'))
+    finally:
+      log_file.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
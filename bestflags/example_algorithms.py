@@ -15,12 +15,16 @@ __author__ = 'yuhenglong@google.com (Yuheng Long)'
 import json
 import multiprocessing
 from optparse import OptionParser
+import os
 import sys
 
 import flags
 from genetic_algorithm import GAGeneration
+from pipeline_process import FormatStats
 from pipeline_process import PipelineProcess
 import pipeline_worker
+from remote_worker import Coordinator
+from result_store import ResultStore
 from steering import Steering
 from task import BUILD_STAGE
 from task import Task
@@ -54,6 +58,18 @@ NUM_TRIALS = 'NUM_TRIALS'
 DEFAULT_NUM_TRIALS = 20
 MUTATION_RATE = 'MUTATION_RATE'
 DEFAULT_MUTATION_RATE = 0.01
+# How often, in seconds, the progress of the pipeline stages is reported.
+STATS_INTERVAL = 60
+# The results of the performed tasks, in the output directory. A restarted
+# experiment does not perform these tasks again.
+RESULTS_JOURNAL = 'results.journal'
+# The ports the coordinators of the build/test stages serve the remote workers
+# on. A stage without a port performs its tasks on this host only. With a port,
+# NUM_BUILDER/NUM_TESTER are the numbers of workers the stage runs locally.
+BUILD_PORT = 'BUILD_PORT'
+TEST_PORT = 'TEST_PORT'
+# The secret the remote workers need to connect to the coordinators.
+AUTHKEY = 'AUTHKEY'
 
 
 def _ProcessGA(meta_data):
@@ -117,13 +133,22 @@ def _ProcessGA(meta_data):
   GAGeneration.InitMetaData(stop_threshold, num_chromosomes, num_trials, specs,
                             mutation_rate)
 
+  # The coordinators of the stages that have remote workers.
+  coordinators = {}
+  for stage, port in [(BUILD_STAGE, BUILD_PORT), (TEST_STAGE, TEST_PORT)]:
+    if port in meta_data:
+      assert AUTHKEY in meta_data
+      coordinators[stage] = Coordinator(stage, ('', meta_data[port]),
+                                        str(meta_data[AUTHKEY]),
+                                        (build_cmd, test_cmd, output_file))
+
   # Generate the initial generations.
   generation_tasks = testing_batch.GenerateRandomGATasks(specs, num_chromosomes,
                                                          num_trials)
   generations = [GAGeneration(generation_tasks, set([]), 0)]
 
   # Execute the experiment.
-  _StartExperiment(num_builders, num_testers, generations)
+  _StartExperiment(num_builders, num_testers, generations, coordinators)
 
 
 def _ParseJson(file_name):
@@ -144,15 +169,20 @@ def _ParseJson(file_name):
       _ProcessGA(experiments[experiment])
 
 
-def _StartExperiment(num_builders, num_testers, generations):
+def _StartExperiment(num_builders, num_testers, generations, coordinators=None):
   """Set up the experiment environment and execute the framework.
 
   Args:
     num_builders: number of concurrent builders.
     num_testers: number of concurrent testers.
     generations: the initial generation for the framework.
+    coordinators: the coordinators of the remote workers of the stages, keyed
+      by the stage.
   """
 
+  if coordinators is None:
+    coordinators = {}
+
   manager = multiprocessing.Manager()
 
   # The queue between the steering algorithm and the builder.
@@ -161,26 +191,39 @@ def _StartExperiment(num_builders, num_testers, generations):
   build_test = manager.Queue()
   # The queue between the tester and the steering algorithm.
   test_steering = manager.Queue()
+  # The queue depth and throughput of the stages.
+  stats = manager.dict()
+
+  # The results of the tasks performed by previous runs of the experiment.
+  result_store = ResultStore(os.path.join(Task.LOG_DIRECTORY, RESULTS_JOURNAL))
+  results = result_store.Load()
 
   # Set up the processes for the builder, tester and steering algorithm module.
-  build_process = PipelineProcess(num_builders, 'builder', {}, BUILD_STAGE,
+  build_process = PipelineProcess(num_builders, 'builder',
+                                  results.get(BUILD_STAGE, {}), BUILD_STAGE,
                                   steering_build, pipeline_worker.Helper,
-                                  pipeline_worker.Worker, build_test)
+                                  pipeline_worker.Worker, build_test, stats,
+                                  result_store, coordinators.get(BUILD_STAGE))
 
-  test_process = PipelineProcess(num_testers, 'tester', {}, TEST_STAGE,
+  test_process = PipelineProcess(num_testers, 'tester',
+                                 results.get(TEST_STAGE, {}), TEST_STAGE,
                                  build_test, pipeline_worker.Helper,
-                                 pipeline_worker.Worker, test_steering)
+                                 pipeline_worker.Worker, test_steering, stats,
+                                 result_store, coordinators.get(TEST_STAGE))
 
   steer_process = multiprocessing.Process(
       target=Steering,
-      args=(set([]), generations, test_steering, steering_build))
+      args=(set([]), generations, test_steering, steering_build, stats))
 
   # Start the processes.
   build_process.start()
   test_process.start()
   steer_process.start()
 
-  # Wait for the processes to finish.
+  # Wait for the processes to finish, reporting the progress meanwhile.
+  while steer_process.is_alive():
+    steer_process.join(STATS_INTERVAL)
+    print(FormatStats(stats))
   build_process.join()
   test_process.join()
   steer_process.join()
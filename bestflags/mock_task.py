@@ -61,6 +61,11 @@ class MockTask(object):
     assert stage == self._stage
     self._performed = True
 
+  def Fail(self, stage):
+    assert stage == self._stage
+    self._cost = None
+    self._performed = True
+
   def GetResult(self, stage):
     assert stage == self._stage
     return self._cost
@@ -90,3 +95,11 @@ class IdentifierMockTask(MockTask):
     if isinstance(other, MockTask):
       return self._identifier == other.GetIdentifier(self._stage)
     return False
+
+
+class FailingMockTask(MockTask):
+  """This class defines the mock task whose work raises an exception."""
+
+  def Work(self, stage):
+    assert stage == self._stage
+    raise RuntimeError('Task %s failed.' % self._identifier)
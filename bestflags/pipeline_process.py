@@ -11,10 +11,65 @@ The actual stages include the builder and the executor.
 __author__ = 'yuhenglong@google.com (Yuheng Long)'
 
 import multiprocessing
+import threading
+import time
 
 # Pick an integer at random.
 POISONPILL = 975
 
+# The longest time, in seconds, a stage waits on one queue while it has to
+# watch another queue as well.
+POLL_TIMEOUT = 0.5
+
+
+class StageStats(object):
+  """The queue depth and throughput of a pipeline stage.
+
+  The counters of the stage are published to a dictionary shared between the
+  processes of the framework (e.g., a multiprocessing.Manager dict), under the
+  name of the stage, so that the progress of the stages can be monitored. The
+  throughput is the number of completed tasks per second.
+  """
+
+  def __init__(self, name, queue, shared_stats):
+    self._name = name
+    self._queue = queue
+    self._shared_stats = shared_stats
+    self._start = time.time()
+    self._counters = {'received': 0, 'duplicates': 0, 'completed': 0}
+    # The counters are also updated from the result thread of the worker pool.
+    self._lock = threading.Lock()
+
+  def Add(self, counter):
+    """Increment the counter and publish the stats of the stage."""
+    with self._lock:
+      self._counters[counter] += 1
+      self.Publish()
+
+  def Snapshot(self):
+    stats = dict(self._counters)
+    stats['queue_depth'] = self._queue.qsize()
+    elapsed = max(time.time() - self._start, 1e-6)
+    stats['throughput'] = stats['completed'] / elapsed
+    return stats
+
+  def Publish(self):
+    if self._shared_stats is not None:
+      self._shared_stats[self._name] = self.Snapshot()
+
+
+def FormatStats(shared_stats):
+  """Format the stats published by the stages, one stage per line."""
+  lines = []
+  for name in sorted(shared_stats.keys()):
+    stats = shared_stats[name]
+    lines.append('%s: queue depth %d, received %d (%d duplicates), completed '
+                 '%d, %.3f tasks/s' %
+                 (name, stats['queue_depth'], stats['received'],
+                  stats['duplicates'], stats['completed'],
+                  stats['throughput']))
+  return '\n'.join(lines)
+
 
 class PipelineProcess(multiprocessing.Process):
   """A process that encapsulates the actual content pipeline stage.
@@ -38,7 +93,8 @@ class PipelineProcess(multiprocessing.Process):
   """
 
   def __init__(self, num_processes, name, cache, stage, task_queue, helper,
-               worker, result_queue):
+               worker, result_queue, stats=None, result_store=None,
+               coordinator=None):
     """Set up input/output queue and the actual method to be called.
 
     Args:
@@ -56,6 +112,14 @@ class PipelineProcess(multiprocessing.Process):
       worker: The method hosted by the worker pools to do the actual work, e.g.,
         compile the image.
       result_queue: The output task queue for this pipeline stage.
+      stats: An optional dictionary shared between processes, which this stage
+        publishes its StageStats to.
+      result_store: An optional ResultStore the workers record the results of
+        the performed tasks to. The results already in the store should be in
+        the cache.
+      coordinator: An optional remote_worker.Coordinator that serves the tasks
+        to remote workers, instead of the pool of workers. The stage then
+        starts num_processes local workers of the coordinator.
     """
 
     multiprocessing.Process.__init__(self)
@@ -70,6 +134,9 @@ class PipelineProcess(multiprocessing.Process):
     self._cache = cache
     self._stage = stage
     self._num_processes = num_processes
+    self._stats = stats
+    self._result_store = result_store
+    self._coordinator = coordinator
 
     # the queues used by the modules for communication
     manager = multiprocessing.Manager()
@@ -77,7 +144,7 @@ class PipelineProcess(multiprocessing.Process):
     self._work_queue = manager.Queue()
 
   def run(self):
-    """Busy pulling the next task from the queue for execution.
+    """Pull the next task from the queue for execution.
 
     Once a job is pulled, this stage invokes the actual stage method and submits
     the result to the next pipeline stage.
@@ -85,8 +152,16 @@ class PipelineProcess(multiprocessing.Process):
     The process will terminate on receiving the poison pill from previous stage.
     """
 
-    # the worker pool
-    work_pool = multiprocessing.Pool(self._num_processes)
+    stats = StageStats(self._name, self._task_queue, self._stats)
+
+    # the worker pool, or the coordinator of the remote workers
+    if self._coordinator:
+      work_pool = None
+      self._coordinator.Start(self._num_processes, self._work_queue,
+                              self._result_queue, self._result_store,
+                              lambda: stats.Add('completed'))
+    else:
+      work_pool = multiprocessing.Pool(self._num_processes)
 
     # the helper process
     helper_process = multiprocessing.Process(
@@ -94,7 +169,7 @@ class PipelineProcess(multiprocessing.Process):
         args=(self._stage, self._cache, self._helper_queue, self._work_queue,
               self._result_queue))
     helper_process.start()
-    mycache = self._cache.keys()
+    mycache = set(self._cache.keys())
 
     while True:
       task = self._task_queue.get()
@@ -103,21 +178,33 @@ class PipelineProcess(multiprocessing.Process):
         self._result_queue.put(POISONPILL)
         break
 
+      stats.Add('received')
       task_key = task.GetIdentifier(self._stage)
       if task_key in mycache:
         # The task has been encountered before. It will be sent to the helper
         # module for further processing.
         self._helper_queue.put(task)
+        stats.Add('duplicates')
+      elif self._coordinator:
+        self._coordinator.Submit(task)
+        mycache.add(task_key)
       else:
         # Let the workers do the actual work.
-        work_pool.apply_async(
-            self._worker,
-            args=(self._stage, task, self._work_queue, self._result_queue))
-        mycache.append(task_key)
+        args = (self._stage, task, self._work_queue, self._result_queue)
+        if self._result_store:
+          args += (self._result_store,)
+        work_pool.apply_async(self._worker,
+                              args=args,
+                              callback=lambda _: stats.Add('completed'))
+        mycache.add(task_key)
 
     # Shutdown the workers pool and the helper process.
-    work_pool.close()
-    work_pool.join()
+    if self._coordinator:
+      self._coordinator.Join()
+      self._coordinator.Stop()
+    else:
+      work_pool.close()
+      work_pool.join()
 
     self._helper_queue.put(POISONPILL)
     helper_process.join()
@@ -25,17 +25,16 @@ def MockHelper(stage, done_dict, helper_queue, _, result_queue):
 
   assert stage == TEST_STAGE
   while True:
-    if not helper_queue.empty():
-      task = helper_queue.get()
-      if task == pipeline_process.POISONPILL:
-        # Poison pill means shutdown
-        break
+    task = helper_queue.get()
+    if task == pipeline_process.POISONPILL:
+      # Poison pill means shutdown
+      break
 
-      if task in done_dict:
-        # verify that it does not get duplicate "1"s in the test.
-        result_queue.put(ERROR)
-      else:
-        result_queue.put(('helper', task.GetIdentifier(TEST_STAGE)))
+    if task in done_dict:
+      # verify that it does not get duplicate "1"s in the test.
+      result_queue.put(ERROR)
+    else:
+      result_queue.put(('helper', task.GetIdentifier(TEST_STAGE)))
 
 
 def MockWorker(stage, task, _, result_queue):
@@ -60,9 +59,11 @@ class PipelineProcessTest(unittest.TestCase):
     manager = multiprocessing.Manager()
     inp = manager.Queue()
     output = manager.Queue()
+    stats = manager.dict()
 
-    process = pipeline_process.PipelineProcess(
-        2, 'testing', {}, TEST_STAGE, inp, MockHelper, MockWorker, output)
+    process = pipeline_process.PipelineProcess(2, 'testing', {}, TEST_STAGE,
+                                               inp, MockHelper, MockWorker,
+                                               output, stats)
 
     process.start()
     inp.put(MockTask(TEST_STAGE, 1))
@@ -84,6 +85,14 @@ class PipelineProcessTest(unittest.TestCase):
       self.assertTrue(task in result)
       result.remove(task)
 
+    # The stage publishes how many tasks it has seen and performed.
+    stage_stats = stats['testing']
+    self.assertEqual(stage_stats['received'], 3)
+    self.assertEqual(stage_stats['duplicates'], 1)
+    self.assertEqual(stage_stats['completed'], 2)
+    self.assertEqual(stage_stats['queue_depth'], 0)
+    self.assertTrue(stage_stats['throughput'] > 0)
+
 
 if __name__ == '__main__':
   unittest.main()
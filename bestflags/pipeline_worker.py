@@ -15,6 +15,9 @@ The worker invokes the work method of the tasks that are not duplicate.
 
 __author__ = 'yuhenglong@google.com (Yuheng Long)'
 
+import collections
+import Queue
+
 import pipeline_process
 
 
@@ -43,48 +46,53 @@ def Helper(stage, done_dict, helper_queue, completed_queue, result_queue):
       the duplicate tasks will be sent to the next stage via this queue.
   """
 
-  # The list of duplicate tasks, the results of which need to be resolved.
-  waiting_list = []
+  # The duplicate tasks, the results of which need to be resolved, by their
+  # identifiers.
+  waiting = collections.defaultdict(list)
 
   while True:
-    # Pull duplicate task from the helper queue.
-    if not helper_queue.empty():
-      task = helper_queue.get()
-
-      if task == pipeline_process.POISONPILL:
-        # Poison pill means no more duplicate task from the helper queue.
-        break
-
+    # Wait for the next duplicate task from the helper queue. Stop waiting now
+    # and then to resolve the tasks whose results have been completed.
+    try:
+      task = helper_queue.get(timeout=pipeline_process.POLL_TIMEOUT)
+    except Queue.Empty:
+      task = None
+
+    if task == pipeline_process.POISONPILL:
+      # Poison pill means no more duplicate task from the helper queue.
+      break
+
+    if task is not None:
       # The task has not been performed before.
       assert not task.Done(stage)
 
       # The identifier of this task.
       identifier = task.GetIdentifier(stage)
 
-      # If a duplicate task comes before the corresponding resolved results from
-      # the completed_queue, it will be put in the waiting list. If the result
-      # arrives before the duplicate task, the duplicate task will be resolved
-      # right away.
+      # If a duplicate task comes before the corresponding resolved results
+      # from the completed_queue, it will be put in the waiting list. If the
+      # result arrives before the duplicate task, the duplicate task will be
+      # resolved right away.
       if identifier in done_dict:
-        # This task has been encountered before and the result is available. The
-        # result can be resolved right away.
+        # This task has been encountered before and the result is available.
+        # The result can be resolved right away.
         task.SetResult(stage, done_dict[identifier])
         result_queue.put(task)
       else:
-        waiting_list.append(task)
+        waiting[identifier].append(task)
 
     # Check and get completed tasks from completed_queue.
-    GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting_list,
+    GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting,
                                 result_queue)
 
   # Wait to resolve the results of the remaining duplicate tasks.
-  while waiting_list:
-    GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting_list,
-                                result_queue)
+  while waiting:
+    GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting,
+                                result_queue, block=True)
 
 
-def GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting_list,
-                                result_queue):
+def GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting,
+                                result_queue, block=False):
   """Pull results from the completed queue and resolves duplicate tasks.
 
   Args:
@@ -96,29 +104,34 @@ def GetResultFromCompletedQueue(stage, completed_queue, done_dict, waiting_list,
     done_dict: A dictionary of tasks that are done. The key of the dictionary is
       the optimization flags of the task. The value of the dictionary is the
       compilation results of the corresponding task.
-    waiting_list: The list of duplicate tasks, the results of which need to be
-      resolved.
+    waiting: A dictionary of the duplicate tasks, the results of which need to
+      be resolved. The key of the dictionary is the identifier of the tasks.
     result_queue: After the results of the duplicate tasks have been resolved,
       the duplicate tasks will be sent to the next stage via this queue.
+    block: Whether to wait for a completed task if there is none yet.
 
-  This helper method tries to pull a completed task from the completed queue.
-  If it gets a task from the queue, it resolves the results of all the relevant
-  duplicate tasks in the waiting list. Relevant tasks are the tasks that have
-  the same flags as the currently received results from the completed_queue.
+  This helper method pulls all the completed tasks from the completed queue.
+  For each of them, it resolves the results of all the relevant duplicate
+  tasks in the waiting dictionary. Relevant tasks are the tasks that have the
+  same flags as the currently received results from the completed_queue.
   """
-  # Pull completed task from the worker queue.
-  if not completed_queue.empty():
-    (identifier, result) = completed_queue.get()
+  while True:
+    # Pull completed task from the worker queue.
+    try:
+      (identifier, result) = completed_queue.get(block)
+    except Queue.Empty:
+      return
     done_dict[identifier] = result
 
-    tasks = [t for t in waiting_list if t.GetIdentifier(stage) == identifier]
-    for duplicate_task in tasks:
+    for duplicate_task in waiting.pop(identifier, []):
       duplicate_task.SetResult(stage, result)
       result_queue.put(duplicate_task)
-      waiting_list.remove(duplicate_task)
+
+    # Only wait for the first completed task.
+    block = False
 
 
-def Worker(stage, task, helper_queue, result_queue):
+def Worker(stage, task, helper_queue, result_queue, result_store=None):
   """Worker that performs the task.
 
   This method calls the work method of the input task and distribute the result
@@ -132,11 +145,17 @@ def Worker(stage, task, helper_queue, result_queue):
       the communication channel between the worker and the helper.
     result_queue: Queue that holds the completed tasks and the results. This is
       the communication channel between the worker and the next stage.
+    result_store: An optional ResultStore that the result is recorded to, so it
+      need not be computed again when the framework is restarted.
   """
 
   # The task has not been completed before.
   assert not task.Done(stage)
 
   task.Work(stage)
-  helper_queue.put((task.GetIdentifier(stage), task.GetResult(stage)))
+  identifier = task.GetIdentifier(stage)
+  result = task.GetResult(stage)
+  if result_store:
+    result_store.Record(stage, identifier, result)
+  helper_queue.put((identifier, result))
   result_queue.put(task)
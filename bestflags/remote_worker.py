@@ -0,0 +1,354 @@
+#!/usr/bin/python2
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Build/test workers that can run on other hosts than the pipeline.
+
+Part of the Chrome build flags optimization.
+
+A pipeline stage with a Coordinator does not perform its tasks in a local pool
+of processes. Instead, the coordinator serves the tasks to workers, that
+connect to it over the network (see the multiprocessing.managers module). A
+worker leases a task, performs it and returns the results of the task, i.e.,
+Task.GetResult(stage), which the coordinator sets to its copy of the task.
+
+While performing a task, the worker renews the lease of the task with
+heartbeats. If a worker is lost, its lease times out and the task is served to
+another worker.
+
+A remote host runs the workers of a stage with, e.g.,
+  ./remote_worker.py --coordinator=host:port --authkey=key --stage=build
+The stage can also start local workers, e.g., to test the framework on one
+host.
+"""
+
+import collections
+import itertools
+import multiprocessing
+from multiprocessing.managers import BaseManager
+from optparse import OptionParser
+import sys
+import threading
+import time
+import traceback
+
+import pipeline_process
+from task import BUILD_STAGE
+from task import Task
+from task import TEST_STAGE
+
+# The time, in seconds, a worker has to perform a task or to renew its lease,
+# before the task is served to another worker.
+LEASE_TIMEOUT = 300
+
+# The number of heartbeats a worker sends per lease timeout.
+HEARTBEATS_PER_LEASE = 3
+
+STAGES = {'build': BUILD_STAGE, 'test': TEST_STAGE}
+
+
+class _CoordinatorServer(BaseManager):
+  """The server that the coordinator serves the workers from."""
+  pass
+
+
+class CoordinatorClient(BaseManager):
+  """The connection of a worker to the coordinator."""
+  pass
+
+
+CoordinatorClient.register('GetCoordinator')
+
+
+class Coordinator(object):
+  """Serves the tasks of a pipeline stage to the workers.
+
+  The tasks are kept until their results are in. A task is leased to one worker
+  at a time. A lease is identified by the id of its task and the number of the
+  lease, so that the result of an expired lease can still be used if the task
+  has not been completed by another worker in the meantime.
+  """
+
+  def __init__(self, stage, address, authkey, task_commands=None,
+               lease_timeout=LEASE_TIMEOUT):
+    """Set up the coordinator.
+
+    Args:
+      stage: The stage (build/test) of the tasks.
+      address: The (host, port) address the workers connect to. Port 0 picks
+        a free port.
+      authkey: The secret the workers need to connect.
+      task_commands: The build command, test command and log directory that
+        the workers pass to Task.InitLogCommand, if any.
+      lease_timeout: Seconds after which a task leased to a worker that did
+        not send a heartbeat is served to another worker.
+    """
+
+    self._stage = stage
+    self.address = address
+    self._authkey = authkey
+    self._task_commands = task_commands
+    self._lease_timeout = lease_timeout
+
+    self._condition = threading.Condition()
+    self._task_ids = itertools.count()
+    self._lease_numbers = itertools.count()
+    # The tasks whose results are not in yet, by task id.
+    self._tasks = {}
+    # The ids of the tasks to be served to the workers.
+    self._queue = collections.deque()
+    # The deadlines of the leases, by lease id.
+    self._leases = {}
+    self._stopped = False
+    self._local_workers = []
+
+    self._completed_queue = None
+    self._result_queue = None
+    self._result_store = None
+    self._on_completed = None
+
+  def Start(self, num_local_workers, completed_queue, result_queue,
+            result_store=None, on_completed=None):
+    """Start serving the workers.
+
+    The tasks are sent to the queues once their results are in, like
+    pipeline_worker.Worker does.
+
+    Args:
+      num_local_workers: Number of workers to start on this host.
+      completed_queue: The queue of (identifier, result) pairs of the
+        completed tasks, for the helper of the stage.
+      result_queue: The queue of the next stage, for the completed tasks.
+      result_store: An optional ResultStore to record the results to.
+      on_completed: An optional method called for every completed task.
+    """
+
+    self._completed_queue = completed_queue
+    self._result_queue = result_queue
+    self._result_store = result_store
+    self._on_completed = on_completed
+
+    server_class = type('_Server', (_CoordinatorServer,), {})
+    server_class.register('GetCoordinator',
+                          callable=lambda: self,
+                          exposed=('GetWorkerConfig', 'GetTask', 'Heartbeat',
+                                   'PutResult'))
+    server = server_class(address=self.address,
+                          authkey=self._authkey).get_server()
+    self.address = server.address
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    local_address = ('localhost', self.address[1])
+    for _ in range(num_local_workers):
+      worker = multiprocessing.Process(target=RunWorker,
+                                       args=(local_address, self._authkey,
+                                             self._stage))
+      worker.start()
+      self._local_workers.append(worker)
+
+  def Submit(self, task):
+    """Queue the task to be served to a worker."""
+
+    with self._condition:
+      task_id = next(self._task_ids)
+      self._tasks[task_id] = task
+      self._queue.append(task_id)
+      self._condition.notify_all()
+
+  def Join(self):
+    """Wait until the results of all the submitted tasks are in."""
+
+    with self._condition:
+      while self._tasks:
+        self._RequeueExpiredLeases()
+        self._condition.wait(pipeline_process.POLL_TIMEOUT)
+
+  def Stop(self):
+    """Let the workers know there will be no more task."""
+
+    with self._condition:
+      self._stopped = True
+      self._condition.notify_all()
+    for worker in self._local_workers:
+      worker.join()
+
+  def _RequeueExpiredLeases(self):
+    now = time.time()
+    for lease_id, deadline in self._leases.items():
+      if deadline < now:
+        del self._leases[lease_id]
+        task_id = lease_id[0]
+        if task_id in self._tasks:
+          self._queue.appendleft(task_id)
+          self._condition.notify_all()
+
+  def GetWorkerConfig(self):
+    """Called by the workers to get the task commands and heartbeat interval."""
+
+    return {'task_commands': self._task_commands,
+            'heartbeat_interval': self._lease_timeout / HEARTBEATS_PER_LEASE}
+
+  def GetTask(self, timeout):
+    """Called by the workers to lease the next task.
+
+    Args:
+      timeout: Seconds to wait for a task.
+
+    Returns:
+      A (lease id, task) pair, None if there is no task to be performed yet,
+      or POISONPILL if there will be no more task.
+    """
+
+    deadline = time.time() + timeout
+    with self._condition:
+      while True:
+        if self._stopped:
+          return pipeline_process.POISONPILL
+        self._RequeueExpiredLeases()
+        while self._queue:
+          task_id = self._queue.popleft()
+          # The task may have been completed by a worker with an expired lease.
+          if task_id in self._tasks:
+            lease_id = (task_id, next(self._lease_numbers))
+            self._leases[lease_id] = time.time() + self._lease_timeout
+            return lease_id, self._tasks[task_id]
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          return None
+        self._condition.wait(min(remaining, pipeline_process.POLL_TIMEOUT))
+
+  def Heartbeat(self, lease_id):
+    """Called by the workers to renew their lease.
+
+    Returns:
+      False if the lease has expired, and the task has been served to another
+      worker or completed.
+    """
+
+    with self._condition:
+      if lease_id not in self._leases:
+        return False
+      self._leases[lease_id] = time.time() + self._lease_timeout
+      return True
+
+  def PutResult(self, lease_id, result):
+    """Called by the workers to return the result of the task they leased.
+
+    Args:
+      lease_id: The lease of the task.
+      result: The result of the task, i.e., Task.GetResult(stage).
+
+    Returns:
+      False if the result was ignored because the task was completed already.
+    """
+
+    with self._condition:
+      task_id = lease_id[0]
+      for other_lease_id in [l for l in self._leases if l[0] == task_id]:
+        del self._leases[other_lease_id]
+      task = self._tasks.get(task_id)
+      if task is None:
+        return False
+
+      task.SetResult(self._stage, result)
+      identifier = task.GetIdentifier(self._stage)
+      if self._result_store:
+        self._result_store.Record(self._stage, identifier, result)
+      self._completed_queue.put((identifier, result))
+      self._result_queue.put(task)
+      if self._on_completed:
+        self._on_completed()
+
+      # Join may return once the task has been sent to the next stage.
+      del self._tasks[task_id]
+      self._condition.notify_all()
+      return True
+
+
+def _Heartbeat(coordinator, lease_id, interval, done):
+  while not done.wait(interval):
+    coordinator.Heartbeat(lease_id)
+
+
+def RunWorker(address, authkey, stage):
+  """Perform the tasks served by the coordinator, until there is no more task.
+
+  Args:
+    address: The (host, port) address of the coordinator.
+    authkey: The secret of the coordinator.
+    stage: The stage (build/test) of the tasks.
+  """
+
+  client = CoordinatorClient(address=address, authkey=authkey)
+  client.connect()
+  coordinator = client.GetCoordinator()
+
+  config = coordinator.GetWorkerConfig()
+  if config['task_commands']:
+    Task.InitLogCommand(*config['task_commands'])
+
+  while True:
+    lease = coordinator.GetTask(config['heartbeat_interval'])
+    if lease == pipeline_process.POISONPILL:
+      break
+    if lease is None:
+      continue
+
+    (lease_id, task) = lease
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_Heartbeat,
+                                 args=(coordinator, lease_id,
+                                       config['heartbeat_interval'], done))
+    heartbeat.daemon = True
+    heartbeat.start()
+    try:
+      task.Work(stage)
+    except Exception:  # pylint: disable=broad-except
+      # A task that kills its worker would be served to the next worker once
+      # the lease expires, and kill it too. It is reported as failed instead.
+      traceback.print_exc()
+      task.Fail(stage)
+    finally:
+      done.set()
+      heartbeat.join()
+
+    coordinator.PutResult(lease_id, task.GetResult(stage))
+
+
+def main(argv):
+  parser = OptionParser()
+  parser.add_option('--coordinator',
+                    dest='coordinator',
+                    help='host:port address of the coordinator')
+  parser.add_option('--authkey',
+                    dest='authkey',
+                    help='secret of the coordinator')
+  parser.add_option('--stage',
+                    dest='stage',
+                    choices=sorted(STAGES.keys()),
+                    help='stage of the tasks: build or test')
+  parser.add_option('-j',
+                    '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=1,
+                    help='number of tasks to perform at the same time')
+  (options, _) = parser.parse_args(argv)
+  assert options.coordinator and options.authkey and options.stage
+
+  host, port = options.coordinator.rsplit(':', 1)
+  args = ((host, int(port)), options.authkey, STAGES[options.stage])
+  workers = [multiprocessing.Process(target=RunWorker, args=args)
+             for _ in range(options.jobs)]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Remote worker unittest.
+
+Part of the Chrome build flags optimization.
+
+The workers of these tests are local stand-ins for the workers on remote hosts.
+"""
+
+import multiprocessing
+import unittest
+
+from mock_task import FailingMockTask
+from mock_task import MockTask
+import pipeline_process
+import pipeline_worker
+import remote_worker
+
+# Pick an integer at random.
+TEST_STAGE = -8
+
+AUTHKEY = 'remote_worker_test'
+
+
+def _DrainQueue(queue):
+  items = []
+  while not queue.empty():
+    items.append(queue.get())
+  return items
+
+
+class RemoteWorkerTest(unittest.TestCase):
+  """This class tests the Coordinator and its workers."""
+
+  def testLocalWorkers(self):
+    """Test that the workers perform all the tasks once."""
+
+    manager = multiprocessing.Manager()
+    completed_queue = manager.Queue()
+    result_queue = manager.Queue()
+
+    coordinator = remote_worker.Coordinator(TEST_STAGE, ('localhost', 0),
+                                            AUTHKEY)
+    completed = []
+    coordinator.Start(3, completed_queue, result_queue,
+                      on_completed=lambda: completed.append(True))
+    tasks = [MockTask(TEST_STAGE, i, i * 10) for i in range(10)]
+    for task in tasks:
+      coordinator.Submit(task)
+    coordinator.Join()
+    coordinator.Stop()
+
+    results = _DrainQueue(result_queue)
+    assert sorted(t.GetIdentifier(TEST_STAGE) for t in results) == range(10)
+    for task in results:
+      assert task.Done(TEST_STAGE)
+      assert task.GetResult(TEST_STAGE) == task.GetIdentifier(TEST_STAGE) * 10
+    assert sorted(_DrainQueue(completed_queue)) == [(i, i * 10)
+                                                    for i in range(10)]
+    assert len(completed) == 10
+
+  def testLostWorker(self):
+    """Test that the task of a lost worker is performed by another worker."""
+
+    manager = multiprocessing.Manager()
+    completed_queue = manager.Queue()
+    result_queue = manager.Queue()
+
+    coordinator = remote_worker.Coordinator(TEST_STAGE, ('localhost', 0),
+                                            AUTHKEY,
+                                            lease_timeout=0.5)
+    coordinator.Start(0, completed_queue, result_queue)
+    coordinator.Submit(MockTask(TEST_STAGE, 1, 5))
+
+    # A worker that leases the task and never sends a heartbeat.
+    client = remote_worker.CoordinatorClient(address=('localhost',
+                                                      coordinator.address[1]),
+                                             authkey=AUTHKEY)
+    client.connect()
+    lost_worker = client.GetCoordinator()
+    (lease_id, task) = lost_worker.GetTask(1)
+    assert task.GetIdentifier(TEST_STAGE) == 1
+    assert lost_worker.GetTask(0) is None
+
+    worker = multiprocessing.Process(target=remote_worker.RunWorker,
+                                     args=(('localhost', coordinator.address[1]),
+                                           AUTHKEY, TEST_STAGE))
+    worker.start()
+    coordinator.Join()
+    coordinator.Stop()
+    worker.join()
+
+    # The lease of the lost worker expired, its result comes too late.
+    assert not lost_worker.Heartbeat(lease_id)
+    assert not lost_worker.PutResult(lease_id, 5)
+    assert _DrainQueue(completed_queue) == [(1, 5)]
+    assert [t.GetIdentifier(TEST_STAGE)
+            for t in _DrainQueue(result_queue)] == [1]
+
+  def testFailingTask(self):
+    """Test that a task whose work raises is reported as failed."""
+
+    manager = multiprocessing.Manager()
+    completed_queue = manager.Queue()
+    result_queue = manager.Queue()
+
+    coordinator = remote_worker.Coordinator(TEST_STAGE, ('localhost', 0),
+                                            AUTHKEY)
+    coordinator.Start(1, completed_queue, result_queue)
+    coordinator.Submit(FailingMockTask(TEST_STAGE, 1, 5))
+    coordinator.Submit(MockTask(TEST_STAGE, 2, 6))
+    coordinator.Join()
+    coordinator.Stop()
+
+    # The worker survived the failing task and performed the next one.
+    assert sorted(_DrainQueue(completed_queue)) == [(1, None), (2, 6)]
+    for task in _DrainQueue(result_queue):
+      assert task.Done(TEST_STAGE)
+
+  def testPipelineProcess(self):
+    """Test a pipeline stage that has its tasks performed by the workers."""
+
+    manager = multiprocessing.Manager()
+    inp = manager.Queue()
+    output = manager.Queue()
+    stats = manager.dict()
+
+    coordinator = remote_worker.Coordinator(TEST_STAGE, ('localhost', 0),
+                                            AUTHKEY)
+    process = pipeline_process.PipelineProcess(
+        2, 'remote', {}, TEST_STAGE, inp, pipeline_worker.Helper,
+        pipeline_worker.Worker, output, stats, coordinator=coordinator)
+
+    process.start()
+    inp.put(MockTask(TEST_STAGE, 1, 3))
+    inp.put(MockTask(TEST_STAGE, 1))
+    inp.put(MockTask(TEST_STAGE, 2, 4))
+    inp.put(pipeline_process.POISONPILL)
+    process.join()
+
+    # The stage passes the poison pill on before its tasks are completed.
+    results = [output.get() for _ in range(4)]
+    assert pipeline_process.POISONPILL in results
+    results.remove(pipeline_process.POISONPILL)
+
+    # The duplicate task gets the result of the task performed by a worker.
+    assert sorted((t.GetIdentifier(TEST_STAGE), t.GetResult(TEST_STAGE))
+                  for t in results) == [(1, 3), (1, 3), (2, 4)]
+    assert stats['remote']['completed'] == 2
+    assert stats['remote']['duplicates'] == 1
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,110 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""A persistent store of the results of the performed tasks.
+
+Part of the Chrome build flags optimization.
+
+The workers of the build and test stages record the result of every task they
+perform, keyed by the identifier of the task in the stage (see
+Task.GetIdentifier). When the framework is restarted, e.g., after a crash, the
+stages start with the recorded results, so the tasks that have been performed
+before are resolved like duplicate tasks instead of being built/tested again.
+
+The store is an append-only journal of JSON records, one per line. Every record
+is appended by a single write under an exclusive lock, so the worker processes
+can record at the same time. A record cut short by a crash is ignored.
+"""
+
+import fcntl
+import json
+import os
+
+
+class ResultStore(object):
+  """An append-only journal of the results of the tasks in each stage."""
+
+  def __init__(self, path):
+    """Set up the journal file of the store.
+
+    Args:
+      path: The journal file. It is created when the first result is recorded.
+    """
+
+    self._path = path
+
+  def Record(self, stage, identifier, result):
+    """Append the result of the task with the identifier in the stage.
+
+    Args:
+      stage: The stage (build/test) in which the task was performed.
+      identifier: The identifier of the task in the stage.
+      result: The result of the task, as returned by Task.GetResult(stage).
+    """
+
+    record = json.dumps({'stage': stage,
+                         'identifier': identifier,
+                         'result': result})
+    directory = os.path.dirname(self._path)
+    if directory and not os.path.exists(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        # Another worker may have just created it.
+        if not os.path.isdir(directory):
+          raise
+
+    with open(self._path, 'a+') as journal:
+      fcntl.flock(journal, fcntl.LOCK_EX)
+      try:
+        # Start a new line after a record cut short by a crash.
+        journal.seek(0, os.SEEK_END)
+        if journal.tell():
+          journal.seek(-1, os.SEEK_END)
+          if journal.read(1) != '\n':
+            record = '\n' + record
+        journal.write(record + '\n')
+        journal.flush()
+      finally:
+        fcntl.flock(journal, fcntl.LOCK_UN)
+
+  def Load(self):
+    """Read the results recorded so far.
+
+    Returns:
+      A dictionary from the stage to the dictionary of the results of the
+      stage, keyed by the task identifiers. The later of two results of a task
+      wins.
+    """
+
+    results = {}
+    if not os.path.exists(self._path):
+      return results
+
+    with open(self._path, 'r') as journal:
+      fcntl.flock(journal, fcntl.LOCK_SH)
+      try:
+        lines = journal.readlines()
+      finally:
+        fcntl.flock(journal, fcntl.LOCK_UN)
+
+    for line in lines:
+      try:
+        record = json.loads(line)
+      except ValueError:
+        # A record that was being written when the framework crashed.
+        continue
+      result = record['result']
+      # JSON has no tuples, the build results are tuples.
+      if isinstance(result, list):
+        result = tuple(result)
+      identifier = record['identifier']
+      if isinstance(identifier, list):
+        identifier = tuple(identifier)
+      results.setdefault(record['stage'], {})[identifier] = result
+    return results
+
+  def GetResults(self, stage):
+    """Get the recorded results of the stage, keyed by the task identifiers."""
+
+    return self.Load().get(stage, {})
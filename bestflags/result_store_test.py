@@ -0,0 +1,101 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for the result store.
+
+Part of the Chrome build flags optimization.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock_task import MockTask
+import pipeline_worker
+from result_store import ResultStore
+
+# Pick an integer at random.
+TEST_STAGE = -17
+
+
+def _RecordResults(path, first, count):
+  store = ResultStore(path)
+  for identifier in range(first, first + count):
+    store.Record(TEST_STAGE, identifier, identifier * 2)
+
+
+class ResultStoreTest(unittest.TestCase):
+  """This class tests the ResultStore.
+
+  The results recorded by the workers should be available to the later runs of
+  the framework, even if the framework crashed while recording a result.
+  """
+
+  def setUp(self):
+    self._directory = tempfile.mkdtemp()
+    self._path = os.path.join(self._directory, 'output', 'results.journal')
+
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+
+  def testRecordAndLoad(self):
+    """Test that the results of every stage are loaded back."""
+
+    store = ResultStore(self._path)
+    self.assertEqual(store.Load(), {})
+
+    store.Record(TEST_STAGE, 'flags', ('checksum', 1.5, 'image', '10', '5'))
+    store.Record(TEST_STAGE + 1, 'checksum', 3.0)
+    store.Record(TEST_STAGE + 1, 'checksum', 2.0)
+
+    results = ResultStore(self._path).Load()
+    self.assertEqual(results[TEST_STAGE],
+                     {'flags': ('checksum', 1.5, 'image', '10', '5')})
+    # The latest result of a task wins.
+    self.assertEqual(ResultStore(self._path).GetResults(TEST_STAGE + 1),
+                     {'checksum': 2.0})
+
+  def testCrash(self):
+    """Test that a record cut short by a crash does not lose other records."""
+
+    store = ResultStore(self._path)
+    store.Record(TEST_STAGE, 1, 2)
+    with open(self._path, 'a') as journal:
+      journal.write('{"stage": %d, "identifier": 2, "res' % TEST_STAGE)
+    store.Record(TEST_STAGE, 3, 6)
+
+    self.assertEqual(store.GetResults(TEST_STAGE), {1: 2, 3: 6})
+
+  def testConcurrentRecords(self):
+    """Test that the records of concurrent workers are all kept."""
+
+    processes = [multiprocessing.Process(target=_RecordResults,
+                                         args=(self._path, i * 100, 100))
+                 for i in range(4)]
+    for process in processes:
+      process.start()
+    for process in processes:
+      process.join()
+
+    results = ResultStore(self._path).GetResults(TEST_STAGE)
+    self.assertEqual(results, dict((i, i * 2) for i in range(400)))
+
+  def testWorker(self):
+    """Test that the worker records the results of the tasks it performs."""
+
+    manager = multiprocessing.Manager()
+    completed_queue = manager.Queue()
+    result_queue = manager.Queue()
+    store = ResultStore(self._path)
+
+    pipeline_worker.Worker(TEST_STAGE, MockTask(TEST_STAGE, 7, 86),
+                           completed_queue, result_queue, store)
+
+    self.assertEqual(completed_queue.get(), (7, 86))
+    self.assertEqual(store.GetResults(TEST_STAGE), {7: 86})
+
+
+if __name__ == '__main__':
+  unittest.main()
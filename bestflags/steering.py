@@ -11,7 +11,7 @@ __author__ = 'yuhenglong@google.com (Yuheng Long)'
 import pipeline_process
 
 
-def Steering(cache, generations, input_queue, result_queue):
+def Steering(cache, generations, input_queue, result_queue, stats=None):
   """The core method template that produces the next generation of tasks to run.
 
   This method waits for the results of the tasks from the previous generation.
@@ -36,8 +36,14 @@ def Steering(cache, generations, input_queue, result_queue):
     result_queue: The output task queue for this pipeline stage. The new tasks
       generated by the steering algorithm will be sent to the next stage via
       this queue.
+    stats: An optional dictionary shared between processes, which the steering
+      stage publishes its StageStats to. The received tasks of this stage are
+      the tasks it generates, the completed tasks are the tasks that went
+      through the whole pipeline.
   """
 
+  stage_stats = pipeline_process.StageStats('steering', input_queue, stats)
+
   # Generations that have pending tasks to be executed. Pending tasks are those
   # whose results are not ready. The tasks that have their results ready are
   # referenced to as ready tasks. Once there is no pending generation, the
@@ -55,6 +61,7 @@ def Steering(cache, generations, input_queue, result_queue):
     for task in [task for task in generation.Pool() if task not in cache]:
       result_queue.put(task)
       cache.add(task)
+      stage_stats.Add('received')
       num_tasks += 1
 
   # If there is no task to be executed at all, the algorithm returns right away.
@@ -66,14 +73,10 @@ def Steering(cache, generations, input_queue, result_queue):
   # The algorithm is done if there is no pending generation. A generation is
   # pending if it has pending task.
   while waiting:
-    # Busy-waiting for the next task.
-    if input_queue.empty():
-      continue
-
-    # If there is a task whose result is ready from the last stage of the
+    # Wait for the next task whose result is ready from the last stage of the
     # feedback loop, there will be one less pending task.
-
     task = input_queue.get()
+    stage_stats.Add('completed')
 
     # Store the result of this ready task. Intermediate results can be used to
     # generate report for final result or be used to reboot from a crash from
@@ -110,6 +113,7 @@ def Steering(cache, generations, input_queue, result_queue):
       for new_task in new_generation.Pool():
         result_queue.put(new_task)
         cache.add(new_task)
+        stage_stats.Add('received')
 
   # Steering algorithm is finished and it informs the next stage that there will
   # be no more task.
@@ -0,0 +1,323 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""A search guided by a surrogate model of the cost of the flags.
+
+Part of the Chrome build flags optimization.
+
+The other algorithms build and test every task they generate. This algorithm
+fits a cheap model of the test cost, a Bayesian linear regression over the flag
+values, to the tasks tested so far. Each generation proposes many candidate
+tasks, the flag set the model predicts best, the neighbors of the best tasks and
+random tasks, and only the candidates the model ranks best are sent to the build
+stage.
+
+The model is fitted to the costs relative to the best and worst costs of the
+tested tasks. Failed tasks, whose cost is sys.maxint, count as the worst tasks
+rather than dominating the fit.
+"""
+
+import random
+import sys
+
+import numpy
+
+import flags
+from flags import Flag
+from flags import FlagSet
+import flags_util
+from generation import Generation
+from task import Task
+
+
+def _SpecFeatures(spec, flag):
+  """The features of the flag of the spec, None if the flag is disabled.
+
+  A boolean flag is 1 if it is enabled. A numeric flag is its value, or one
+  less than the start of its range if it is disabled, and the square of that,
+  both scaled to [0, 1].
+  """
+
+  numeric_flag_match = flags.Search(spec)
+  if not numeric_flag_match:
+    return [0.0 if flag is None else 1.0]
+
+  start = int(numeric_flag_match.group('start')) - 1
+  end = int(numeric_flag_match.group('end'))
+  value = start if flag is None else flag.GetValue()
+  scaled = float(value - start) / (end - start)
+  return [scaled, scaled * scaled]
+
+
+def _SpecChoices(spec):
+  """All the flags of the spec, None for the disabled flag."""
+
+  numeric_flag_match = flags.Search(spec)
+  if not numeric_flag_match:
+    return [None, Flag(spec)]
+
+  start = int(numeric_flag_match.group('start'))
+  end = int(numeric_flag_match.group('end'))
+  return [None] + [Flag(spec, value) for value in range(start, end)]
+
+
+def FlagFeatures(specs, flag_set):
+  """The features of the flag set for the surrogate model.
+
+  The first feature is the constant 1, followed by the features of the flag of
+  every spec, see _SpecFeatures.
+
+  Args:
+    specs: The flags that can be used to generate new tasks.
+    flag_set: The FlagSet of a task.
+
+  Returns:
+    A list of the features of the flag set.
+  """
+
+  features = [1.0]
+  for spec in specs:
+    features.extend(_SpecFeatures(spec, flag_set[spec]
+                                  if spec in flag_set else None))
+  return features
+
+
+class SurrogateModel(object):
+  """A Bayesian linear regression of the relative costs of the tasks."""
+
+  # The precision of the prior of the weights and of the noise of the costs.
+  PRIOR_PRECISION = 0.01
+  NOISE_PRECISION = 100.0
+
+  def __init__(self, specs):
+    self._specs = specs
+    self._mean = None
+    self._covariance = None
+
+  def Fit(self, tasks):
+    """Fit the model to the tested tasks.
+
+    Args:
+      tasks: The tasks whose test results are available.
+    """
+
+    tasks = list(tasks)
+    features = numpy.array([FlagFeatures(self._specs, task.GetFlags())
+                            for task in tasks])
+    costs = [task.GetTestResult() for task in tasks]
+    # Scale the costs to [0, 1]. The costs are subtracted before they are
+    # converted to floats, large costs may not differ by much.
+    valid = [cost for cost in costs if cost != sys.maxint] or [0]
+    low, high = min(valid), max(valid)
+    relative_costs = numpy.array([1.0 if cost == sys.maxint else
+                                  float(cost - low) / max(high - low, 1e-9)
+                                  for cost in costs])
+
+    precision = (self.PRIOR_PRECISION * numpy.eye(features.shape[1]) +
+                 self.NOISE_PRECISION * features.T.dot(features))
+    self._covariance = numpy.linalg.inv(precision)
+    self._mean = self.NOISE_PRECISION * self._covariance.dot(
+        features.T.dot(relative_costs))
+
+  def Predict(self, flag_set):
+    """The predicted relative cost of the flag set and its deviation."""
+
+    features = numpy.array(FlagFeatures(self._specs, flag_set))
+    variance = (1.0 / self.NOISE_PRECISION +
+                features.dot(self._covariance).dot(features))
+    return features.dot(self._mean), numpy.sqrt(variance)
+
+  def LowerConfidenceBound(self, flag_set, exploration):
+    """The optimistic relative cost of the flag set, lower is better."""
+
+    mean, deviation = self.Predict(flag_set)
+    return mean - exploration * deviation
+
+  def BestFlagSet(self):
+    """The flag set with the lowest predicted cost.
+
+    The predicted cost is a sum over the specs, so the best flag of each spec
+    is picked independently.
+    """
+
+    flag_set = []
+    # Skip the constant feature.
+    offset = 1
+    for spec in self._specs:
+      best_flag = None
+      best_cost = None
+      for flag in _SpecChoices(spec):
+        features = _SpecFeatures(spec, flag)
+        cost = numpy.dot(self._mean[offset:offset + len(features)], features)
+        if best_cost is None or cost < best_cost:
+          best_flag = flag
+          best_cost = cost
+      offset += len(features)
+      if best_flag is not None:
+        flag_set.append(best_flag)
+    return FlagSet(flag_set)
+
+
+def _RandomFlagSet(specs):
+  """A flag set that enables each flag with probability 1/2.
+
+  The value of an enabled numeric flag is uniformly distributed in its range.
+  """
+
+  flag_set = []
+  for spec in specs:
+    if not random.randint(0, 1):
+      continue
+    numeric_flag_match = flags.Search(spec)
+    if numeric_flag_match:
+      start = int(numeric_flag_match.group('start'))
+      end = int(numeric_flag_match.group('end'))
+      flag_set.append(Flag(spec, random.randint(start, end - 1)))
+    else:
+      flag_set.append(Flag(spec))
+  return FlagSet(flag_set)
+
+
+class SurrogateGeneration(Generation):
+  """A generation of the tasks ranked best by the surrogate model."""
+
+  # If STOP_THRESHOLD of generations have not seen any improvement, the
+  # algorithm stops.
+  STOP_THRESHOLD = None
+
+  # Number of tasks built and tested in each generation.
+  NUM_BUILDS = None
+
+  # Number of candidate tasks the model ranks in each generation.
+  NUM_CANDIDATES = None
+
+  # The flags that can be used to generate new tasks.
+  SPECS = None
+
+  # How much the uncertainty of the model counts in favor of a candidate.
+  EXPLORATION = 0.5
+
+  @staticmethod
+  def InitMetaData(stop_threshold, num_builds, num_candidates, specs,
+                   exploration=0.5):
+    """Set up the meta data for the surrogate search.
+
+    Args:
+      stop_threshold: The number of generations, upon which no improvement has
+        been seen, the algorithm stops.
+      num_builds: Number of tasks built and tested in each generation.
+      num_candidates: Number of candidate tasks ranked in each generation.
+      specs: The flags that can be used to generate new tasks.
+      exploration: How many standard deviations of the predicted cost a
+        candidate is credited with.
+    """
+
+    SurrogateGeneration.STOP_THRESHOLD = stop_threshold
+    SurrogateGeneration.NUM_BUILDS = num_builds
+    SurrogateGeneration.NUM_CANDIDATES = num_candidates
+    SurrogateGeneration.SPECS = specs
+    SurrogateGeneration.EXPLORATION = exploration
+
+  def __init__(self, tasks, history, total_stucks):
+    """Set up the tasks of this generation.
+
+    Args:
+      tasks: A set of tasks to be run.
+      history: All the tasks tested by the previous generations. The model is
+        fitted to these tasks.
+      total_stucks: The number of generations that have not seen improvement.
+    """
+
+    Generation.__init__(self, tasks, history)
+    self._total_stucks = total_stucks
+
+  def IsImproved(self):
+    """True if this generation has improvement upon the previous generations."""
+
+    history = self.CandidatePool()
+
+    # The first generation does not have a history.
+    if not history:
+      return True
+
+    best_history = min(history, key=lambda task: task.GetTestResult())
+    best_current = min(self.Pool(), key=lambda task: task.GetTestResult())
+
+    if best_current.IsImproved(best_history):
+      self._total_stucks = 0
+      return True
+
+    if self._total_stucks >= SurrogateGeneration.STOP_THRESHOLD:
+      return False
+
+    self._total_stucks += 1
+    return True
+
+  def _Candidates(self, model, history, cache):
+    """Propose the candidate tasks that have not been generated before.
+
+    The candidates are the best flag set of the model and the neighbors of it
+    and of the best tasks tested so far, see flags_util.ClimbNext, and random
+    tasks.
+    """
+
+    specs = SurrogateGeneration.SPECS
+    target_len = SurrogateGeneration.NUM_CANDIDATES
+
+    candidates = set()
+    model_task = Task(model.BestFlagSet())
+    if model_task not in cache:
+      candidates.add(model_task)
+
+    best_tasks = sorted(history, key=lambda task: task.GetTestResult())
+    for task in [model_task] + best_tasks[:SurrogateGeneration.NUM_BUILDS]:
+      flag_set = task.GetFlags().GetFlags()
+      for spec in specs:
+        for next_flag in flags_util.ClimbNext(flag_set, spec):
+          new_task = Task(FlagSet(next_flag.values()))
+          if new_task not in cache:
+            candidates.add(new_task)
+
+    # Give up on random tasks after a number of duplicates, the space of the
+    # flags may be exhausted.
+    num_trials = 0
+    while len(candidates) < target_len and num_trials < target_len:
+      new_task = Task(_RandomFlagSet(specs))
+      if new_task in cache or new_task in candidates:
+        num_trials += 1
+      else:
+        candidates.add(new_task)
+
+    return candidates
+
+  def Next(self, cache):
+    """Calculate the next generation.
+
+    Fit the model to all the tasks tested so far and build the candidates with
+    the lowest lower confidence bound of their predicted cost.
+
+    Args:
+      cache: A set of tasks that have been generated before.
+
+    Returns:
+      A set of new generations.
+    """
+
+    history = set(self.CandidatePool())
+    history.update(self.Pool())
+
+    model = SurrogateModel(SurrogateGeneration.SPECS)
+    model.Fit(history)
+
+    candidates = self._Candidates(model, history, cache)
+    if not candidates:
+      return []
+
+    exploration = SurrogateGeneration.EXPLORATION
+    ranked = sorted(
+        candidates,
+        key=lambda task: model.LowerConfidenceBound(task.GetFlags(), exploration))
+
+    return [SurrogateGeneration(
+        set(ranked[:SurrogateGeneration.NUM_BUILDS]), history,
+        self._total_stucks)]
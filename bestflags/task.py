@@ -208,6 +208,23 @@ class Task(object):
 
     work_functions[stage]()
 
+  def Fail(self, stage):
+    """Record that the task could not be performed in the stage.
+
+    The task gets the results of a failing build or test, so that it is still
+    passed on to the next stage.
+
+    Args:
+      stage: The stage in which the task failed, compile or test.
+    """
+
+    if stage == BUILD_STAGE:
+      self.__SetBuildResult((ERROR_STRING, sys.maxint, ERROR_STRING,
+                             ERROR_STRING, ERROR_STRING))
+    else:
+      assert stage == TEST_STAGE
+      self.__SetTestResult(sys.maxint)
+
   def FormattedFlags(self):
     """Format the optimization flag set of this task.
 
@@ -169,6 +169,19 @@ class TaskTest(unittest.TestCase):
       assert work_task.Done(task.TEST_STAGE)
       assert work_task.Done(task.BUILD_STAGE)
 
+  def testFail(self):
+    """Test that a failed task has the results of a failing build and test."""
+
+    fail_task = Task(MockFlagSet(0))
+    fail_task.Fail(task.BUILD_STAGE)
+    assert fail_task.Done(task.BUILD_STAGE)
+    assert fail_task.GetResult(task.BUILD_STAGE)[1] == sys.maxint
+    assert fail_task.GetIdentifier(task.TEST_STAGE) == task.ERROR_STRING
+
+    fail_task.Fail(task.TEST_STAGE)
+    assert fail_task.Done(task.TEST_STAGE)
+    assert fail_task.GetResult(task.TEST_STAGE) == sys.maxint
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -5,15 +5,19 @@
 
 Part of the Chrome build flags optimization.
 
-Test the best branching hill climbing algorithms, genetic algorithm and
-iterative elimination algorithm.
+Test the best branching hill climbing algorithms, genetic algorithm, iterative
+elimination algorithm and surrogate search. Also compare the number of builds
+the algorithms take to find their best results.
 """
 
 __author__ = 'yuhenglong@google.com (Yuheng Long)'
 
 import multiprocessing
+import os
 import random
+import shutil
 import sys
+import tempfile
 import unittest
 
 import flags
@@ -25,6 +29,7 @@ from hill_climb_best_neighbor import HillClimbingBestBranch
 from iterative_elimination import IterativeEliminationFirstGeneration
 import pipeline_process
 from steering import Steering
+from surrogate_search import SurrogateGeneration
 from task import BUILD_STAGE
 from task import Task
 from task import TEST_STAGE
@@ -41,6 +46,14 @@ NUM_CHROMOSOMES = 10
 NUM_TRIALS = 20
 MUTATION_RATE = 0.03
 
+# The following variables are meta data for the surrogate search.
+NUM_BUILDS = 4
+NUM_CANDIDATES = 200
+
+# The cost functions the algorithms are compared on, and their best results.
+COMPARISON_COST_FUNCTIONS = [('sum(values[0:len(values)])', 0),
+                             ('sum([(v - 5) ** 2 for v in values])', 0)]
+
 
 def _GenerateRandomRasks(specs):
   """Generate a task that has random values.
@@ -274,10 +287,11 @@ def _GenerateTestFlags(num_flags, upper_bound, file_name):
       output_file.write('%s=[1-%d]\n' % (i, upper_bound))
 
 
-def _TestAlgorithm(cost_func, specs, generations, best_result):
-  """Test the best result the algorithm should return.
+def _RunAlgorithm(cost_func, specs, generations):
+  """Run the algorithm with mock costs.
 
-  Set up the framework, run the input algorithm and verify the result.
+  Set up the framework and run the input algorithm, computing the mock cost of
+  every task it builds.
 
   Args:
     cost_func: The cost function which is used to compute the mock cost of a
@@ -285,9 +299,11 @@ def _TestAlgorithm(cost_func, specs, generations, best_result):
     specs: All the specs that are used in the algorithm. This is used to check
       whether certain flag is disabled in the flag_set dictionary.
     generations: The initial generations to be evaluated.
-    best_result: The expected best result of the algorithm. If best_result is
-      -1, the algorithm may or may not return the best value. Therefore, no
-      assertion will be inserted.
+
+  Returns:
+    A tuple of the best result of the algorithm, the number of builds before
+    the best result was found (including the build of the best result) and the
+    total number of builds.
   """
 
   # Set up the utilities to test the framework.
@@ -301,6 +317,8 @@ def _TestAlgorithm(cost_func, specs, generations, best_result):
 
   # The best result of the algorithm so far.
   result = sys.maxint
+  builds = 0
+  builds_to_best = 0
 
   while True:
     task = input_queue.get()
@@ -310,6 +328,7 @@ def _TestAlgorithm(cost_func, specs, generations, best_result):
       break
 
     task.SetResult(BUILD_STAGE, (0, 0, 0, 0, 0))
+    builds += 1
 
     # Compute the mock cost for the task.
     task_result = _ComputeCost(cost_func, specs, task.GetFlags())
@@ -319,16 +338,57 @@ def _TestAlgorithm(cost_func, specs, generations, best_result):
     # result to be the best result.
     if task_result < result:
       result = task_result
+      builds_to_best = builds
 
     output_queue.put(task)
 
   pp_steer.join()
 
+  return result, builds_to_best, builds
+
+
+def _TestAlgorithm(cost_func, specs, generations, best_result):
+  """Test the best result the algorithm should return.
+
+  Set up the framework, run the input algorithm and verify the result.
+
+  Args:
+    cost_func: The cost function which is used to compute the mock cost of a
+      dictionary of flags.
+    specs: All the specs that are used in the algorithm. This is used to check
+      whether certain flag is disabled in the flag_set dictionary.
+    generations: The initial generations to be evaluated.
+    best_result: The expected best result of the algorithm. If best_result is
+      -1, the algorithm may or may not return the best value. Therefore, no
+      assertion will be inserted.
+  """
+
+  result = _RunAlgorithm(cost_func, specs, generations)[0]
+
   # Only do this test when best_result is not -1.
   if best_result != -1:
     assert best_result == result
 
 
+def _GenerateFlagSpecifications(directory):
+  """Generate the testing specifications, in a file of the directory."""
+
+  mock_test_file = os.path.join(directory, 'scale_mock_test')
+  _GenerateTestFlags(NUM_FLAGS, FLAG_RANGES, mock_test_file)
+  return flags.ReadConf(mock_test_file)
+
+
+def _GenerateSurrogateTasks(specs):
+  """Generate the initial generations for the surrogate search."""
+
+  SurrogateGeneration.InitMetaData(STOP_THRESHOLD, NUM_BUILDS, NUM_CANDIDATES,
+                                   specs)
+  tasks = set()
+  while len(tasks) < NUM_BUILDS:
+    tasks.update(_GenerateRandomRasks(specs))
+  return [SurrogateGeneration(tasks, set([]), 0)]
+
+
 class MockAlgorithmsTest(unittest.TestCase):
   """This class mock tests different steering algorithms.
 
@@ -338,12 +398,14 @@ class MockAlgorithmsTest(unittest.TestCase):
   build and test phases by letting the user define the fitness function.
   """
 
-  def _GenerateFlagSpecifications(self):
-    """Generate the testing specifications."""
+  def setUp(self):
+    # Initiate the build/test command and the log directory, in a temporary
+    # directory that also holds the mock flag specifications.
+    self._directory = tempfile.mkdtemp()
+    Task.InitLogCommand(None, None, os.path.join(self._directory, 'output'))
 
-    mock_test_file = 'scale_mock_test'
-    _GenerateTestFlags(NUM_FLAGS, FLAG_RANGES, mock_test_file)
-    return flags.ReadConf(mock_test_file)
+  def tearDown(self):
+    shutil.rmtree(self._directory)
 
   def testBestHillClimb(self):
     """Test the best hill climb algorithm.
@@ -351,11 +413,8 @@ class MockAlgorithmsTest(unittest.TestCase):
     Test whether it finds the best results as expected.
     """
 
-    # Initiate the build/test command and the log directory.
-    Task.InitLogCommand(None, None, 'output')
-
     # Generate the testing specs.
-    specs = self._GenerateFlagSpecifications()
+    specs = _GenerateFlagSpecifications(self._directory)
 
     # Generate the initial generations for a test whose cost function is the
     # summation of the values of all the flags.
@@ -389,11 +448,8 @@ class MockAlgorithmsTest(unittest.TestCase):
     Do a functional testing here and see how well it scales.
     """
 
-    # Initiate the build/test command and the log directory.
-    Task.InitLogCommand(None, None, 'output')
-
     # Generate the testing specs.
-    specs = self._GenerateFlagSpecifications()
+    specs = _GenerateFlagSpecifications(self._directory)
     # Initiate the build/test command and the log directory.
     GAGeneration.InitMetaData(STOP_THRESHOLD, NUM_CHROMOSOMES, NUM_TRIALS,
                               specs, MUTATION_RATE)
@@ -413,11 +469,8 @@ class MockAlgorithmsTest(unittest.TestCase):
     Test whether it finds the best results as expected.
     """
 
-    # Initiate the build/test command and the log directory.
-    Task.InitLogCommand(None, None, 'output')
-
     # Generate the testing specs.
-    specs = self._GenerateFlagSpecifications()
+    specs = _GenerateFlagSpecifications(self._directory)
 
     # Generate the initial generations. The generation contains the base line
     # task that turns on all the flags and tasks that each turn off one of the
@@ -445,6 +498,79 @@ class MockAlgorithmsTest(unittest.TestCase):
     # be generated.
     _TestAlgorithm(cost_function, specs, generations, cost)
 
+  def testSurrogateSearch(self):
+    """Test the surrogate search.
+
+    Test whether it finds the best results as expected.
+    """
+
+    # Generate the testing specs.
+    specs = _GenerateFlagSpecifications(self._directory)
+
+    # The cost function is the summation of all the values of all the flags.
+    # Therefore, the best value is supposed to be 0, i.e., when all the flags
+    # are disabled.
+    _TestAlgorithm('sum(values[0:len(values)])', specs,
+                   _GenerateSurrogateTasks(specs), 0)
+
+    # The best result of the negative of the previous cost function is found in
+    # the task with all the flags at their largest values.
+    cost_function = 'sys.maxint - sum(values[0:len(values)])'
+    all_flags = _GenerateAllIterativeEliminationTasks(specs)[0].Pool()
+    cost = min(_ComputeCost(cost_function, specs, task.GetFlags())
+               for task in all_flags)
+    _TestAlgorithm(cost_function, specs, _GenerateSurrogateTasks(specs), cost)
+
+
+class AlgorithmComparisonTest(unittest.TestCase):
+  """This class compares the builds the algorithms take to find their best.
+
+  The mock costs are computed by the cost functions, see _ComputeCost. The
+  table of the best results and builds of the algorithms is printed.
+  """
+
+  def setUp(self):
+    # Initiate the build/test command and the log directory, in a temporary
+    # directory that also holds the mock flag specifications.
+    self._directory = tempfile.mkdtemp()
+    Task.InitLogCommand(None, None, os.path.join(self._directory, 'output'))
+
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+
+  def _Generations(self, specs):
+    """The initial generations of each algorithm, by the algorithm name."""
+
+    GAGeneration.InitMetaData(STOP_THRESHOLD, NUM_CHROMOSOMES, NUM_TRIALS,
+                              specs, MUTATION_RATE)
+    return [
+        ('hill climbing', [HillClimbingBestBranch(
+            _GenerateAllFlagsTasks(specs), set([]), specs)]),
+        ('genetic', [GAGeneration(
+            GenerateRandomGATasks(specs, NUM_CHROMOSOMES, NUM_TRIALS), set([]),
+            0)]),
+        ('iterative elimination', _GenerateAllIterativeEliminationTasks(specs)),
+        ('surrogate', _GenerateSurrogateTasks(specs)),
+    ]
+
+  def testBuildsToBestResult(self):
+    """Compare the builds to the best result of the algorithms."""
+
+    # Generate the testing specs.
+    specs = _GenerateFlagSpecifications(self._directory)
+
+    print('')
+    print('%-36s %-22s %6s %14s %6s' % ('cost function', 'algorithm', 'best',
+                                        'builds to best', 'builds'))
+    for cost_func, best_result in COMPARISON_COST_FUNCTIONS:
+      for name, generations in self._Generations(specs):
+        result, builds_to_best, builds = _RunAlgorithm(cost_func, specs,
+                                                       generations)
+        print('%-36s %-22s %6d %14d %6d' % (cost_func, name, result,
+                                            builds_to_best, builds))
+        if name == 'surrogate':
+          assert result == best_result
+
 
 if __name__ == '__main__':
   unittest.main()
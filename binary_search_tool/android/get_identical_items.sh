@@ -0,0 +1,17 @@
+#!/bin/bash -u
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+#
+# This script is intended to be used by binary_search_state.py, as
+# part of the binary search triage on the Android source tree.  This script
+# lists the Android object files that are the same in the good and bad builds,
+# so they can be left out of the binary search.
+#
+
+source android/common.sh
+
+python2 -c 'import sys, bisect_driver
+print("\n".join(sorted(bisect_driver.get_identical_objects(sys.argv[1]))))' \
+  $(dirname ${BISECT_GOOD_BUILD})
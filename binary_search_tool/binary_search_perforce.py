@@ -112,6 +112,44 @@ class BinarySearcher(object):
       self.logger.LogOutput('lo: %d hi: %d\n' % (self.lo, self.hi))
       self.current = (self.lo + self.hi) / 2
 
+    return self._IsDone()
+
+  def SetStatuses(self, statuses):
+    """Set the statuses of indices that were tested at the same time.
+
+    Args:
+      statuses: list of (index, status) pairs, as returned by the tests of
+                the indices from GetNextParallel.
+
+    Returns:
+      True if the search is complete.
+    """
+    for index, status in statuses:
+      message = ('Revision: %s index: %d returned: %d' %
+                 (self.sorted_list[index], index, status))
+      self.logger.LogOutput(message, print_to_console=verbose)
+      assert status == 0 or status == 1 or status == 125
+      self.index_log.append(index)
+      self.status_log.append(status)
+      self.points[index] = BinarySearchPoint(self.sorted_list[index], status)
+      if status == 125:
+        self.skipped_indices.append(index)
+
+    # The first bad index bounds the search, good indices past it are ignored
+    # (flaky tests).
+    bad_indices = [i for i, status in statuses if status == 1]
+    if bad_indices:
+      self.hi = min([self.hi] + bad_indices)
+    good_indices = [i for i, status in statuses
+                    if status == 0 and i < self.hi]
+    if good_indices:
+      self.lo = max([self.lo] + [i + 1 for i in good_indices])
+    self.logger.LogOutput('lo: %d hi: %d\n' % (self.lo, self.hi))
+    self.current = (self.lo + self.hi) / 2
+
+    return self._IsDone()
+
+  def _IsDone(self):
     if self.lo == self.hi:
       message = ('Search complete. First bad version: %s'
                  ' at index: %d' % (self.sorted_list[self.current], self.lo))
@@ -177,6 +215,23 @@ class BinarySearcher(object):
     self.logger.LogOutput(str(self), print_to_console=verbose)
     return self.sorted_list[self.current]
 
+  def GetNextParallel(self, count):
+    """Get up to count indices to test at the same time.
+
+    The indices split the remaining range into count + 1 equal parts, so the
+    range shrinks by a factor of count + 1 per round instead of 2.
+    """
+    candidates = [i for i in range(self.lo, self.hi)
+                  if i not in self.skipped_indices]
+    if len(candidates) <= count:
+      indices = candidates
+    else:
+      indices = sorted(set(candidates[(j + 1) * len(candidates) / (count + 1)]
+                           for j in range(count)))
+    message = ('lo: %d hi: %d next: %s\n' % (self.lo, self.hi, indices))
+    self.logger.LogOutput(message, print_to_console=verbose)
+    return indices
+
   def SetLoRevision(self, lo_revision):
     self.lo = self.sorted_list.index(lo_revision)
 
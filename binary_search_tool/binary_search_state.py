@@ -9,9 +9,11 @@ import errno
 import math
 import os
 import pickle
+import pipes
 import sys
 import tempfile
 import time
+from multiprocessing.pool import ThreadPool
 
 # Adds cros_utils to PYTHONPATH
 import common
@@ -21,9 +23,13 @@ from cros_utils import command_executer
 from cros_utils import logger
 
 import binary_search_perforce
+import bisect_driver
 
 GOOD_SET_VAR = 'BISECT_GOOD_SET'
 BAD_SET_VAR = 'BISECT_BAD_SET'
+# Index of the parallel search worker running a script, so that the workers
+# can use different devices.
+WORKER_VAR = 'BISECT_WORKER'
 
 STATE_FILE = '%s.state' % sys.argv[0]
 HIDDEN_STATE_FILE = os.path.join(
@@ -35,6 +41,24 @@ class Error(Exception):
   pass
 
 
+@contextlib.contextmanager
+def _SetFile(items):
+  """Generate a temporary set file holding items and yield its name.
+
+  Also generate the lookup table of the set file, so the compiler wrapper
+  (bisect_driver) can check if objects are in the set without scanning it.
+  """
+  with tempfile.NamedTemporaryFile() as f:
+    f.write('\n'.join(items))
+    f.flush()
+    table = f.name + bisect_driver.SET_TABLE_SUFFIX
+    bisect_driver.write_set_table(items, table)
+    try:
+      yield f.name
+    finally:
+      os.remove(table)
+
+
 @contextlib.contextmanager
 def SetFile(env_var, items):
   """Generate set files that can be used by switch/test scripts.
@@ -52,19 +76,61 @@ def SetFile(env_var, items):
     env_var: What environment variable to store the file name in.
     items: What items are in this set.
   """
-  with tempfile.NamedTemporaryFile() as f:
-    os.environ[env_var] = f.name
-    f.write('\n'.join(items))
-    f.flush()
+  with _SetFile(items) as set_file:
+    os.environ[env_var] = set_file
     yield
 
 
+@contextlib.contextmanager
+def WorkerSetFiles(worker, good_items, bad_items):
+  """Generate the good/bad set files of a parallel search worker.
+
+  Like SetFile, but os.environ is shared by all workers, so the file names are
+  exported by the commands of the worker instead (see BisectWorker.GetCommand).
+
+  Args:
+    worker: The BisectWorker running the switch/test scripts.
+    good_items: What items are in the good set.
+    bad_items: What items are in the bad set.
+  """
+  with _SetFile(good_items) as good_file, _SetFile(bad_items) as bad_file:
+    worker.env = {GOOD_SET_VAR: good_file, BAD_SET_VAR: bad_file}
+    try:
+      yield
+    finally:
+      worker.env = {}
+
+
+class BisectWorker(object):
+  """Where one of the tests of a parallel search round runs.
+
+  Each worker has its own work dir (or device, picked by the scripts from
+  $BISECT_WORKER), so it keeps track of its own switched items.
+  """
+
+  def __init__(self, index, work_dir):
+    self.index = index
+    self.work_dir = work_dir
+    self.currently_good_items = set([])
+    self.currently_bad_items = set([])
+    self.env = {}
+
+  def GetCommand(self, command):
+    """Return command, run in the work dir with the worker environment."""
+    env = dict(self.env)
+    env[WORKER_VAR] = str(self.index)
+    exports = ' '.join('export %s=%s;' % (var, pipes.quote(env[var]))
+                       for var in sorted(env))
+    return '(cd %s && %s %s)' % (pipes.quote(self.work_dir), exports, command)
+
+
 class BinarySearchState(object):
   """The binary search state class."""
 
   def __init__(self, get_initial_items, switch_to_good, switch_to_bad,
                test_setup_script, test_script, incremental, prune, iterations,
-               prune_iterations, verify, file_args, verbose):
+               prune_iterations, verify, file_args, verbose, parallel=1,
+               work_dirs=None, identical_items=None):
     """BinarySearchState constructor, see Run for full args documentation."""
     self.get_initial_items = get_initial_items
     self.switch_to_good = switch_to_good
@@ -78,6 +144,16 @@ class BinarySearchState(object):
     self.verify = verify
     self.file_args = file_args
     self.verbose = verbose
+    self.parallel = parallel
+    self.identical_items = identical_items
+    self.workers = []
+    if parallel > 1:
+      work_dirs = work_dirs or [os.getcwd()] * parallel
+      if len(work_dirs) != parallel:
+        raise Error('Need one work dir per parallel worker (%d), got %d' %
+                    (parallel, len(work_dirs)))
+      self.workers = [BisectWorker(i, os.path.abspath(d))
+                      for i, d in enumerate(work_dirs)]
 
     self.l = logger.GetLogger()
     self.ce = command_executer.GetCommandExecuter()
@@ -92,17 +168,21 @@ class BinarySearchState(object):
     self.currently_bad_items = set([])
     self.found_items = set([])
     self.known_good = set([])
+    if self.identical_items:
+      self.PruneIdenticalItems(self.identical_items)
 
     self.start_time = time.time()
 
-  def SwitchToGood(self, item_list):
-    """Switch given items to "good" set."""
+  def SwitchToGood(self, item_list, worker=None):
+    """Switch given items to "good" set (in the work dir of worker)."""
+    switched = worker or self
     if self.incremental:
       self.l.LogOutput(
           'Incremental set. Wanted to switch %s to good' % str(item_list),
           print_to_console=self.verbose)
       incremental_items = [
-          item for item in item_list if item not in self.currently_good_items
+          item for item in item_list
+          if item not in switched.currently_good_items
       ]
       item_list = incremental_items
       self.l.LogOutput(
@@ -114,18 +194,21 @@ class BinarySearchState(object):
 
     self.l.LogOutput(
         'Switching %s to good' % str(item_list), print_to_console=self.verbose)
-    self.RunSwitchScript(self.switch_to_good, item_list)
-    self.currently_good_items = self.currently_good_items.union(set(item_list))
-    self.currently_bad_items.difference_update(set(item_list))
-
-  def SwitchToBad(self, item_list):
-    """Switch given items to "bad" set."""
+    self.RunSwitchScript(self.switch_to_good, item_list, worker)
+    switched.currently_good_items = switched.currently_good_items.union(
+        set(item_list))
+    switched.currently_bad_items.difference_update(set(item_list))
+
+  def SwitchToBad(self, item_list, worker=None):
+    """Switch given items to "bad" set (in the work dir of worker)."""
+    switched = worker or self
     if self.incremental:
       self.l.LogOutput(
           'Incremental set. Wanted to switch %s to bad' % str(item_list),
           print_to_console=self.verbose)
       incremental_items = [
-          item for item in item_list if item not in self.currently_bad_items
+          item for item in item_list
+          if item not in switched.currently_bad_items
       ]
       item_list = incremental_items
       self.l.LogOutput(
@@ -137,26 +220,33 @@ class BinarySearchState(object):
 
     self.l.LogOutput(
         'Switching %s to bad' % str(item_list), print_to_console=self.verbose)
-    self.RunSwitchScript(self.switch_to_bad, item_list)
-    self.currently_bad_items = self.currently_bad_items.union(set(item_list))
-    self.currently_good_items.difference_update(set(item_list))
+    self.RunSwitchScript(self.switch_to_bad, item_list, worker)
+    switched.currently_bad_items = switched.currently_bad_items.union(
+        set(item_list))
+    switched.currently_good_items.difference_update(set(item_list))
 
-  def RunSwitchScript(self, switch_script, item_list):
+  def _GetCommand(self, command, worker):
+    return worker.GetCommand(command) if worker else command
+
+  def RunSwitchScript(self, switch_script, item_list, worker=None):
     """Pass given items to switch script.
 
     Args:
       switch_script: path to switch script
       item_list: list of all items to be switched
+      worker: BisectWorker to run the switch script for, if searching in
+              parallel
     """
     if self.file_args:
       with tempfile.NamedTemporaryFile() as f:
         f.write('\n'.join(item_list))
         f.flush()
-        command = '%s %s' % (switch_script, f.name)
+        command = self._GetCommand('%s %s' % (switch_script, f.name), worker)
         ret, _, _ = self.ce.RunCommandWExceptionCleanup(
             command, print_to_console=self.verbose)
     else:
-      command = '%s %s' % (switch_script, ' '.join(item_list))
+      command = self._GetCommand(
+          '%s %s' % (switch_script, ' '.join(item_list)), worker)
       try:
         ret, _, _ = self.ce.RunCommandWExceptionCleanup(
             command, print_to_console=self.verbose)
@@ -167,21 +257,54 @@ class BinarySearchState(object):
           raise
     assert ret == 0, 'Switch script %s returned %d' % (switch_script, ret)
 
-  def TestScript(self):
+  def TestScript(self, worker=None):
     """Run test script and return exit code from script."""
-    command = self.test_script
+    command = self._GetCommand(self.test_script, worker)
     ret, _, _ = self.ce.RunCommandWExceptionCleanup(command)
     return ret
 
-  def TestSetupScript(self):
+  def TestSetupScript(self, worker=None):
     """Run test setup script and return exit code from script."""
     if not self.test_setup_script:
       return 0
 
-    command = self.test_setup_script
+    command = self._GetCommand(self.test_setup_script, worker)
     ret, _, _ = self.ce.RunCommandWExceptionCleanup(command)
     return ret
 
+  def TestItems(self, worker, bad_items, good_items):
+    """Switch and test the given items in the work dir of worker.
+
+    Returns:
+      The exit code of the test (setup) script.
+    """
+    with WorkerSetFiles(worker, good_items, bad_items):
+      self.SwitchToGood(good_items, worker)
+      self.SwitchToBad(bad_items, worker)
+      status = self.TestSetupScript(worker)
+      if status == 0:
+        status = self.TestScript(worker)
+    return status
+
+  def TestInParallel(self, indices):
+    """Test the given border indices at the same time, one per worker.
+
+    Returns:
+      List of (index, status) pairs.
+    """
+
+    def _Test(args):
+      worker, index = args
+      bad_items, good_items = self.GetItemsAt(index)
+      return index, self.TestItems(worker, bad_items, good_items)
+
+    pool = ThreadPool(len(indices))
+    try:
+      return pool.map(_Test, zip(self.workers, indices))
+    finally:
+      pool.close()
+      pool.join()
+
   def DoVerify(self):
     """Verify correctness of test environment.
 
@@ -195,6 +318,10 @@ class BinarySearchState(object):
     self.l.LogOutput('VERIFICATION')
     self.l.LogOutput('Beginning tests to verify good/bad sets\n')
 
+    if self.workers:
+      self._DoVerifyInWorker(self.workers[0])
+      return
+
     self._OutputProgress('Verifying items from GOOD set\n')
     with SetFile(GOOD_SET_VAR, self.all_items), SetFile(BAD_SET_VAR, []):
       self.l.LogOutput('Resetting all items to good to verify.')
@@ -216,6 +343,26 @@ class BinarySearchState(object):
         status = self.TestScript()
       assert status == 1, 'When reset_to_bad, status should be 1.'
 
+  def _DoVerifyInWorker(self, worker):
+    """DoVerify for parallel searches, in the work dir of worker."""
+    self._OutputProgress('Verifying items from GOOD set\n')
+    with WorkerSetFiles(worker, self.all_items, []):
+      self.l.LogOutput('Resetting all items to good to verify.')
+      self.SwitchToGood(self.all_items, worker)
+      status = self.TestSetupScript(worker)
+      assert status == 0, 'When reset_to_good, test setup should succeed.'
+      status = self.TestScript(worker)
+      assert status == 0, 'When reset_to_good, status should be 0.'
+
+    self._OutputProgress('Verifying items from BAD set\n')
+    with WorkerSetFiles(worker, [], self.all_items):
+      self.l.LogOutput('Resetting all items to bad to verify.')
+      self.SwitchToBad(self.all_items, worker)
+      status = self.TestSetupScript(worker)
+      if status == 0:
+        status = self.TestScript(worker)
+      assert status == 1, 'When reset_to_bad, status should be 1.'
+
   def DoSearch(self):
     """Perform full search for bad items.
 
@@ -284,6 +431,14 @@ class BinarySearchState(object):
       self.OutputIterationProgress()
 
       self.search_cycles += 1
+      if self.workers:
+        indices = self.binary_search.GetNextParallel(len(self.workers))
+        statuses = self.TestInParallel(indices)
+        terminated = self.binary_search.SetStatuses(statuses)
+        if terminated:
+          self.l.LogOutput('Terminated!', print_to_console=self.verbose)
+        continue
+
       [bad_items, good_items] = self.GetNextItems()
 
       with SetFile(GOOD_SET_VAR, good_items), SetFile(BAD_SET_VAR, bad_items):
@@ -317,6 +472,38 @@ class BinarySearchState(object):
     all_items = out.split()
     self.PopulateItemsUsingList(all_items)
 
+  def PruneIdenticalItems(self, command):
+    """Take the items that are the same in the good and bad sets out of search.
+
+    Switching these items can't change the test result, so they are handled
+    like known good items: still switched to good, but never searched.
+
+    Args:
+      command: path to executable that will enumerate the identical items.
+    """
+    _, out, _ = self.ce.RunCommandWExceptionCleanup(
+        command, return_output=True, print_to_console=self.verbose)
+    identical_items = set(out.split())
+    items = [item for item in self.all_items if item not in identical_items]
+    num_pruned = len(self.all_items) - len(items)
+    if not num_pruned:
+      self.l.LogOutput('No identical items to prune.')
+      return
+    # A single item is never searched, so keep the search as it is then.
+    if len(items) < 2:
+      self.l.LogWarning('Only %d of %d items differ, not pruning identical '
+                        'items.' % (len(items), len(self.all_items)))
+      return
+
+    saved = (self.EstimateSearchCycles(len(self.all_items)) -
+             self.EstimateSearchCycles(len(items)))
+    self.l.LogOutput('Pruned %d identical items out of %d, saving %d search '
+                     'iterations per bad item.' %
+                     (num_pruned, len(self.all_items), saved))
+    self.known_good.update(item for item in self.all_items
+                           if item in identical_items)
+    self.PopulateItemsUsingList(items)
+
   def PopulateItemsUsingList(self, all_items):
     """Update all_items and binary searching logic from list.
 
@@ -385,6 +572,9 @@ class BinarySearchState(object):
       # a previous switch_script corrupted the environment.
       bss.currently_good_items = set([])
       bss.currently_bad_items = set([])
+      for worker in bss.workers:
+        worker.currently_good_items = set([])
+        worker.currently_bad_items = set([])
 
       binary_search_perforce.verbose = bss.verbose
       return bss
@@ -403,7 +593,10 @@ class BinarySearchState(object):
     """Get next items for binary search based on result of the last test run."""
     border_item = self.binary_search.GetNext()
     index = self.all_items.index(border_item)
+    return self.GetItemsAt(index)
 
+  def GetItemsAt(self, index):
+    """Get the bad and good items to test the item at index as border item."""
     next_bad_items = self.all_items[:index + 1]
     next_good_items = self.all_items[index + 1:] + list(self.known_good)
 
@@ -434,13 +627,17 @@ class BinarySearchState(object):
     progress = progress % (self.ElapsedTimeString(), progress_text)
     self.l.LogOutput(progress)
 
+  def EstimateSearchCycles(self, num_items):
+    """Return the number of search iterations to find a bad item."""
+    return int(math.ceil(math.log(num_items, self.parallel + 1)))
+
   def OutputIterationProgress(self):
     out = ('Search %d of estimated %d.\n'
            'Prune %d of max %d.\n'
            'Current bad items found:\n'
            '%s\n')
     out = out % (self.search_cycles + 1,
-                 math.ceil(math.log(len(self.all_items), 2)),
+                 self.EstimateSearchCycles(len(self.all_items)),
                  self.prune_cycles + 1, self.prune_iterations,
                  ', '.join(self.found_items))
     self._OutputProgress(out)
@@ -471,7 +668,10 @@ class MockBinarySearchState(BinarySearchState):
         'prune_iterations': 100,
         'verify': True,
         'file_args': False,
-        'verbose': False
+        'verbose': False,
+        'parallel': 1,
+        'work_dirs': None,
+        'identical_items': None
     }
     default_kwargs.update(kwargs)
     super(MockBinarySearchState, self).__init__(**default_kwargs)
@@ -489,6 +689,7 @@ def _CanonicalizeScript(script_name):
   script_name = os.path.expanduser(script_name)
   if not script_name.startswith('/'):
     return os.path.join('.', script_name)
+  return script_name
 
 
 def Run(get_initial_items,
@@ -503,7 +704,10 @@ def Run(get_initial_items,
         verify=True,
         prune_iterations=100,
         verbose=False,
-        resume=False):
+        resume=False,
+        parallel=1,
+        work_dirs=None,
+        identical_items=None):
   """Run binary search tool. Equivalent to running through terminal.
 
   Args:
@@ -528,6 +732,16 @@ def Run(get_initial_items,
     prune_iterations: Max number of bad items to search for.
     verbose: If True will print extra debug information to user.
     resume: If True will resume using STATE_FILE.
+    parallel: Number of border items to test at the same time in each search
+              round. The switch/test scripts of each test run in their own
+              work dir, with $BISECT_WORKER set to the index of the test.
+    work_dirs: List of parallel work dirs, one per parallel test. Defaults to
+               the current dir, in which case the scripts should use
+               $BISECT_WORKER to keep the tests apart (e.g. test on different
+               devices).
+    identical_items: Script to enumerate the items that are the same in the
+                     good and bad sets (e.g. byte identical objects). These
+                     items are left out of the search.
 
   Returns:
     0 for success, error otherwise
@@ -546,14 +760,28 @@ def Run(get_initial_items,
       test_setup_script = _CanonicalizeScript(test_setup_script)
     test_script = _CanonicalizeScript(test_script)
     get_initial_items = _CanonicalizeScript(get_initial_items)
+    if identical_items:
+      identical_items = _CanonicalizeScript(identical_items)
     incremental = not noincremental
+    if parallel > 1:
+      # The scripts run in the work dirs of the workers.
+      switch_to_good = os.path.abspath(switch_to_good)
+      switch_to_bad = os.path.abspath(switch_to_bad)
+      if test_setup_script:
+        test_setup_script = os.path.abspath(test_setup_script)
+      test_script = os.path.abspath(test_script)
 
     binary_search_perforce.verbose = verbose
 
-    bss = BinarySearchState(get_initial_items, switch_to_good, switch_to_bad,
-                            test_setup_script, test_script, incremental, prune,
-                            iterations, prune_iterations, verify, file_args,
-                            verbose)
+    try:
+      bss = BinarySearchState(get_initial_items, switch_to_good, switch_to_bad,
+                              test_setup_script, test_script, incremental,
+                              prune, iterations, prune_iterations, verify,
+                              file_args, verbose, parallel, work_dirs,
+                              identical_items)
+    except Error as e:
+      logger.GetLogger().LogError(e)
+      return 1
     bss.DoVerify()
 
   try:
@@ -181,6 +181,7 @@ class BisectObject(Bisector):
     self.method_name = 'ChromeOS Object'
     self.default_kwargs = {
         'get_initial_items': 'sysroot_wrapper/get_initial_items.sh',
+        'identical_items': 'sysroot_wrapper/get_identical_items.sh',
         'switch_to_good': 'sysroot_wrapper/switch_to_good.sh',
         'switch_to_bad': 'sysroot_wrapper/switch_to_bad.sh',
         'test_setup_script': 'sysroot_wrapper/test_setup.sh',
@@ -236,6 +237,7 @@ class BisectAndroid(Bisector):
     self.method_name = 'Android'
     self.default_kwargs = {
         'get_initial_items': 'android/get_initial_items.sh',
+        'identical_items': 'android/get_identical_items.sh',
         'switch_to_good': 'android/switch_to_good.sh',
         'switch_to_bad': 'android/switch_to_bad.sh',
         'test_setup_script': 'android/test_setup.sh',
@@ -19,15 +19,30 @@ from __future__ import print_function
 
 import contextlib
 import fcntl
+import hashlib
+import mmap
 import os
 import shutil
+import struct
 import subprocess
 import sys
+import tempfile
+import zlib
 
 VALID_MODES = ['POPULATE_GOOD', 'POPULATE_BAD', 'TRIAGE']
 GOOD_CACHE = 'good'
 BAD_CACHE = 'bad'
 LIST_FILE = os.path.join(GOOD_CACHE, '_LIST')
+# Every cached file is stored once per content in STORE_DIR, and hard linked
+# into the good/bad caches. The digests of the objects in the _LIST of a cache
+# are in its DIGESTS_FILE, as "<digest> <object path>" lines.
+STORE_DIR = '_OBJECTS'
+DIGESTS_FILE = '_DIGESTS'
+# The binary search tool writes a lookup table next to each good/bad set file,
+# so the wrapper doesn't have to scan the sets for every compile.
+SET_TABLE_SUFFIX = '.table'
+_TABLE_MAGIC = 'BISECT_SET_TABLE1\n'
+_TABLE_SLOT = struct.Struct('<Q')
 
 CONTINUE_ON_MISSING = os.environ.get('BISECT_CONTINUE_ON_MISSING', None) == '1'
 WRAPPER_SAFE_MODE = os.environ.get('BISECT_WRAPPER_SAFE_MODE', None) == '1'
@@ -86,6 +101,80 @@ def log_to_file(path, execargs, link_from=None, link_to=None):
       log.write('%s -> %s\n' % (link_from, link_to))
 
 
+def _hash_name(name):
+  return zlib.crc32(name) & 0xffffffff
+
+
+def write_set_table(items, path):
+  """Write a hash table of items to path, for lookups with in_set_table.
+
+  The table is an open addressing hash table: after a header holding the
+  number of slots, every slot holds the file offset of an item name (0 if the
+  slot is empty), followed by the newline terminated item names.
+  """
+  items = set(items)
+  num_slots = 1
+  while num_slots < 2 * len(items):
+    num_slots *= 2
+  mask = num_slots - 1
+  header_size = len(_TABLE_MAGIC) + _TABLE_SLOT.size * (num_slots + 1)
+
+  slots = [0] * num_slots
+  names = []
+  offset = header_size
+  for item in items:
+    i = _hash_name(item) & mask
+    while slots[i]:
+      i = (i + 1) & mask
+    slots[i] = offset
+    names.append(item)
+    offset += len(item) + 1
+
+  with open(path, 'wb') as f:
+    f.write(_TABLE_MAGIC)
+    f.write(struct.pack('<%dQ' % (num_slots + 1), num_slots, *slots))
+    for name in names:
+      f.write('%s\n' % name)
+
+
+def in_set_table(name, path):
+  """Check if name is in the table written to path by write_set_table."""
+  with open(path, 'rb') as f:
+    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  try:
+    if table[:len(_TABLE_MAGIC)] != _TABLE_MAGIC:
+      raise Error('%s is not a set table' % path)
+    slots_start = len(_TABLE_MAGIC) + _TABLE_SLOT.size
+    num_slots, = _TABLE_SLOT.unpack_from(table, len(_TABLE_MAGIC))
+    mask = num_slots - 1
+    i = _hash_name(name) & mask
+    while True:
+      offset, = _TABLE_SLOT.unpack_from(table,
+                                        slots_start + i * _TABLE_SLOT.size)
+      if not offset:
+        return False
+      end = offset + len(name)
+      if table[offset:end] == name and table[end] == '\n':
+        return True
+      i = (i + 1) & mask
+  finally:
+    table.close()
+
+
+def get_set_table(set_var):
+  """Get the lookup table of the set file in environment variable set_var.
+
+  Returns:
+    Path of the table, or empty string if there is none (e.g. the set file
+    wasn't generated by the binary search tool).
+  """
+  set_file = os.environ.get(set_var)
+  if not set_file:
+    return ''
+  table = set_file + SET_TABLE_SUFFIX
+  return table if os.path.isfile(table) else ''
+
+
 def exec_and_return(execargs):
   """Execute process and return.
 
@@ -102,6 +191,10 @@ def which_cache(obj_file):
   the full set of bad objects and full set of good objects. We use this to
   determine where an object file should be linked from (good or bad).
   """
+  bad_set_table = get_set_table('BISECT_BAD_SET')
+  if bad_set_table:
+    return BAD_CACHE if in_set_table(obj_file, bad_set_table) else GOOD_CACHE
+
   bad_set_file = os.environ.get('BISECT_BAD_SET')
   ret = subprocess.call(['grep', '-x', '-q', obj_file, bad_set_file])
   if ret == 0:
@@ -187,6 +280,13 @@ def in_object_list(obj_name, list_filename):
   if not obj_name:
     return False
 
+  # The good and bad sets of a search iteration together hold all objects of
+  # the list.
+  set_tables = [get_set_table('BISECT_GOOD_SET'),
+                get_set_table('BISECT_BAD_SET')]
+  if all(set_tables):
+    return any(in_set_table(obj_name, table) for table in set_tables)
+
   with lock_file(list_filename, 'r') as list_file:
     for line in list_file:
       if line.strip() == obj_name:
@@ -216,8 +316,56 @@ def get_side_effects(execargs):
   return side_effects
 
 
+def file_digest(path):
+  """Get the hex SHA-1 digest of the contents of the file at path."""
+  digest = hashlib.sha1()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 20), ''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def store_file(bisect_dir, abs_file_path):
+  """Add file to the content addressed object store of the bisection.
+
+  Returns:
+    Tuple of the digest of the file and its path in the store. Files with
+    the same contents are only stored once.
+  """
+  digest = file_digest(abs_file_path)
+  stored_dir = os.path.join(bisect_dir, STORE_DIR, digest[:2])
+  stored_path = os.path.join(stored_dir, digest)
+  if not os.path.exists(stored_path):
+    makedirs(stored_dir)
+    # Other compiles may store the same contents at the same time, so move
+    # the copy into place atomically.
+    fd, temp_path = tempfile.mkstemp(dir=stored_dir)
+    os.close(fd)
+    try:
+      shutil.copy2(abs_file_path, temp_path)
+      os.rename(temp_path, stored_path)
+    except:
+      os.remove(temp_path)
+      raise
+  return digest, stored_path
+
+
+def link_file(src, dst):
+  """Hard link src to dst, or copy it if the file system can't link."""
+  if os.path.lexists(dst):
+    os.remove(dst)
+  try:
+    os.link(src, dst)
+  except OSError:
+    shutil.copy2(src, dst)
+
+
 def cache_file(execargs, bisect_dir, cache, abs_file_path):
-  """Cache compiler output file (.o/.d/.dwo)."""
+  """Cache compiler output file (.o/.d/.dwo).
+
+  Returns:
+    The digest of the cached file, None if there is no file to cache.
+  """
   # os.path.join fails with absolute paths, use + instead
   bisect_path = os.path.join(bisect_dir, cache) + abs_file_path
   bisect_path_dir = os.path.dirname(bisect_path)
@@ -227,10 +375,43 @@ def cache_file(execargs, bisect_dir, cache, abs_file_path):
 
   try:
     if os.path.exists(abs_file_path):
-      shutil.copy2(abs_file_path, bisect_path)
+      digest, stored_path = store_file(bisect_dir, abs_file_path)
+      link_file(stored_path, bisect_path)
+      return digest
   except Exception:
     print('Could not cache file %s' % abs_file_path, file=sys.stderr)
     raise
+  return None
+
+
+def read_digests(bisect_dir, cache):
+  """Get the digests of the objects in the given cache (good/bad).
+
+  Returns:
+    Dict of object path to digest of the cached object.
+  """
+  digests = {}
+  digests_file = os.path.join(bisect_dir, cache, DIGESTS_FILE)
+  if not os.path.exists(digests_file):
+    return digests
+  with lock_file(digests_file, 'r') as f:
+    for line in f:
+      digest, _, obj_path = line.rstrip('\n').partition(' ')
+      # Objects compiled again are cached again, the last one counts.
+      digests[obj_path] = digest
+  return digests
+
+
+def get_identical_objects(bisect_dir):
+  """Get the objects that are the same in the good and bad caches.
+
+  Switching these objects between good and bad changes nothing, so they can
+  be left out of the bisection.
+  """
+  good_digests = read_digests(bisect_dir, GOOD_CACHE)
+  bad_digests = read_digests(bisect_dir, BAD_CACHE)
+  return set(obj_path for obj_path, digest in good_digests.iteritems()
+             if bad_digests.get(obj_path) == digest)
 
 
 def restore_file(bisect_dir, cache, abs_file_path):
@@ -251,8 +432,9 @@ def bisect_populate(execargs, bisect_dir, population_name):
 
   Extract the necessary information for bisection from the compiler
   execution arguments and put it into the bisection cache. This
-  includes copying the created object file, adding the object
-  file path to the cache list and keeping a log of the execution.
+  includes storing the created object file, adding the object
+  file path (and its digest) to the cache list and keeping a log of the
+  execution.
 
   Args:
     execargs: compiler execution arguments.
@@ -268,11 +450,15 @@ def bisect_populate(execargs, bisect_dir, population_name):
   if not full_obj_path:
     return
 
-  cache_file(execargs, bisect_dir, population_name, full_obj_path)
+  digest = cache_file(execargs, bisect_dir, population_name, full_obj_path)
 
   population_dir = os.path.join(bisect_dir, population_name)
   with lock_file(os.path.join(population_dir, '_LIST'), 'a') as object_list:
     object_list.write('%s\n' % full_obj_path)
+  if digest:
+    digests_file = os.path.join(population_dir, DIGESTS_FILE)
+    with lock_file(digests_file, 'a') as digests:
+      digests.write('%s %s\n' % (digest, full_obj_path))
 
   for side_effect in get_side_effects(execargs):
     cache_file(execargs, bisect_dir, population_name, side_effect)
@@ -0,0 +1,112 @@
+#!/usr/bin/python2
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Measures the overhead of the compiler wrapper per compile when triaging.
+
+Sets up a bisection dir with a _LIST of --objects objects, half of them bad,
+and times bisect_driver.bisect_triage for --compiles compiles of listed
+objects, with (table) and without (scan) the lookup tables of the good/bad
+sets.
+
+Example:
+  ./bisect_driver_benchmark.py --objects=40000 --compiles=200
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import bisect_driver
+
+
+def SetUp(work_dir, num_objects, num_compiles):
+  """Write the bisection dir and good/bad sets, create compiled objects.
+
+  Returns:
+    The compiler arguments of the compiles to time.
+  """
+  objects = [os.path.join(work_dir, 'out', '%d.o' % i)
+             for i in range(num_objects)]
+  bisect_dir = os.path.join(work_dir, 'bisect')
+  bisect_driver.makedirs(os.path.join(bisect_dir, bisect_driver.GOOD_CACHE))
+  with open(os.path.join(bisect_dir, bisect_driver.LIST_FILE), 'w') as f:
+    f.write(''.join('%s\n' % obj for obj in objects))
+
+  random.shuffle(objects)
+  good_items = objects[:num_objects / 2]
+  bad_items = objects[num_objects / 2:]
+  for var, items in [('BISECT_GOOD_SET', good_items),
+                     ('BISECT_BAD_SET', bad_items)]:
+    set_file = os.path.join(work_dir, var)
+    with open(set_file, 'w') as f:
+      f.write('\n'.join(items))
+    bisect_driver.write_set_table(items,
+                                  set_file + bisect_driver.SET_TABLE_SUFFIX)
+    os.environ[var] = set_file
+
+  # The objects are already in place, so triaging doesn't have to restore
+  # them from the caches.
+  bisect_driver.makedirs(os.path.join(work_dir, 'out'))
+  compiled = random.sample(objects, min(num_compiles, num_objects))
+  for obj in compiled:
+    open(obj, 'w').close()
+  return bisect_dir, [['cc', '-c', '-o', obj] for obj in compiled]
+
+
+def TimeTriage(bisect_dir, compiles, mode):
+  """Returns the average seconds bisect_triage takes per compile."""
+  tables = [os.environ[var] + bisect_driver.SET_TABLE_SUFFIX
+            for var in ['BISECT_GOOD_SET', 'BISECT_BAD_SET']]
+  hidden_tables = [table + '.hidden' for table in tables]
+  if mode == 'scan':
+    for table, hidden_table in zip(tables, hidden_tables):
+      os.rename(table, hidden_table)
+  try:
+    start = time.time()
+    for execargs in compiles:
+      bisect_driver.bisect_triage(execargs, bisect_dir)
+    return (time.time() - start) / len(compiles)
+  finally:
+    if mode == 'scan':
+      for table, hidden_table in zip(tables, hidden_tables):
+        os.rename(hidden_table, table)
+
+
+def Main(argv):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--objects',
+                      type=int,
+                      default=40000,
+                      help='Number of objects in the bisection.')
+  parser.add_argument('--compiles',
+                      type=int,
+                      default=200,
+                      help='Number of compiles to time.')
+  parser.add_argument('--modes',
+                      default='scan,table',
+                      help='Comma separated lookup modes: scan (_LIST scan '
+                      'and grep of the bad set) and/or table (set tables).')
+  options = parser.parse_args(argv)
+
+  work_dir = tempfile.mkdtemp()
+  try:
+    bisect_dir, compiles = SetUp(work_dir, options.objects, options.compiles)
+    for mode in options.modes.split(','):
+      elapsed = TimeTriage(bisect_dir, compiles, mode)
+      print('%8d objects %-6s %10.1f us/compile' % (options.objects, mode,
+                                                    elapsed * 1e6))
+  finally:
+    shutil.rmtree(work_dir)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(Main(sys.argv[1:]))
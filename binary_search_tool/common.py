@@ -259,3 +259,27 @@ def _BuildArgsDict(args):
       help=('Resume bisection tool execution from state file.'
             'Useful if the last bisection was terminated '
             'before it could properly finish.'))
+  args.AddArgument(
+      '-d',
+      '--identical_items',
+      dest='identical_items',
+      help=('Script to enumerate the items that are the same in the good and '
+            'bad sets. These items are not searched (but still switched to '
+            'good).'))
+  args.AddArgument(
+      '-P',
+      '--parallel',
+      dest='parallel',
+      type=int,
+      help=('Number of items to test at the same time in each search round. '
+            'The switch and test scripts of each test run in their own work '
+            'dir (see --work_dirs), with $BISECT_WORKER set to the index of '
+            'the test. Defaults to 1.'),
+      default=1)
+  args.AddArgument(
+      '-w',
+      '--work_dirs',
+      dest='work_dirs',
+      type=lambda dirs: dirs.split(','),
+      help=('Comma separated work dirs of the parallel tests, one per test. '
+            'Defaults to the current dir for all tests.'))
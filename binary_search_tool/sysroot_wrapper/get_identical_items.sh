@@ -0,0 +1,9 @@
+#!/bin/bash -u
+
+source common/common.sh
+
+# Objects that were compiled to the same contents in the good and bad builds
+# (see the _DIGESTS files written by the compiler wrapper).
+python2 -c 'import sys, bisect_driver
+print("\n".join(sorted(bisect_driver.get_identical_objects(sys.argv[1]))))' \
+  ${bisect_dir}
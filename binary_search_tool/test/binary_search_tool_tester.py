@@ -7,14 +7,18 @@ from __future__ import print_function
 
 __author__ = 'shenhan@google.com (Han Shen)'
 
+import math
 import os
 import random
+import shutil
 import sys
+import tempfile
 import unittest
 
 from cros_utils import command_executer
 from binary_search_tool import binary_search_state
 from binary_search_tool import bisect
+from binary_search_tool import bisect_driver
 
 import common
 import gen_obj
@@ -317,6 +321,113 @@ class BisectingUtilsTest(unittest.TestCase):
     self.assertEquals(ret, 0)
     self.check_output()
 
+  def test_set_table(self):
+    items = ['/out/%d.o' % i for i in range(100)]
+    with binary_search_state.SetFile('BISECT_GOOD_SET', items[:50]), \
+        binary_search_state.SetFile('BISECT_BAD_SET', items[50:]):
+      table = bisect_driver.get_set_table('BISECT_BAD_SET')
+      self.assertTrue(table)
+      self.assertTrue(bisect_driver.in_set_table('/out/50.o', table))
+      self.assertFalse(bisect_driver.in_set_table('/out/5.o', table))
+      self.assertFalse(bisect_driver.in_set_table('/out/50', table))
+      self.assertEquals(bisect_driver.which_cache('/out/99.o'),
+                        bisect_driver.BAD_CACHE)
+      self.assertEquals(bisect_driver.which_cache('/out/0.o'),
+                        bisect_driver.GOOD_CACHE)
+      self.assertTrue(bisect_driver.in_object_list('/out/0.o', None))
+      self.assertFalse(bisect_driver.in_object_list('/out/100.o', None))
+    self.assertFalse(os.path.exists(table))
+
+  def test_populate_object_store(self):
+    work_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, work_dir)
+    bisect_dir = os.path.join(work_dir, 'bisect')
+    same_obj = os.path.join(work_dir, 'same.o')
+    diff_obj = os.path.join(work_dir, 'diff.o')
+
+    def Populate(population_name, diff_contents):
+      for obj, contents in [(same_obj, 'same'), (diff_obj, diff_contents)]:
+        with open(obj, 'w') as f:
+          f.write(contents)
+        # Stands in for the compiler: sh -c true -o <obj>
+        bisect_driver.bisect_populate(['sh', '-c', 'true', '-o', obj],
+                                      bisect_dir, population_name)
+
+    Populate(bisect_driver.GOOD_CACHE, 'good')
+    Populate(bisect_driver.BAD_CACHE, 'bad')
+
+    def Cached(cache, obj):
+      return os.path.join(bisect_dir, cache) + obj
+
+    good_same = os.stat(Cached(bisect_driver.GOOD_CACHE, same_obj))
+    bad_same = os.stat(Cached(bisect_driver.BAD_CACHE, same_obj))
+    self.assertEquals(good_same.st_ino, bad_same.st_ino)
+    with open(Cached(bisect_driver.BAD_CACHE, diff_obj)) as f:
+      self.assertEquals(f.read(), 'bad')
+    self.assertEquals(
+        bisect_driver.read_digests(bisect_dir, bisect_driver.GOOD_CACHE),
+        {same_obj: bisect_driver.file_digest(same_obj),
+         diff_obj: bisect_driver.file_digest(
+             Cached(bisect_driver.GOOD_CACHE, diff_obj))})
+    self.assertEquals(bisect_driver.get_identical_objects(bisect_dir),
+                      set([same_obj]))
+
+  def test_prune_identical_items(self):
+    objects = common.ReadObjectsFile()
+    good_objects = [str(i) for i, obj in enumerate(objects) if obj == 0]
+    bad_objects = [str(i) for i, obj in enumerate(objects) if obj == 1]
+    bss = binary_search_state.MockBinarySearchState(
+        get_initial_items='./gen_init_list.py',
+        switch_to_good='./switch_to_good.py',
+        switch_to_bad='./switch_to_bad.py',
+        test_script='./is_good.py',
+        prune=True,
+        file_args=True,
+        identical_items='echo %s' % ' '.join(good_objects[1:]))
+    self.assertEquals(sorted(bss.all_items), sorted(bad_objects +
+                                                    good_objects[:1]))
+    bss.DoVerify()
+    bss.DoSearch()
+    self.assertEquals(bss.found_items, set(bad_objects))
+
+  def _MakeWorkDirs(self, count):
+    work_dirs = [tempfile.mkdtemp() for _ in range(count)]
+    for work_dir in work_dirs:
+      for f in [common.OBJECTS_FILE, common.WORKING_SET_FILE, 'is_setup']:
+        shutil.copy(f, work_dir)
+      self.addCleanup(shutil.rmtree, work_dir)
+    return work_dirs
+
+  def test_parallel(self):
+    ret = binary_search_state.Run(get_initial_items='./gen_init_list.py',
+                                  switch_to_good='./switch_to_good.py',
+                                  switch_to_bad='./switch_to_bad.py',
+                                  test_script='./is_good.py',
+                                  prune=True,
+                                  file_args=True,
+                                  parallel=3,
+                                  work_dirs=self._MakeWorkDirs(3))
+    self.assertEquals(ret, 0)
+    self.check_output()
+
+  def test_parallel_search_rounds(self):
+    bss = binary_search_state.MockBinarySearchState(
+        get_initial_items='./gen_init_list.py',
+        switch_to_good=os.path.abspath('switch_to_good.py'),
+        switch_to_bad=os.path.abspath('switch_to_bad.py'),
+        test_script=os.path.abspath('is_good.py'),
+        prune=False,
+        file_args=True,
+        parallel=3,
+        work_dirs=self._MakeWorkDirs(3))
+    bss.DoSearch()
+    self.assertEquals(len(bss.found_items), 1)
+    self.assertEquals(common.ReadObjectsFile().index(1),
+                      int(bss.found_items.pop()))
+    # Every round splits the remaining items in 4.
+    self.assertLessEqual(bss.search_cycles,
+                         math.ceil(math.log(len(bss.all_items), 4)))
+
   def check_output(self):
     _, out, _ = command_executer.GetCommandExecuter().RunCommandWOutput(
         ('grep "Bad items are: " logs/binary_search_tool_tester.py.out | '
@@ -410,6 +521,11 @@ def Main(argv):
   suite.addTest(BisectingUtilsTest('test_no_prune'))
   suite.addTest(BisectingUtilsTest('test_set_file'))
   suite.addTest(BisectingUtilsTest('test_noincremental_prune'))
+  suite.addTest(BisectingUtilsTest('test_set_table'))
+  suite.addTest(BisectingUtilsTest('test_populate_object_store'))
+  suite.addTest(BisectingUtilsTest('test_prune_identical_items'))
+  suite.addTest(BisectingUtilsTest('test_parallel'))
+  suite.addTest(BisectingUtilsTest('test_parallel_search_rounds'))
   suite.addTest(BisectTest('test_full_bisector'))
   suite.addTest(BisectStressTest('test_every_obj_bad'))
   suite.addTest(BisectStressTest('test_every_index_is_bad'))
@@ -17,11 +17,17 @@ import time
 
 import logger
 import misc
+import ssh_master
 
 mock_default = False
 
 LOG_LEVEL = ('none', 'quiet', 'average', 'verbose')
 
+# Size of the reads from the pipes of a command.
+READ_SIZE = 65536
+# Captured output larger than this is spilled to a temp file.
+OUTPUT_SPOOL_THRESHOLD = 64 * 1024 * 1024
+
 
 def InitCommandExecuter(mock=False):
   # pylint: disable=global-statement
@@ -38,6 +44,92 @@ def GetCommandExecuter(logger_to_set=None, mock=False, log_level='verbose'):
     return CommandExecuter(log_level, logger_to_set)
 
 
+class CommandOutput(object):
+  """Captured output of a command.
+
+  The output is kept as a list of chunks, so capturing it takes linear time,
+  and is spilled to a temp file once it grows larger than spool_threshold.
+  """
+
+  def __init__(self, spool_threshold=None):
+    if spool_threshold is None:
+      spool_threshold = OUTPUT_SPOOL_THRESHOLD
+    self._spool_threshold = spool_threshold
+    self._chunks = []
+    self._size = 0
+    self._file = None
+
+  def __len__(self):
+    return self._size
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+  def IsSpooled(self):
+    return self._file is not None
+
+  def Write(self, data):
+    if not data:
+      return
+    self._size += len(data)
+    if self._file is None:
+      self._chunks.append(data)
+      if self._size > self._spool_threshold:
+        self._file = tempfile.TemporaryFile(prefix='command_output.')
+        for chunk in self._chunks:
+          self._file.write(chunk)
+        self._chunks = []
+    else:
+      self._file.seek(0, os.SEEK_END)
+      self._file.write(data)
+
+  def IterChunks(self, chunk_size=READ_SIZE):
+    """Yields the output in chunks."""
+    if self._file is None:
+      for chunk in self._chunks:
+        yield chunk
+      return
+    self._file.flush()
+    self._file.seek(0)
+    while True:
+      chunk = self._file.read(chunk_size)
+      if not chunk:
+        break
+      yield chunk
+
+  def IterLines(self):
+    """Yields the lines of the output, with their trailing newline."""
+    # Parts of the current line, which may span several chunks.
+    pending = []
+    for chunk in self.IterChunks():
+      lines = chunk.split('\n')
+      for line in lines[:-1]:
+        pending.append(line)
+        yield ''.join(pending) + '\n'
+        pending = []
+      pending.append(lines[-1])
+    last_line = ''.join(pending)
+    if last_line:
+      yield last_line
+
+  def GetValue(self):
+    """Returns the whole output as a single string."""
+    value = ''.join(self.IterChunks())
+    if self._file is None:
+      self._chunks = [value]
+    return value
+
+  def Close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+    self._chunks = []
+    self._size = 0
+
+
 class CommandExecuter(object):
   """Provides several methods to execute commands on several environments."""
 
@@ -66,10 +158,13 @@ class CommandExecuter(object):
                         command_timeout=None,
                         terminated_timeout=10,
                         print_to_console=True,
-                        except_handler=lambda p, e: None):
+                        except_handler=lambda p, e: None,
+                        return_buffers=False):
     """Run a command.
 
-    Returns triplet (returncode, stdout, stderr).
+    Returns triplet (returncode, stdout, stderr). If return_buffers is set,
+    stdout and stderr are CommandOutput objects instead of strings, so large
+    outputs can be read in chunks or lines rather than as one string.
     """
 
     cmd = str(cmd)
@@ -104,8 +199,11 @@ class CommandExecuter(object):
                            shell=True,
                            preexec_fn=os.setsid)
 
-      full_stdout = ''
-      full_stderr = ''
+      capture_output = return_output or return_buffers
+      # Output returned as a string has to fit in memory anyway.
+      spool_threshold = None if return_buffers else float('inf')
+      full_stdout = CommandOutput(spool_threshold)
+      full_stderr = CommandOutput(spool_threshold)
 
       # Pull output from pipes, send it to file/stdout/string
       out = err = None
@@ -130,18 +228,18 @@ class CommandExecuter(object):
         l = my_poll.poll(100)
         for (fd, _) in l:
           if fd == p.stdout.fileno():
-            out = os.read(p.stdout.fileno(), 16384)
-            if return_output:
-              full_stdout += out
+            out = os.read(p.stdout.fileno(), READ_SIZE)
+            if capture_output:
+              full_stdout.Write(out)
             if self.logger:
               self.logger.LogCommandOutput(out, print_to_console)
             if out == '':
               pipes.remove(p.stdout)
               my_poll.unregister(p.stdout)
           if fd == p.stderr.fileno():
-            err = os.read(p.stderr.fileno(), 16384)
-            if return_output:
-              full_stderr += err
+            err = os.read(p.stderr.fileno(), READ_SIZE)
+            if capture_output:
+              full_stderr.Write(err)
             if self.logger:
               self.logger.LogCommandError(err, print_to_console)
             if err == '':
@@ -173,8 +271,10 @@ class CommandExecuter(object):
           break
 
       p.wait()
-      if return_output:
+      if return_buffers:
         return (p.returncode, full_stdout, full_stderr)
+      if return_output:
+        return (p.returncode, full_stdout.GetValue(), full_stderr.GetValue())
       return (p.returncode, '', '')
     except BaseException as e:
       except_handler(p, e)
@@ -221,6 +321,19 @@ class CommandExecuter(object):
     kwargs['return_output'] = True
     return self.RunCommandGeneric(*args, **kwargs)
 
+  def RunCommandWOutputBuffers(self, *args, **kwargs):
+    """Run a command.
+
+    Takes the same arguments as RunCommandGeneric except for return_buffers.
+    Returns a triplet (returncode, stdout, stderr), where stdout and stderr
+    are CommandOutput objects. The caller should Close() them.
+    """
+    # Make sure that args does not overwrite 'return_buffers'
+    assert len(args) <= 9
+    assert 'return_buffers' not in kwargs
+    kwargs['return_buffers'] = True
+    return self.RunCommandGeneric(*args, **kwargs)
+
   def RemoteAccessInitCommand(self, chromeos_root, machine):
     command = ''
     command += '\nset -- --remote=' + machine
@@ -275,6 +388,22 @@ class CommandExecuter(object):
         sys.exit(1)
     chromeos_root = os.path.expanduser(chromeos_root)
 
+    pool = ssh_master.GetSSHMasterPool()
+    if pool.GetMaster(chromeos_root, machine) is not None:
+      master = pool.Connect(chromeos_root, machine)
+      if master is None:
+        if self.logger:
+          self.logger.LogError('Could not run remote command on machine.'
+                               ' Is the machine up?')
+        return (255, '', '')
+      return self.RunCommandGeneric(master.GetCommand(cmd),
+                                    return_output,
+                                    command_terminator=command_terminator,
+                                    command_timeout=command_timeout,
+                                    terminated_timeout=terminated_timeout,
+                                    print_to_console=print_to_console)
+
+    # No testing key to connect with, use remote_access.sh instead.
     # Write all commands to a file.
     command_file = self.WriteToTempShFile(cmd)
     retval = self.CopyFiles(command_file,
@@ -650,7 +779,8 @@ class MockCommandExecuter(CommandExecuter):
                         command_timeout=None,
                         terminated_timeout=10,
                         print_to_console=True,
-                        except_handler=lambda p, e: None):
+                        except_handler=lambda p, e: None,
+                        return_buffers=False):
     assert not command_timeout
     cmd = str(cmd)
     if machine is None:
@@ -659,6 +789,8 @@ class MockCommandExecuter(CommandExecuter):
       username = 'current'
     logger.GetLogger().LogCmd('(Mock) ' + cmd, machine, username,
                               print_to_console)
+    if return_buffers:
+      return (0, CommandOutput(), CommandOutput())
     return (0, '', '')
 
   def RunCommand(self, *args, **kwargs):
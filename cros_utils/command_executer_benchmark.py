@@ -0,0 +1,68 @@
+#!/usr/bin/env python2
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Measures how long CommandExecuter takes to capture large outputs.
+
+Example:
+  ./command_executer_benchmark.py --sizes=1M,100M,1G
+"""
+
+from __future__ import print_function
+
+import argparse
+import re
+import sys
+import time
+
+import command_executer
+
+UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+
+def ParseSize(size):
+  mo = re.match(r'^(\d+)([KMG]?)$', size.upper())
+  if not mo:
+    raise argparse.ArgumentTypeError('Invalid size: %s' % size)
+  return int(mo.group(1)) * UNITS[mo.group(2)]
+
+
+def TimeCapture(ce, size, mode):
+  """Returns the seconds taken to capture size bytes of output."""
+  # Lines of 100 bytes, like a typical perf report or test log.
+  command = 'yes %s | head -c %d' % ('x' * 99, size)
+  start = time.time()
+  if mode == 'string':
+    _, out, _ = ce.RunCommandWOutput(command, print_to_console=False)
+    assert len(out) == size
+  else:
+    _, out, _ = ce.RunCommandWOutputBuffers(command, print_to_console=False)
+    with out:
+      assert sum(len(l) for l in out.IterLines()) == size
+  return time.time() - start
+
+
+def Main(argv):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--sizes',
+                      default='1M,100M,1G',
+                      help='Comma separated output sizes to capture.')
+  parser.add_argument('--modes',
+                      default='string,buffers',
+                      help='Comma separated capture modes: string '
+                      '(RunCommandWOutput) and/or buffers '
+                      '(RunCommandWOutputBuffers).')
+  options = parser.parse_args(argv)
+
+  ce = command_executer.CommandExecuter('none')
+  for size in options.sizes.split(','):
+    for mode in options.modes.split(','):
+      elapsed = TimeCapture(ce, ParseSize(size), mode)
+      print('%6s %-8s %8.2fs %8.1f MB/s' % (size, mode, elapsed, ParseSize(
+          size) / float(1 << 20) / max(elapsed, 1e-6)))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(Main(sys.argv[1:]))
@@ -3,6 +3,7 @@
 
 from __future__ import print_function
 
+import mock
 import time
 import unittest
 
@@ -22,6 +23,39 @@ class CommandExecuterTest(unittest.TestCase):
     end = time.time()
     self.assertTrue(round(end - start) == timeout)
 
+  def testOutputCapture(self):
+    ce = command_executer.CommandExecuter('none')
+    retval, out, err = ce.RunCommandWOutput('seq 1 100000; echo error >&2')
+    self.assertEqual(retval, 0)
+    self.assertEqual(out, ''.join('%d\n' % i for i in range(1, 100001)))
+    self.assertEqual(err, 'error\n')
+
+  def testOutputBuffers(self):
+    ce = command_executer.CommandExecuter('none')
+    with mock.patch.object(command_executer, 'OUTPUT_SPOOL_THRESHOLD', 1000):
+      retval, out, err = ce.RunCommandWOutputBuffers('seq 1 1000; printf end')
+    with out, err:
+      self.assertEqual(retval, 0)
+      self.assertTrue(out.IsSpooled())
+      self.assertFalse(err.IsSpooled())
+      lines = ['%d\n' % i for i in range(1, 1001)] + ['end']
+      self.assertEqual(list(out.IterLines()), lines)
+      self.assertEqual(out.GetValue(), ''.join(lines))
+      self.assertEqual(len(out), len(''.join(lines)))
+      self.assertEqual(err.GetValue(), '')
+
+  def testCommandOutput(self):
+    output = command_executer.CommandOutput(spool_threshold=10)
+    for chunk in ['ab', 'c\nd', 'e\n\nf', 'ghijkl', 'mn\n']:
+      output.Write(chunk)
+    self.assertTrue(output.IsSpooled())
+    self.assertEqual(list(output.IterLines()),
+                     ['abc\n', 'de\n', '\n', 'fghijklmn\n'])
+    self.assertEqual(''.join(output.IterChunks(chunk_size=4)),
+                     'abc\nde\n\nfghijklmn\n')
+    output.Close()
+    self.assertEqual(output.GetValue(), '')
+
 
 if __name__ == '__main__':
   unittest.main()
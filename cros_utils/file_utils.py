@@ -4,9 +4,9 @@
 from __future__ import print_function
 
 import errno
+import hashlib
 import os
 import shutil
-import command_executer
 
 
 class FileUtils(object):
@@ -27,14 +27,18 @@ class FileUtils(object):
         cls._instance = super(FileUtils, cls).__new__(cls, *args, **kwargs)
     return cls._instance
 
-  def Md5File(self, filename, log_level='verbose', _block_size=2**10):
-    command = 'md5sum %s' % filename
-    ce = command_executer.GetCommandExecuter(log_level=log_level)
-    ret, out, _ = ce.RunCommandWOutput(command)
-    if ret:
-      raise RuntimeError('Could not run md5sum on: %s' % filename)
-
-    return out.strip().split()[0]
+  # pylint: disable=unused-argument
+  def Md5File(self, filename, log_level='verbose', block_size=2**22):
+    # Images are several GB, so read them in large blocks. hashlib releases
+    # the GIL while hashing, so several files can be hashed in parallel.
+    md5 = hashlib.md5()
+    try:
+      with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), ''):
+          md5.update(block)
+    except IOError:
+      raise RuntimeError('Could not compute md5sum of: %s' % filename)
+    return md5.hexdigest()
 
   def CanonicalizeChromeOSRoot(self, chromeos_root):
     chromeos_root = os.path.expanduser(chromeos_root)
@@ -68,7 +72,7 @@ class FileUtils(object):
 class MockFileUtils(FileUtils):
   """Mock class for file utilities."""
 
-  def Md5File(self, filename, log_level='verbose', _block_size=2**10):
+  def Md5File(self, filename, log_level='verbose', block_size=2**22):
     return 'd41d8cd98f00b204e9800998ecf8427e'
 
   def CanonicalizeChromeOSRoot(self, chromeos_root):
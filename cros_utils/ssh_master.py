@@ -0,0 +1,174 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Persistent, multiplexed ssh connections to ChromeOS machines.
+
+Running a command through remote_access.sh costs several ssh handshakes
+(copying the command file, then running it). Instead, one ssh ControlMaster
+connection is kept open per machine, and every command runs in a new session
+over it, with the command fed to the remote shell through stdin.
+"""
+
+from __future__ import print_function
+
+import atexit
+import os
+import pipes
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+# The testing key of ChromeOS test images, relative to the chromeos root.
+TESTING_KEY = 'src/scripts/mod_for_test_scripts/ssh_keys/testing_rsa'
+# Seconds to wait for a new connection to a machine.
+CONNECT_TIMEOUT = 30
+# A master connection is dropped after that many keepalives are missed, e.g.
+# when the machine reboots.
+SERVER_ALIVE_INTERVAL = 10
+SERVER_ALIVE_COUNT_MAX = 3
+
+
+class SSHMaster(object):
+  """A ControlMaster connection to root@machine."""
+
+  def __init__(self, machine, private_key, control_dir):
+    self.machine = machine
+    self.private_key = private_key
+    self.control_path = os.path.join(control_dir,
+                                     re.sub(r'[^\w.-]', '_', machine))
+    self.lock = threading.Lock()
+    self._proc = None
+
+  def GetSSHOptions(self):
+    return ['-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', 'BatchMode=yes',
+            '-o', 'ConnectTimeout=%d' % CONNECT_TIMEOUT,
+            '-o', 'ControlPath=%s' % self.control_path,
+            '-i', self.private_key]
+
+  def IsAlive(self):
+    return (self._proc is not None and self._proc.poll() is None and
+            os.path.exists(self.control_path))
+
+  def Start(self):
+    """Opens the master connection. Returns whether it is up."""
+    self.Stop()
+    command = ['ssh', '-N',
+               '-o', 'ControlMaster=yes',
+               '-o', 'ServerAliveInterval=%d' % SERVER_ALIVE_INTERVAL,
+               '-o', 'ServerAliveCountMax=%d' % SERVER_ALIVE_COUNT_MAX]
+    command += self.GetSSHOptions() + ['root@%s' % self.machine]
+    with open(os.devnull, 'r+') as devnull:
+      # Not in our session, so that the connection survives a SIGINT sent to
+      # the commands run over it.
+      self._proc = subprocess.Popen(command,
+                                    stdin=devnull,
+                                    stdout=devnull,
+                                    stderr=devnull,
+                                    preexec_fn=os.setsid)
+    deadline = time.time() + CONNECT_TIMEOUT
+    while time.time() < deadline and self._proc.poll() is None:
+      if os.path.exists(self.control_path):
+        return True
+      time.sleep(0.05)
+    alive = self.IsAlive()
+    if not alive:
+      self.Stop()
+    return alive
+
+  def Stop(self):
+    if self._proc is not None and self._proc.poll() is None:
+      self._proc.terminate()
+      self._proc.wait()
+    self._proc = None
+    if os.path.exists(self.control_path):
+      os.remove(self.control_path)
+
+  def GetCommand(self, cmd):
+    """Returns a shell command running cmd on the machine over the master.
+
+    The remote bash reads cmd from its stdin, so nothing has to be copied to
+    the machine first.
+    """
+    ssh_command = ['ssh', '-o', 'ControlMaster=no'] + self.GetSSHOptions()
+    ssh_command += ['root@%s' % self.machine, 'bash', '-s']
+    delimiter = 'CROS_COMMAND_%s' % uuid.uuid4().hex
+    return "%s <<'%s'\n%s\n%s" % (' '.join(pipes.quote(a)
+                                           for a in ssh_command), delimiter,
+                                  cmd, delimiter)
+
+
+class SSHMasterPool(object):
+  """The master connections of this process, one per machine."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._masters = {}
+    self._keys = {}
+    self._control_dir = None
+
+  def _GetPrivateKey(self, chromeos_root):
+    # ssh refuses keys that others can read, which is how the key is checked
+    # out, so use a private copy.
+    if chromeos_root not in self._keys:
+      key = os.path.join(chromeos_root, TESTING_KEY)
+      if not os.path.isfile(key):
+        return None
+      private_key = os.path.join(self._control_dir,
+                                 'testing_rsa.%d' % len(self._keys))
+      shutil.copy(key, private_key)
+      os.chmod(private_key, 0600)
+      self._keys[chromeos_root] = private_key
+    return self._keys[chromeos_root]
+
+  def GetMaster(self, chromeos_root, machine):
+    """Returns the master connection to machine.
+
+    Returns None if the connection can not be multiplexed (no testing key in
+    chromeos_root). The returned master may be down; call Connect() first.
+    """
+    with self._lock:
+      if self._control_dir is None:
+        self._control_dir = tempfile.mkdtemp(prefix='cros_ssh.')
+      if machine not in self._masters:
+        private_key = self._GetPrivateKey(chromeos_root)
+        if not private_key:
+          return None
+        self._masters[machine] = SSHMaster(machine, private_key,
+                                           self._control_dir)
+      return self._masters[machine]
+
+  def Connect(self, chromeos_root, machine):
+    """Returns an up master connection to machine, or None."""
+    master = self.GetMaster(chromeos_root, machine)
+    if master is None:
+      return None
+    with master.lock:
+      if master.IsAlive() or master.Start():
+        return master
+    return None
+
+  def CloseAll(self):
+    with self._lock:
+      for master in self._masters.values():
+        with master.lock:
+          master.Stop()
+      self._masters = {}
+      self._keys = {}
+      if self._control_dir is not None:
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+        self._control_dir = None
+
+
+_pool = SSHMasterPool()
+atexit.register(_pool.CloseAll)
+
+
+def GetSSHMasterPool():
+  return _pool
@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for ssh_master.py."""
+
+from __future__ import print_function
+
+import mock
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import command_executer
+import ssh_master
+
+# Stands in for ssh: a master creates its control socket and waits, other
+# invocations run the remote command locally.
+FAKE_SSH = """#!/bin/bash
+master=false
+for arg in "$@"; do
+  case "${arg}" in
+    ControlMaster=yes) master=true ;;
+    ControlPath=*) control_path="${arg#ControlPath=}" ;;
+  esac
+done
+if ${master}; then
+  touch "${control_path}"
+  exec sleep 1000
+fi
+while [[ "$1" != root@* ]]; do shift; done
+shift
+exec "$@"
+"""
+
+
+class SSHMasterTest(unittest.TestCase):
+  """Tests for SSHMaster and SSHMasterPool."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.chromeos_root = os.path.join(self.tempdir, 'chromeos')
+    key = os.path.join(self.chromeos_root, ssh_master.TESTING_KEY)
+    os.makedirs(os.path.dirname(key))
+    with open(key, 'w') as f:
+      f.write('key')
+    bin_dir = os.path.join(self.tempdir, 'bin')
+    os.mkdir(bin_dir)
+    with open(os.path.join(bin_dir, 'ssh'), 'w') as f:
+      f.write(FAKE_SSH)
+    os.chmod(os.path.join(bin_dir, 'ssh'), 0755)
+    self.path = os.environ['PATH']
+    os.environ['PATH'] = bin_dir + os.pathsep + self.path
+    self.pool = ssh_master.SSHMasterPool()
+
+  def tearDown(self):
+    self.pool.CloseAll()
+    os.environ['PATH'] = self.path
+    shutil.rmtree(self.tempdir)
+
+  def test_no_testing_key(self):
+    self.assertIsNone(self.pool.GetMaster(self.tempdir, 'lumpy1'))
+
+  def test_connect(self):
+    master = self.pool.Connect(self.chromeos_root, 'lumpy1')
+    self.assertTrue(master.IsAlive())
+    self.assertEqual(stat.S_IMODE(os.stat(master.private_key).st_mode), 0600)
+    self.assertIs(self.pool.Connect(self.chromeos_root, 'lumpy1'), master)
+    self.assertIsNot(self.pool.Connect(self.chromeos_root, 'lumpy2'), master)
+
+    # The connection is reopened if it goes away.
+    master.Stop()
+    self.assertFalse(master.IsAlive())
+    self.assertIs(self.pool.Connect(self.chromeos_root, 'lumpy1'), master)
+    self.assertTrue(master.IsAlive())
+
+    self.pool.CloseAll()
+    self.assertFalse(master.IsAlive())
+
+  def test_cros_run_command(self):
+    ce = command_executer.CommandExecuter('average')
+    with mock.patch.object(ssh_master, '_pool', self.pool):
+      cmd = "echo 'a b'\necho \"$((1 + 1))\" >&2\nread line; exit 3"
+      retval, out, err = ce.CrosRunCommandWOutput(
+          cmd, machine='lumpy1', chromeos_root=self.chromeos_root)
+    self.assertEqual(retval, 3)
+    self.assertEqual(out, 'a b\n')
+    self.assertEqual(err, '2\n')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -63,6 +63,7 @@ table:
 from __future__ import print_function
 
 import getpass
+import heapq
 import math
 import sys
 import numpy
@@ -70,6 +71,13 @@ import numpy
 from email_sender import EmailSender
 import misc
 
+try:
+  from scipy.special import betainc
+except ImportError:
+  # betainc is the regularized incomplete beta function, the same as betai of
+  # the stats module, which is slower but has no dependency.
+  betainc = None
+
 
 def _AllFloat(values):
   return all([misc.IsFloat(v) for v in values])
@@ -104,51 +112,74 @@ class TableGenerator(object):
     self._labels = l
     self._sort = sort
     self._key_name = key_name
+    self._index = None
+    # The runs of label i are the runs _offsets[i] to _offsets[i + 1] - 1 of
+    # the index.
+    self._offsets = [0]
+    for run_list in self._runs:
+      self._offsets.append(self._offsets[-1] + len(run_list))
+
+  def _GetIndex(self):
+    """Returns the values of every key, indexed in one pass over the runs.
+
+    The index maps a key to the list of its values in all the runs, label after
+    label, None if a run does not have the key. The values are the values of
+    the runs, i.e. [value, unit] lists for the results that have a unit.
+    """
+    if self._index is None:
+      index = {}
+      num_runs = self._offsets[-1]
+      run_number = 0
+      for run_list in self._runs:
+        for run in run_list:
+          for key, value in run.iteritems():
+            values = index.get(key)
+            if values is None:
+              values = index[key] = [None] * num_runs
+            values[run_number] = value
+          run_number += 1
+      self._index = index
+    return self._index
 
   def _AggregateKeys(self):
-    keys = set([])
-    for run_list in self._runs:
-      for run in run_list:
-        keys = keys.union(run.keys())
-    return keys
+    return self._GetIndex().keys()
+
+  def _GetValues(self, key):
+    values = [value for value in self._GetIndex()[key] if value is not None]
+    try:
+      return [float(value) for value in values]
+    except ValueError:
+      # Not all floats.
+      return values
 
   def _GetHighestValue(self, key):
-    values = []
-    for run_list in self._runs:
-      for run in run_list:
-        if key in run:
-          values.append(run[key])
-    values = _StripNone(values)
-    if _AllFloat(values):
-      values = _GetFloats(values)
-    return max(values)
+    return max(self._GetValues(key))
 
   def _GetLowestValue(self, key):
-    values = []
-    for run_list in self._runs:
-      for run in run_list:
-        if key in run:
-          values.append(run[key])
-    values = _StripNone(values)
-    if _AllFloat(values):
-      values = _GetFloats(values)
-    return min(values)
+    return min(self._GetValues(key))
 
-  def _SortKeys(self, keys):
+  def _SortKeys(self, keys, number_of_rows=sys.maxint):
+    """Sorts the keys, keeping only the first number_of_rows of them.
+
+    A heap selects the first keys when there are fewer rows than keys, like
+    sorted(...)[:number_of_rows] but without sorting all the keys.
+    """
     if self._sort == self.SORT_BY_KEYS:
-      return sorted(keys)
+      select, sort_key = heapq.nsmallest, None
     elif self._sort == self.SORT_BY_VALUES:
-      # pylint: disable=unnecessary-lambda
-      return sorted(keys, key=lambda x: self._GetLowestValue(x))
+      select, sort_key = heapq.nsmallest, self._GetLowestValue
     elif self._sort == self.SORT_BY_VALUES_DESC:
-      # pylint: disable=unnecessary-lambda
-      return sorted(keys, key=lambda x: self._GetHighestValue(x), reverse=True)
+      select, sort_key = heapq.nlargest, self._GetHighestValue
     else:
       assert 0, 'Unimplemented sort %s' % self._sort
 
-  def _GetKeys(self):
+    if 0 < number_of_rows < len(keys):
+      return select(number_of_rows, keys, key=sort_key)
+    return sorted(keys, key=sort_key, reverse=select is heapq.nlargest)
+
+  def _GetKeys(self, number_of_rows=sys.maxint):
     keys = self._AggregateKeys()
-    return self._SortKeys(keys)
+    return self._SortKeys(keys, number_of_rows)
 
   def GetTable(self, number_of_rows=sys.maxint):
     """Returns a table from a list of list of dicts.
@@ -177,37 +208,187 @@ class TableGenerator(object):
       The returned table can then be processed further by other classes in this
       module.
     """
-    keys = self._GetKeys()
+    index = self._GetIndex()
+    keys = self._GetKeys(number_of_rows)
     header = [self._key_name] + self._labels
     table = [header]
-    rows = 0
     for k in keys:
       row = [k]
       unit = None
-      for run_list in self._runs:
+      values = index[k]
+      for start, end in zip(self._offsets, self._offsets[1:]):
         v = []
-        for run in run_list:
-          if k in run:
-            if type(run[k]) is list:
-              val = run[k][0]
-              unit = run[k][1]
-            else:
-              val = run[k]
-            v.append(val)
-          else:
-            v.append(None)
+        for val in values[start:end]:
+          if type(val) is list:
+            unit = val[1]
+            val = val[0]
+          v.append(val)
         row.append(v)
       # If we got a 'unit' value, append the units name to the key name.
       if unit:
         keyname = row[0] + ' (%s) ' % unit
         row[0] = keyname
       table.append(row)
-      rows += 1
-      if rows == number_of_rows:
-        break
     return table
 
 
+class TableStats(object):
+  """Summary statistics of the values of a table, by row and label.
+
+  The values of every (row, label) are stripped of None and converted to floats
+  once, into an array of shape (rows, labels, iterations). Each statistic is
+  computed for the whole table at once, the first label being the baseline of
+  the comparisons. The statistics of a (row, label) whose values, or whose
+  baseline values, are not all floats are not meaningful, see IsFloat.
+  """
+
+  def __init__(self, rows):
+    """Set up the arrays of the values.
+
+    Args:
+      rows: The rows of a table generated by TableGenerator, without the
+      header, i.e. ["key", [values of label 1], [values of label 2], ...].
+    """
+    self._rows = rows
+    num_labels = max([len(row) - 1 for row in rows] or [0])
+    shape = (len(rows), num_labels)
+    self._counts = numpy.zeros(shape, dtype=int)
+    self._float = numpy.zeros(shape, dtype=bool)
+
+    float_rows = []
+    for row in rows:
+      float_row = []
+      for label, values in enumerate(row[1:]):
+        values = _StripNone(values)
+        is_float = _AllFloat(values)
+        float_row.append(_GetFloats(values) if is_float else [])
+        self._counts[len(float_rows), label] = len(values)
+        self._float[len(float_rows), label] = is_float
+      float_rows.append(float_row)
+
+    num_iterations = max([len(values) for float_row in float_rows
+                          for values in float_row] or [0])
+    self._values = numpy.zeros(shape + (num_iterations,))
+    for row_index, float_row in enumerate(float_rows):
+      for label, values in enumerate(float_row):
+        self._values[row_index, label, :len(values)] = values
+
+    self._mask = (numpy.arange(num_iterations) <
+                  numpy.where(self._float, self._counts, 0)[..., None])
+    self._statistics = {}
+
+  def GetValues(self, row, label):
+    return self._rows[row][label + 1]
+
+  def Count(self, row, label):
+    """The number of values of the (row, label) that are not None."""
+    return self._counts[row, label]
+
+  def IsFloat(self, row, label):
+    """Whether the values of the (row, label) and its baseline are floats.
+
+    Result.Compute uses the string values of the (row, label) unless this is
+    true.
+    """
+    if not self._counts[row, label] or not self._float[row, label]:
+      return False
+    return (label == 0 or not self._counts[row, 0] or self._float[row, 0])
+
+  def Get(self, statistic, row, label):
+    """The value of the statistic for the (row, label).
+
+    Args:
+      statistic: One of 'min', 'max', 'mean', 'std', 'gmean', 'coeff_var',
+      'amean_ratio', 'gmean_ratio' and 'p_value'.
+      row: The index of the row.
+      label: The index of the label.
+    """
+    return self._GetArray(statistic)[row, label]
+
+  def _GetArray(self, statistic):
+    if statistic not in self._statistics:
+      with numpy.errstate(all='ignore'):
+        self._statistics[statistic] = getattr(self, '_Compute_' + statistic)()
+    return self._statistics[statistic]
+
+  def _Sum(self, values):
+    return numpy.where(self._mask, values, 0.0).sum(axis=2)
+
+  def _Compute_min(self):
+    return numpy.where(self._mask, self._values, numpy.inf).min(axis=2)
+
+  def _Compute_max(self):
+    return numpy.where(self._mask, self._values, -numpy.inf).max(axis=2)
+
+  def _Compute_mean(self):
+    return self._Sum(self._values) / self._counts
+
+  def _SquaredDeviations(self):
+    return self._Sum((self._values - self._GetArray('mean')[..., None])**2)
+
+  def _Compute_std(self):
+    return numpy.sqrt(self._SquaredDeviations() / self._counts)
+
+  def _Compute_var(self):
+    """The variance with N-1 in the denominator."""
+    return self._SquaredDeviations() / (self._counts - 1)
+
+  def _Compute_gmean(self):
+    # Like Result._GetGmean: NaN if a value is negative, 0 if a value is 0.
+    negative = (self._mask & (self._values < 0)).any(axis=2)
+    zero = (self._mask & (self._values == 0)).any(axis=2)
+    logs = numpy.log(numpy.where(self._mask & (self._values > 0), self._values,
+                                 1.0))
+    gmean = numpy.exp(logs.sum(axis=2) / self._counts)
+    return numpy.where(negative, numpy.nan, numpy.where(zero, 0.0, gmean))
+
+  def _Compute_coeff_var(self):
+    mean = self._GetArray('mean')
+    return numpy.where(mean != 0.0,
+                       numpy.abs(self._GetArray('std') / mean), 0.0)
+
+  def _Ratio(self, statistic):
+    # Zero if only the baseline is 0, one if both are.
+    values = self._GetArray(statistic)
+    baseline = values[:, :1]
+    return numpy.where(baseline != 0, values / baseline,
+                       numpy.where(values != 0, 0.0, 1.0))
+
+  def _Compute_amean_ratio(self):
+    return self._Ratio('mean')
+
+  def _Compute_gmean_ratio(self):
+    return self._Ratio('gmean')
+
+  def _Compute_p_value(self):
+    """The two-tailed p-value of the t-test of each label and the baseline.
+
+    Same as stats.lttest_ind, which pools the variances of the samples.
+    """
+    counts = self._counts.astype(float)
+    baseline_counts = counts[:, :1]
+    mean = self._GetArray('mean')
+    var = self._GetArray('var')
+
+    df = counts + baseline_counts - 2
+    svar = ((counts - 1) * var + (baseline_counts - 1) * var[:, :1]) / df
+    svar = numpy.where(svar == 0, 1.0e-26, svar)
+    t = (mean - mean[:, :1]) / numpy.sqrt(svar * (1.0 / counts + 1.0 /
+                                                  baseline_counts))
+    x = df / (df + t * t)
+    valid = (counts >= 2) & (baseline_counts >= 2)
+
+    p_value = numpy.empty(counts.shape)
+    p_value.fill(numpy.nan)
+    if betainc is not None:
+      p_value[valid] = betainc(0.5 * df[valid], 0.5, x[valid])
+    else:
+      import stats
+      p_value[valid] = [stats.lbetai(0.5 * float(d), 0.5, float(v))
+                        for d, v in zip(df[valid], x[valid])]
+    return p_value
+
+
 class Result(object):
   """A class that respresents a single result.
 
@@ -215,6 +396,9 @@ class Result(object):
   runs and a list of baseline runs.
   """
 
+  # The statistic of TableStats that _ComputeFloat computes, if any.
+  FLOAT_STATISTIC = None
+
   def __init__(self):
     pass
 
@@ -285,6 +469,26 @@ class Result(object):
     else:
       self._ComputeString(cell, values, baseline_values)
 
+  def ComputeFromStats(self, cell, stats, row, label):
+    """Compute the result of a (row, label) of a table.
+
+    Same as Compute on the values of the label and of the first, baseline,
+    label, but the FLOAT_STATISTIC is taken from the TableStats of the table.
+
+    Args:
+      cell: A cell data structure to populate.
+      stats: The TableStats of the table.
+      row: The index of the row in the table.
+      label: The index of the label in the row.
+    """
+    if (self.FLOAT_STATISTIC is None or not stats.IsFloat(row, label) or
+        (self.NeedsBaseline() and (not label or not stats.Count(row, 0)))):
+      baseline_values = stats.GetValues(row, 0) if label else None
+      self.Compute(cell, stats.GetValues(row, label), baseline_values)
+      return
+    cell.value = float(stats.Get(self.FLOAT_STATISTIC, row, label))
+    self._InvertIfLowerIsBetter(cell)
+
 
 class LiteralResult(Result):
   """A literal result."""
@@ -343,6 +547,8 @@ class StringMeanResult(Result):
 class AmeanResult(StringMeanResult):
   """Arithmetic mean."""
 
+  FLOAT_STATISTIC = 'mean'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     cell.value = numpy.mean(values)
 
@@ -355,6 +561,8 @@ class RawResult(Result):
 class MinResult(Result):
   """Minimum."""
 
+  FLOAT_STATISTIC = 'min'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     cell.value = min(values)
 
@@ -368,6 +576,8 @@ class MinResult(Result):
 class MaxResult(Result):
   """Maximum."""
 
+  FLOAT_STATISTIC = 'max'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     cell.value = max(values)
 
@@ -388,6 +598,8 @@ class NumericalResult(Result):
 class StdResult(NumericalResult):
   """Standard deviation."""
 
+  FLOAT_STATISTIC = 'std'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     cell.value = numpy.std(values)
 
@@ -395,6 +607,8 @@ class StdResult(NumericalResult):
 class CoeffVarResult(NumericalResult):
   """Standard deviation / Mean"""
 
+  FLOAT_STATISTIC = 'coeff_var'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     if numpy.mean(values) != 0.0:
       noise = numpy.abs(numpy.std(values) / numpy.mean(values))
@@ -428,6 +642,8 @@ class ComparisonResult(Result):
 class PValueResult(ComparisonResult):
   """P-value."""
 
+  FLOAT_STATISTIC = 'p_value'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     if len(values) < 2 or len(baseline_values) < 2:
       cell.value = float('nan')
@@ -482,6 +698,8 @@ class KeyAwareComparisonResult(ComparisonResult):
 class AmeanRatioResult(KeyAwareComparisonResult):
   """Ratio of arithmetic means of values vs. baseline values."""
 
+  FLOAT_STATISTIC = 'amean_ratio'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     if numpy.mean(baseline_values) != 0:
       cell.value = numpy.mean(values) / numpy.mean(baseline_values)
@@ -496,6 +714,8 @@ class AmeanRatioResult(KeyAwareComparisonResult):
 class GmeanRatioResult(KeyAwareComparisonResult):
   """Ratio of geometric means of values vs. baseline values."""
 
+  FLOAT_STATISTIC = 'gmean_ratio'
+
   def _ComputeFloat(self, cell, values, baseline_values):
     if self._GetGmean(baseline_values) != 0:
       cell.value = self._GetGmean(values) / self._GetGmean(baseline_values)
@@ -788,7 +1008,8 @@ class TableFormatter(object):
     row_index = 0
     all_failed = False
 
-    for row in self._table[1:]:
+    stats = TableStats(self._table[1:])
+    for row_number, row in enumerate(self._table[1:]):
       # It does not make sense to put retval in the summary table.
       if str(row[0]) == 'retval' and table_type == 'summary':
         # Check to see if any runs passed, and update all_failed.
@@ -800,27 +1021,18 @@ class TableFormatter(object):
       key = Cell()
       key.string_value = str(row[0])
       out_row = [key]
-      baseline = None
-      for values in row[1:]:
+      for label in range(len(row) - 1):
         for column in self._columns:
+          # The first label is the baseline, it is not compared to itself.
+          if column.result.NeedsBaseline() and not label:
+            continue
           cell = Cell()
           cell.name = key.string_value
-          if column.result.NeedsBaseline():
-            if baseline is not None:
-              column.result.Compute(cell, values, baseline)
-              column.fmt.Compute(cell)
-              out_row.append(cell)
-              if not row_index:
-                self._table_columns.append(column)
-          else:
-            column.result.Compute(cell, values, baseline)
-            column.fmt.Compute(cell)
-            out_row.append(cell)
-            if not row_index:
-              self._table_columns.append(column)
-
-        if baseline is None:
-          baseline = values
+          column.result.ComputeFromStats(cell, stats, row_number, label)
+          column.fmt.Compute(cell)
+          out_row.append(cell)
+          if not row_index:
+            self._table_columns.append(column)
       self._out_table.append(out_row)
       row_index += 1
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python2
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Measures how long TableGenerator takes to build tables of large perf dicts.
+
+The runs are synthetic perf reports: every run maps --keys function names to
+their overhead percentage, the way crosperf passes them to TableGenerator.
+
+Example:
+  ./tabulator_benchmark.py --keys=100000 --labels=2 --iterations=3
+"""
+
+from __future__ import print_function
+
+import argparse
+import random
+import sys
+import time
+
+import tabulator
+
+
+def MakeRuns(num_keys, num_labels, num_iterations):
+  """Returns num_labels lists of num_iterations perf dicts of num_keys keys."""
+  keys = ['function_%d' % i for i in range(num_keys)]
+  runs = []
+  for _ in range(num_labels):
+    run_list = []
+    for _ in range(num_iterations):
+      # Like perf reports, each run misses some of the functions.
+      run_list.append({key: '%.2f' % random.expovariate(1.0)
+                       for key in keys if random.random() < 0.9})
+    runs.append(run_list)
+  return runs
+
+
+def TimeTable(runs, labels, sort, number_of_rows):
+  """Returns the seconds taken to build the table and its number of rows."""
+  start = time.time()
+  table = tabulator.TableGenerator(runs, labels, sort=sort).GetTable(
+      number_of_rows)
+  return time.time() - start, len(table) - 1
+
+
+def Main(argv):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--keys',
+                      type=int,
+                      default=100000,
+                      help='Number of keys per run.')
+  parser.add_argument('--labels',
+                      type=int,
+                      default=2,
+                      help='Number of labels.')
+  parser.add_argument('--iterations',
+                      type=int,
+                      default=3,
+                      help='Number of runs per label.')
+  parser.add_argument('--rows',
+                      type=int,
+                      default=5,
+                      help='Number of rows of the top-N tables, like the '
+                      'PERF_ROWS of crosperf.')
+  options = parser.parse_args(argv)
+
+  random.seed(0)
+  runs = MakeRuns(options.keys, options.labels, options.iterations)
+  labels = ['label_%d' % i for i in range(options.labels)]
+
+  sorts = [('keys', tabulator.TableGenerator.SORT_BY_KEYS),
+           ('values', tabulator.TableGenerator.SORT_BY_VALUES),
+           ('values_desc', tabulator.TableGenerator.SORT_BY_VALUES_DESC)]
+  for name, sort in sorts:
+    for number_of_rows in [sys.maxint, options.rows]:
+      elapsed, rows = TimeTable(runs, labels, sort, number_of_rows)
+      print('%-12s %7d rows %8.2fs' % (name, rows, elapsed))
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(Main(sys.argv[1:]))
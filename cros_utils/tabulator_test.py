@@ -6,6 +6,8 @@ from __future__ import print_function
 __author__ = 'asharif@google.com (Ahmad Sharif)'
 
 # System modules
+import math
+import sys
 import unittest
 
 # Local modules
@@ -70,6 +72,33 @@ class TabulatorTest(unittest.TestCase):
     b = tabulator.Result()._GetGmean(a)
     self.assertTrue(b >= 0.99e+308 and b <= 1.01e+308)
 
+  def testTableStats(self):
+    rows = [['k1', ['1', '3', None], ['55', '57'], ['4']],
+            ['ms_k2', ['10', '12'], ['0', '30'], [None]],
+            ['k3', ['-1', '2'], ['PASS', 'PASS'], []],
+            ['k4', ['PASS'], ['2', '3'], ['FAIL', None]]]
+    results = [tabulator.RawResult(), tabulator.MinResult(),
+               tabulator.MaxResult(), tabulator.AmeanResult(),
+               tabulator.StdResult(), tabulator.CoeffVarResult(),
+               tabulator.AmeanRatioResult(), tabulator.GmeanRatioResult(),
+               tabulator.PValueResult(), tabulator.NonEmptyCountResult()]
+    stats = tabulator.TableStats(rows)
+    for row_number, row in enumerate(rows):
+      for label in range(len(row) - 1):
+        for result in results:
+          if result.NeedsBaseline() and not label:
+            continue
+          cell = tabulator.Cell()
+          cell.name = row[0]
+          result.Compute(cell, row[label + 1], row[1] if label else None)
+          stats_cell = tabulator.Cell()
+          stats_cell.name = row[0]
+          result.ComputeFromStats(stats_cell, stats, row_number, label)
+          if isinstance(cell.value, float) and math.isnan(cell.value):
+            self.assertTrue(math.isnan(stats_cell.value))
+          else:
+            self.assertAlmostEqual(cell.value, stats_cell.value)
+
   def testTableGenerator(self):
     runs = [[{'k1': '10',
               'k2': '12'}, {'k1': '13',
@@ -103,6 +132,26 @@ class TabulatorTest(unittest.TestCase):
     table = tf.GetCellTable()
     self.assertTrue(table)
 
+  def testTableGeneratorSort(self):
+    runs = [[{'k1': '10', 'k2': '2', 'k3': '7'}, {'k1': '1', 'k4': '4'}],
+            [{'k2': '30', 'k3': None, 'k5': '5'}]]
+    labels = ['vanilla', 'modified']
+
+    def _Keys(sort, number_of_rows=sys.maxint):
+      tg = tabulator.TableGenerator(runs, labels, sort=sort)
+      return [row[0] for row in tg.GetTable(number_of_rows)[1:]]
+
+    self.assertEqual(_Keys(tabulator.TableGenerator.SORT_BY_KEYS),
+                     ['k1', 'k2', 'k3', 'k4', 'k5'])
+    self.assertEqual(_Keys(tabulator.TableGenerator.SORT_BY_VALUES),
+                     ['k1', 'k2', 'k4', 'k5', 'k3'])
+    self.assertEqual(_Keys(tabulator.TableGenerator.SORT_BY_VALUES_DESC),
+                     ['k2', 'k1', 'k3', 'k5', 'k4'])
+    self.assertEqual(_Keys(tabulator.TableGenerator.SORT_BY_VALUES_DESC, 2),
+                     ['k2', 'k1'])
+    self.assertEqual(_Keys(tabulator.TableGenerator.SORT_BY_KEYS, 3),
+                     ['k1', 'k2', 'k3'])
+
   def testColspan(self):
     simple_table = [
         ['binary', 'b1', 'b2', 'b3'],
@@ -27,7 +27,8 @@ class Experiment(object):
   def __init__(self, name, remote, working_directory, chromeos_root,
                cache_conditions, labels, benchmarks, experiment_file, email_to,
                acquire_timeout, log_dir, log_level, share_cache,
-               results_directory, locks_directory):
+               results_directory, locks_directory, image_parallelism,
+               schedv2_policy):
     self.name = name
     self.working_directory = working_directory
     self.remote = remote
@@ -53,6 +54,7 @@ class Experiment(object):
     # locking mechanism.
     self.locks_dir = locks_directory
     self.locked_machines = []
+    self.schedv2_policy = schedv2_policy
 
     if not remote:
       raise RuntimeError('No remote hosts specified')
@@ -75,13 +77,16 @@ class Experiment(object):
     machine_manager_fn = MachineManager
     if test_flag.GetTestMode():
       machine_manager_fn = MockMachineManager
-    self.machine_manager = machine_manager_fn(chromeos_root, acquire_timeout,
-                                              log_level, locks_directory)
+    self.machine_manager = machine_manager_fn(
+        chromeos_root,
+        acquire_timeout,
+        log_level,
+        locks_directory,
+        image_parallelism=image_parallelism)
     self.l = logger.GetLogger(log_dir)
 
-    for machine in self.remote:
-      # machine_manager.AddMachine only adds reachable machines.
-      self.machine_manager.AddMachine(machine)
+    # machine_manager.AddMachines only adds reachable machines.
+    self.machine_manager.AddMachines(self.remote)
     # Now machine_manager._all_machines contains a list of reachable
     # machines. This is a subset of self.remote. We make both lists the same.
     self.remote = [m.name for m in self.machine_manager.GetAllMachines()]
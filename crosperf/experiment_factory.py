@@ -11,9 +11,11 @@ import socket
 from benchmark import Benchmark
 import config
 from experiment import Experiment
+from image_checksummer import ImageChecksummer
 from label import Label
 from label import MockLabel
 from results_cache import CacheConditions
+from schedv2 import Schedv2
 import test_flag
 import file_lock_machine
 
@@ -140,6 +142,10 @@ class ExperimentFactory(object):
     log_level = global_settings.GetField('logging_level')
     if log_level not in ('quiet', 'average', 'verbose'):
       log_level = 'verbose'
+    schedv2_policy = global_settings.GetField('schedv2_policy')
+    if schedv2_policy not in Schedv2.POLICIES:
+      raise RuntimeError("Unknown schedv2_policy '%s', options are: %s" %
+                         (schedv2_policy, ', '.join(Schedv2.POLICIES)))
     # Default cache hit conditions. The image checksum in the cache and the
     # computed checksum of the image must match. Also a cache file must exist.
     cache_conditions = [
@@ -298,6 +304,8 @@ class ExperimentFactory(object):
 
     if not labels:
       raise RuntimeError('No labels specified')
+    if not test_flag.GetTestMode():
+      ImageChecksummer().ComputeChecksums(labels, log_level)
 
     email = global_settings.GetField('email')
     all_remote += list(set(my_remote))
@@ -306,7 +314,9 @@ class ExperimentFactory(object):
                             chromeos_root, cache_conditions, labels, benchmarks,
                             experiment_file.Canonicalize(), email,
                             acquire_timeout, log_dir, log_level, share_cache,
-                            results_dir, locks_dir)
+                            results_dir, locks_dir,
+                            global_settings.GetField('image_parallelism'),
+                            schedv2_policy)
 
     return experiment
 
@@ -4,11 +4,14 @@
 """The experiment runner module."""
 from __future__ import print_function
 
+import functools
 import getpass
 import os
 import shutil
 import time
 
+from multiprocessing.pool import ThreadPool
+
 import afe_lock_machine
 import test_flag
 
@@ -21,11 +24,16 @@ import config
 from experiment_status import ExperimentStatus
 from results_cache import CacheConditions
 from results_cache import ResultsCache
+from results_report import BenchmarkResults
 from results_report import HTMLResultsReport
 from results_report import TextResultsReport
 from results_report import JSONResultsReport
 from schedv2 import Schedv2
 
+# Maximum number of benchmark runs whose results are stored at the same time.
+MAX_STORE_THREADS = 8
+
+
 def _WriteJSONReportToFile(experiment, results_dir, json_report):
   """Writes a JSON report to a file in results_dir."""
   has_llvm = any('llvm' in l.compiler for l in experiment.labels)
@@ -242,19 +250,20 @@ class ExperimentRunner(object):
                             attachments=[attachment],
                             msg_type='html')
 
-  def _StoreResults(self, experiment):
-    if self._terminated:
-      return
-    results_directory = experiment.results_directory
-    FileUtils().RmDir(results_directory)
-    FileUtils().MkDirP(results_directory)
-    self.l.LogOutput('Storing experiment file in %s.' % results_directory)
-    experiment_file_path = os.path.join(results_directory, 'experiment.exp')
-    FileUtils().WriteFile(experiment_file_path, experiment.experiment_file)
+  def _StoreBenchmarkRunResults(self, results_directory, benchmark_run):
+    benchmark_run_name = filter(str.isalnum, benchmark_run.name)
+    benchmark_run_path = os.path.join(results_directory, benchmark_run_name)
+    benchmark_run.result.CopyResultsTo(benchmark_run_path)
+    benchmark_run.result.CleanUp(benchmark_run.benchmark.rm_chroot_tmp)
 
+  def _StoreReports(self, experiment, results_directory):
     self.l.LogOutput('Storing results report in %s.' % results_directory)
+    # The results are organized once for the HTML and the text reports; the
+    # JSON report has all the keyvals, so it organizes its own.
+    benchmark_results = BenchmarkResults.FromExperiment(experiment)
     results_table_path = os.path.join(results_directory, 'results.html')
-    report = HTMLResultsReport.FromExperiment(experiment).GetReport()
+    report = HTMLResultsReport.FromExperiment(
+        experiment, benchmark_results=benchmark_results).GetReport()
     if self.json_report:
       json_report = JSONResultsReport.FromExperiment(experiment,
                                                      json_args={'indent': 2})
@@ -264,19 +273,48 @@ class ExperimentRunner(object):
 
     self.l.LogOutput('Storing email message body in %s.' % results_directory)
     msg_file_path = os.path.join(results_directory, 'msg_body.html')
-    text_report = TextResultsReport.FromExperiment(experiment, True).GetReport()
+    text_report = TextResultsReport.FromExperiment(
+        experiment, True, benchmark_results=benchmark_results).GetReport()
     text_report += ('\nResults are stored in %s.\n' %
                     experiment.results_directory)
     msg_body = "<pre style='font-size: 13px'>%s</pre>" % text_report
     FileUtils().WriteFile(msg_file_path, msg_body)
 
+  def _StoreResults(self, experiment):
+    if self._terminated:
+      return
+    results_directory = experiment.results_directory
+    FileUtils().RmDir(results_directory)
+    FileUtils().MkDirP(results_directory)
+    self.l.LogOutput('Storing experiment file in %s.' % results_directory)
+    experiment_file_path = os.path.join(results_directory, 'experiment.exp')
+    FileUtils().WriteFile(experiment_file_path, experiment.experiment_file)
+
+    # The results of the benchmark runs are stored first, for the reports to
+    # find the perf reports among them.
     self.l.LogOutput('Storing results of each benchmark run.')
-    for benchmark_run in experiment.benchmark_runs:
-      if benchmark_run.result:
-        benchmark_run_name = filter(str.isalnum, benchmark_run.name)
-        benchmark_run_path = os.path.join(results_directory, benchmark_run_name)
-        benchmark_run.result.CopyResultsTo(benchmark_run_path)
-        benchmark_run.result.CleanUp(benchmark_run.benchmark.rm_chroot_tmp)
+    start_time = time.time()
+    benchmark_runs = [benchmark_run
+                      for benchmark_run in experiment.benchmark_runs
+                      if benchmark_run.result]
+    try:
+      if benchmark_runs:
+        pool = ThreadPool(min(len(benchmark_runs), MAX_STORE_THREADS))
+        try:
+          pool.map(functools.partial(self._StoreBenchmarkRunResults,
+                                     results_directory), benchmark_runs)
+        finally:
+          pool.close()
+          pool.join()
+      self.l.LogOutput('Stored the results of %d benchmark runs in %.1f '
+                       'seconds.' % (len(benchmark_runs),
+                                     time.time() - start_time))
+    finally:
+      # The reports are stored even if some results could not be.
+      start_time = time.time()
+      self._StoreReports(experiment, results_directory)
+      self.l.LogOutput('Stored the reports in %.1f seconds.' %
+                       (time.time() - start_time))
 
   def Run(self):
     try:
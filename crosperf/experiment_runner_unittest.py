@@ -23,6 +23,7 @@ import test_flag
 from experiment_factory import ExperimentFactory
 from experiment_file import ExperimentFile
 from results_cache import Result
+from results_report import BenchmarkResults
 from results_report import HTMLResultsReport
 from results_report import TextResultsReport
 
@@ -385,10 +386,12 @@ class ExperimentRunnerTest(unittest.TestCase):
   @mock.patch.object(FileUtils, 'WriteFile')
   @mock.patch.object(HTMLResultsReport, 'FromExperiment')
   @mock.patch.object(TextResultsReport, 'FromExperiment')
+  @mock.patch.object(BenchmarkResults, 'FromExperiment')
   @mock.patch.object(Result, 'CopyResultsTo')
   @mock.patch.object(Result, 'CleanUp')
-  def test_store_results(self, mock_cleanup, mock_copy, _mock_text_report,
-                         mock_report, mock_writefile, mock_mkdir, mock_rmdir):
+  def test_store_results(self, mock_cleanup, mock_copy, mock_results,
+                         mock_text_report, mock_report, mock_writefile,
+                         mock_mkdir, mock_rmdir):
 
     self.mock_logger.Reset()
     self.exp.results_directory = '/usr/local/crosperf-results'
@@ -437,13 +440,25 @@ class ExperimentRunnerTest(unittest.TestCase):
     mock_mkdir.called_with('/usr/local/crosperf-results')
     self.assertEqual(mock_rmdir.call_count, 1)
     mock_rmdir.called_with('/usr/local/crosperf-results')
-    self.assertEqual(self.mock_logger.LogOutputCount, 4)
+    # The results are organized once for both reports.
+    self.assertEqual(mock_results.call_count, 1)
+    self.assertEqual(mock_report.call_args[1]['benchmark_results'],
+                     mock_results.return_value)
+    self.assertEqual(mock_text_report.call_args[1]['benchmark_results'],
+                     mock_results.return_value)
+    self.assertEqual(self.mock_logger.LogOutputCount, 6)
+    output_msgs = self.mock_logger.output_msgs
     self.assertEqual(
-        self.mock_logger.output_msgs,
+        output_msgs[:2],
         ['Storing experiment file in /usr/local/crosperf-results.',
-         'Storing results report in /usr/local/crosperf-results.',
-         'Storing email message body in /usr/local/crosperf-results.',
          'Storing results of each benchmark run.'])
+    self.assertTrue(output_msgs[2].startswith(
+        'Stored the results of 6 benchmark runs in '))
+    self.assertEqual(
+        output_msgs[3:5],
+        ['Storing results report in /usr/local/crosperf-results.',
+         'Storing email message body in /usr/local/crosperf-results.'])
+    self.assertTrue(output_msgs[5].startswith('Stored the reports in '))
 
 
 if __name__ == '__main__':
@@ -80,6 +80,11 @@ class ExperimentStatus(object):
     strings.append('Current time: %s Elapsed: %s ETA: %s' %
                    (datetime.datetime.now(),
                     datetime.timedelta(seconds=int(elapsed_time)), eta))
+    if self.experiment.schedv2():
+      makespan = self.experiment.schedv2().get_estimated_makespan()
+      if makespan is not None:
+        strings.append('Estimated time left from run history: %s' %
+                       datetime.timedelta(seconds=int(makespan)))
     strings.append(self._GetProgressBar(self.experiment.num_complete,
                                         self.num_total))
     return '\n'.join(strings)
@@ -3,12 +3,82 @@
 
 from __future__ import print_function
 
+import json
 import os
+import tempfile
 import threading
 
+from multiprocessing.pool import ThreadPool
+
 from cros_utils import logger
 from cros_utils.file_utils import FileUtils
 
+# Checksums of local images, so that unchanged images are not hashed again
+# on every run. Lives in the default cache dir (results_cache.SCRATCH_DIR).
+CHECKSUM_CACHE_FILE = os.path.join(
+    os.path.expanduser('~/cros_scratch'), 'image_checksums.json')
+# Maximum number of images hashed at the same time.
+MAX_CHECKSUM_THREADS = 4
+
+
+class ChecksumCache(object):
+  """Persistent map from the identity of a file to its checksum.
+
+  A file is identified by its path, size, mtime and inode, so a cached
+  checksum is only used if the file was not modified (or replaced) since.
+  """
+
+  _lock = threading.Lock()
+
+  def __init__(self, cache_file=None):
+    self.cache_file = cache_file or CHECKSUM_CACHE_FILE
+
+  @staticmethod
+  def _GetIdentity(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime, 'inode': st.st_ino}
+
+  def _Load(self):
+    try:
+      with open(self.cache_file, 'r') as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return {}
+
+  def Get(self, path):
+    path = os.path.realpath(path)
+    with self._lock:
+      entry = self._Load().get(path)
+    if not entry:
+      return None
+    checksum = entry.pop('checksum', None)
+    if entry != self._GetIdentity(path):
+      return None
+    return checksum
+
+  def Put(self, path, checksum):
+    path = os.path.realpath(path)
+    entry = self._GetIdentity(path)
+    entry['checksum'] = checksum
+    with self._lock:
+      entries = self._Load()
+      # Forget about the images that are gone.
+      entries = {p: e for p, e in entries.iteritems() if os.path.exists(p)}
+      entries[path] = entry
+      cache_dir = os.path.dirname(self.cache_file)
+      try:
+        if not os.path.isdir(cache_dir):
+          os.makedirs(cache_dir)
+        # Write to a temp file first, so that other crosperf instances never
+        # read a partially written cache.
+        fd, temp_file = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+          json.dump(entries, f)
+        os.rename(temp_file, self.cache_file)
+      except (IOError, OSError) as e:
+        logger.GetLogger().LogWarning('Could not update image checksum cache '
+                                      '%s: %s' % (self.cache_file, e))
+
 
 class ImageChecksummer(object):
   """Compute image checksum."""
@@ -32,10 +102,14 @@ class ImageChecksummer(object):
             raise RuntimeError('Called Checksum on non-local image!')
           if self.label.chromeos_image:
             if os.path.exists(self.label.chromeos_image):
-              self._checksum = FileUtils().Md5File(
-                  self.label.chromeos_image, log_level=self.log_level)
-              logger.GetLogger().LogOutput('Computed checksum is '
-                                           ': %s' % self._checksum)
+              checksum_cache = ChecksumCache()
+              self._checksum = checksum_cache.Get(self.label.chromeos_image)
+              if not self._checksum:
+                self._checksum = FileUtils().Md5File(
+                    self.label.chromeos_image, log_level=self.log_level)
+                logger.GetLogger().LogOutput('Computed checksum is '
+                                             ': %s' % self._checksum)
+                checksum_cache.Put(self.label.chromeos_image, self._checksum)
           if not self._checksum:
             raise RuntimeError('Checksum computing error.')
           logger.GetLogger().LogOutput('Checksum is: %s' % self._checksum)
@@ -67,3 +141,15 @@ class ImageChecksummer(object):
       logger.GetLogger().LogError('Could not compute checksum of image in label'
                                   " '%s'." % label.name)
       raise
+
+  def ComputeChecksums(self, labels, log_level):
+    """Computes the checksums of the local images of labels in parallel."""
+    local_labels = [l for l in labels if l.image_type == 'local']
+    if not local_labels:
+      return
+    pool = ThreadPool(min(len(local_labels), MAX_CHECKSUM_THREADS))
+    try:
+      pool.map(lambda l: self.Checksum(l, log_level), local_labels)
+    finally:
+      pool.close()
+      pool.join()
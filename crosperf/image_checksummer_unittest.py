@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for image_checksummer."""
+
+from __future__ import print_function
+
+import hashlib
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+import image_checksummer
+from image_checksummer import ChecksumCache
+from image_checksummer import ImageChecksummer
+from cros_utils.file_utils import FileUtils
+
+
+class FakeLabel(object):
+  """A label with just what the checksummer needs."""
+
+  def __init__(self, name, chromeos_image):
+    self.name = name
+    self.chromeos_image = chromeos_image
+    self.image_type = 'local'
+
+
+class ImageChecksummerTest(unittest.TestCase):
+  """Tests for ImageChecksummer and ChecksumCache."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.tempdir, 'scratch', 'checksums.json')
+    self.images = []
+    for i in range(3):
+      image = os.path.join(self.tempdir, 'image%d.bin' % i)
+      with open(image, 'w') as f:
+        f.write('image %d' % i)
+      self.images.append(image)
+    ImageChecksummer._per_image_checksummers = {}
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+    ImageChecksummer._per_image_checksummers = {}
+
+  def test_md5_file(self):
+    self.assertEqual(FileUtils().Md5File(self.images[0], block_size=2),
+                     hashlib.md5('image 0').hexdigest())
+    self.assertRaises(RuntimeError, FileUtils().Md5File,
+                      os.path.join(self.tempdir, 'missing'))
+
+  def test_checksum_cache(self):
+    cache = ChecksumCache(self.cache_file)
+    self.assertIsNone(cache.Get(self.images[0]))
+    cache.Put(self.images[0], 'abc')
+    cache.Put(self.images[1], 'def')
+    self.assertEqual(cache.Get(self.images[0]), 'abc')
+    self.assertEqual(ChecksumCache(self.cache_file).Get(self.images[1]), 'def')
+
+    # A modified image is hashed again.
+    with open(self.images[0], 'a') as f:
+      f.write('modified')
+    self.assertIsNone(cache.Get(self.images[0]))
+
+    # Entries of removed images are dropped.
+    os.remove(self.images[1])
+    cache.Put(self.images[2], 'ghi')
+    os.mknod(self.images[1])
+    self.assertIsNone(cache.Get(self.images[1]))
+    self.assertEqual(cache.Get(self.images[2]), 'ghi')
+
+  @mock.patch.object(FileUtils, 'Md5File')
+  def test_compute_checksums(self, mock_md5file):
+    mock_md5file.side_effect = lambda f, log_level: 'md5 of %s' % f
+    labels = [
+        FakeLabel('label%d' % i, image) for i, image in enumerate(self.images)
+    ]
+    official = FakeLabel('official', 'xbuddy://remote/lumpy/latest')
+    official.image_type = 'official'
+
+    with mock.patch.object(image_checksummer, 'CHECKSUM_CACHE_FILE',
+                           self.cache_file):
+      ImageChecksummer().ComputeChecksums(labels + [official], 'quiet')
+      self.assertEqual(mock_md5file.call_count, 3)
+      for label in labels:
+        self.assertEqual(ImageChecksummer().Checksum(label, 'quiet'),
+                         'md5 of %s' % label.chromeos_image)
+      self.assertEqual(mock_md5file.call_count, 3)
+
+      # A new crosperf run gets the checksums from the cache.
+      ImageChecksummer._per_image_checksummers = {}
+      ImageChecksummer().ComputeChecksums(labels, 'quiet')
+      self.assertEqual(mock_md5file.call_count, 3)
+      self.assertEqual(ImageChecksummer().Checksum(labels[0], 'quiet'),
+                       'md5 of %s' % self.images[0])
+
+
+if __name__ == '__main__':
+  unittest.main()
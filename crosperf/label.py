@@ -81,11 +81,22 @@ class Label(object):
   def _SetupChecksum(self):
     """Compute label checksum only once."""
 
-    self.checksum = None
-    if self.image_type == 'local':
-      self.checksum = ImageChecksummer().Checksum(self, self.log_level)
-    elif self.image_type == 'trybot':
-      self.checksum = hashlib.md5(self.chromeos_image).hexdigest()
+    # The checksum of a local image is computed when it is first needed, so
+    # that the images of all labels can be hashed in parallel (see
+    # ImageChecksummer.ComputeChecksums).
+    self._checksum = None
+    if self.image_type == 'trybot':
+      self._checksum = hashlib.md5(self.chromeos_image).hexdigest()
+
+  @property
+  def checksum(self):
+    if self._checksum is None and self.image_type == 'local':
+      self._checksum = ImageChecksummer().Checksum(self, self.log_level)
+    return self._checksum
+
+  @checksum.setter
+  def checksum(self, value):
+    self._checksum = value
 
   def _GetImageType(self, chromeos_image):
     image_type = None
@@ -6,21 +6,34 @@
 from __future__ import print_function
 
 import collections
+import contextlib
 import file_lock_machine
+import functools
 import hashlib
 import image_chromeos
+import json
 import math
 import os.path
 import re
+import shutil
 import sys
+import tempfile
 import threading
 import time
 
+from multiprocessing.pool import ThreadPool
+
 import test_flag
 from cros_utils import command_executer
 from cros_utils import logger
 
 CHECKSUM_FILE = '/usr/local/osimage_checksum_file'
+# Maximum number of machines probed at the same time.
+MAX_PROBE_THREADS = 8
+# What was learnt about each machine by the previous runs. Lives in the default
+# cache dir (results_cache.SCRATCH_DIR).
+FINGERPRINTS_FILE = os.path.join(
+    os.path.expanduser('~/cros_scratch'), 'machine_fingerprints.json')
 
 
 class BadChecksum(Exception):
@@ -41,9 +54,74 @@ class CrosCommandError(Exception):
   """Raised when an error occurs running command on DUT."""
 
 
+class MachineFingerprints(object):
+  """Persistent map from machine name to its probed hardware info.
+
+  An entry is a dict with the boot_id, meminfo, cpuinfo and machine_id of
+  the machine when it was last probed.
+  """
+
+  _lock = threading.Lock()
+
+  def __init__(self, fingerprints_file=None):
+    self.fingerprints_file = fingerprints_file or FINGERPRINTS_FILE
+
+  def _Load(self):
+    try:
+      with open(self.fingerprints_file, 'r') as f:
+        fingerprints = json.load(f)
+    except (IOError, ValueError):
+      return {}
+    # The probe outputs were written as latin-1, which maps every byte to a
+    # character, so encoding them gives back the bytes that were probed.
+    return dict((name, dict((k, v.encode('latin-1')
+                             if isinstance(v, unicode) else v)
+                            for k, v in fingerprint.iteritems()))
+                for name, fingerprint in fingerprints.iteritems())
+
+  def Get(self, machine_name):
+    with self._lock:
+      return self._Load().get(machine_name)
+
+  def Put(self, machine_name, fingerprint):
+    with self._lock:
+      fingerprints = self._Load()
+      fingerprints[machine_name] = fingerprint
+      fingerprints_dir = os.path.dirname(self.fingerprints_file)
+      try:
+        if not os.path.isdir(fingerprints_dir):
+          os.makedirs(fingerprints_dir)
+        # Replace the file at once, several crosperf instances may read it.
+        # The probe outputs are not necessarily valid UTF-8.
+        fd, temp_file = tempfile.mkstemp(dir=fingerprints_dir)
+        try:
+          with os.fdopen(fd, 'w') as f:
+            json.dump(fingerprints, f, encoding='latin-1')
+          os.rename(temp_file, self.fingerprints_file)
+        finally:
+          if os.path.exists(temp_file):
+            os.remove(temp_file)
+      except (IOError, OSError, ValueError) as e:
+        logger.GetLogger().LogWarning('Could not update machine fingerprints '
+                                      '%s: %s' % (self.fingerprints_file, e))
+
+
 class CrosMachine(object):
   """The machine class."""
 
+  # Everything SetUpChecksumInfo needs is gathered by a single remote command,
+  # whose output is split in these sections.
+  PROBE_SECTIONS = collections.OrderedDict([
+      ('boot_id', 'cat /proc/sys/kernel/random/boot_id'),
+      ('meminfo', 'cat /proc/meminfo'),
+      ('cpuinfo', 'cat /proc/cpuinfo'),
+      ('vpd', 'dump_vpd_log --full --stdout'),
+      ('ifconfig', 'ifconfig'),
+  ])
+  PROBE_MARKER = '@@crosperf_probe:'
+  # Seconds after which an unresponsive machine is considered unreachable.
+  PROBE_TIMEOUT = 60
+
   def __init__(self, name, chromeos_root, log_level, cmd_exec=None):
     self.name = name
     self.image = None
@@ -66,16 +144,94 @@ class CrosMachine(object):
     self.SetUpChecksumInfo()
 
   def SetUpChecksumInfo(self):
-    if not self.IsReachable():
+    """Sets the checksums identifying the hardware of the machine.
+
+    If the machine was probed by a previous run and hasn't rebooted since, the
+    stored fingerprint is used right away: it only takes reading the boot_id
+    of the machine. Otherwise the machine is probed, before its checksums are
+    used.
+    """
+    fingerprints = MachineFingerprints()
+    stored_fingerprint = fingerprints.Get(self.name)
+    if stored_fingerprint:
+      boot_id = self._GetBootID()
+      if boot_id is None:
+        self.machine_checksum = None
+        return
+      if boot_id == stored_fingerprint['boot_id']:
+        self._ApplyFingerprint(stored_fingerprint)
+        return
+
+    fingerprint = self._ProbeFingerprint()
+    if fingerprint is None:
       self.machine_checksum = None
       return
-    self._GetMemoryInfo()
-    self._GetCPUInfo()
+    fingerprints.Put(self.name, fingerprint)
+    if stored_fingerprint and any(
+        fingerprint[k] != stored_fingerprint[k]
+        for k in ('meminfo', 'cpuinfo', 'machine_id')):
+      logger.GetLogger().LogWarning('The hardware of %s changed since it was '
+                                    'last probed.' % self.name)
+    self._ApplyFingerprint(fingerprint)
+
+  def _GetBootID(self):
+    ret, out, _ = self.ce.CrosRunCommandWOutput(
+        self.PROBE_SECTIONS['boot_id'],
+        machine=self.name,
+        chromeos_root=self.chromeos_root,
+        command_timeout=self.PROBE_TIMEOUT)
+    if ret:
+      return None
+    return out.strip()
+
+  def _ProbeFingerprint(self):
+    """Probes the machine. Returns None if it is not reachable."""
+    probe = self._Probe()
+    if probe is None:
+      return None
+    assert probe['meminfo'], ('Could not get meminfo from machine: %s' %
+                              self.name)
+    assert probe['cpuinfo'], ('Could not get cpuinfo from machine: %s' %
+                              self.name)
+    return {
+        'boot_id': probe['boot_id'].strip(),
+        'meminfo': probe['meminfo'],
+        'cpuinfo': probe['cpuinfo'],
+        'machine_id': self._ParseMachineID(probe['vpd'], probe['ifconfig'])
+    }
+
+  def _ApplyFingerprint(self, fingerprint):
+    self.meminfo = fingerprint['meminfo']
+    self._ParseMemoryInfo()
+    self.cpuinfo = fingerprint['cpuinfo']
     self._ComputeMachineChecksumString()
-    self._GetMachineID()
+    self.machine_id = fingerprint['machine_id']
     self.machine_checksum = self._GetMD5Checksum(self.checksum_string)
     self.machine_id_checksum = self._GetMD5Checksum(self.machine_id)
 
+  def _Probe(self):
+    """Returns the output of the probe commands, by section name.
+
+    Returns None if the machine is not reachable.
+    """
+    command = '; '.join("echo '%s%s'; %s" % (self.PROBE_MARKER, name, cmd)
+                        for name, cmd in self.PROBE_SECTIONS.iteritems())
+    ret, out, _ = self.ce.CrosRunCommandWOutput(
+        command + '; true',
+        machine=self.name,
+        chromeos_root=self.chromeos_root,
+        command_timeout=self.PROBE_TIMEOUT)
+    if ret:
+      return None
+    probe = dict.fromkeys(self.PROBE_SECTIONS, '')
+    section = None
+    for line in out.splitlines(True):
+      if line.startswith(self.PROBE_MARKER):
+        section = line[len(self.PROBE_MARKER):].strip()
+      elif section in probe:
+        probe[section] += line
+    return probe
+
   def IsReachable(self):
     command = 'ls'
     ret = self.ce.CrosRunCommand(command,
@@ -156,25 +312,34 @@ class CrosMachine(object):
         command,
         machine=self.name,
         chromeos_root=self.chromeos_root)
-    b = if_out.splitlines()
-    a = [l for l in b if 'Product' in l]
-    if len(a):
-      self.machine_id = a[0]
+    self.machine_id = self._ParseMachineID(if_out, None)
+    if self.machine_id:
       return
     command = 'ifconfig'
     _, if_out, _ = self.ce.CrosRunCommandWOutput(
         command,
         machine=self.name,
         chromeos_root=self.chromeos_root)
+    self.machine_id = self._ParseMachineID('', if_out)
+
+  def _ParseMachineID(self, vpd_out, if_out):
+    """Returns the machine id from the output of dump_vpd_log or ifconfig.
+
+    Returns None if vpd_out has no id and if_out is None.
+    """
+    b = vpd_out.splitlines()
+    a = [l for l in b if 'Product' in l]
+    if len(a):
+      return a[0]
+    if if_out is None:
+      return None
     b = if_out.splitlines()
     a = [l for l in b if 'HWaddr' in l]
     if len(a):
-      self.machine_id = '_'.join(a)
-      return
+      return '_'.join(a)
     a = [l for l in b if 'ether' in l]
     if len(a):
-      self.machine_id = '_'.join(a)
-      return
+      return '_'.join(a)
     assert 0, 'Could not get machine_id from machine: %s' % self.name
 
   def __str__(self):
@@ -199,17 +364,35 @@ class MachineManager(object):
   same machine at the same time.
   """
 
+  # Number of times image_chromeos is tried on a machine before giving up.
+  IMAGE_ATTEMPTS = 3
+  # Time given to a rebooting machine before it is polled; doubled after each
+  # failed attempt.
+  IMAGE_RETRY_WAIT = 30
+  REBOOT_POLL_INTERVAL = 10
+  REBOOT_TIMEOUT = 600
+
   def __init__(self,
                chromeos_root,
                acquire_timeout,
                log_level,
                locks_dir,
                cmd_exec=None,
-               lgr=None):
+               lgr=None,
+               image_parallelism=1):
     self._lock = threading.RLock()
     self._all_machines = []
     self._machines = []
-    self.image_lock = threading.Lock()
+    # Bounds the number of machines being imaged at the same time.
+    self.image_semaphore = threading.BoundedSemaphore(max(1, image_parallelism))
+    # Images are staged in the chromeos root once and then flashed onto any
+    # number of machines. Maps (chromeos_root, image) to [lock, staged image].
+    self._staged_images = {}
+    self._staged_images_lock = threading.Lock()
+    self._temp_image_dirs = []
+    self._imaging_log_level_lock = threading.Lock()
+    self._num_imaging = 0
+    self._saved_ce_log_level = None
     self.num_reimages = 0
     self.chromeos_root = None
     self.machine_checksum = {}
@@ -253,6 +436,60 @@ class MachineManager(object):
       version = ''
     return version.rstrip()
 
+  def _StageImage(self, label, chromeos_root):
+    """Returns [True, path] of the local image of label inside chromeos_root.
+
+    DoImage calls this only once a machine's checksum shows it needs imaging.
+    The image is located (or copied) in the chromeos root only once, however
+    many machines it is then flashed onto, and the copy is removed by this
+    manager rather than by DoImage.
+    """
+    key = (chromeos_root, label.chromeos_image)
+    with self._staged_images_lock:
+      if key not in self._staged_images:
+        self._staged_images[key] = [threading.Lock(), None]
+      staged = self._staged_images[key]
+    with staged[0]:
+      if not staged[1]:
+        found, staged[1] = image_chromeos.LocateOrCopyImage(
+            chromeos_root, label.chromeos_image, board=label.board)
+        if not found:
+          self._temp_image_dirs.append(os.path.dirname(staged[1]))
+      return [True, staged[1]]
+
+  @contextlib.contextmanager
+  def _ImagingLogLevel(self):
+    """Raises the log level of self.ce while any machine is being imaged."""
+    with self._imaging_log_level_lock:
+      if not self._num_imaging:
+        self._saved_ce_log_level = self.ce.log_level
+        if self.log_level != 'verbose':
+          self.ce.log_level = 'average'
+      self._num_imaging += 1
+    try:
+      yield
+    finally:
+      with self._imaging_log_level_lock:
+        self._num_imaging -= 1
+        if not self._num_imaging:
+          self.ce.log_level = self._saved_ce_log_level
+
+  def _RebootAndWait(self, machine, wait_time):
+    """Reboots machine and waits until it is reachable again."""
+    if self.log_level != 'verbose':
+      self.logger.LogOutput('reboot & exit.')
+    self.ce.CrosRunCommand('reboot && exit',
+                           machine=machine.name,
+                           chromeos_root=self.chromeos_root)
+    # Give the machine some time to go down, then poll until it is back.
+    time.sleep(wait_time)
+    waited = wait_time
+    poll_interval = self.REBOOT_POLL_INTERVAL
+    while waited < self.REBOOT_TIMEOUT and not machine.IsReachable():
+      time.sleep(poll_interval)
+      waited += poll_interval
+      poll_interval = min(2 * poll_interval, self.REBOOT_TIMEOUT - waited)
+
   def ImageMachine(self, machine, label):
     checksum = label.checksum
 
@@ -269,45 +506,40 @@ class MachineManager(object):
     if label.board:
       image_chromeos_args.append('--board=%s' % label.board)
 
-    # Currently can't image two machines at once.
-    # So have to serialized on this lock.
-    save_ce_log_level = self.ce.log_level
-    if self.log_level != 'verbose':
-      self.ce.log_level = 'average'
-
-    with self.image_lock:
-      if self.log_level != 'verbose':
-        self.logger.LogOutput('Pushing image onto machine.')
-        self.logger.LogOutput('Running image_chromeos.DoImage with %s' %
-                              ' '.join(image_chromeos_args))
-      retval = 0
-      if not test_flag.GetTestMode():
-        retval = image_chromeos.DoImage(image_chromeos_args)
-      if retval:
-        cmd = 'reboot && exit'
-        if self.log_level != 'verbose':
-          self.logger.LogOutput('reboot & exit.')
-        self.ce.CrosRunCommand(cmd,
-                               machine=machine.name,
-                               chromeos_root=self.chromeos_root)
-        time.sleep(60)
-        if self.log_level != 'verbose':
-          self.logger.LogOutput('Pushing image onto machine.')
-          self.logger.LogOutput('Running image_chromeos.DoImage with %s' %
-                                ' '.join(image_chromeos_args))
-        retval = image_chromeos.DoImage(image_chromeos_args)
-      if retval:
-        raise RuntimeError("Could not image machine: '%s'." % machine.name)
-      else:
-        self.num_reimages += 1
-      machine.checksum = checksum
-      machine.image = label.chromeos_image
-      machine.label = label
-
-    if not label.chrome_version:
-      label.chrome_version = self.GetChromeVersion(machine)
-
-    self.ce.log_level = save_ce_log_level
+    with self._ImagingLogLevel():
+      # Only a limited number of machines are imaged at the same time.
+      with self.image_semaphore:
+        retval = 0
+        wait_time = self.IMAGE_RETRY_WAIT
+        for attempt in range(self.IMAGE_ATTEMPTS):
+          if attempt:
+            self.logger.LogWarning("Imaging '%s' failed, retrying (attempt "
+                                   '%d of %d).' % (machine.name, attempt + 1,
+                                                   self.IMAGE_ATTEMPTS))
+            self._RebootAndWait(machine, wait_time)
+            wait_time *= 2
+          if self.log_level != 'verbose':
+            self.logger.LogOutput('Pushing image onto machine.')
+            self.logger.LogOutput('Running image_chromeos.DoImage with %s' %
+                                  ' '.join(image_chromeos_args))
+          if not test_flag.GetTestMode():
+            retval = image_chromeos.DoImage(
+                image_chromeos_args,
+                locate_image=functools.partial(self._StageImage, label,
+                                               chromeos_root))
+          if not retval:
+            break
+        if retval:
+          raise RuntimeError("Could not image machine: '%s'." % machine.name)
+        with self._lock:
+          self.num_reimages += 1
+        machine.checksum = checksum
+        machine.image = label.chromeos_image
+        machine.label = label
+
+      if not label.chrome_version:
+        label.chrome_version = self.GetChromeVersion(machine)
+
     return retval
 
   def ComputeCommonCheckSum(self, label):
@@ -365,17 +597,39 @@ class MachineManager(object):
 
   # This is called from single threaded mode.
   def AddMachine(self, machine_name):
-    with self._lock:
-      for m in self._all_machines:
-        assert m.name != machine_name, 'Tried to double-add %s' % machine_name
+    self.AddMachines([machine_name])
 
-      if self.log_level != 'verbose':
-        self.logger.LogOutput('Setting up remote access to %s' % machine_name)
-        self.logger.LogOutput('Checking machine characteristics for %s' %
-                              machine_name)
-      cm = CrosMachine(machine_name, self.chromeos_root, self.log_level)
-      if cm.machine_checksum:
-        self._all_machines.append(cm)
+  def _CreateMachine(self, machine_name):
+    if self.log_level != 'verbose':
+      self.logger.LogOutput('Setting up remote access to %s' % machine_name)
+      self.logger.LogOutput('Checking machine characteristics for %s' %
+                            machine_name)
+    return CrosMachine(machine_name, self.chromeos_root, self.log_level)
+
+  # This is called from single threaded mode.
+  def AddMachines(self, machine_names):
+    """Adds the reachable machines of machine_names.
+
+    The machines are probed concurrently, so unreachable ones only delay
+    the others by their timeout once.
+    """
+    with self._lock:
+      names = [m.name for m in self._all_machines] + list(machine_names)
+      for machine_name in machine_names:
+        assert names.count(machine_name) == 1, ('Tried to double-add %s' %
+                                                machine_name)
+    if not machine_names:
+      return
+    pool = ThreadPool(min(len(machine_names), MAX_PROBE_THREADS))
+    try:
+      machines = pool.map(self._CreateMachine, machine_names)
+    finally:
+      pool.close()
+      pool.join()
+    with self._lock:
+      for cm in machines:
+        if cm.machine_checksum:
+          self._all_machines.append(cm)
 
   def RemoveMachine(self, machine_name):
     with self._lock:
@@ -388,8 +642,17 @@ class MachineManager(object):
 
   def ForceSameImageToAllMachines(self, label):
     machines = self.GetMachines(label)
+    if not machines:
+      return
+    # Imaging is throttled by image_semaphore. The pool re-raises the error of
+    # any machine that could not be imaged, once all of them are done.
+    pool = ThreadPool(len(machines))
+    try:
+      pool.map(lambda m: self.ImageMachine(m, label), machines)
+    finally:
+      pool.close()
+      pool.join()
     for m in machines:
-      self.ImageMachine(m, label)
       m.SetUpChecksumInfo()
 
   def AcquireMachine(self, label):
@@ -478,6 +741,12 @@ class MachineManager(object):
         if not res:
           self.logger.LogError("Could not unlock machine: '%s'." % m.name)
 
+    # Remove the images that had to be copied into the chromeos root.
+    for temp_dir in self._temp_image_dirs:
+      self.logger.LogOutput('Deleting temp image dir: %s' % temp_dir)
+      shutil.rmtree(temp_dir, ignore_errors=True)
+    self._temp_image_dirs = []
+
   def __str__(self):
     with self._lock:
       l = ['MachineManager Status:'] + [str(m) for m in self._machines]
@@ -650,14 +919,27 @@ power management:
 class MockMachineManager(MachineManager):
   """Mock machine manager class."""
 
-  def __init__(self, chromeos_root, acquire_timeout, log_level, locks_dir):
+  def __init__(self,
+               chromeos_root,
+               acquire_timeout,
+               log_level,
+               locks_dir,
+               image_parallelism=1):
     super(MockMachineManager, self).__init__(
-        chromeos_root, acquire_timeout, log_level, locks_dir)
+        chromeos_root,
+        acquire_timeout,
+        log_level,
+        locks_dir,
+        image_parallelism=image_parallelism)
 
   def _TryToLockMachine(self, cros_machine):
     self._machines.append(cros_machine)
     cros_machine.checksum = ''
 
+  def AddMachines(self, machine_names):
+    for machine_name in machine_names:
+      self.AddMachine(machine_name)
+
   def AddMachine(self, machine_name):
     with self._lock:
       for m in self._all_machines:
@@ -6,6 +6,9 @@
 from __future__ import print_function
 
 import os.path
+import shutil
+import tempfile
+import threading
 import time
 import hashlib
 
@@ -223,6 +226,136 @@ class MachineManagerTest(unittest.TestCase):
     self.assertEqual(mock_run_croscmd.call_count, 0)
     self.assertEqual(mock_sleep.call_count, 0)
 
+  @mock.patch.object(time, 'sleep')
+  @mock.patch.object(machine_manager.image_chromeos, 'DoImage')
+  def test_image_machine_retries(self, mock_do_image, mock_sleep):
+    test_flag.SetTestMode(False)
+    self.mock_cmd_exec.CrosRunCommand = mock.Mock()
+    self.mock_cmd_exec.log_level = 'verbose'
+    machine = self.mock_lumpy2
+    machine.checksum = ''
+    machine.IsReachable.side_effect = [False, True, True]
+    label_lumpy = label.MockLabel('lumpy', 'lumpy_chromeos_image',
+                                  'autotest_dir', CHROMEOS_ROOT, 'lumpy',
+                                  ['lumpy1', 'lumpy2'], '', '', False,
+                                  'average', 'gcc', None)
+    label_lumpy.image_type = 'trybot'
+    label_lumpy.chrome_version = 'R60-9000.0.0'
+
+    try:
+      # Two failures, then the machine gets imaged.
+      mock_do_image.side_effect = [1, 1, 0]
+      self.assertEqual(self.mm.ImageMachine(machine, label_lumpy), 0)
+      self.assertEqual(mock_do_image.call_count, 3)
+      self.assertEqual(self.mock_cmd_exec.CrosRunCommand.call_count, 2)
+      # The wait after a reboot doubles, and the machine is polled until it
+      # is reachable again.
+      self.assertEqual(mock_sleep.call_args_list, [
+          mock.call(30), mock.call(10), mock.call(60)
+      ])
+      self.assertEqual(self.mm.num_reimages, 1)
+      self.assertEqual(machine.label, label_lumpy)
+      self.assertEqual(self.mock_cmd_exec.log_level, 'verbose')
+
+      mock_do_image.reset_mock()
+      machine.checksum = ''
+      machine.IsReachable.side_effect = None
+      machine.IsReachable.return_value = True
+      mock_do_image.side_effect = None
+      mock_do_image.return_value = 1
+      self.assertRaises(RuntimeError, self.mm.ImageMachine, machine,
+                        label_lumpy)
+      self.assertEqual(mock_do_image.call_count,
+                       machine_manager.MachineManager.IMAGE_ATTEMPTS)
+    finally:
+      test_flag.SetTestMode(True)
+
+  @mock.patch.object(machine_manager.image_chromeos, 'LocateOrCopyImage')
+  @mock.patch.object(machine_manager.image_chromeos, 'DoImage')
+  def test_image_machines_in_parallel(self, mock_do_image, mock_locate):
+    test_flag.SetTestMode(False)
+    mm = machine_manager.MachineManager(CHROMEOS_ROOT, 0, 'average', None,
+                                        self.mock_cmd_exec, self.mock_logger,
+                                        image_parallelism=2)
+    label_lumpy = label.MockLabel('lumpy', '/tmp/lumpy_chromeos_image.bin',
+                                  'autotest_dir', CHROMEOS_ROOT, 'lumpy',
+                                  ['lumpy1', 'lumpy2'], '', '', False,
+                                  'average', 'gcc', None)
+    label_lumpy.chrome_version = 'R60-9000.0.0'
+    label_lumpy.checksum = 'image_checksum'
+    staged_image = os.path.join(CHROMEOS_ROOT, 'src/build/images/lumpy',
+                                'tmp123/chromiumos_test_image.bin')
+    mock_locate.return_value = [False, staged_image]
+    machines = [self.mock_lumpy1, self.mock_lumpy2, self.mock_lumpy3,
+                self.mock_lumpy4]
+
+    imaging = []
+    max_imaging = []
+    located_images = []
+    imaging_lock = threading.Lock()
+
+    def FakeDoImage(argv, locate_image=None):
+      with imaging_lock:
+        imaging.append(argv)
+        max_imaging.append(len(imaging))
+      # The first machine already runs the image, so only the others need
+      # the image staged.
+      if '--remote=lumpy1' not in argv:
+        located_images.append(locate_image())
+      time.sleep(0.1)
+      with imaging_lock:
+        imaging.remove(argv)
+      return 0
+
+    mock_do_image.side_effect = FakeDoImage
+    try:
+      threads = []
+      for m in machines:
+        m.checksum = ''
+        threads.append(threading.Thread(target=mm.ImageMachine,
+                                        args=(m, label_lumpy)))
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+    finally:
+      test_flag.SetTestMode(True)
+
+    self.assertEqual(mock_do_image.call_count, 4)
+    self.assertEqual(max(max_imaging), 2)
+    self.assertEqual(mm.num_reimages, 4)
+    # The image is staged once, and flashed from the staged copy, which
+    # DoImage must not delete.
+    self.assertEqual(mock_locate.call_count, 1)
+    self.assertEqual(located_images, [[True, staged_image]] * 3)
+    for call in mock_do_image.call_args_list:
+      self.assertIn('--image=/tmp/lumpy_chromeos_image.bin', call[0][0])
+    self.assertEqual(mm._temp_image_dirs, [os.path.dirname(staged_image)])
+    for m in machines:
+      self.assertEqual(m.checksum, 'image_checksum')
+
+  @mock.patch.object(machine_manager.image_chromeos, 'LocateOrCopyImage')
+  @mock.patch.object(machine_manager.image_chromeos, 'DoImage')
+  def test_image_machine_not_staged(self, mock_do_image, mock_locate):
+    test_flag.SetTestMode(False)
+    label_lumpy = label.MockLabel('lumpy', '/tmp/lumpy_chromeos_image.bin',
+                                  'autotest_dir', CHROMEOS_ROOT, 'lumpy',
+                                  ['lumpy1', 'lumpy2'], '', '', False,
+                                  'average', 'gcc', None)
+    label_lumpy.chrome_version = 'R60-9000.0.0'
+    label_lumpy.checksum = 'image_checksum'
+    machine = self.mock_lumpy1
+    machine.checksum = ''
+    # The device checksum matches, so DoImage never asks for the image.
+    mock_do_image.return_value = 0
+    try:
+      self.assertEqual(self.mm.ImageMachine(machine, label_lumpy), 0)
+    finally:
+      test_flag.SetTestMode(True)
+    self.assertEqual(mock_do_image.call_count, 1)
+    self.assertEqual(mock_locate.call_count, 0)
+    self.assertEqual(self.mm._temp_image_dirs, [])
+
   def test_compute_common_checksum(self):
 
     self.mm.machine_checksum = {}
@@ -276,6 +409,37 @@ class MachineManagerTest(unittest.TestCase):
 
     self.assertRaises(Exception, self.mm.AddMachine, 'lumpy1')
 
+  @mock.patch.object(machine_manager, 'CrosMachine')
+  def test_add_machines(self, mock_machine):
+    probing = []
+    max_probing = []
+    probing_lock = threading.Lock()
+
+    def FakeCrosMachine(name, _chromeos_root, _log_level):
+      with probing_lock:
+        probing.append(name)
+        max_probing.append(len(probing))
+      time.sleep(0.1)
+      with probing_lock:
+        probing.remove(name)
+      cm = mock.Mock(spec=machine_manager.CrosMachine)
+      cm.name = name
+      # Machines ending with an odd number are unreachable.
+      cm.machine_checksum = None if int(name[-1]) % 2 else 'checksum'
+      return cm
+
+    mock_machine.side_effect = FakeCrosMachine
+    names = ['host%d' % i for i in range(10)]
+    self.mm.AddMachines(names)
+    self.assertEqual(mock_machine.call_count, 10)
+    self.assertEqual(max(max_probing), machine_manager.MAX_PROBE_THREADS)
+    self.assertEqual([m.name for m in self.mm._all_machines[5:]],
+                     ['host0', 'host2', 'host4', 'host6', 'host8'])
+
+    self.assertRaises(Exception, self.mm.AddMachines, ['host10', 'host10'])
+    self.assertRaises(Exception, self.mm.AddMachines, ['host12', 'host0'])
+    self.assertEqual(mock_machine.call_count, 10)
+
   def test_remove_machine(self):
     self.mm._machines = self.mm._all_machines
     self.assertTrue(self.mock_lumpy2 in self.mm._machines)
@@ -306,6 +470,21 @@ class MachineManagerTest(unittest.TestCase):
     self.assertEqual(self.image_log[2],
                      'Pushed lumpy_chromeos_image onto lumpy3')
 
+  def test_force_same_image_to_all_machines_failure(self):
+    self.checksummed = []
+
+    def FakeImageMachine(machine, _):
+      if machine.name == 'lumpy2':
+        raise RuntimeError('Could not image machine: (%s).' % machine.name)
+
+    self.mm.ImageMachine = FakeImageMachine
+    for m in [self.mock_lumpy1, self.mock_lumpy2, self.mock_lumpy3]:
+      m.SetUpChecksumInfo = lambda m=m: self.checksummed.append(m.name)
+
+    self.assertRaises(RuntimeError, self.mm.ForceSameImageToAllMachines,
+                      LABEL_LUMPY)
+    self.assertEqual(self.checksummed, [])
+
   @mock.patch.object(image_checksummer.ImageChecksummer, 'Checksum')
   @mock.patch.object(hashlib, 'md5')
   def test_acquire_machine(self, mock_md5, mock_checksum):
@@ -681,45 +860,126 @@ class CrosMachineTest(unittest.TestCase):
     self.assertEqual(cm.chromeos_root, '/usr/local/chromeos')
     self.assertEqual(cm.log_level, 'average')
 
-  @mock.patch.object(machine_manager.CrosMachine, 'IsReachable')
-  @mock.patch.object(machine_manager.CrosMachine, '_GetMemoryInfo')
-  @mock.patch.object(machine_manager.CrosMachine, '_GetCPUInfo')
-  @mock.patch.object(machine_manager.CrosMachine,
-                     '_ComputeMachineChecksumString')
-  @mock.patch.object(machine_manager.CrosMachine, '_GetMachineID')
+  @mock.patch.object(machine_manager.CrosMachine, '_GetBootID')
+  @mock.patch.object(machine_manager.CrosMachine, '_Probe')
   @mock.patch.object(machine_manager.CrosMachine, '_GetMD5Checksum')
-  def test_setup_checksum_info(self, mock_md5sum, mock_machineid,
-                               mock_checkstring, mock_cpuinfo, mock_meminfo,
-                               mock_isreachable):
-
+  def test_setup_checksum_info(self, mock_md5sum, mock_probe, mock_boot_id):
+    tempdir = tempfile.mkdtemp()
+    fingerprints_file = os.path.join(tempdir, 'fingerprints.json')
+    with mock.patch.object(machine_manager, 'FINGERPRINTS_FILE',
+                           fingerprints_file):
+      try:
+        self._TestSetupChecksumInfo(mock_md5sum, mock_probe, mock_boot_id)
+      finally:
+        shutil.rmtree(tempdir)
+
+  def test_fingerprints_not_utf8(self):
+    tempdir = tempfile.mkdtemp()
+    try:
+      fingerprints = machine_manager.MachineFingerprints(
+          os.path.join(tempdir, 'fingerprints.json'))
+      fingerprint = {'boot_id': 'boot_id1',
+                     'meminfo': MEMINFO_STRING,
+                     'cpuinfo': 'model name\t: \xff\xfe CPU\n',
+                     'machine_id': ''}
+      fingerprints.Put('daisy.cros', fingerprint)
+      self.assertEqual(fingerprints.Get('daisy.cros'), fingerprint)
+      # Only the fingerprints file is left, no temporary file.
+      self.assertEqual(os.listdir(tempdir), ['fingerprints.json'])
+    finally:
+      shutil.rmtree(tempdir)
+
+  def _TestSetupChecksumInfo(self, mock_md5sum, mock_probe, mock_boot_id):
     # Test 1. Machine is not reachable; SetUpChecksumInfo is called via
     # __init__.
-    mock_isreachable.return_value = False
-    mock_md5sum.return_value = 'md5_checksum'
+    mock_probe.return_value = None
+    mock_md5sum.side_effect = lambda s: 'md5 of %s' % s
     cm = machine_manager.CrosMachine('daisy.cros', '/usr/local/chromeos',
                                      'average', self.mock_cmd_exec)
-    cm.checksum_string = 'This is a checksum string.'
-    cm.machine_id = 'machine_id1'
-    self.assertEqual(mock_isreachable.call_count, 1)
+    self.assertEqual(mock_probe.call_count, 1)
     self.assertIsNone(cm.machine_checksum)
-    self.assertEqual(mock_meminfo.call_count, 0)
-
-    # Test 2. Machine is reachable. Call explicitly.
-    mock_isreachable.return_value = True
-    cm.checksum_string = 'This is a checksum string.'
-    cm.machine_id = 'machine_id1'
+    self.assertIsNone(cm.meminfo)
+    self.assertIsNone(machine_manager.MachineFingerprints().Get('daisy.cros'))
+
+    # Test 2. Machine is reachable and was never probed. Call explicitly.
+    probe = {
+        'boot_id': 'boot_id1\n',
+        'meminfo': MEMINFO_STRING,
+        'cpuinfo': CPUINFO_STRING,
+        'vpd': DUMP_VPD_STRING,
+        'ifconfig': IFCONFIG_STRING
+    }
+    mock_probe.return_value = probe
+    cm.SetUpChecksumInfo()
+    self.assertEqual(mock_probe.call_count, 2)
+    self.assertEqual(mock_boot_id.call_count, 0)
+    self.assertEqual(cm.phys_kbytes, 4194304)
+    self.assertEqual(cm.checksum_string, CHECKSUM_STRING)
+    self.assertEqual(cm.machine_id, '"Product_S/N"="HT4L91SC300208"')
+    self.assertEqual(cm.machine_checksum, 'md5 of %s' % CHECKSUM_STRING)
+    self.assertEqual(cm.machine_id_checksum,
+                     'md5 of "Product_S/N"="HT4L91SC300208"')
+    fingerprint = machine_manager.MachineFingerprints().Get('daisy.cros')
+    self.assertEqual(fingerprint['boot_id'], 'boot_id1')
+
+    # Test 3. Same boot, the stored fingerprint is used without probing.
+    mock_boot_id.return_value = 'boot_id1'
+    cm = machine_manager.CrosMachine('daisy.cros', '/usr/local/chromeos',
+                                     'average', self.mock_cmd_exec)
+    self.assertEqual(mock_probe.call_count, 2)
+    self.assertEqual(mock_boot_id.call_count, 1)
+    self.assertEqual(cm.machine_checksum, 'md5 of %s' % CHECKSUM_STRING)
+    self.assertEqual(cm.machine_id_checksum,
+                     'md5 of "Product_S/N"="HT4L91SC300208"')
+
+    # Test 4. The machine rebooted, it is probed again before its checksums
+    # are set.
+    mock_boot_id.return_value = 'boot_id2'
+    probe['boot_id'] = 'boot_id2'
+    probe['vpd'] = ''
+    cm = machine_manager.CrosMachine('daisy.cros', '/usr/local/chromeos',
+                                     'average', self.mock_cmd_exec)
+    self.assertEqual(mock_probe.call_count, 3)
+    self.assertIn('ether 00:50:b6:63:db:65', cm.machine_id)
+    self.assertEqual(cm.machine_id_checksum, 'md5 of %s' % cm.machine_id)
+    fingerprint = machine_manager.MachineFingerprints().Get('daisy.cros')
+    self.assertEqual(fingerprint['boot_id'], 'boot_id2')
+    self.assertEqual(fingerprint['machine_id'], cm.machine_id)
+
+    # Test 5. The machine is not reachable.
+    mock_boot_id.return_value = None
     cm.SetUpChecksumInfo()
-    self.assertEqual(mock_isreachable.call_count, 2)
-    self.assertEqual(mock_meminfo.call_count, 1)
-    self.assertEqual(mock_cpuinfo.call_count, 1)
-    self.assertEqual(mock_checkstring.call_count, 1)
-    self.assertEqual(mock_machineid.call_count, 1)
-    self.assertEqual(mock_md5sum.call_count, 2)
-    self.assertEqual(cm.machine_checksum, 'md5_checksum')
-    self.assertEqual(cm.machine_id_checksum, 'md5_checksum')
-    self.assertEqual(mock_md5sum.call_args_list[0][0][0],
-                     'This is a checksum string.')
-    self.assertEqual(mock_md5sum.call_args_list[1][0][0], 'machine_id1')
+    self.assertIsNone(cm.machine_checksum)
+
+  @mock.patch.object(machine_manager.CrosMachine, 'SetUpChecksumInfo')
+  def test_probe(self, _mock_setup):
+    cm = machine_manager.CrosMachine('daisy.cros', '/usr/local/chromeos',
+                                     'average', self.mock_cmd_exec)
+    marker = machine_manager.CrosMachine.PROBE_MARKER
+    self.mock_cmd_exec.CrosRunCommandWOutput = mock.Mock(return_value=[
+        0, marker + 'boot_id\nboot_id1\n' + marker + 'meminfo\n' +
+        MEMINFO_STRING + marker + 'cpuinfo\n' + CPUINFO_STRING + marker +
+        'vpd\n' + marker + 'ifconfig\n' + IFCONFIG_STRING, ''
+    ])
+    self.assertEqual(cm._Probe(), {
+        'boot_id': 'boot_id1\n',
+        'meminfo': MEMINFO_STRING,
+        'cpuinfo': CPUINFO_STRING,
+        'vpd': '',
+        'ifconfig': IFCONFIG_STRING
+    })
+    # A single remote command gathers everything.
+    self.assertEqual(self.mock_cmd_exec.CrosRunCommandWOutput.call_count, 1)
+    command = self.mock_cmd_exec.CrosRunCommandWOutput.call_args[0][0]
+    for probe_command in machine_manager.CrosMachine.PROBE_SECTIONS.values():
+      self.assertIn(probe_command, command)
+    args_dict = self.mock_cmd_exec.CrosRunCommandWOutput.call_args[1]
+    self.assertEqual(args_dict['machine'], 'daisy.cros')
+    self.assertEqual(args_dict['command_timeout'],
+                     machine_manager.CrosMachine.PROBE_TIMEOUT)
+
+    self.mock_cmd_exec.CrosRunCommandWOutput.return_value = [255, '', '']
+    self.assertIsNone(cm._Probe())
 
   @mock.patch.object(command_executer.CommandExecuter, 'CrosRunCommand')
   @mock.patch.object(machine_manager.CrosMachine, 'SetUpChecksumInfo')
@@ -0,0 +1,505 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Reads perf.data files in-process, instead of running `perf report`.
+
+ReadPerfData parses the header, the event attributes and the records of a
+perf.data file written by `perf record`, and returns a PerfProfile with, for
+every event, its number of samples, its event count (the sum of the sample
+periods) and a histogram of the sampled addresses. Addresses are kept relative
+to the file they were mapped from, so symbolizing them is a separate step (see
+perf_symbols), done once per address instead of once per sample.
+
+WritePerfReport writes a PerfProfile in the format of
+`perf report -n --stdio`, which is what the rest of crosperf parses.
+
+Only the parts of the format crosperf needs are supported: a PerfDataError is
+raised for anything else (such as piped perf.data files), so that callers can
+fall back to `perf report`.
+"""
+
+from __future__ import print_function
+
+import bisect
+import collections
+import struct
+
+PERF_MAGIC = 'PERFILE2'
+
+# perf_event_attr.sample_type bits, in the order of their sample fields.
+PERF_SAMPLE_IP = 1 << 0
+PERF_SAMPLE_TID = 1 << 1
+PERF_SAMPLE_TIME = 1 << 2
+PERF_SAMPLE_ADDR = 1 << 3
+PERF_SAMPLE_ID = 1 << 6
+PERF_SAMPLE_CPU = 1 << 7
+PERF_SAMPLE_PERIOD = 1 << 8
+PERF_SAMPLE_STREAM_ID = 1 << 9
+PERF_SAMPLE_IDENTIFIER = 1 << 16
+
+# perf_event_attr flags bits.
+_ATTR_FLAG_FREQ = 1 << 10
+
+PERF_RECORD_MMAP = 1
+PERF_RECORD_COMM = 3
+PERF_RECORD_FORK = 7
+PERF_RECORD_SAMPLE = 9
+PERF_RECORD_MMAP2 = 10
+
+PERF_RECORD_MISC_CPUMODE_MASK = 7
+PERF_RECORD_MISC_KERNEL = 1
+
+# The header feature listing the names of the events.
+HEADER_EVENT_DESC = 12
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+
+_HARDWARE_EVENTS = ['cycles', 'instructions', 'cache-references',
+                    'cache-misses', 'branches', 'branch-misses', 'bus-cycles',
+                    'stalled-cycles-frontend', 'stalled-cycles-backend',
+                    'ref-cycles']
+_SOFTWARE_EVENTS = ['cpu-clock', 'task-clock', 'page-faults',
+                    'context-switches', 'cpu-migrations', 'minor-faults',
+                    'major-faults', 'alignment-faults', 'emulation-faults',
+                    'dummy']
+
+# The name of the main kernel map, and of the symbol it is relocated against.
+KERNEL_DSO = '[kernel.kallsyms]'
+KERNEL_REF_SYMBOL = '_text'
+UNKNOWN_DSO = '[unknown]'
+
+# How much of the data section is read at once.
+_READ_SIZE = 4 * 1024 * 1024
+
+
+class PerfDataError(Exception):
+  """Raised for perf.data files that are invalid or not supported."""
+
+
+class PerfEvent(object):
+  """The samples of one event of a perf.data file.
+
+  Attributes:
+    name: The name of the event, e.g. 'cycles'.
+    samples: The number of samples of the event.
+    period: The event count, i.e. the sum of the periods of the samples.
+    histogram: Maps (command, dso, address, kernel) tuples to the
+      [samples, period] of the samples at that address. For samples in
+      files, address is the offset in the file; otherwise it is the sampled
+      instruction pointer.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.samples = 0
+    self.period = 0
+    self.histogram = collections.defaultdict(lambda: [0, 0])
+
+  def Add(self, key, period):
+    self.samples += 1
+    self.period += period
+    counts = self.histogram[key]
+    counts[0] += 1
+    counts[1] += period
+
+
+class PerfProfile(object):
+  """The events read from a perf.data file, see ReadPerfData.
+
+  Attributes:
+    events: The PerfEvents, in the order they were recorded.
+    kernel_start: The address KERNEL_REF_SYMBOL was loaded at, if known. It
+      tells how far the kernel was relocated from its symbol table.
+  """
+
+  def __init__(self, events):
+    self.events = events
+    self.kernel_start = None
+
+  def GetEventTotals(self):
+    """Returns a dictionary of the number of samples of every event."""
+    return dict((event.name, event.samples) for event in self.events
+                if event.samples)
+
+
+class _Map(object):
+  """A file or memory region mapped into an address space."""
+
+  __slots__ = ('start', 'end', 'pgoff', 'dso', 'relative')
+
+  def __init__(self, start, length, pgoff, filename):
+    self.start = start
+    self.end = start + length
+    self.pgoff = pgoff
+    if filename.startswith(KERNEL_DSO):
+      # '[kernel.kallsyms]_text': the main kernel map is not relative.
+      self.dso = KERNEL_DSO
+      self.relative = False
+    else:
+      self.dso = filename
+      # Anonymous memory, such as JITed code, is identified by its addresses.
+      self.relative = filename.startswith('/') and not filename.startswith(
+          '//')
+
+  def GetAddress(self, ip):
+    if self.relative:
+      return ip - self.start + self.pgoff
+    return ip
+
+
+class _AddressSpace(object):
+  """The maps of a process, sorted by start address."""
+
+  def __init__(self, maps=None):
+    self.maps = list(maps or [])
+    self.starts = [map_.start for map_ in self.maps]
+
+  def Copy(self):
+    return _AddressSpace(self.maps)
+
+  def Add(self, map_):
+    # A new map replaces the maps it overlaps.
+    low = bisect.bisect_left(self.starts, map_.start)
+    if low and self.maps[low - 1].end > map_.start:
+      low -= 1
+    high = bisect.bisect_left(self.starts, map_.end)
+    self.maps[low:high] = [map_]
+    self.starts[low:high] = [map_.start]
+
+  def Find(self, ip):
+    index = bisect.bisect_right(self.starts, ip) - 1
+    if index >= 0 and ip < self.maps[index].end:
+      return self.maps[index]
+    return None
+
+
+class _Attr(object):
+  """The parts of a perf_event_attr crosperf needs."""
+
+  _FORMAT = 'IIQQQQQ'
+
+  def __init__(self, endian, data, ids):
+    (self.type, _, self.config, self.sample_period, self.sample_type, _,
+     self.flags) = struct.unpack_from(endian + self._FORMAT, data)
+    self.ids = ids
+    self.name = None
+
+  def GetDefaultName(self):
+    if self.type == PERF_TYPE_HARDWARE and self.config < len(_HARDWARE_EVENTS):
+      return _HARDWARE_EVENTS[self.config]
+    if self.type == PERF_TYPE_SOFTWARE and self.config < len(_SOFTWARE_EVENTS):
+      return _SOFTWARE_EVENTS[self.config]
+    return 'r%x' % self.config
+
+  def GetPeriod(self):
+    """Returns the period of samples without one, like perf does."""
+    if self.flags & _ATTR_FLAG_FREQ:
+      return 1
+    return self.sample_period
+
+
+class _SampleFormat(object):
+  """Unpacks the fields crosperf needs from the front of sample records."""
+
+  def __init__(self, endian, sample_type):
+    if not sample_type & PERF_SAMPLE_IP:
+      raise PerfDataError('Samples without instruction pointers.')
+    fields = [(PERF_SAMPLE_IDENTIFIER, 'Q', ['id']),
+              (PERF_SAMPLE_IP, 'Q', ['ip']),
+              (PERF_SAMPLE_TID, 'ii', ['pid', 'tid']),
+              (PERF_SAMPLE_TIME, 'Q', [None]),
+              (PERF_SAMPLE_ADDR, 'Q', [None]),
+              (PERF_SAMPLE_ID, 'Q', ['id']),
+              (PERF_SAMPLE_STREAM_ID, 'Q', [None]),
+              (PERF_SAMPLE_CPU, 'II', [None, None]),
+              (PERF_SAMPLE_PERIOD, 'Q', ['period'])]
+    codes = []
+    names = []
+    for bit, code, field_names in fields:
+      if sample_type & bit:
+        codes.append(code)
+        names.extend(field_names)
+    self.struct = struct.Struct(endian + ''.join(codes))
+    # The first of the fields is used if it comes twice, like the id.
+    self.index = {}
+    for index, name in enumerate(names):
+      if name and name not in self.index:
+        self.index[name] = index
+    self._indexes = [self.index.get(name)
+                     for name in ('id', 'ip', 'pid', 'tid', 'period')]
+
+  def Unpack(self, data):
+    """Returns the (id, ip, pid, tid, period) of a sample, None if absent."""
+    if len(data) < self.struct.size:
+      raise PerfDataError('Truncated sample record.')
+    sample = self.struct.unpack_from(data)
+    return tuple(sample[index] if index is not None else None
+                 for index in self._indexes)
+
+
+class _PerfDataReader(object):
+  """Reads the perf.data file open as perf_file, see ReadPerfData."""
+
+  def __init__(self, perf_file):
+    self.perf_file = perf_file
+    magic = self._Read(0, 8)
+    if magic == PERF_MAGIC:
+      self.endian = '<'
+    elif magic == PERF_MAGIC[::-1]:
+      self.endian = '>'
+    else:
+      raise PerfDataError('Not a supported perf.data file.')
+
+    header = self._Unpack('QQQQQQQQ4Q', 8)
+    header_size, self.attr_size = header[0:2]
+    if header_size != struct.calcsize('8sQQQQQQQQ4Q'):
+      raise PerfDataError('Piped perf.data files are not supported.')
+    self.attrs_section = header[2:4]
+    self.data_section = header[4:6]
+    self.features = header[8:12]
+
+  def _Read(self, offset, size):
+    self.perf_file.seek(offset)
+    data = self.perf_file.read(size)
+    if len(data) != size:
+      raise PerfDataError('Truncated perf.data file.')
+    return data
+
+  def _Unpack(self, fmt, offset):
+    fmt = self.endian + fmt
+    return struct.unpack(fmt, self._Read(offset, struct.calcsize(fmt)))
+
+  def ReadAttrs(self):
+    offset, size = self.attrs_section
+    if not self.attr_size or size % self.attr_size:
+      raise PerfDataError('Bad attribute section.')
+    attrs = []
+    for attr_offset in range(offset, offset + size, self.attr_size):
+      data = self._Read(attr_offset, self.attr_size)
+      ids_offset, ids_size = struct.unpack_from(self.endian + 'QQ', data,
+                                                self.attr_size - 16)
+      ids = self._Unpack('%dQ' % (ids_size // 8), ids_offset)
+      attrs.append(_Attr(self.endian, data, ids))
+    if not attrs:
+      raise PerfDataError('No events recorded.')
+
+    for attr, name in zip(attrs, self._ReadEventNames()):
+      attr.name = name
+    for attr in attrs:
+      attr.name = attr.name or attr.GetDefaultName()
+    return attrs
+
+  def _GetFeatureSection(self, feature):
+    """Returns the (offset, size) of a feature section, or None."""
+    if not self.features[feature // 64] & 1 << feature % 64:
+      return None
+    # The sections of the features that are present follow the data section.
+    index = len([bit for bit in range(feature)
+                 if self.features[bit // 64] & 1 << bit % 64])
+    return self._Unpack('QQ', sum(self.data_section) + index * 16)
+
+  def _ReadEventNames(self):
+    section = self._GetFeatureSection(HEADER_EVENT_DESC)
+    if not section:
+      return []
+    offset = section[0]
+    num_events, attr_size = self._Unpack('II', offset)
+    offset += 8
+    names = []
+    for _ in range(num_events):
+      offset += attr_size
+      num_ids, name_size = self._Unpack('II', offset)
+      offset += 8
+      names.append(self._Read(offset, name_size).rstrip('\0'))
+      offset += name_size + num_ids * 8
+    return names
+
+  def ReadRecords(self):
+    """Yields the (type, misc, data) of every record of the data section."""
+    offset, size = self.data_section
+    end = offset + size
+    header = struct.Struct(self.endian + 'IHH')
+    self.perf_file.seek(offset)
+    buf = ''
+    pos = 0
+    while True:
+      if len(buf) - pos < header.size or (
+          len(buf) - pos < header.unpack_from(buf, pos)[2]):
+        to_read = min(_READ_SIZE, end - offset)
+        if not to_read:
+          break
+        buf = buf[pos:] + self.perf_file.read(to_read)
+        offset += to_read
+        pos = 0
+        continue
+      record_type, misc, record_size = header.unpack_from(buf, pos)
+      if record_size < header.size:
+        raise PerfDataError('Bad record size: %d' % record_size)
+      yield record_type, misc, buf[pos + header.size:pos + record_size]
+      pos += record_size
+
+
+def _GetFilename(data, offset):
+  return data[offset:].split('\0', 1)[0]
+
+
+def ReadPerfData(perf_data_file):
+  """Reads the events and samples of a perf.data file.
+
+  Args:
+    perf_data_file: The path of the perf.data file.
+
+  Returns:
+    A PerfProfile.
+
+  Raises:
+    PerfDataError: if the file is not a perf.data file crosperf can read.
+    IOError: if the file cannot be read.
+  """
+  with open(perf_data_file, 'rb') as perf_file:
+    reader = _PerfDataReader(perf_file)
+    attrs = reader.ReadAttrs()
+    endian = reader.endian
+
+    sample_types = set(attr.sample_type for attr in attrs)
+    if len(sample_types) > 1 and not all(sample_type & PERF_SAMPLE_IDENTIFIER
+                                         for sample_type in sample_types):
+      raise PerfDataError('Events with different sample formats.')
+    sample_formats = dict((sample_type, _SampleFormat(endian, sample_type))
+                          for sample_type in sample_types)
+    if len(attrs) > 1 and any('id' not in sample_format.index
+                              for sample_format in sample_formats.values()):
+      raise PerfDataError('Samples of several events without ids.')
+
+    events = [PerfEvent(attr.name) for attr in attrs]
+    events_by_id = {}
+    sample_formats_by_id = {}
+    for attr, event in zip(attrs, events):
+      for event_id in attr.ids:
+        events_by_id[event_id] = (event, attr.GetPeriod())
+        sample_formats_by_id[event_id] = sample_formats[attr.sample_type]
+    default_event = (events[0], attrs[0].GetPeriod())
+    default_format = sample_formats[attrs[0].sample_type]
+    # With several sample formats, every sample starts with the id of its
+    # event (PERF_SAMPLE_IDENTIFIER), which tells the format of the rest.
+    leading_id = struct.Struct(endian + 'Q') if len(sample_formats) > 1 else None
+
+    profile = PerfProfile(events)
+    kernel = _AddressSpace()
+    processes = {}
+    comms = {}
+    mmap = struct.Struct(endian + 'iiQQQ')
+    mmap2_filename = mmap.size + struct.calcsize('IIQQII')
+    fork = struct.Struct(endian + 'iiii')
+    comm = struct.Struct(endian + 'ii')
+
+    for record_type, misc, data in reader.ReadRecords():
+      if record_type == PERF_RECORD_SAMPLE:
+        sample_format = default_format
+        if leading_id:
+          if len(data) < leading_id.size:
+            raise PerfDataError('Truncated sample record.')
+          sample_format = sample_formats_by_id.get(
+              leading_id.unpack_from(data)[0])
+          if sample_format is None:
+            raise PerfDataError('Sample of an unknown event.')
+        event_id, ip, pid, tid, sample_period = sample_format.Unpack(data)
+        if pid is None:
+          pid = -1
+        if tid is None:
+          tid = pid
+        event, period = events_by_id.get(event_id, default_event)
+        if sample_period is not None:
+          period = sample_period
+
+        is_kernel = misc & PERF_RECORD_MISC_CPUMODE_MASK == (
+            PERF_RECORD_MISC_KERNEL)
+        if is_kernel:
+          map_ = kernel.Find(ip)
+        else:
+          address_space = processes.get(pid)
+          map_ = address_space.Find(ip) if address_space else None
+        if map_:
+          key = (comms.get(tid) or ':%d' % tid, map_.dso, map_.GetAddress(ip),
+                 is_kernel)
+        else:
+          key = (comms.get(tid) or ':%d' % tid, UNKNOWN_DSO, ip, is_kernel)
+        event.Add(key, period)
+
+      elif record_type in (PERF_RECORD_MMAP, PERF_RECORD_MMAP2):
+        pid, _, start, length, pgoff = mmap.unpack_from(data)
+        if record_type == PERF_RECORD_MMAP:
+          filename = _GetFilename(data, mmap.size)
+        else:
+          filename = _GetFilename(data, mmap2_filename)
+        map_ = _Map(start, length, pgoff, filename)
+        if pid == -1:
+          kernel.Add(map_)
+          if map_.dso == KERNEL_DSO:
+            profile.kernel_start = pgoff
+        else:
+          processes.setdefault(pid, _AddressSpace()).Add(map_)
+
+      elif record_type == PERF_RECORD_COMM:
+        _, tid = comm.unpack_from(data)
+        comms[tid] = _GetFilename(data, comm.size)
+
+      elif record_type == PERF_RECORD_FORK:
+        pid, ppid, tid, ptid = fork.unpack_from(data)
+        if ptid in comms and tid not in comms:
+          comms[tid] = comms[ptid]
+        if pid != ppid and ppid in processes:
+          processes[pid] = processes[ppid].Copy()
+
+  return profile
+
+
+def WritePerfReport(profile, symbolizer, report_file):
+  """Writes a profile in the format of `perf report -n --stdio`.
+
+  Every address of the histograms is symbolized once; addresses that cannot
+  be symbolized are printed in hexadecimal, as perf does.
+
+  Args:
+    profile: A PerfProfile.
+    symbolizer: A perf_symbols.Symbolizer.
+    report_file: A file object to write the report to.
+  """
+  addresses = set()
+  for event in profile.events:
+    addresses.update((dso, address, is_kernel)
+                     for _, dso, address, is_kernel in event.histogram)
+  symbols = symbolizer.SymbolizeAll(addresses, profile.kernel_start)
+  # perf reports the shared objects by their file names.
+  dso_names = dict((dso, dso.rsplit('/', 1)[-1])
+                   for dso, _, _ in addresses)
+
+  report_file.write('# To display the perf.data header info, please use '
+                    '--header/--header-only options.\n#\n')
+  for event in profile.events:
+    if not event.samples:
+      # Like the sideband events of newer perf versions.
+      continue
+    # The samples of every address of a function are counted together.
+    functions = collections.defaultdict(lambda: [0, 0])
+    for (command, dso, address, is_kernel), counts in (
+        event.histogram.iteritems()):
+      symbol = symbols.get((dso, address, is_kernel)) or '0x%016x' % address
+      function = functions[(command, dso_names[dso], is_kernel, symbol)]
+      function[0] += counts[0]
+      function[1] += counts[1]
+
+    report_file.write('# Samples: %d of event \'%s\'\n' % (event.samples,
+                                                            event.name))
+    report_file.write('# Event count (approx.): %d\n#\n' % event.period)
+    report_file.write('# Overhead       Samples  Command          '
+                      'Shared Object                   Symbol\n')
+    report_file.write('# ........  ............  ...............  '
+                      '..............................  ......\n#\n')
+    rows = sorted(functions.iteritems(), key=lambda row: -row[1][1])
+    for (command, dso, is_kernel, symbol), (samples, period) in rows:
+      report_file.write('%9.2f%%  %12d  %15s  %-30s  [%s] %s\n' %
+                        (100.0 * period / (event.period or 1), samples,
+                         command, dso, 'k' if is_kernel else '.', symbol))
+    report_file.write('\n\n')
@@ -0,0 +1,242 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for the in-process reader of perf.data files."""
+
+from __future__ import print_function
+
+from StringIO import StringIO
+
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import perf_data
+import results_report
+
+_ATTR_SIZE = 72
+_SAMPLE_TYPE = (perf_data.PERF_SAMPLE_IDENTIFIER | perf_data.PERF_SAMPLE_IP |
+                perf_data.PERF_SAMPLE_TID | perf_data.PERF_SAMPLE_TIME |
+                perf_data.PERF_SAMPLE_CPU | perf_data.PERF_SAMPLE_PERIOD)
+
+_SHORT_SAMPLE_TYPE = (perf_data.PERF_SAMPLE_IDENTIFIER |
+                      perf_data.PERF_SAMPLE_IP | perf_data.PERF_SAMPLE_TID)
+
+_KERNEL_START = 0xffffffff81000000
+
+
+def _Pad(data):
+  return data + '\0' * (-len(data) % 8)
+
+
+def _PackAttr(config, sample_type=_SAMPLE_TYPE):
+  attr = struct.pack('<IIQQQQQ', perf_data.PERF_TYPE_HARDWARE, _ATTR_SIZE,
+                     config, 100000, sample_type, 0, 0)
+  return attr + '\0' * (_ATTR_SIZE - len(attr))
+
+
+def _Record(record_type, body, misc=0):
+  body = _Pad(body)
+  return struct.pack('<IHH', record_type, misc, 8 + len(body)) + body
+
+
+def Mmap(pid, start, length, pgoff, filename):
+  return _Record(perf_data.PERF_RECORD_MMAP,
+                 struct.pack('<iiQQQ', pid, pid, start, length, pgoff) +
+                 filename + '\0')
+
+
+def Mmap2(pid, start, length, pgoff, filename):
+  return _Record(perf_data.PERF_RECORD_MMAP2,
+                 struct.pack('<iiQQQIIQQII', pid, pid, start, length, pgoff, 8,
+                             1, 1234, 0, 5, 2) + filename + '\0')
+
+
+def Comm(pid, tid, comm):
+  return _Record(perf_data.PERF_RECORD_COMM,
+                 struct.pack('<ii', pid, tid) + comm + '\0')
+
+
+def Fork(pid, ppid, tid, ptid):
+  return _Record(perf_data.PERF_RECORD_FORK,
+                 struct.pack('<iiiiQ', pid, ppid, tid, ptid, 0))
+
+
+def Sample(event_id, pid, ip, period, kernel=False):
+  misc = perf_data.PERF_RECORD_MISC_KERNEL if kernel else 2
+  return _Record(perf_data.PERF_RECORD_SAMPLE,
+                 struct.pack('<QQiiQIIQ', event_id, ip, pid, pid, 0, 0, 0,
+                             period), misc)
+
+
+def ShortSample(event_id, pid, ip):
+  """A sample of an event with the _SHORT_SAMPLE_TYPE sample type."""
+  return _Record(perf_data.PERF_RECORD_SAMPLE,
+                 struct.pack('<QQii', event_id, ip, pid, pid), 2)
+
+
+def WritePerfData(path, events, records):
+  """Writes a perf.data file like `perf record` does.
+
+  Args:
+    path: The file to write.
+    events: (name, config, ids) tuples of the events recorded, or (name,
+      config, ids, sample_type) tuples.
+    records: The records of the data section, as returned by Sample etc.
+  """
+  header_size = struct.calcsize('<8sQQQQQQQQ4Q')
+  attr_entry_size = _ATTR_SIZE + 16
+
+  # The ids of each event, then the attributes, the data, the table of the
+  # feature sections and the event names.
+  ids_data = ''
+  attrs_data = ''
+  events = [event + (_SAMPLE_TYPE,) if len(event) == 3 else event
+            for event in events]
+  ids_offset = header_size
+  attrs_offset = ids_offset + sum(8 * len(ids) for _, _, ids, _ in events)
+  for _, config, ids, sample_type in events:
+    attrs_data += _PackAttr(config, sample_type) + struct.pack(
+        '<QQ', ids_offset + len(ids_data), 8 * len(ids))
+    ids_data += struct.pack('<%dQ' % len(ids), *ids)
+
+  data = ''.join(records)
+  data_offset = attrs_offset + len(attrs_data)
+  features_offset = data_offset + len(data)
+
+  event_desc = struct.pack('<II', len(events), _ATTR_SIZE)
+  for name, config, ids, sample_type in events:
+    name = _Pad(name + '\0')
+    event_desc += _PackAttr(config, sample_type) + struct.pack('<II', len(ids), len(name))
+    event_desc += name + struct.pack('<%dQ' % len(ids), *ids)
+  sections = struct.pack('<QQ', features_offset + 16, len(event_desc))
+
+  header = struct.pack('<8sQQQQQQQQ4Q', perf_data.PERF_MAGIC, header_size,
+                       attr_entry_size, attrs_offset, len(attrs_data),
+                       data_offset, len(data), 0, 0,
+                       1 << perf_data.HEADER_EVENT_DESC, 0, 0, 0)
+  with open(path, 'wb') as f:
+    f.write(header + ids_data + attrs_data + data + sections + event_desc)
+
+
+class FakeSymbolizer(object):
+  """Symbolizes the addresses of a dictionary."""
+
+  def __init__(self, symbols):
+    self.symbols = symbols
+    self.kernel_start = None
+
+  def SymbolizeAll(self, addresses, kernel_start=None):
+    self.kernel_start = kernel_start
+    return dict((address, self.symbols[address]) for address in addresses
+                if address in self.symbols)
+
+
+class PerfDataTest(unittest.TestCase):
+  """Tests for perf_data."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.perf_data_file = os.path.join(self.tempdir, 'perf.data')
+    records = [
+        Mmap(-1, _KERNEL_START, 0x1000000, _KERNEL_START,
+             '[kernel.kallsyms]_text'),
+        Comm(10, 10, 'benchmark'),
+        Mmap(10, 0x400000, 0x10000, 0, '/usr/bin/benchmark'),
+        Mmap2(10, 0x7f0000000000, 0x10000, 0x2000, '/lib64/libc.so.6'),
+        Sample(1, 10, 0x400100, 300),
+        Sample(2, 10, 0x400100, 1000),
+        Sample(1, 10, 0x7f0000000010, 100),
+        Fork(11, 10, 11, 10),
+        Sample(1, 11, 0x400200, 200),
+        Sample(1, 11, _KERNEL_START + 0x20, 250, kernel=True),
+        # Unmapped addresses.
+        Sample(1, 12, 0x1234, 150),
+    ]
+    WritePerfData(self.perf_data_file,
+                  [('cycles', 0, [1]), ('instructions', 1, [2])], records)
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+  def testReadPerfData(self):
+    profile = perf_data.ReadPerfData(self.perf_data_file)
+    self.assertEqual(profile.GetEventTotals(), {'cycles': 5,
+                                                'instructions': 1})
+    self.assertEqual(profile.kernel_start, _KERNEL_START)
+
+    cycles, instructions = profile.events
+    self.assertEqual(cycles.period, 1000)
+    self.assertEqual(dict(cycles.histogram), {
+        ('benchmark', '/usr/bin/benchmark', 0x100, False): [1, 300],
+        ('benchmark', '/lib64/libc.so.6', 0x2010, False): [1, 100],
+        # The forked process has the maps and command of its parent.
+        ('benchmark', '/usr/bin/benchmark', 0x200, False): [1, 200],
+        ('benchmark', perf_data.KERNEL_DSO, _KERNEL_START + 0x20,
+         True): [1, 250],
+        (':12', perf_data.UNKNOWN_DSO, 0x1234, False): [1, 150],
+    })
+    self.assertEqual(dict(instructions.histogram), {
+        ('benchmark', '/usr/bin/benchmark', 0x100, False): [1, 1000],
+    })
+
+  def testWritePerfReport(self):
+    profile = perf_data.ReadPerfData(self.perf_data_file)
+    symbolizer = FakeSymbolizer({
+        ('/usr/bin/benchmark', 0x100, False): 'main',
+        ('/usr/bin/benchmark', 0x200, False): 'main',
+        ('/lib64/libc.so.6', 0x2010, False): 'memcpy',
+    })
+    report = StringIO()
+    perf_data.WritePerfReport(profile, symbolizer, report)
+    self.assertEqual(symbolizer.kernel_start, _KERNEL_START)
+
+    report.seek(0)
+    self.assertEqual(results_report.ParseStandardPerfReport(report), {
+        'cycles': {'main': 50.0,
+                   '0xffffffff81000020': 25.0,
+                   '0x0000000000001234': 15.0,
+                   'memcpy': 10.0},
+        'instructions': {'main': 100.0},
+    })
+    self.assertIn("# Samples: 5 of event 'cycles'", report.getvalue())
+    self.assertIn('# Event count (approx.): 1000', report.getvalue())
+
+  def testDifferentSampleTypes(self):
+    WritePerfData(self.perf_data_file,
+                  [('cycles', 0, [1]),
+                   ('instructions', 1, [2], _SHORT_SAMPLE_TYPE)],
+                  [Comm(10, 10, 'benchmark'),
+                   Mmap(10, 0x400000, 0x10000, 0, '/usr/bin/benchmark'),
+                   Sample(1, 10, 0x400100, 300),
+                   ShortSample(2, 10, 0x400200),
+                   Sample(1, 10, 0x400100, 200)])
+    cycles, instructions = perf_data.ReadPerfData(self.perf_data_file).events
+    self.assertEqual(dict(cycles.histogram), {
+        ('benchmark', '/usr/bin/benchmark', 0x100, False): [2, 500],
+    })
+    # The samples without a period have the period of their event.
+    self.assertEqual(dict(instructions.histogram), {
+        ('benchmark', '/usr/bin/benchmark', 0x200, False): [1, 100000],
+    })
+
+    WritePerfData(self.perf_data_file,
+                  [('cycles', 0, [1]),
+                   ('instructions', 1, [2], _SHORT_SAMPLE_TYPE)],
+                  [ShortSample(3, 10, 0x400200)])
+    with self.assertRaises(perf_data.PerfDataError):
+      perf_data.ReadPerfData(self.perf_data_file)
+
+  def testNotPerfData(self):
+    with open(self.perf_data_file, 'w') as f:
+      f.write('fake perf data')
+    with self.assertRaises(perf_data.PerfDataError):
+      perf_data.ReadPerfData(self.perf_data_file)
+
+
+if __name__ == '__main__':
+  unittest.main()
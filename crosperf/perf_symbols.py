@@ -0,0 +1,326 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Symbolizes the addresses of perf profiles, see perf_data.
+
+The function symbols of ELF files (binaries, their separate debug files and
+vmlinux) and of System.map files are read once per file and kept in a cache
+shared by all Symbolizers, so that the perf.data files of every iteration of
+a benchmark are symbolized with the symbol tables read for the first one.
+"""
+
+from __future__ import print_function
+
+import bisect
+import distutils.spawn
+import os
+import struct
+import subprocess
+import threading
+
+import perf_data
+
+ELF_MAGIC = '\x7fELF'
+_ELF_CLASS_64 = 2
+_ELF_DATA_BIG_ENDIAN = 2
+_EM_ARM = 40
+
+_SHT_SYMTAB = 2
+_SHT_DYNSYM = 11
+_PT_LOAD = 1
+_STT_FUNC = 2
+_STT_GNU_IFUNC = 10
+_SHN_UNDEF = 0
+
+# The struct formats of the ELF header (after e_ident), section headers,
+# program headers and symbols, for 32 and 64 bit ELF files.
+_ELF_FORMATS = {
+    False: ('HHIIIIIHHHHHH', 'IIIIIIIIII', 'IIIIIIII', 'IIIBBH'),
+    True: ('HHIQQQIHHHHHH', 'IIQQQQIIQQ', 'IIQQQQQQ', 'IBBHQQ'),
+}
+
+# Symbols without a size are assumed to span to the next symbol, or this many
+# bytes for the last one.
+_MAX_SYMBOL_SIZE = 4096
+
+_cache_lock = threading.Lock()
+_symbol_tables = {}
+_demangled_names = {}
+
+
+class SymbolTable(object):
+  """Function symbols, sorted by address."""
+
+  def __init__(self, symbols, loads=None):
+    """Creates a symbol table.
+
+    Args:
+      symbols: (address, size, name) tuples, size being 0 if it is unknown.
+      loads: (offset, address, size) tuples of the loaded segments of the file,
+        to translate offsets in the file to the addresses of its symbols.
+    """
+    symbols = sorted(set(symbols))
+    self.starts = [address for address, _, _ in symbols]
+    self.names = [name for _, _, name in symbols]
+    self.ends = []
+    for index, (address, size, _) in enumerate(symbols):
+      if not size:
+        size = _MAX_SYMBOL_SIZE
+        if index + 1 < len(symbols):
+          size = min(symbols[index + 1][0] - address, size)
+      self.ends.append(address + size)
+    self.loads = loads or []
+
+  def Lookup(self, address):
+    """Returns the name of the function at address, or None."""
+    index = bisect.bisect_right(self.starts, address) - 1
+    if index >= 0 and address < self.ends[index]:
+      return self.names[index]
+    return None
+
+  def LookupOffset(self, offset):
+    """Returns the name of the function at an offset in the file, or None."""
+    for load_offset, load_address, load_size in self.loads:
+      if load_offset <= offset < load_offset + load_size:
+        return self.Lookup(offset - load_offset + load_address)
+    return None
+
+  def GetAddress(self, name):
+    try:
+      return self.starts[self.names.index(name)]
+    except ValueError:
+      return None
+
+
+def _ReadElf(path):
+  """Returns the function symbols and loaded segments of an ELF file.
+
+  The symbols are those of the symbol table, or of the dynamic symbol table if
+  the file is stripped. Returns ([], []) for files that are not ELF files.
+  """
+  with open(path, 'rb') as elf:
+    ident = elf.read(16)
+    if len(ident) < 16 or not ident.startswith(ELF_MAGIC):
+      return [], []
+    is_64 = ord(ident[4]) == _ELF_CLASS_64
+    endian = '>' if ord(ident[5]) == _ELF_DATA_BIG_ENDIAN else '<'
+    header_format, section_format, segment_format, symbol_format = (
+        _ELF_FORMATS[is_64])
+
+    header_struct = struct.Struct(endian + header_format)
+    (_, machine, _, _, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum,
+     _) = header_struct.unpack(elf.read(header_struct.size))
+
+    loads = []
+    segment_struct = struct.Struct(endian + segment_format)
+    for index in range(phnum):
+      elf.seek(phoff + index * phentsize)
+      segment = segment_struct.unpack(elf.read(segment_struct.size))
+      if is_64:
+        segment_type, _, offset, address, _, size, _, _ = segment
+      else:
+        segment_type, offset, address, _, size, _, _, _ = segment
+      if segment_type == _PT_LOAD:
+        loads.append((offset, address, size))
+
+    sections = []
+    section_struct = struct.Struct(endian + section_format)
+    for index in range(shnum):
+      elf.seek(shoff + index * shentsize)
+      sections.append(section_struct.unpack(elf.read(section_struct.size)))
+
+    symbol_struct = struct.Struct(endian + symbol_format)
+    symbols = []
+    for wanted_type in (_SHT_SYMTAB, _SHT_DYNSYM):
+      for (_, section_type, _, _, offset, size, link, _, _,
+           _) in sections:
+        if section_type != wanted_type or link >= len(sections):
+          continue
+        elf.seek(offset)
+        data = elf.read(size)
+        strings_offset, strings_size = sections[link][4:6]
+        elf.seek(strings_offset)
+        strings = elf.read(strings_size)
+
+        for symbol_offset in range(0, len(data) - symbol_struct.size + 1,
+                                   symbol_struct.size):
+          if is_64:
+            name, info, _, shndx, address, symbol_size = (
+                symbol_struct.unpack_from(data, symbol_offset))
+          else:
+            name, address, symbol_size, info, _, shndx = (
+                symbol_struct.unpack_from(data, symbol_offset))
+          if info & 0xf not in (_STT_FUNC, _STT_GNU_IFUNC) or (
+              shndx == _SHN_UNDEF):
+            continue
+          if machine == _EM_ARM:
+            # The lowest bit of the address of Thumb functions is set.
+            address &= ~1
+          symbols.append((address, symbol_size,
+                          strings[name:strings.find('\0', name)]))
+      if symbols:
+        break
+
+  return symbols, loads
+
+
+def _ReadSystemMap(path):
+  """Returns the function symbols of a System.map or kallsyms file."""
+  entries = []
+  with open(path) as system_map:
+    for line in system_map:
+      fields = line.split()
+      if len(fields) < 3:
+        continue
+      try:
+        entries.append((int(fields[0], 16), fields[1], fields[2]))
+      except ValueError:
+        continue
+  entries.sort()
+
+  # Functions span to the next symbol, whatever its type.
+  symbols = []
+  for index, (address, symbol_type, name) in enumerate(entries):
+    if symbol_type not in 'tTwW':
+      continue
+    size = 0
+    if index + 1 < len(entries):
+      size = entries[index + 1][0] - address
+    symbols.append((address, size, name))
+  return symbols
+
+
+def _GetCached(kind, path, load):
+  """Returns the result of load(), cached until the file at path changes."""
+  try:
+    stat = os.stat(path)
+  except OSError:
+    return None
+  key = (kind, path, stat.st_mtime, stat.st_size)
+  with _cache_lock:
+    if key not in _symbol_tables:
+      _symbol_tables[key] = load()
+    return _symbol_tables[key]
+
+
+def GetElfSymbolTable(path, layout_path=None):
+  """Returns the SymbolTable of an ELF file, or None if it does not exist.
+
+  Args:
+    path: The ELF file to read the symbols from.
+    layout_path: The ELF file to read the loaded segments from, if path is
+      its separate debug file. Defaults to path.
+  """
+  layout_path = layout_path or path
+
+  def _Load():
+    try:
+      symbols, loads = _ReadElf(path)
+      if layout_path != path and os.path.exists(layout_path):
+        loads = _ReadElf(layout_path)[1] or loads
+    except (IOError, struct.error):
+      # Truncated or unreadable files have no symbols.
+      return None
+    return SymbolTable(symbols, loads)
+
+  return _GetCached(('elf', layout_path), path, _Load)
+
+
+def GetSystemMapSymbolTable(path):
+  """Returns the SymbolTable of a System.map file, or None."""
+  return _GetCached('system_map', path,
+                    lambda: SymbolTable(_ReadSystemMap(path)))
+
+
+def Demangle(names):
+  """Returns a dictionary of the demangled names of C++ symbol names.
+
+  Names are demangled with c++filt, if it is installed; names that are not
+  demangled are mapped to themselves.
+  """
+  with _cache_lock:
+    mangled = sorted(set(name for name in names if name.startswith('_Z') and
+                         name not in _demangled_names))
+  cxxfilt = distutils.spawn.find_executable('c++filt')
+  if mangled and cxxfilt:
+    process = subprocess.Popen([cxxfilt], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE)
+    output = process.communicate('\n'.join(mangled) + '\n')[0].splitlines()
+    if process.returncode == 0 and len(output) == len(mangled):
+      with _cache_lock:
+        _demangled_names.update(zip(mangled, output))
+
+  with _cache_lock:
+    return dict((name, _demangled_names.get(name, name)) for name in names)
+
+
+class Symbolizer(object):
+  """Symbolizes the addresses of perf profiles.
+
+  The files a profile was recorded with are looked up under symfs, which is
+  the board directory (/build/<board>) for profiles recorded on a DUT. The
+  debug files under usr/lib/debug are preferred to the files themselves.
+  """
+
+  def __init__(self, symfs='', vmlinux=None, kallsyms=None):
+    self.symfs = symfs
+    self.vmlinux = vmlinux
+    self.kallsyms = kallsyms
+
+  def _GetDsoSymbolTable(self, dso):
+    layout_path = self.symfs + dso
+    debug_path = os.path.join(self.symfs + '/usr/lib/debug',
+                              dso.lstrip('/')) + '.debug'
+    if os.path.exists(debug_path):
+      return GetElfSymbolTable(debug_path, layout_path)
+    return GetElfSymbolTable(layout_path)
+
+  def _GetKernelSymbolTable(self):
+    # System.map lists KERNEL_REF_SYMBOL, which tells how far the kernel was
+    # relocated, so it is preferred to vmlinux.
+    if self.kallsyms and os.path.exists(self.kallsyms):
+      return GetSystemMapSymbolTable(self.kallsyms)
+    if self.vmlinux:
+      return GetElfSymbolTable(self.vmlinux)
+    return None
+
+  def SymbolizeAll(self, addresses, kernel_start=None):
+    """Returns the names of the functions at addresses.
+
+    Args:
+      addresses: (dso, address, is_kernel) tuples, as in the histograms of
+        perf_data.PerfEvent.
+      kernel_start: The address the kernel was loaded at, see
+        perf_data.PerfProfile.
+
+    Returns:
+      A dictionary of the demangled function names of the addresses that
+      could be symbolized.
+    """
+    names = {}
+    tables = {}
+    kernel_offset = 0
+    for dso, address, is_kernel in addresses:
+      if dso not in tables:
+        if dso == perf_data.KERNEL_DSO:
+          tables[dso] = self._GetKernelSymbolTable()
+          reference = tables[dso] and tables[dso].GetAddress(
+              perf_data.KERNEL_REF_SYMBOL)
+          if kernel_start is not None and reference is not None:
+            kernel_offset = kernel_start - reference
+        elif dso.startswith('/'):
+          tables[dso] = self._GetDsoSymbolTable(dso)
+        else:
+          tables[dso] = None
+      table = tables[dso]
+      if not table:
+        continue
+      if dso == perf_data.KERNEL_DSO:
+        name = table.Lookup(address - kernel_offset)
+      else:
+        name = table.LookupOffset(address)
+      if name:
+        names[(dso, address, is_kernel)] = name
+
+    demangled = Demangle(names.values())
+    return dict((key, demangled[name]) for key, name in names.iteritems())
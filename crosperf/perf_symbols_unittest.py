@@ -0,0 +1,95 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for the symbolization of perf profiles."""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import perf_data
+import perf_symbols
+
+SYSTEM_MAP = """\
+ffffffff81000000 T _text
+ffffffff81000100 T start_kernel
+ffffffff81000180 t do_one_initcall
+ffffffff81000200 D some_data
+ffffffff81000300 T schedule
+"""
+
+
+class SymbolTableTest(unittest.TestCase):
+  """Tests for SymbolTable."""
+
+  def testLookup(self):
+    table = perf_symbols.SymbolTable([(0x1000, 0x10, 'a'), (0x1020, 0, 'b'),
+                                      (0x1100, 0, 'c')],
+                                     loads=[(0, 0x1000, 0x2000)])
+    self.assertEqual(table.Lookup(0x1000), 'a')
+    self.assertEqual(table.Lookup(0x100f), 'a')
+    self.assertIsNone(table.Lookup(0x1010))
+    # Symbols without a size span to the next one.
+    self.assertEqual(table.Lookup(0x10ff), 'b')
+    self.assertEqual(table.Lookup(0x1100), 'c')
+    self.assertIsNone(table.Lookup(0xfff))
+    self.assertEqual(table.LookupOffset(0x20), 'b')
+    self.assertIsNone(table.LookupOffset(0x3000))
+    self.assertEqual(table.GetAddress('c'), 0x1100)
+
+
+class SymbolizerTest(unittest.TestCase):
+  """Tests for Symbolizer."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.system_map = os.path.join(self.tempdir, 'System.map-4.4')
+    with open(self.system_map, 'w') as f:
+      f.write(SYSTEM_MAP)
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+  def testKernelSymbols(self):
+    symbolizer = perf_symbols.Symbolizer(self.tempdir,
+                                         kallsyms=self.system_map)
+    kernel = perf_data.KERNEL_DSO
+    # The kernel was relocated by 0x10000000.
+    addresses = [(kernel, 0xffffffff91000110, True),
+                 (kernel, 0xffffffff910001a0, True),
+                 (kernel, 0xffffffff91000310, True),
+                 (kernel, 0xffffffff91000200, True),
+                 ('/usr/bin/missing', 0x10, False),
+                 ('//anon', 0x7f0000000000, False)]
+    self.assertEqual(
+        symbolizer.SymbolizeAll(addresses, 0xffffffff91000000),
+        {(kernel, 0xffffffff91000110, True): 'start_kernel',
+         (kernel, 0xffffffff910001a0, True): 'do_one_initcall',
+         (kernel, 0xffffffff91000310, True): 'schedule'})
+
+  def testElfSymbols(self):
+    # The symbols of the python binary itself.
+    table = perf_symbols.GetElfSymbolTable(os.path.realpath(
+        os.path.join('/proc', str(os.getpid()), 'exe')))
+    if not table or not table.loads or 'main' not in table.names:
+      self.skipTest('The python binary has no symbols.')
+    address = table.GetAddress('main')
+    offsets = [address - load_address + load_offset
+               for load_offset, load_address, load_size in table.loads
+               if load_address <= address < load_address + load_size]
+    self.assertEqual(table.LookupOffset(offsets[0]), 'main')
+
+  def testDemangle(self):
+    names = perf_symbols.Demangle(['main', '_ZN4base8internal3RunEv'])
+    self.assertEqual(names['main'], 'main')
+    self.assertIn(names['_ZN4base8internal3RunEv'],
+                  ['base::internal::Run()', '_ZN4base8internal3RunEv'])
+
+
+if __name__ == '__main__':
+  unittest.main()
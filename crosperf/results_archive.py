@@ -0,0 +1,175 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Storage formats for the autotest results dir of a cache entry.
+
+The original format is a bzip2 tarball, which has to be decompressed and
+fully extracted on every cache hit. The default format is now an
+uncompressed tar with a manifest giving the offset and size of every file in
+it, so single files can be read without touching the rest of the archive.
+Tarballs written by older versions of crosperf can still be read.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import tarfile
+
+MANIFEST_VERSION = 1
+
+# Paths excluded from the stored results dir.
+EXCLUDED_DIRS = ('var/spool', 'var/log')
+
+
+class ResultsArchive(object):
+  """Base class for an archive holding a results dir in a cache entry."""
+
+  FILENAME = None
+
+  def __init__(self, cache_dir, ce):
+    self.cache_dir = cache_dir
+    self.path = os.path.join(cache_dir, self.FILENAME)
+    self.ce = ce
+
+  def Exists(self):
+    return os.path.exists(self.path)
+
+  def Store(self, results_dir):
+    """Stores results_dir in the archive."""
+    raise NotImplementedError()
+
+  def ListFiles(self):
+    """Returns the relative paths of the files in the archive.
+
+    Returns None if the archive has no manifest, in which case it can only be
+    fully extracted.
+    """
+    return None
+
+  def Extract(self, dest_dir, files=None):
+    """Extracts files (relative paths) into dest_dir, or everything if None."""
+    raise NotImplementedError()
+
+
+class Bzip2Tarball(ResultsArchive):
+  """The bzip2 tarball used by older versions of crosperf."""
+
+  FILENAME = 'autotest.tbz2'
+
+  def Store(self, results_dir):
+    excludes = ' '.join('--exclude=%s' % d for d in EXCLUDED_DIRS)
+    command = ('cd %s && tar %s -cjf %s .' % (results_dir, excludes,
+                                              self.path))
+    if self.ce.RunCommand(command):
+      raise RuntimeError("Couldn't store autotest output directory.")
+
+  def Extract(self, dest_dir, files=None):
+    command = 'cd %s && tar xf %s' % (dest_dir, self.path)
+    if files:
+      command += ' ' + ' '.join('./%s' % f for f in files)
+    if self.ce.RunCommand(command, print_to_console=False):
+      raise RuntimeError('Could not untar cached tarball')
+
+
+class IndexedTar(ResultsArchive):
+  """An uncompressed tar, with a manifest of the files it contains."""
+
+  FILENAME = 'autotest.tar'
+  MANIFEST = 'autotest.manifest'
+
+  def __init__(self, cache_dir, ce):
+    super(IndexedTar, self).__init__(cache_dir, ce)
+    self.manifest_path = os.path.join(cache_dir, self.MANIFEST)
+    self._files = None
+
+  def Exists(self):
+    return (os.path.exists(self.path) and os.path.exists(self.manifest_path))
+
+  @staticmethod
+  def _Excluded(tarinfo):
+    path = '/%s/' % os.path.normpath(tarinfo.name)
+    if any('/%s/' % d in path for d in EXCLUDED_DIRS):
+      return None
+    return tarinfo
+
+  def Store(self, results_dir):
+    try:
+      tar = tarfile.open(self.path, 'w')
+      try:
+        tar.add(results_dir, arcname='.', filter=self._Excluded)
+      finally:
+        tar.close()
+
+      files = {}
+      tar = tarfile.open(self.path, 'r')
+      try:
+        for member in tar:
+          if member.isfile():
+            files[os.path.normpath(member.name)] = [member.offset_data,
+                                                    member.size]
+      finally:
+        tar.close()
+      with open(self.manifest_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f)
+    except (IOError, OSError, tarfile.TarError):
+      raise RuntimeError("Couldn't store autotest output directory.")
+
+  def _GetManifest(self):
+    if self._files is None:
+      with open(self.manifest_path, 'r') as f:
+        manifest = json.load(f)
+      if manifest.get('version') != MANIFEST_VERSION:
+        raise RuntimeError('Unknown cache manifest version in %s' %
+                           self.manifest_path)
+      self._files = manifest['files']
+    return self._files
+
+  def ListFiles(self):
+    return sorted(self._GetManifest())
+
+  def ReadFile(self, name):
+    """Returns the contents of the file name, without extracting it."""
+    offset, size = self._GetManifest()[name]
+    with open(self.path, 'rb') as f:
+      f.seek(offset)
+      return f.read(size)
+
+  def Extract(self, dest_dir, files=None):
+    try:
+      if files is None:
+        tar = tarfile.open(self.path, 'r')
+        try:
+          tar.extractall(dest_dir)
+        finally:
+          tar.close()
+        return
+      for name in files:
+        dest_file = os.path.join(dest_dir, name)
+        if os.path.exists(dest_file):
+          continue
+        if not os.path.isdir(os.path.dirname(dest_file)):
+          os.makedirs(os.path.dirname(dest_file))
+        with open(dest_file, 'wb') as f:
+          f.write(self.ReadFile(name))
+    except (IOError, OSError, KeyError, tarfile.TarError):
+      raise RuntimeError('Could not extract cached results from %s' %
+                         self.path)
+
+
+# Formats a results dir can be stored in, by name.
+ARCHIVE_FORMATS = {'tar': IndexedTar, 'tbz2': Bzip2Tarball}
+DEFAULT_ARCHIVE_FORMAT = 'tar'
+
+
+def GetArchiveForWrite(cache_dir, ce, archive_format=DEFAULT_ARCHIVE_FORMAT):
+  return ARCHIVE_FORMATS[archive_format](cache_dir, ce)
+
+
+def OpenArchive(cache_dir, ce):
+  """Returns the archive stored in cache_dir, or None."""
+  for archive_class in (IndexedTar, Bzip2Tarball):
+    archive = archive_class(cache_dir, ce)
+    if archive.Exists():
+      return archive
+  return None
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for the storage formats of cached results dirs."""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import results_archive
+from cros_utils import command_executer
+
+FILES = {
+    'keyval': 'a=1\n',
+    'telemetry_Crosperf/results/results-chart.json': '{}',
+    'telemetry_Crosperf/profiling/perf.data': '\x00\x01perf',
+    'var/log/messages': 'excluded',
+}
+
+
+class ResultsArchiveTest(unittest.TestCase):
+  """Tests for the results archive formats."""
+
+  def setUp(self):
+    self.ce = command_executer.GetCommandExecuter(log_level='quiet')
+    self.results_dir = tempfile.mkdtemp()
+    self.cache_dir = tempfile.mkdtemp()
+    self.dest_dir = tempfile.mkdtemp()
+    for name, contents in FILES.iteritems():
+      path = os.path.join(self.results_dir, name)
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as f:
+        f.write(contents)
+
+  def tearDown(self):
+    for d in (self.results_dir, self.cache_dir, self.dest_dir):
+      shutil.rmtree(d)
+
+  def _CheckExtracted(self, names):
+    for name in FILES:
+      path = os.path.join(self.dest_dir, name)
+      self.assertEqual(os.path.exists(path), name in names)
+      if name in names:
+        with open(path) as f:
+          self.assertEqual(f.read(), FILES[name])
+
+  def test_indexed_tar(self):
+    self.assertIsNone(results_archive.OpenArchive(self.cache_dir, self.ce))
+    archive = results_archive.GetArchiveForWrite(self.cache_dir, self.ce)
+    archive.Store(self.results_dir)
+
+    archive = results_archive.OpenArchive(self.cache_dir, self.ce)
+    self.assertIsInstance(archive, results_archive.IndexedTar)
+    self.assertEqual(archive.ListFiles(), [
+        'keyval', 'telemetry_Crosperf/profiling/perf.data',
+        'telemetry_Crosperf/results/results-chart.json'
+    ])
+    self.assertEqual(
+        archive.ReadFile('telemetry_Crosperf/profiling/perf.data'),
+        '\x00\x01perf')
+
+    archive.Extract(self.dest_dir, ['keyval'])
+    self._CheckExtracted(['keyval'])
+    archive.Extract(self.dest_dir)
+    self._CheckExtracted([n for n in FILES if not n.startswith('var/')])
+
+    self.assertRaises(RuntimeError, archive.Extract, self.dest_dir,
+                      ['no_such_file'])
+
+  def test_bzip2_tarball(self):
+    archive = results_archive.GetArchiveForWrite(self.cache_dir, self.ce,
+                                                 'tbz2')
+    archive.Store(self.results_dir)
+
+    archive = results_archive.OpenArchive(self.cache_dir, self.ce)
+    self.assertIsInstance(archive, results_archive.Bzip2Tarball)
+    self.assertIsNone(archive.ListFiles())
+    archive.Extract(self.dest_dir)
+    self._CheckExtracted([n for n in FILES if not n.startswith('var/')])
+
+
+if __name__ == '__main__':
+  unittest.main()
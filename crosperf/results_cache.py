@@ -5,11 +5,13 @@
 
 from __future__ import print_function
 
+import fnmatch
 import glob
 import hashlib
 import os
 import pickle
 import re
+import shutil
 import tempfile
 import json
 import sys
@@ -19,15 +21,45 @@ from cros_utils import misc
 
 from image_checksummer import ImageChecksummer
 
+import perf_data
+import perf_symbols
+import results_archive
+import results_catalog
 import results_report
 import test_flag
 
 SCRATCH_DIR = os.path.expanduser('~/cros_scratch')
 RESULTS_FILE = 'results.txt'
 MACHINE_FILE = 'machine.txt'
-AUTOTEST_TARBALL = 'autotest.tbz2'
 PERF_RESULTS_FILE = 'perf-results.txt'
 CACHE_KEYS_FILE = 'cache_keys.txt'
+KEYVALS_FILE = 'keyvals.json'
+KEYVALS_FILE_VERSION = 2
+# Files that are read on every cache hit. Everything else in the results dir
+# is only extracted from the cache archive when it is needed.
+CACHE_HIT_FILES = ('results-chart.json', 'perf.data.report')
+
+
+def _ConvertToStr(obj):
+  """Converts the unicode strings loaded from JSON back to str."""
+  if isinstance(obj, unicode):
+    return obj.encode('utf-8')
+  if isinstance(obj, dict):
+    return {_ConvertToStr(k): _ConvertToStr(v) for k, v in obj.iteritems()}
+  if isinstance(obj, list):
+    return [_ConvertToStr(v) for v in obj]
+  return obj
+
+
+def _LinkOrCopyFile(src, dest):
+  """Hard links src to dest, or copies it if it cannot be linked."""
+  if os.path.lexists(dest):
+    os.remove(dest)
+  try:
+    os.link(src, dest)
+  except OSError:
+    # src is on another file system, or the file system has no hard links.
+    shutil.copy2(src, dest)
 
 
 class Result(object):
@@ -50,6 +82,9 @@ class Result(object):
     self.machine = machine
     self.perf_data_files = []
     self.perf_report_files = []
+    # The number of samples of every event of the perf reports generated
+    # without perf, by report file.
+    self.perf_event_totals = {}
     self.results_file = []
     self.chrome_version = ''
     self.err = None
@@ -60,21 +95,25 @@ class Result(object):
     self.suite = None
     self.retval = None
     self.out = None
+    # Set when the results dir is only partially extracted from the cache.
+    self.archive = None
 
   def CopyFilesTo(self, dest_dir, files_to_copy):
     file_index = 0
     for file_to_copy in files_to_copy:
       if not os.path.isdir(dest_dir):
-        command = 'mkdir -p %s' % dest_dir
-        self.ce.RunCommand(command)
+        os.makedirs(dest_dir)
       dest_file = os.path.join(dest_dir,
                                ('%s.%s' % (os.path.basename(file_to_copy),
                                            file_index)))
-      ret = self.ce.CopyFiles(file_to_copy, dest_file, recursive=False)
-      if ret:
-        raise IOError('Could not copy results file: %s' % file_to_copy)
+      try:
+        _LinkOrCopyFile(file_to_copy, dest_file)
+      except (IOError, OSError) as e:
+        raise IOError('Could not copy results file: %s (%s)' %
+                      (file_to_copy, e))
 
   def CopyResultsTo(self, dest_dir):
+    self.ExtractFromArchive(self.perf_data_files + self.perf_report_files)
     self.CopyFilesTo(dest_dir, self.perf_data_files)
     self.CopyFilesTo(dest_dir, self.perf_report_files)
     if len(self.perf_data_files) or len(self.perf_report_files):
@@ -199,6 +238,16 @@ class Result(object):
     if not self.results_dir:
       return None
 
+    if self.archive:
+      # The results dir was not extracted, so search the archive manifest.
+      mo = re.match(r'-name (\S+)$', find_args)
+      if not mo:
+        raise RuntimeError('Could not search the cache archive for: %s' %
+                           find_args)
+      return '\n'.join(
+          os.path.join(self.results_dir, f) for f in self.archive.ListFiles()
+          if fnmatch.fnmatch(os.path.basename(f), mo.group(1)))
+
     command = 'find %s %s' % (self.results_dir, find_args)
     ret, out, _ = self.ce.RunCommandWOutput(command, print_to_console=False)
     if ret:
@@ -221,17 +270,64 @@ class Result(object):
           self.FindFilesInResultsDir('-name results-chart.json').splitlines()
     return result
 
+  def _CanExtractLazily(self, cached_files):
+    names = set(os.path.basename(f) for f in cached_files)
+    # Results in the perf_measurements format are parsed by
+    # generate_test_report, which needs the whole results dir.
+    return 'results-chart.json' in names and 'perf_measurements' not in names
+
+  def ExtractFromArchive(self, files):
+    """Extracts files of the results dir that were left in the archive."""
+    if not self.archive:
+      return
+    self.archive.Extract(self.results_dir,
+                         [os.path.relpath(f, self.results_dir) for f in files])
+
+  def _GetPerfSymbolizer(self):
+    symfs = os.path.join(self.chromeos_root, 'chroot', 'build', self.board)
+    kallsyms = sorted(glob.glob(os.path.join(symfs, 'boot', 'System.map-*')))
+    return perf_symbols.Symbolizer(
+        symfs,
+        vmlinux=os.path.join(symfs, 'usr/lib/debug/boot/vmlinux'),
+        kallsyms=kallsyms[0] if kallsyms else None)
+
+  def _ReadPerfDataFile(self, perf_data_file, perf_report_file):
+    """Writes the report of a perf.data file without running perf.
+
+    Returns:
+      The number of samples of every event, or None if the perf.data file
+      cannot be read this way.
+    """
+    try:
+      profile = perf_data.ReadPerfData(perf_data_file)
+    except (IOError, perf_data.PerfDataError) as e:
+      self._logger.LogOutput('Could not read %s (%s), running perf report.' %
+                             (perf_data_file, e))
+      return None
+    with open(perf_report_file, 'w') as report:
+      perf_data.WritePerfReport(profile, self._GetPerfSymbolizer(), report)
+    return profile.GetEventTotals()
+
   def GeneratePerfReportFiles(self):
     perf_report_files = []
     for perf_data_file in self.perf_data_files:
       # Generate a perf.report and store it side-by-side with the perf.data
       # file.
-      chroot_perf_data_file = misc.GetInsideChrootPath(self.chromeos_root,
-                                                       perf_data_file)
       perf_report_file = '%s.report' % perf_data_file
       if os.path.exists(perf_report_file):
         raise RuntimeError('Perf report file already exists: %s' %
                            perf_report_file)
+
+      # perf.data files are read in-process, and only the ones that cannot be
+      # are reported by perf, in the chroot.
+      event_totals = self._ReadPerfDataFile(perf_data_file, perf_report_file)
+      if event_totals is not None:
+        self.perf_event_totals[perf_report_file] = event_totals
+        perf_report_files.append(perf_report_file)
+        continue
+
+      chroot_perf_data_file = misc.GetInsideChrootPath(self.chromeos_root,
+                                                       perf_data_file)
       chroot_perf_report_file = misc.GetInsideChrootPath(self.chromeos_root,
                                                          perf_report_file)
       perf_path = os.path.join(self.chromeos_root, 'chroot', 'usr/bin/perf')
@@ -259,11 +355,21 @@ class Result(object):
   def GatherPerfResults(self):
     report_id = 0
     for perf_report_file in self.perf_report_files:
+      if perf_report_file in self.perf_event_totals:
+        # The events were counted when the report was generated.
+        for event_name, num_events in (
+            self.perf_event_totals[perf_report_file].iteritems()):
+          key = 'perf_%s_%s' % (report_id, event_name)
+          self.keyvals[key] = str(float(num_events))
+        continue
       with open(perf_report_file, 'r') as f:
         report_contents = f.read()
-        for group in re.findall(r'Events: (\S+) (\S+)', report_contents):
-          num_events = group[0]
-          event_name = group[1]
+        # Current perf versions write "# Samples: 2K of event 'cycles'",
+        # older ones "# Events: 2K cycles".
+        groups = re.findall(r"^# Samples: (\S+) of event '([^']+)'",
+                            report_contents, re.MULTILINE)
+        groups += re.findall(r'Events: (\S+) (\S+)', report_contents)
+        for num_events, event_name in groups:
           key = 'perf_%s_%s' % (report_id, event_name)
           value = str(misc.UnitToNumber(num_events))
           self.keyvals[key] = value
@@ -356,25 +462,75 @@ class Result(object):
             break
     return chrome_version
 
+  def PopulateFromKeyvalsFile(self, cache_dir):
+    """Populates the result from the keyvals file of a cache entry.
+
+    Returns False if the entry has no (usable) keyvals file, in which case the
+    result has to be recomputed from the cached results dir.
+    """
+    keyvals_file = os.path.join(cache_dir, KEYVALS_FILE)
+    if not os.path.exists(keyvals_file):
+      return False
+    try:
+      with open(keyvals_file, 'r') as f:
+        data = _ConvertToStr(json.load(f))
+    except ValueError:
+      return False
+    if data.get('version') != KEYVALS_FILE_VERSION:
+      return False
+
+    self.out = data['out']
+    self.err = data['err']
+    self.retval = data['retval']
+    self.keyvals = data['keyvals']
+    self.chrome_version = data['chrome_version']
+    if data['perf_data_files'] or data['perf_report_files']:
+      # The perf files are only extracted if something asks for them.
+      self.archive = results_archive.OpenArchive(cache_dir, self.ce)
+      if not self.archive:
+        raise RuntimeError('Could not find cached results in %s' % cache_dir)
+      self.temp_dir = tempfile.mkdtemp(
+          dir=os.path.join(self.chromeos_root, 'chroot', 'tmp'))
+      self.results_dir = self.temp_dir
+      self.perf_data_files = [
+          os.path.join(self.results_dir, f) for f in data['perf_data_files']
+      ]
+      self.perf_report_files = [
+          os.path.join(self.results_dir, f) for f in data['perf_report_files']
+      ]
+    return True
+
   def PopulateFromCacheDir(self, cache_dir, test, suite):
     self.test_name = test
     self.suite = suite
+    if self.PopulateFromKeyvalsFile(cache_dir):
+      return
     # Read in everything from the cache directory.
     with open(os.path.join(cache_dir, RESULTS_FILE), 'r') as f:
       self.out = pickle.load(f)
       self.err = pickle.load(f)
       self.retval = pickle.load(f)
 
-    # Untar the tarball to a temporary directory
+    # Extract the results dir to a temporary directory
     self.temp_dir = tempfile.mkdtemp(
         dir=os.path.join(self.chromeos_root, 'chroot', 'tmp'))
-
-    command = ('cd %s && tar xf %s' %
-               (self.temp_dir, os.path.join(cache_dir, AUTOTEST_TARBALL)))
-    ret = self.ce.RunCommand(command, print_to_console=False)
-    if ret:
-      raise RuntimeError('Could not untar cached tarball')
     self.results_dir = self.temp_dir
+
+    archive = results_archive.OpenArchive(cache_dir, self.ce)
+    if not archive:
+      raise RuntimeError('Could not find cached results in %s' % cache_dir)
+    cached_files = archive.ListFiles()
+    if cached_files and self._CanExtractLazily(cached_files):
+      # Only extract what is needed to compute the keyvals; the rest (e.g.
+      # perf.data) is extracted if and when it is used.
+      archive.Extract(self.temp_dir, [
+          f for f in cached_files if os.path.basename(f) in CACHE_HIT_FILES
+      ])
+      self.archive = archive
+    else:
+      # Old tarball, or results that need the deprecated (whole directory)
+      # keyval parsing.
+      archive.Extract(self.temp_dir)
     self.results_file = self.GetDataMeasurementsFiles()
     self.perf_data_files = self.GetPerfDataFiles()
     self.perf_report_files = self.GetPerfReportFiles()
@@ -393,6 +549,34 @@ class Result(object):
       command = 'rm -rf %s' % self.temp_dir
       self.ce.RunCommand(command)
 
+  def StoreKeyvalsFile(self, dest_dir):
+    """Writes the processed results, so cache hits need not redo it."""
+    chrome_version = self.label.chrome_version
+    if not chrome_version.startswith('Google Chrome '):
+      chrome_version = ''
+    data = {
+        'version': KEYVALS_FILE_VERSION,
+        'out': self.out,
+        'err': self.err,
+        'retval': self.retval,
+        'keyvals': self.keyvals,
+        'chrome_version': chrome_version,
+        'perf_data_files': [
+            os.path.relpath(f, self.results_dir) for f in self.perf_data_files
+        ],
+        'perf_report_files': [
+            os.path.relpath(f, self.results_dir)
+            for f in self.perf_report_files
+        ],
+    }
+    try:
+      contents = json.dumps(data)
+    except UnicodeDecodeError:
+      # The output is not valid UTF-8; cache hits will reprocess the results.
+      return
+    with open(os.path.join(dest_dir, KEYVALS_FILE), 'w') as f:
+      f.write(contents)
+
   def StoreToCacheDir(self, cache_dir, machine_manager, key_list):
     # Create the dir if it doesn't exist.
     temp_dir = tempfile.mkdtemp()
@@ -412,16 +596,12 @@ class Result(object):
           f.write(k)
           f.write('\n')
 
+    if self.keyvals is not None:
+      self.StoreKeyvalsFile(temp_dir)
+
     if self.results_dir:
-      tarball = os.path.join(temp_dir, AUTOTEST_TARBALL)
-      command = ('cd %s && '
-                 'tar '
-                 '--exclude=var/spool '
-                 '--exclude=var/log '
-                 '-cjf %s .' % (self.results_dir, tarball))
-      ret = self.ce.RunCommand(command)
-      if ret:
-        raise RuntimeError("Couldn't store autotest output directory.")
+      archive = results_archive.GetArchiveForWrite(temp_dir, self.ce)
+      archive.Store(self.results_dir)
     # Store machine info.
     # TODO(asharif): Make machine_manager a singleton, and don't pass it into
     # this function.
@@ -532,6 +712,8 @@ class TelemetryResult(Result):
   def PopulateFromCacheDir(self, cache_dir, test, suite):
     self.test_name = test
     self.suite = suite
+    if self.PopulateFromKeyvalsFile(cache_dir):
+      return
     with open(os.path.join(cache_dir, RESULTS_FILE), 'r') as f:
       self.out = pickle.load(f)
       self.err = pickle.load(f)
@@ -624,9 +806,22 @@ class ResultsCache(object):
     self.run_local = run_local
 
   def GetCacheDirForRead(self):
+    key_list = self.GetCacheKeyList(True)
     matching_dirs = []
-    for glob_path in self.FormCacheDir(self.GetCacheKeyList(True)):
-      matching_dirs += glob.glob(glob_path)
+    for cache_home, glob_path in zip(self.GetCacheHomes(),
+                                     self.FormCacheDir(key_list)):
+      catalog = results_catalog.ResultsCatalog(cache_home)
+      cataloged_dirs = None
+      if catalog.Exists():
+        # Index the entries stored by a crosperf that doesn't keep the
+        # catalog, if there may be any since the last scan.
+        catalog.Refresh()
+        cataloged_dirs = catalog.Lookup(key_list)
+      if cataloged_dirs is None:
+        matching_dirs += glob.glob(glob_path)
+      else:
+        # The catalog may still list entries that were removed by hand.
+        matching_dirs += [d for d in cataloged_dirs if os.path.isdir(d)]
 
     if matching_dirs:
       # Cache file found.
@@ -647,23 +842,25 @@ class ResultsCache(object):
       return cache_path, keylist
     return cache_path
 
-  def FormCacheDir(self, list_of_strings):
-    cache_key = ' '.join(list_of_strings)
-    cache_dir = misc.GetFilenameFromString(cache_key)
+  def GetCacheHomes(self):
     if self.label.cache_dir:
-      cache_home = os.path.abspath(os.path.expanduser(self.label.cache_dir))
-      cache_path = [os.path.join(cache_home, cache_dir)]
+      cache_homes = [os.path.abspath(os.path.expanduser(self.label.cache_dir))]
     else:
-      cache_path = [os.path.join(SCRATCH_DIR, cache_dir)]
+      cache_homes = [SCRATCH_DIR]
 
     if len(self.share_cache):
       for path in [x.strip() for x in self.share_cache.split(',')]:
         if os.path.exists(path):
-          cache_path.append(os.path.join(path, cache_dir))
+          cache_homes.append(path)
         else:
           self._logger.LogFatal('Unable to find shared cache: %s' % path)
 
-    return cache_path
+    return cache_homes
+
+  def FormCacheDir(self, list_of_strings):
+    cache_key = ' '.join(list_of_strings)
+    cache_dir = misc.GetFilenameFromString(cache_key)
+    return [os.path.join(home, cache_dir) for home in self.GetCacheHomes()]
 
   def GetCacheKeyList(self, read):
     if read and CacheConditions.MACHINES_MATCH not in self.cache_conditions:
@@ -733,7 +930,13 @@ class ResultsCache(object):
 
   def StoreResult(self, result):
     cache_dir, keylist = self.GetCacheDirForWrite(get_keylist=True)
+    catalog = results_catalog.ResultsCatalog(os.path.dirname(cache_dir))
+    home_mtime = catalog.GetHomeMtime()
+    # StoreToCacheDir replaces any previous entry, so drop its catalog row
+    # first; the new row is only added once the entry is fully in place.
+    catalog.Remove(cache_dir)
     result.StoreToCacheDir(cache_dir, self.machine_manager, keylist)
+    catalog.Add(cache_dir, self.GetCacheKeyList(False), home_mtime)
 
 
 class MockResultsCache(ResultsCache):
@@ -9,11 +9,16 @@ from __future__ import print_function
 
 import mock
 import os
+import pickle
+import shutil
 import tempfile
 import unittest
 
 import image_checksummer
 import machine_manager
+import perf_data_unittest
+import results_archive
+import results_catalog
 import test_flag
 
 from label import MockLabel
@@ -211,46 +216,35 @@ class ResultTest(unittest.TestCase):
     self.result = Result(self.mock_logger, self.mock_label, 'average',
                          self.mock_cmd_exec)
 
-  @mock.patch.object(os.path, 'isdir')
-  @mock.patch.object(command_executer.CommandExecuter, 'RunCommand')
-  @mock.patch.object(command_executer.CommandExecuter, 'CopyFiles')
-  def test_copy_files_to(self, mock_copyfiles, mock_runcmd, mock_isdir):
-
-    files = ['src_file_1', 'src_file_2', 'src_file_3']
-    dest_dir = '/tmp/test'
-    self.mock_cmd_exec.RunCommand = mock_runcmd
-    self.mock_cmd_exec.CopyFiles = mock_copyfiles
-
-    mock_copyfiles.return_value = 0
-
-    #test 1. dest_dir exists; CopyFiles returns 0.
-    mock_isdir.return_value = True
-    self.result.CopyFilesTo(dest_dir, files)
-    self.assertEqual(mock_runcmd.call_count, 0)
-    self.assertEqual(mock_copyfiles.call_count, 3)
-    first_args = mock_copyfiles.call_args_list[0][0]
-    second_args = mock_copyfiles.call_args_list[1][0]
-    third_args = mock_copyfiles.call_args_list[2][0]
-    self.assertEqual(first_args, ('src_file_1', '/tmp/test/src_file_1.0'))
-    self.assertEqual(second_args, ('src_file_2', '/tmp/test/src_file_2.0'))
-    self.assertEqual(third_args, ('src_file_3', '/tmp/test/src_file_3.0'))
-
-    mock_runcmd.reset_mock()
-    mock_copyfiles.reset_mock()
-    #test 2. dest_dir does not exist; CopyFiles returns 0.
-    mock_isdir.return_value = False
-    self.result.CopyFilesTo(dest_dir, files)
-    self.assertEqual(mock_runcmd.call_count, 3)
-    self.assertEqual(mock_copyfiles.call_count, 3)
-    self.assertEqual(mock_runcmd.call_args_list[0],
-                     mock_runcmd.call_args_list[1])
-    self.assertEqual(mock_runcmd.call_args_list[0],
-                     mock_runcmd.call_args_list[2])
-    self.assertEqual(mock_runcmd.call_args_list[0][0], ('mkdir -p /tmp/test',))
-
-    #test 3. CopyFiles returns 1 (fails).
-    mock_copyfiles.return_value = 1
-    self.assertRaises(Exception, self.result.CopyFilesTo, dest_dir, files)
+  def test_copy_files_to(self):
+    src_dir = tempfile.mkdtemp()
+    dest_dir = os.path.join(src_dir, 'test')
+    try:
+      files = []
+      for name in ['src_file_1', 'src_file_2', 'src_file_3']:
+        files.append(os.path.join(src_dir, name))
+        with open(files[-1], 'w') as f:
+          f.write(name)
+
+      #test 1. dest_dir does not exist.
+      self.result.CopyFilesTo(dest_dir, files)
+      self.assertEqual(sorted(os.listdir(dest_dir)),
+                       ['src_file_1.0', 'src_file_2.0', 'src_file_3.0'])
+      with open(os.path.join(dest_dir, 'src_file_2.0')) as f:
+        self.assertEqual(f.read(), 'src_file_2')
+
+      #test 2. dest_dir and the files exist.
+      with open(files[0], 'w') as f:
+        f.write('new contents')
+      self.result.CopyFilesTo(dest_dir, files)
+      with open(os.path.join(dest_dir, 'src_file_1.0')) as f:
+        self.assertEqual(f.read(), 'new contents')
+
+      #test 3. A file cannot be copied.
+      self.assertRaises(IOError, self.result.CopyFilesTo, dest_dir,
+                        [os.path.join(src_dir, 'missing_file')])
+    finally:
+      shutil.rmtree(src_dir)
 
   @mock.patch.object(Result, 'CopyFilesTo')
   def test_copy_results_to(self, mockCopyFilesTo):
@@ -549,6 +543,39 @@ class ResultTest(unittest.TestCase):
                        '--kallsyms /build/lumpy/boot/System.map-* -i '
                        '%s --stdio > %s') % (fake_file, fake_file)))
 
+  @mock.patch.object(command_executer.CommandExecuter, 'ChrootRunCommand')
+  def test_generate_perf_report_files_without_perf(self, mock_chrootruncmd):
+    results_dir = tempfile.mkdtemp()
+    try:
+      perf_data_file = os.path.join(results_dir, 'perf.data')
+      perf_data_unittest.WritePerfData(perf_data_file, [('cycles', 0, [1])], [
+          perf_data_unittest.Sample(1, 10, 0x1000, 100),
+          perf_data_unittest.Sample(1, 10, 0x2000, 100)
+      ])
+      self.result.perf_data_files = [perf_data_file]
+      self.result.chromeos_root = results_dir
+      self.result.board = 'lumpy'
+      self.result.ce.ChrootRunCommand = mock_chrootruncmd
+
+      self.result.perf_report_files = self.result.GeneratePerfReportFiles()
+      self.assertEqual(self.result.perf_report_files,
+                       ['%s.report' % perf_data_file])
+      self.assertTrue(os.path.exists(self.result.perf_report_files[0]))
+      self.assertFalse(mock_chrootruncmd.called)
+
+      self.result.keyvals = {}
+      self.result.GatherPerfResults()
+      self.assertEqual(self.result.keyvals, {'perf_0_cycles': '2.0'})
+
+      # Reading the report itself, as for reports of `perf report`, gives the
+      # same keyvals.
+      self.result.perf_event_totals = {}
+      self.result.keyvals = {}
+      self.result.GatherPerfResults()
+      self.assertEqual(self.result.keyvals, {'perf_0_cycles': '2.0'})
+    finally:
+      shutil.rmtree(results_dir)
+
   @mock.patch.object(misc, 'GetOutsideChrootPath')
   def test_populate_from_run(self, mock_getpath):
 
@@ -689,6 +716,112 @@ class ResultTest(unittest.TestCase):
     command = 'rm -Rf %s' % self.tmpdir
     self.result.ce.RunCommand(command)
 
+  def test_populate_from_indexed_cache_dir(self):
+    chromeos_root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(chromeos_root, 'chroot', 'tmp'))
+    results_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+      test_dir = os.path.join(results_dir, 'telemetry_Crosperf')
+      os.makedirs(os.path.join(test_dir, 'results'))
+      os.makedirs(os.path.join(test_dir, 'profiling'))
+      with open(os.path.join(test_dir, 'results', 'results-chart.json'),
+                'w') as f:
+        f.write('{"charts": {"Total": {"Total": '
+                '{"type": "scalar", "value": 444.0, "units": "ms"}}}}')
+      with open(os.path.join(test_dir, 'profiling', 'perf.data'), 'w') as f:
+        f.write('fake perf data')
+      with open(os.path.join(test_dir, 'profiling', 'perf.data.report'),
+                'w') as f:
+        f.write('# Events: 2K cycles\n')
+      with open(os.path.join(cache_dir, 'results.txt'), 'w') as f:
+        pickle.dump('out', f)
+        pickle.dump('err', f)
+        pickle.dump(0, f)
+      results_archive.IndexedTar(cache_dir, self.result.ce).Store(results_dir)
+
+      # Nothing should be extracted or searched with external commands.
+      self.result.ce = self.mock_cmd_exec
+      self.result.chromeos_root = chromeos_root
+      self.result.PopulateFromCacheDir(cache_dir, 'sunspider',
+                                       'telemetry_Crosperf')
+      self.assertEqual(self.result.keyvals, {
+          u'Total__Total': [444.0, u'ms'],
+          'perf_0_cycles': '2000.0',
+          'retval': 0
+      })
+      self.assertFalse(self.mock_cmd_exec.RunCommand.called)
+      self.assertFalse(self.mock_cmd_exec.RunCommandWOutput.called)
+      # perf.data is only extracted when it is needed.
+      self.assertEqual(len(self.result.perf_data_files), 1)
+      perf_data_file = self.result.perf_data_files[0]
+      self.assertFalse(os.path.exists(perf_data_file))
+      self.result.ExtractFromArchive(self.result.perf_data_files)
+      with open(perf_data_file) as f:
+        self.assertEqual(f.read(), 'fake perf data')
+    finally:
+      for d in (chromeos_root, results_dir, cache_dir):
+        shutil.rmtree(d)
+
+  def test_keyvals_file(self):
+    chromeos_root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(chromeos_root, 'chroot', 'tmp'))
+    results_dir = tempfile.mkdtemp()
+    cache_dir = tempfile.mkdtemp()
+    try:
+      perf_dir = os.path.join(results_dir, 'telemetry_Crosperf', 'profiling')
+      os.makedirs(perf_dir)
+      for name in ('perf.data', 'perf.data.report'):
+        with open(os.path.join(perf_dir, name), 'w') as f:
+          f.write(name)
+      results_archive.IndexedTar(cache_dir, self.result.ce).Store(results_dir)
+
+      saved_chrome_version = self.mock_label.chrome_version
+      self.mock_label.chrome_version = 'Google Chrome 50.0.2661.0'
+      self.result.out = 'out'
+      self.result.err = 'err'
+      self.result.retval = 0
+      self.result.keyvals = {
+          'Total__Total': [444.0, 'ms'],
+          'perf_0_cycles': '2000.0',
+          'retval': 0
+      }
+      self.result.results_dir = results_dir
+      self.result.perf_data_files = [os.path.join(perf_dir, 'perf.data')]
+      self.result.perf_report_files = [
+          os.path.join(perf_dir, 'perf.data.report')
+      ]
+      self.result.StoreKeyvalsFile(cache_dir)
+
+      # Neither the pickled output nor the results dir should be needed.
+      result = Result(self.mock_logger, self.mock_label, 'average', None,
+                      self.mock_cmd_exec)
+      result.chromeos_root = chromeos_root
+      result.PopulateFromCacheDir(cache_dir, 'sunspider', 'telemetry_Crosperf')
+      self.assertEqual(result.out, 'out')
+      self.assertEqual(result.err, 'err')
+      self.assertEqual(result.retval, 0)
+      self.assertEqual(result.keyvals, self.result.keyvals)
+      self.assertIsInstance(result.keyvals['Total__Total'][1], str)
+      self.assertEqual(result.chrome_version, 'Google Chrome 50.0.2661.0')
+      self.assertFalse(self.mock_cmd_exec.RunCommand.called)
+      self.assertFalse(self.mock_cmd_exec.RunCommandWOutput.called)
+
+      self.assertEqual(len(result.perf_report_files), 1)
+      self.assertFalse(os.path.exists(result.perf_report_files[0]))
+      result.ExtractFromArchive(result.perf_report_files)
+      with open(result.perf_report_files[0]) as f:
+        self.assertEqual(f.read(), 'perf.data.report')
+
+      # Unknown versions of the file are ignored.
+      with open(os.path.join(cache_dir, 'keyvals.json'), 'w') as f:
+        f.write('{"version": 1000}')
+      self.assertFalse(result.PopulateFromKeyvalsFile(cache_dir))
+      self.mock_label.chrome_version = saved_chrome_version
+    finally:
+      for d in (chromeos_root, results_dir, cache_dir):
+        shutil.rmtree(d)
+
   @mock.patch.object(misc, 'GetRoot')
   @mock.patch.object(command_executer.CommandExecuter, 'RunCommand')
   def test_cleanup(self, mock_runcmd, mock_getroot):
@@ -774,7 +907,9 @@ class ResultTest(unittest.TestCase):
     # Check that the correct things were written to the 'cache'.
     test_dir = os.path.join(os.getcwd(), 'test_cache/test_output')
     base_dir = os.path.join(os.getcwd(), 'test_cache/compare_output')
-    self.assertTrue(os.path.exists(os.path.join(test_dir, 'autotest.tbz2')))
+    self.assertTrue(os.path.exists(os.path.join(test_dir, 'autotest.tar')))
+    self.assertTrue(
+        os.path.exists(os.path.join(test_dir, 'autotest.manifest')))
     self.assertTrue(os.path.exists(os.path.join(test_dir, 'machine.txt')))
     self.assertTrue(os.path.exists(os.path.join(test_dir, 'results.txt')))
 
@@ -1018,6 +1153,50 @@ class ResultsCacheTest(unittest.TestCase):
     comp_path = os.path.join(os.getcwd(), 'cache_dir', test_dirname)
     self.assertEqual(path1, comp_path)
 
+  @mock.patch.object(image_checksummer.ImageChecksummer, 'Checksum')
+  def test_get_cache_dir_for_read(self, mock_checksum):
+    mock_checksum.return_value = 'FakeImageChecksumabc123'
+    self.results_cache.machine_manager.machine_checksum['mock_label'] = \
+        'FakeMachineChecksumabc987'
+    cache_home = tempfile.mkdtemp()
+    self.results_cache.label.cache_dir = cache_home
+    try:
+      # Without a catalog, entries are found with glob.
+      self.assertIsNone(self.results_cache.GetCacheDirForRead())
+      cache_dir = self.results_cache.GetCacheDirForWrite()
+      os.mkdir(cache_dir)
+      self.assertEqual(self.results_cache.GetCacheDirForRead(), cache_dir)
+
+      # Once a catalog exists, it is used before glob.
+      catalog = results_catalog.ResultsCatalog(cache_home)
+      catalog.Remove(cache_dir)
+      catalog.Add(cache_dir, self.results_cache.GetCacheKeyList(False))
+      with mock.patch('glob.glob') as mock_glob:
+        mock_glob.return_value = []
+        self.assertEqual(self.results_cache.GetCacheDirForRead(), cache_dir)
+        # Rows whose directory was removed are ignored, and a miss in the
+        # catalog is a miss.
+        os.rmdir(cache_dir)
+        self.assertIsNone(self.results_cache.GetCacheDirForRead())
+
+        # Entries stored without updating the catalog are found once the
+        # cache home changed, and indexed from then on.
+        catalog.Remove(cache_dir)
+        os.mkdir(cache_dir)
+        os.utime(cache_home, (1000, 1000))
+        self.assertEqual(self.results_cache.GetCacheDirForRead(), cache_dir)
+        self.assertEqual(
+            catalog.Lookup(self.results_cache.GetCacheKeyList(True)),
+            [cache_dir])
+        self.assertFalse(mock_glob.called)
+
+      # A catalog that can't be read is ignored.
+      open(catalog.path, 'w').close()
+      self.assertEqual(self.results_cache.GetCacheDirForRead(), cache_dir)
+    finally:
+      shutil.rmtree(cache_home)
+      self.results_cache.label.cache_dir = 'cache_dir'
+
   @mock.patch.object(image_checksummer.ImageChecksummer, 'Checksum')
   def test_get_cache_key_list(self, mock_checksum):
     # This tests the mechanism that generates the various pieces of the
@@ -0,0 +1,353 @@
+#!/usr/bin/env python2
+#
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Indexed catalog of the entries stored in a crosperf cache home.
+
+Every cache entry is a directory whose name is built from the key tuple
+returned by ResultsCache.GetCacheKeyList. Looking entries up with glob means
+listing the whole cache home for every benchmark run, which is very slow on
+large shared (NFS) caches. The catalog keeps one row per entry in a SQLite
+database that lives next to the entries, so wildcard reads become indexed
+queries.
+
+The catalog also records the modification time the cache home had when it
+was last scanned, so entries stored by a crosperf that doesn't keep the
+catalog are picked up by listing the cache home again only once it changed.
+
+This file can also be run as a script to rebuild or verify the catalog of an
+existing cache home.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from cros_utils import misc
+
+CATALOG_FILE = 'results_catalog.db'
+CATALOG_VERSION = 2
+
+# The fields of the key tuple, in the order GetCacheKeyList returns them.
+KEY_FIELDS = ('image_path_checksum', 'test_name', 'iteration',
+              'test_args_checksum', 'checksum', 'machine_checksum',
+              'machine_id_checksum', 'cache_version')
+
+# Matches the name of a cache entry directory. The test name may contain
+# underscores, so every other field is anchored on its known format.
+CACHE_DIR_RE = re.compile(r'^(?P<image_path_checksum>[^_]*)_'
+                          r'(?P<test_name>.+)_'
+                          r'(?P<iteration>\d+)_'
+                          r'(?P<test_args_checksum>[0-9a-f]{32})_'
+                          r'(?P<checksum>[^_]*)_'
+                          r'(?P<machine_checksum>[^_]*)_'
+                          r'(?P<machine_id_checksum>[^_]*)_'
+                          r'(?P<cache_version>\d+)$')
+
+
+def NormalizeKeyList(key_list):
+  """Applies the cache dir name transformation to each field of a key."""
+  return tuple(misc.GetFilenameFromString(k) for k in key_list)
+
+
+def ParseCacheDirName(dirname):
+  """Returns the (normalized) key tuple of a cache dir name, or None."""
+  mo = CACHE_DIR_RE.match(dirname)
+  if not mo:
+    return None
+  return tuple(mo.group(f) for f in KEY_FIELDS)
+
+
+class ResultsCatalog(object):
+  """Catalog of the cache entries stored in a single cache home."""
+
+  def __init__(self, cache_home):
+    self.cache_home = cache_home
+    self.path = os.path.join(cache_home, CATALOG_FILE)
+
+  def Exists(self):
+    return os.path.isfile(self.path)
+
+  def _Connect(self):
+    # Several crosperf instances may share a cache home, so wait for the
+    # other writers instead of failing.
+    conn = sqlite3.connect(self.path, timeout=60)
+    # Keep the journal file around, creating and deleting it on every write
+    # would change the modification time of the cache home.
+    try:
+      conn.execute('PRAGMA journal_mode = PERSIST')
+    except sqlite3.DatabaseError:
+      # Not a catalog; the statements run on conn report it.
+      pass
+    return conn
+
+  def _CreateTables(self, conn):
+    columns = ', '.join('%s TEXT NOT NULL' % f for f in KEY_FIELDS)
+    conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                 'dirname TEXT PRIMARY KEY, %s, stored REAL)' % columns)
+    conn.execute('CREATE INDEX IF NOT EXISTS entries_test ON entries '
+                 '(test_name, iteration, test_args_checksum)')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta ('
+                 'name TEXT PRIMARY KEY, value)')
+    conn.execute('PRAGMA user_version = %d' % CATALOG_VERSION)
+
+  def _Build(self):
+    """Creates the catalog of the entries on disk. Returns their number.
+
+    The tables are created and filled in a single exclusive transaction of the
+    live catalog: readers find either no table, and list the cache home, or
+    all the entries, and the rows that Add inserts meanwhile are kept.
+    """
+    home_mtime = self.GetHomeMtime()
+    on_disk = self._ListCacheDirs()
+    conn = self._Connect()
+    conn.isolation_level = None
+    try:
+      conn.execute('BEGIN EXCLUSIVE')
+      try:
+        self._CreateTables(conn)
+        # Only drop the rows of entries that are still gone now that no one
+        # else can write to the catalog.
+        rows = conn.execute('SELECT dirname FROM entries').fetchall()
+        conn.executemany('DELETE FROM entries WHERE dirname = ?', [
+            row for row in rows if row[0] not in on_disk and
+            not os.path.isdir(os.path.join(self.cache_home, row[0]))
+        ])
+        self._Insert(conn, [(d,) + key + (mtime,)
+                            for d, (key, mtime) in on_disk.iteritems()])
+        self._SetScannedMtime(conn, home_mtime)
+        conn.execute('COMMIT')
+      except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+      conn.close()
+    return len(on_disk)
+
+  def Open(self):
+    """Returns a connection, creating and populating the catalog if needed."""
+    if not os.path.isdir(self.cache_home):
+      os.makedirs(self.cache_home)
+    if not self.Exists():
+      # Index the entries that were stored before the catalog existed.
+      self._Build()
+    return self._Connect()
+
+  def _ListCacheDirs(self):
+    """Returns {dirname: (key, mtime)} for the entries in the cache home."""
+    entries = {}
+    for dirname in os.listdir(self.cache_home):
+      key = ParseCacheDirName(dirname)
+      if not key:
+        continue
+      try:
+        mtime = os.path.getmtime(os.path.join(self.cache_home, dirname))
+      except OSError:
+        continue
+      if os.path.isdir(os.path.join(self.cache_home, dirname)):
+        entries[dirname] = (key, mtime)
+    return entries
+
+  def _Insert(self, conn, rows):
+    # Rows that are already there were added when their entry was stored,
+    # which is more accurate than what is found on disk later.
+    conn.executemany('INSERT OR IGNORE INTO entries VALUES (%s)' %
+                     ', '.join(['?'] * (len(KEY_FIELDS) + 2)), rows)
+
+  def GetHomeMtime(self):
+    """Returns the modification time of the cache home, or None."""
+    try:
+      return os.path.getmtime(self.cache_home)
+    except OSError:
+      return None
+
+  def _GetScannedMtime(self, conn):
+    row = conn.execute("SELECT value FROM meta WHERE name = 'scanned_mtime'"
+                      ).fetchone()
+    return row[0] if row else None
+
+  def _SetScannedMtime(self, conn, mtime):
+    conn.execute("INSERT OR REPLACE INTO meta VALUES ('scanned_mtime', ?)",
+                 (mtime,))
+
+  def Add(self, cache_dir, key_list, home_mtime=None):
+    """Records that cache_dir holds the entry for key_list.
+
+    Args:
+      cache_dir: The directory of the entry, inside the cache home.
+      key_list: The cache key of the entry.
+      home_mtime: The value of GetHomeMtime() before cache_dir was stored. If
+        the catalog had been scanned at that time, storing cache_dir doesn't
+        make it out of date.
+    """
+    row = ((os.path.basename(cache_dir),) + NormalizeKeyList(key_list) +
+           (time.time(),))
+    conn = self.Open()
+    try:
+      with conn:
+        conn.execute('INSERT OR REPLACE INTO entries VALUES (%s)' %
+                     ', '.join(['?'] * len(row)), row)
+        if (home_mtime is not None and
+            self._GetScannedMtime(conn) == home_mtime):
+          self._SetScannedMtime(conn, self.GetHomeMtime())
+    finally:
+      conn.close()
+
+  def AddCacheDirs(self, cache_dirs):
+    """Records entries found on disk, e.g. stored by a crosperf without it."""
+    rows = []
+    for cache_dir in cache_dirs:
+      key = ParseCacheDirName(os.path.basename(cache_dir))
+      if key:
+        rows.append((os.path.basename(cache_dir),) + key +
+                    (os.path.getmtime(cache_dir),))
+    if not rows or not self.Exists():
+      return
+    conn = self._Connect()
+    try:
+      with conn:
+        self._Insert(conn, rows)
+    except sqlite3.DatabaseError:
+      pass
+    finally:
+      conn.close()
+
+  def Refresh(self):
+    """Indexes the entries on disk if the cache home changed since its scan.
+
+    Entries stored by a crosperf that doesn't keep the catalog change the
+    modification time of the cache home. Rows of entries that were removed
+    by hand are left to Verify. Returns whether the cache home was scanned.
+    """
+    home_mtime = self.GetHomeMtime()
+    if home_mtime is None or not self.Exists():
+      return False
+    conn = self._Connect()
+    try:
+      if self._GetScannedMtime(conn) == home_mtime:
+        return False
+      on_disk = self._ListCacheDirs()
+      with conn:
+        self._CreateTables(conn)
+        self._Insert(conn, [(d,) + key + (mtime,)
+                            for d, (key, mtime) in on_disk.iteritems()])
+        self._SetScannedMtime(conn, home_mtime)
+    except sqlite3.DatabaseError:
+      return False
+    finally:
+      conn.close()
+    return True
+
+  def Remove(self, cache_dir):
+    if not self.Exists():
+      return
+    conn = self._Connect()
+    try:
+      with conn:
+        conn.execute('DELETE FROM entries WHERE dirname = ?',
+                     (os.path.basename(cache_dir),))
+    finally:
+      conn.close()
+
+  def Lookup(self, key_list):
+    """Returns the cache dirs matching key_list, newest first.
+
+    Fields of key_list that are '*' match anything, like they do in the glob
+    pattern built from the same key. Returns None if the catalog can't be
+    read, e.g. it was left without its table by an older crosperf.
+    """
+    conditions = []
+    values = []
+    for field, value in zip(KEY_FIELDS, NormalizeKeyList(key_list)):
+      if value == '*':
+        continue
+      conditions.append('%s = ?' % field)
+      values.append(value)
+    query = 'SELECT dirname FROM entries'
+    if conditions:
+      query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY stored DESC'
+    conn = self._Connect()
+    try:
+      rows = conn.execute(query, values).fetchall()
+    except sqlite3.DatabaseError:
+      return None
+    finally:
+      conn.close()
+    return [os.path.join(self.cache_home, row[0]) for row in rows]
+
+  def Rebuild(self):
+    """Recreates the catalog from the entries on disk."""
+    return self._Build()
+
+  def Verify(self, fix=False):
+    """Compares the catalog with the cache entries on disk.
+
+    Returns a (missing, stale) tuple: the entries on disk that are not in the
+    catalog and the catalog rows whose directory is gone. If fix is set, the
+    catalog is updated to match the disk.
+    """
+    home_mtime = self.GetHomeMtime()
+    on_disk = self._ListCacheDirs()
+    conn = self.Open()
+    try:
+      cataloged = set(row[0] for row in
+                      conn.execute('SELECT dirname FROM entries'))
+      missing = sorted(set(on_disk) - cataloged)
+      stale = sorted(cataloged - set(on_disk))
+      if fix:
+        self._CreateTables(conn)
+        with conn:
+          conn.executemany('DELETE FROM entries WHERE dirname = ?',
+                           [(d,) for d in stale])
+          self._Insert(conn, [(d,) + on_disk[d][0] + (on_disk[d][1],)
+                              for d in missing])
+          self._SetScannedMtime(conn, home_mtime)
+    finally:
+      conn.close()
+    return missing, stale
+
+
+def _ParseArgs(argv):
+  parser = argparse.ArgumentParser(description='Rebuild or verify the '
+                                   'catalog of a crosperf results cache.')
+  parser.add_argument('cache_homes', nargs='+',
+                      help='Cache directories (e.g. ~/cros_scratch).')
+  parser.add_argument('--rebuild', action='store_true',
+                      help='Recreate the catalog from the cache entries.')
+  parser.add_argument('--fix', action='store_true',
+                      help='When verifying, update the catalog to match the '
+                      'cache entries on disk.')
+  return parser.parse_args(argv)
+
+
+def Main(argv):
+  args = _ParseArgs(argv)
+  ok = True
+  for cache_home in args.cache_homes:
+    catalog = ResultsCatalog(os.path.abspath(os.path.expanduser(cache_home)))
+    if args.rebuild:
+      count = catalog.Rebuild()
+      print('%s: indexed %d entries.' % (cache_home, count))
+      continue
+    missing, stale = catalog.Verify(fix=args.fix)
+    for d in missing:
+      print('%s: not in catalog: %s' % (cache_home, d))
+    for d in stale:
+      print('%s: stale catalog entry: %s' % (cache_home, d))
+    print('%s: %d missing, %d stale%s.' % (cache_home, len(missing),
+                                           len(stale),
+                                           ' (fixed)' if args.fix else ''))
+    if (missing or stale) and not args.fix:
+      ok = False
+  return 0 if ok else 1
+
+
+if __name__ == '__main__':
+  sys.exit(Main(sys.argv[1:]))
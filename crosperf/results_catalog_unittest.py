@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for the results cache catalog."""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import results_catalog
+from results_catalog import ResultsCatalog
+
+KEY1 = ('54524606abaae4fdf7b02f49f7ae7127', 'page_cycler_v2.typical_25', '1',
+        'fda29412ceccb72977516c4785d08e2c', 'FakeImageChecksumabc123',
+        'FakeMachineChecksumabc987', '', '6')
+KEY2 = ('54524606abaae4fdf7b02f49f7ae7127', 'sunspider', '2',
+        'fda29412ceccb72977516c4785d08e2c', 'FakeImageChecksumabc123',
+        'FakeMachineChecksumabc987', 'a0ad9c5d4e3d1b5c0c6d6a0b7e9b1f11', '6')
+
+
+def _DirName(key):
+  return '_'.join(results_catalog.NormalizeKeyList(key))
+
+
+class ResultsCatalogTest(unittest.TestCase):
+  """Tests for ResultsCatalog."""
+
+  def setUp(self):
+    self.cache_home = tempfile.mkdtemp()
+    self.catalog = ResultsCatalog(self.cache_home)
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_home)
+
+  def _MakeEntry(self, key):
+    path = os.path.join(self.cache_home, _DirName(key))
+    os.mkdir(path)
+    return path
+
+  def test_parse_cache_dir_name(self):
+    self.assertEqual(results_catalog.ParseCacheDirName(_DirName(KEY1)), KEY1)
+    self.assertEqual(results_catalog.ParseCacheDirName(_DirName(KEY2)), KEY2)
+    self.assertIsNone(results_catalog.ParseCacheDirName('results_catalog.db'))
+
+  def test_add_and_lookup(self):
+    self.assertFalse(self.catalog.Exists())
+    path1 = self._MakeEntry(KEY1)
+    path2 = self._MakeEntry(KEY2)
+    self.catalog.Add(path2, KEY2)
+    self.assertTrue(self.catalog.Exists())
+    # KEY1 was on disk before the catalog was created, so it gets indexed too.
+    self.assertEqual(self.catalog.Lookup(KEY1), [path1])
+    self.assertEqual(self.catalog.Lookup(KEY2), [path2])
+
+    wildcard = ('*',) + KEY1[1:5] + ('*', '*', '6')
+    self.assertEqual(self.catalog.Lookup(wildcard), [path1])
+    wildcard = ('*', '*', '*') + KEY1[3:]
+    self.assertEqual(self.catalog.Lookup(wildcard), [path1])
+    self.assertEqual(
+        sorted(self.catalog.Lookup(('*',) * len(KEY1))), sorted([path1,
+                                                                 path2]))
+    self.assertEqual(self.catalog.Lookup(KEY1[:-1] + ('7',)), [])
+
+  def test_test_name_is_normalized(self):
+    key = ('54524606abaae4fdf7b02f49f7ae7127', 'page_cycler/typical 25', '1'
+          ) + KEY1[3:]
+    path = self._MakeEntry(key)
+    self.catalog.Add(path, key)
+    self.assertEqual(self.catalog.Lookup(key), [path])
+
+  def test_remove(self):
+    path = self._MakeEntry(KEY1)
+    self.catalog.Remove(path)
+    self.catalog.Add(path, KEY1)
+    self.catalog.Remove(path)
+    self.assertEqual(self.catalog.Lookup(KEY1), [])
+
+  def test_verify_and_rebuild(self):
+    path1 = self._MakeEntry(KEY1)
+    self.catalog.Add(path1, KEY1)
+    path2 = self._MakeEntry(KEY2)
+    shutil.rmtree(path1)
+
+    missing, stale = self.catalog.Verify()
+    self.assertEqual(missing, [os.path.basename(path2)])
+    self.assertEqual(stale, [os.path.basename(path1)])
+
+    self.catalog.Verify(fix=True)
+    self.assertEqual(self.catalog.Verify(), ([], []))
+    self.assertEqual(self.catalog.Lookup(KEY2), [path2])
+
+    path1 = self._MakeEntry(KEY1)
+    self.assertEqual(self.catalog.Rebuild(), 2)
+    self.assertEqual(self.catalog.Lookup(KEY1), [path1])
+
+  def test_build_in_place(self):
+    path1 = self._MakeEntry(KEY1)
+    path2 = self._MakeEntry(KEY2)
+    self.catalog.Add(path2, KEY2)
+    shutil.rmtree(path1)
+    self.assertEqual(self.catalog.Rebuild(), 1)
+    # The row Add inserted is kept, the one of the removed entry is dropped.
+    self.assertEqual(self.catalog.Lookup(('*',) * len(KEY1)), [path2])
+    # Only the catalog and its journal are left next to the entries.
+    self.assertEqual(sorted(os.listdir(self.cache_home)),
+                     sorted([_DirName(KEY2), results_catalog.CATALOG_FILE,
+                             results_catalog.CATALOG_FILE + '-journal']))
+
+  def test_unreadable_catalog(self):
+    # A catalog file without its table, like an interrupted build leaves.
+    open(self.catalog.path, 'w').close()
+    self.assertTrue(self.catalog.Exists())
+    self.assertIsNone(self.catalog.Lookup(KEY1))
+
+  def test_add_cache_dirs(self):
+    self.catalog.Open().close()
+    path1 = self._MakeEntry(KEY1)
+    self.assertEqual(self.catalog.Lookup(KEY1), [])
+    self.catalog.AddCacheDirs([path1])
+    self.assertEqual(self.catalog.Lookup(KEY1), [path1])
+
+  def test_refresh(self):
+    self.assertFalse(self.catalog.Refresh())
+    self.catalog.Open().close()
+    # Nothing changed since the catalog was built.
+    os.utime(self.cache_home, (1000, 1000))
+    self.catalog.Rebuild()
+    with mock.patch.object(os, 'listdir') as mock_listdir:
+      self.assertFalse(self.catalog.Refresh())
+      self.assertFalse(mock_listdir.called)
+
+    # An entry stored without the catalog changes the cache home.
+    path1 = self._MakeEntry(KEY1)
+    os.utime(self.cache_home, (2000, 2000))
+    self.assertEqual(self.catalog.Lookup(KEY1), [])
+    self.assertTrue(self.catalog.Refresh())
+    self.assertEqual(self.catalog.Lookup(KEY1), [path1])
+    self.assertFalse(self.catalog.Refresh())
+
+    # Entries stored with the catalog don't make it out of date.
+    home_mtime = self.catalog.GetHomeMtime()
+    path2 = self._MakeEntry(KEY2)
+    os.utime(self.cache_home, (3000, 3000))
+    self.catalog.Add(path2, KEY2, home_mtime)
+    self.assertFalse(self.catalog.Refresh())
+    self.assertEqual(self.catalog.Lookup(KEY2), [path2])
+
+  def test_main(self):
+    self._MakeEntry(KEY1)
+    self.assertEqual(results_catalog.Main([self.cache_home, '--rebuild']), 0)
+    self.assertEqual(results_catalog.Main([self.cache_home]), 0)
+    self._MakeEntry(KEY2)
+    self.assertEqual(results_catalog.Main([self.cache_home]), 1)
+    self.assertEqual(results_catalog.Main([self.cache_home, '--fix']), 0)
+    self.assertEqual(results_catalog.Main([self.cache_home]), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
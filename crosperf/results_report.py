@@ -6,10 +6,12 @@ from __future__ import print_function
 
 import datetime
 import functools
+import heapq
 import itertools
 import json
 import os
 import re
+import tempfile
 
 from cros_utils.tabulator import AmeanResult
 from cros_utils.tabulator import Cell
@@ -36,6 +38,18 @@ from results_organizer import OrganizeResults
 
 import results_report_templates as templates
 
+# The number of functions per event kept in the summary of a perf report. Only
+# the ResultsReport.PERF_ROWS functions with the highest percentages in any run
+# are shown; keeping more lets the other runs of a label have the percentages
+# of those functions as well.
+PERF_SUMMARY_TOP_K = 100
+
+# The summary of perf.data.report.0 is cached in perf.data.report.0.summary.json
+PERF_SUMMARY_SUFFIX = '.summary.json'
+
+# Bumped whenever the parser or the format of the summaries changes.
+PERF_SUMMARY_VERSION = 1
+
 
 def ParseChromeosImage(chromeos_image):
   """Parse the chromeos_image string for the image and version.
@@ -106,7 +120,9 @@ class _PerfTable(object):
   where LabelData is a list of perf dicts, each perf dict coming from the same
   label.
   Each perf dict looks like {'function_name': 0.10, ...} (where 0.10 is the
-  percentage of time spent in function_name).
+  percentage of time spent in function_name). The perf dicts are the summaries
+  of the perf reports of the runs (see ReadPerfReportSummary), so only the
+  functions with the highest percentages of each run are merged.
   """
 
   def __init__(self, benchmark_names_and_iterations, label_names,
@@ -292,8 +308,8 @@ class TextResultsReport(ResultsReport):
     return '\n'.join([header_line, title, header_line, body, '\n'])
 
   @staticmethod
-  def FromExperiment(experiment, email=False):
-    results = BenchmarkResults.FromExperiment(experiment)
+  def FromExperiment(experiment, email=False, benchmark_results=None):
+    results = benchmark_results or BenchmarkResults.FromExperiment(experiment)
     return TextResultsReport(results, email, experiment)
 
   def GetStatusTable(self):
@@ -386,9 +402,9 @@ class HTMLResultsReport(ResultsReport):
     self.experiment = experiment
 
   @staticmethod
-  def FromExperiment(experiment):
-    return HTMLResultsReport(BenchmarkResults.FromExperiment(experiment),
-                             experiment=experiment)
+  def FromExperiment(experiment, benchmark_results=None):
+    results = benchmark_results or BenchmarkResults.FromExperiment(experiment)
+    return HTMLResultsReport(results, experiment=experiment)
 
   def GetReport(self):
     label_names = self.benchmark_results.label_names
@@ -413,7 +429,66 @@ class HTMLResultsReport(ResultsReport):
                                       experiment_file=experiment_file)
 
 
-def ParseStandardPerfReport(report_data):
+class _PerfEventFunctions(object):
+  """The functions of an event of a perf report that are retained.
+
+  With neither top_k nor threshold, every function is retained, and the later
+  line of a function replaces the earlier one. Otherwise, the functions with at
+  least threshold percent, and the top_k other functions with the highest
+  percentages, are retained, with the highest percentage of their lines.
+  """
+
+  def __init__(self, top_k=None, threshold=None):
+    self._top_k = top_k
+    self._threshold = threshold
+    self._functions = {}
+    # A min-heap of (percentage, line number, function name) of the top_k
+    # functions below the threshold. An entry is stale unless it is the entry
+    # of the function in _heap_entries, i.e. unless it has not been replaced
+    # by a line with a higher percentage.
+    self._heap = []
+    self._heap_entries = {}
+    self._line_number = 0
+
+  def Add(self, func_name, percentage):
+    self._line_number += 1
+    if self._top_k is None and self._threshold is None:
+      self._functions[func_name] = percentage
+      return
+
+    if percentage <= self._functions.get(func_name, percentage - 1):
+      return
+    if self._threshold is not None and percentage >= self._threshold:
+      self._functions[func_name] = percentage
+      self._heap_entries.pop(func_name, None)
+      return
+    if not self._top_k:
+      return
+    # Most lines of a large report are below all of the top_k.
+    if (len(self._heap_entries) == self._top_k and
+        percentage < self._heap[0][0]):
+      return
+
+    entry = self._heap_entries.get(func_name)
+    if entry is not None and entry[0] >= percentage:
+      return
+    entry = (percentage, self._line_number, func_name)
+    heapq.heappush(self._heap, entry)
+    self._heap_entries[func_name] = entry
+    while len(self._heap_entries) > self._top_k:
+      evicted = heapq.heappop(self._heap)
+      if self._heap_entries.get(evicted[2]) == evicted:
+        del self._heap_entries[evicted[2]]
+
+  def GetDict(self):
+    """Returns {function_name: percentage} of the retained functions."""
+    functions = {func_name: entry[0]
+                 for func_name, entry in self._heap_entries.iteritems()}
+    functions.update(self._functions)
+    return functions
+
+
+def ParseStandardPerfReport(report_data, top_k=None, threshold=None):
   """Parses the output of `perf report`.
 
   It'll parse the following:
@@ -432,6 +507,11 @@ def ParseStandardPerfReport(report_data):
   Into:
     {'foo': {'function::name': 1.23, 'function2::name': 1.22},
      'bar': {'function3::name': 0.23, etc.}}
+
+  The lines are parsed one at a time, so report_data can be a file that is
+  too large to be read in memory. If top_k or threshold is given, only the
+  functions with at least threshold percent and the top_k other functions with
+  the highest percentages of each event are kept, see _PerfEventFunctions.
   """
   # This function fails silently on its if it's handed a string (as opposed to a
   # list of lines). So, auto-split if we do happen to get a string.
@@ -466,13 +546,13 @@ def ParseStandardPerfReport(report_data):
     return {}
 
   sample_name = samples_regex.match(first_sample_line).group(1)
-  current_result = {}
+  current_result = _PerfEventFunctions(top_k, threshold)
   results = {sample_name: current_result}
   for line in interesting_lines:
     samples_match = samples_regex.match(line)
     if samples_match:
       sample_name = samples_match.group(1)
-      current_result = {}
+      current_result = _PerfEventFunctions(top_k, threshold)
       results[sample_name] = current_result
       continue
 
@@ -485,8 +565,68 @@ def ParseStandardPerfReport(report_data):
     except ValueError:
       # Couldn't parse it; try to be "resilient".
       continue
-    current_result[func_name] = percentage
-  return results
+    current_result.Add(func_name, percentage)
+  return {event: functions.GetDict() for event, functions in results.iteritems()}
+
+
+def _LoadPerfReportSummary(summary_path, report_path, params):
+  """Returns the cached summary, None if it is missing or out of date."""
+  try:
+    if os.path.getmtime(summary_path) < os.path.getmtime(report_path):
+      return None
+    with open(summary_path) as summary_file:
+      summary = json.load(summary_file)
+  except (IOError, OSError, ValueError):
+    return None
+  if summary.get('params') != params:
+    return None
+
+  # The names were written as latin-1, which maps every byte to a character.
+  def _Bytes(name):
+    return name.encode('latin-1')
+
+  return {_Bytes(event): {_Bytes(func_name): percentage
+                          for func_name, percentage in functions.iteritems()}
+          for event, functions in summary['events'].iteritems()}
+
+
+def _StorePerfReportSummary(summary_path, params, events):
+  """Writes the summary next to the report, if the directory is writable."""
+  directory = os.path.dirname(summary_path) or '.'
+  try:
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=PERF_SUMMARY_SUFFIX)
+  except OSError:
+    return
+  try:
+    with os.fdopen(fd, 'w') as summary_file:
+      json.dump({'params': params, 'events': events}, summary_file,
+                encoding='latin-1')
+    os.rename(temp_path, summary_path)
+  except (IOError, OSError):
+    os.remove(temp_path)
+
+
+def ReadPerfReportSummary(report_path, top_k=PERF_SUMMARY_TOP_K,
+                          threshold=None):
+  """Returns the summary of a perf report, see ParseStandardPerfReport.
+
+  The summary is cached next to the report, and the report is parsed again
+  only if it is newer than the cached summary, or if the summary was made with
+  other parameters.
+
+  Raises:
+    IOError: The report cannot be read.
+  """
+  summary_path = report_path + PERF_SUMMARY_SUFFIX
+  params = {'version': PERF_SUMMARY_VERSION,
+            'top_k': top_k,
+            'threshold': threshold}
+  events = _LoadPerfReportSummary(summary_path, report_path, params)
+  if events is None:
+    with open(report_path) as in_file:
+      events = ParseStandardPerfReport(in_file, top_k, threshold)
+    _StorePerfReportSummary(summary_path, params, events)
+  return events
 
 
 def _ReadExperimentPerfReport(results_directory, label_name, benchmark_name,
@@ -496,18 +636,31 @@ def _ReadExperimentPerfReport(results_directory, label_name, benchmark_name,
   The result should be a map of maps; it should look like:
   {perf_event_name: {function_name: pct_time_spent}}, e.g.
   {'cpu_cycles': {'_malloc': 10.0, '_free': 0.3, ...}}
+  It is the summary of the report, with the PERF_SUMMARY_TOP_K functions of
+  each event that have the highest percentages.
   """
   raw_dir_name = label_name + benchmark_name + str(benchmark_iteration + 1)
   dir_name = ''.join(c for c in raw_dir_name if c.isalnum())
   file_name = os.path.join(results_directory, dir_name, 'perf.data.report.0')
   try:
-    with open(file_name) as in_file:
-      return ParseStandardPerfReport(in_file)
+    return ReadPerfReportSummary(file_name)
   except IOError:
     # Yes, we swallow any IO-related errors.
     return {}
 
 
+def _Memoized(function):
+  """Returns a function that calls function once per arguments."""
+  results = {}
+
+  def _MemoizedFunction(*args):
+    if args not in results:
+      results[args] = function(*args)
+    return results[args]
+
+  return _MemoizedFunction
+
+
 # Split out so that testing (specifically: mocking) is easier
 def _ExperimentToKeyvals(experiment, for_json_report):
   """Converts an experiment to keyvals."""
@@ -536,8 +689,9 @@ class BenchmarkResults(object):
     benchmark_names_and_iterations = [(benchmark.name, benchmark.iterations)
                                       for benchmark in experiment.benchmarks]
     run_keyvals = _ExperimentToKeyvals(experiment, for_json_report)
-    read_perf_report = functools.partial(_ReadExperimentPerfReport,
-                                         experiment.results_directory)
+    # The reports sharing these results read each perf report once.
+    read_perf_report = _Memoized(functools.partial(
+        _ReadExperimentPerfReport, experiment.results_directory))
     return BenchmarkResults(label_names, benchmark_names_and_iterations,
                             run_keyvals, read_perf_report)
 
@@ -14,6 +14,8 @@ from StringIO import StringIO
 import collections
 import mock
 import os
+import shutil
+import tempfile
 import test_flag
 import unittest
 
@@ -29,6 +31,8 @@ from results_report import HTMLResultsReport
 from results_report import JSONResultsReport
 from results_report import ParseChromeosImage
 from results_report import ParseStandardPerfReport
+from results_report import PERF_SUMMARY_SUFFIX
+from results_report import ReadPerfReportSummary
 from results_report import TextResultsReport
 
 
@@ -409,6 +413,60 @@ class PerfReportParserTest(unittest.TestCase):
       self.assertIn(k, report_instructions)
       self.assertEqual(v, report_instructions[k])
 
+  def testParserKeepsTopFunctions(self):
+    report = ParseStandardPerfReport(self._ReadRealPerfReport(), top_k=5)
+    self.assertItemsEqual(['cycles', 'instructions'], report.keys())
+    # 0xffffffffa4eca110 is listed twice, with 0.61% and 0.08%.
+    self.assertEqual(report['cycles'], {'0xffffffffa4a1f1c9': 0.66,
+                                        '0xffffffffa4eca110': 0.61,
+                                        '0xffffffffa4beea47': 0.50,
+                                        '0x0000115bb6c35d7a': 0.48,
+                                        '0x0000115bb7ba9b54': 0.47})
+    self.assertEqual(len(report['instructions']), 5)
+
+  def testParserKeepsTopFunctionsOfUnsortedLines(self):
+    lines = ["# Samples: 1K of event 'cycles'"]
+    lines.extend('%.2f%% 1 chrome chrome [.] f%d' % (pct, pct)
+                 for pct in [3, 1, 4, 1, 5, 9, 2, 6])
+    lines.append('8.00% 1 chrome chrome [.] f3')
+    report = ParseStandardPerfReport(lines, top_k=3)
+    self.assertEqual(report, {'cycles': {'f9': 9.0, 'f3': 8.0, 'f6': 6.0}})
+
+  def testParserKeepsFunctionsAboveThreshold(self):
+    report = ParseStandardPerfReport(self._ReadRealPerfReport(), top_k=1,
+                                     threshold=0.5)
+    self.assertEqual(report['cycles'], {'0xffffffffa4a1f1c9': 0.66,
+                                        '0xffffffffa4eca110': 0.61,
+                                        '0xffffffffa4beea47': 0.50,
+                                        '0x0000115bb6c35d7a': 0.48})
+
+  def testSummaryIsCachedNextToTheReport(self):
+    temp_dir = tempfile.mkdtemp()
+    try:
+      my_dir = os.path.dirname(os.path.realpath(__file__))
+      report_path = os.path.join(temp_dir, 'perf.data.report.0')
+      shutil.copy(os.path.join(my_dir, 'perf_files/perf.data.report.0'),
+                  report_path)
+
+      summary = ReadPerfReportSummary(report_path, top_k=10)
+      self.assertTrue(os.path.exists(report_path + PERF_SUMMARY_SUFFIX))
+      self.assertEqual(summary,
+                       ParseStandardPerfReport(self._ReadRealPerfReport(),
+                                               top_k=10))
+
+      with mock.patch('results_report.ParseStandardPerfReport') as parse:
+        self.assertEqual(ReadPerfReportSummary(report_path, top_k=10), summary)
+        self.assertFalse(parse.called)
+        for func_name in summary['cycles']:
+          self.assertIsInstance(func_name, str)
+
+        # A summary made with other parameters is not used.
+        parse.return_value = {}
+        self.assertEqual(ReadPerfReportSummary(report_path, top_k=5), {})
+        self.assertTrue(parse.called)
+    finally:
+      shutil.rmtree(temp_dir)
+
 
 if __name__ == '__main__':
   test_flag.SetTestMode(True)
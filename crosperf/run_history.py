@@ -0,0 +1,85 @@
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""How long benchmark runs took in previous experiments.
+
+Used by the scheduler to estimate how long the benchmark runs of an
+experiment will take, so the longest ones can be started first.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import tempfile
+import threading
+
+from cros_utils import logger
+
+# Lives in the default cache dir (results_cache.SCRATCH_DIR).
+HISTORY_FILE = os.path.join(
+    os.path.expanduser('~/cros_scratch'), 'run_history.json')
+# Weight of the latest duration in the stored (moving) average.
+LATEST_RUN_WEIGHT = 0.5
+
+
+class RunHistory(object):
+  """Persistent map from a kind of benchmark run to its average duration."""
+
+  _lock = threading.Lock()
+
+  def __init__(self, history_file=None):
+    self.history_file = history_file or HISTORY_FILE
+    self._durations = self._Load()
+
+  def _Load(self):
+    try:
+      with open(self.history_file, 'r') as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return {}
+
+  @staticmethod
+  def GetKey(br):
+    """Returns the key of the runs expected to take as long as br."""
+    return ':'.join([br.label.board or '', br.benchmark.suite,
+                     br.benchmark.test_name, br.benchmark.test_args or ''])
+
+  def HasEstimates(self):
+    return bool(self._durations)
+
+  def Estimate(self, br):
+    """Returns the estimated duration of br, in seconds.
+
+    Runs that were never timed are assumed to take the average duration of
+    the known runs. Returns 0 if no run was ever timed.
+    """
+    duration = self._durations.get(self.GetKey(br))
+    if duration is not None:
+      return duration
+    if not self._durations:
+      return 0
+    return sum(self._durations.values()) / len(self._durations)
+
+  def Record(self, br, duration):
+    """Records that br ran for duration seconds."""
+    key = self.GetKey(br)
+    with self._lock:
+      durations = self._Load()
+      if key in durations:
+        duration = (LATEST_RUN_WEIGHT * duration +
+                    (1 - LATEST_RUN_WEIGHT) * durations[key])
+      durations[key] = duration
+      self._durations[key] = duration
+      history_dir = os.path.dirname(self.history_file)
+      try:
+        if not os.path.isdir(history_dir):
+          os.makedirs(history_dir)
+        # Other crosperf instances may be reading the history.
+        fd, temp_file = tempfile.mkstemp(dir=history_dir)
+        with os.fdopen(fd, 'w') as f:
+          json.dump(durations, f)
+        os.rename(temp_file, self.history_file)
+      except (IOError, OSError) as e:
+        logger.GetLogger().LogWarning('Could not update run history %s: %s' %
+                                      (self.history_file, e))
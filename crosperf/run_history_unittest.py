@@ -0,0 +1,63 @@
+#!/usr/bin/env python2
+
+# Copyright 2017 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+"""Unittest for run_history."""
+
+from __future__ import print_function
+
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from run_history import RunHistory
+
+
+def MakeBenchmarkRun(test_name, test_args=''):
+  br = mock.Mock()
+  br.label.board = 'lumpy'
+  br.benchmark.suite = 'telemetry_Crosperf'
+  br.benchmark.test_name = test_name
+  br.benchmark.test_args = test_args
+  return br
+
+
+class RunHistoryTest(unittest.TestCase):
+  """Tests for RunHistory."""
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.history_file = os.path.join(self.tempdir, 'scratch', 'history.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+  def test_estimate(self):
+    kraken = MakeBenchmarkRun('kraken')
+    octane = MakeBenchmarkRun('octane')
+    history = RunHistory(self.history_file)
+    self.assertFalse(history.HasEstimates())
+    self.assertEqual(history.Estimate(kraken), 0)
+
+    history.Record(kraken, 100)
+    self.assertTrue(history.HasEstimates())
+    self.assertEqual(history.Estimate(kraken), 100)
+    # Unknown runs take the average time.
+    self.assertEqual(history.Estimate(octane), 100)
+    history.Record(octane, 300)
+    self.assertEqual(history.Estimate(MakeBenchmarkRun('kraken', '-v')), 200)
+
+    # The history is shared with later experiments, and keeps a moving
+    # average of the durations.
+    history = RunHistory(self.history_file)
+    self.assertEqual(history.Estimate(octane), 300)
+    history.Record(octane, 500)
+    self.assertEqual(history.Estimate(octane), 400)
+    self.assertEqual(RunHistory(self.history_file).Estimate(octane), 400)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -6,12 +6,17 @@
 
 from __future__ import print_function
 
+import heapq
 import sys
 import test_flag
+import time
 import traceback
 
+from benchmark_run import STATUS_RUNNING
+from benchmark_run import STATUS_SUCCEEDED
 from collections import defaultdict
 from machine_image_manager import MachineImageManager
+from run_history import RunHistory
 from threading import Lock
 from threading import Thread
 from cros_utils import command_executer
@@ -108,8 +113,8 @@ class DutWorker(Thread):
     self._stat_num_reimage += 1
     self._stat_annotation = 'reimaging using "{}"'.format(label.name)
     try:
-      # Note, only 1 reimage at any given time, this is guaranteed in
-      # ImageMachine, so no sync needed below.
+      # Note, ImageMachine bounds the number of machines imaged at the same
+      # time and stages every image only once, so no sync needed below.
       retval = self._sched.get_experiment().machine_manager.ImageMachine(
           self._dut,
           label)
@@ -144,9 +149,14 @@ class DutWorker(Thread):
       br.run()
     finally:
       self._sched.get_experiment().BenchmarkRunFinished(br)
+      self._sched.record_run_time(br)
       with self._active_br_lock:
         self._active_br = None
 
+  def active_benchmark_run(self):
+    with self._active_br_lock:
+      return self._active_br
+
   def _setup_dut_label(self):
     """Try to match dut image with a certain experiment label.
 
@@ -221,6 +231,10 @@ class BenchmarkRunCacheReader(Thread):
 class Schedv2(object):
   """New scheduler for crosperf."""
 
+  # Scheduling policies: run the benchmark_runs of a label in the order of the
+  # experiment file, or the longest ones first according to the run history.
+  POLICIES = ('fifo', 'longest_first')
+
   def __init__(self, experiment):
     self._experiment = experiment
     self._logger = logger.GetLogger(experiment.log_dir)
@@ -238,6 +252,11 @@ class Schedv2(object):
     # Test mode flag
     self._in_test_mode = test_flag.GetTestMode()
 
+    self._policy = self._experiment.schedv2_policy
+    assert self._policy in self.POLICIES, ('Unknown scheduling policy: %s' %
+                                           self._policy)
+    self._history = RunHistory()
+
     # Read benchmarkrun cache.
     self._read_br_cache()
 
@@ -249,6 +268,12 @@ class Schedv2(object):
       if br not in self._cached_br_list:
         self._label_brl_map[br.label].append(br)
 
+    if self._policy == 'longest_first':
+      # The duts that share a label all pick from the head of its list, so a
+      # dut never waits on a long run while another one is idle.
+      for brl in self._label_brl_map.itervalues():
+        brl.sort(key=self._history.Estimate, reverse=True)
+
     # Use machine image manager to calculate initial label allocation.
     self._mim = MachineImageManager(self._labels, self._duts)
     self._mim.compute_initial_allocation()
@@ -376,6 +401,50 @@ class Schedv2(object):
       # Return the first br.
       return brl.pop(0)
 
+  def record_run_time(self, br):
+    """Add the duration of a successful, non cached br to the history."""
+    if self._in_test_mode or br.cache_hit:
+      return
+    events = br.timeline.GetEventDict()
+    if STATUS_RUNNING in events and STATUS_SUCCEEDED in events:
+      self._history.Record(br,
+                           events[STATUS_SUCCEEDED] - events[STATUS_RUNNING])
+
+  def get_estimated_makespan(self):
+    """Estimates how long it takes to finish the remaining benchmark_runs.
+
+    The runs left are assigned, longest first, to the dut that would be done
+    first. Reimages are not taken into account.
+
+    Returns:
+      The estimate in seconds, or None if there is no run history.
+    """
+
+    if not self._history.HasEstimates():
+      return None
+    now = time.time()
+    with self._workers_lock:
+      workers = list(self._active_workers)
+    if not workers:
+      return 0
+    dut_busy_times = []
+    for w in workers:
+      busy_time = 0
+      br = w.active_benchmark_run()
+      if br is not None:
+        started = br.timeline.GetEventDict().get(STATUS_RUNNING, now)
+        busy_time = max(0, self._history.Estimate(br) - (now - started))
+      dut_busy_times.append(busy_time)
+    remaining = []
+    for label, brl in self._label_brl_map.iteritems():
+      with self.lock_on(label):
+        remaining.extend(self._history.Estimate(br) for br in brl)
+    heapq.heapify(dut_busy_times)
+    for duration in sorted(remaining, reverse=True):
+      heapq.heappush(dut_busy_times,
+                     heapq.heappop(dut_busy_times) + duration)
+    return max(dut_busy_times)
+
   def allocate_label(self, dut):
     """Allocate a label to a dut.
 
@@ -5,11 +5,17 @@
 
 from __future__ import print_function
 
+import json
 import mock
+import os
+import shutil
+import tempfile
+import time
 import unittest
 import StringIO
 
 import benchmark_run
+import run_history
 import test_flag
 from experiment_factory import ExperimentFactory
 from experiment_file import ExperimentFile
@@ -57,6 +63,31 @@ image2 {{
 }}
 """
 
+EXPERIMENT_FILE_LONGEST_FIRST = """\
+board: daisy
+remote: chromeos-daisy1.cros chromeos-daisy2.cros
+schedv2_policy: longest_first
+
+benchmark: kraken {
+  suite: telemetry_Crosperf
+  iterations: 2
+}
+
+benchmark: octane {
+  suite: telemetry_Crosperf
+  iterations: 2
+}
+
+benchmark: sunspider {
+  suite: telemetry_Crosperf
+  iterations: 1
+}
+
+image1 {
+  chromeos_image: /chromeos/src/build/images/daisy/latest/cros_image1.bin
+}
+"""
+
 
 class Schedv2Test(unittest.TestCase):
   """Class for setting up and running the unit tests."""
@@ -215,6 +246,53 @@ class Schedv2Test(unittest.TestCase):
                  my_schedv2.get_label_map().iteritems(),
                  0), 60)
 
+  def test_longest_first(self):
+    """Test brs are sorted by duration and the makespan is estimated."""
+
+    def MockReadCache(br):
+      br.cache_hit = False
+
+    tempdir = tempfile.mkdtemp()
+    history_file = os.path.join(tempdir, 'run_history.json')
+    with open(history_file, 'w') as f:
+      json.dump({
+          'daisy:telemetry_Crosperf:kraken:': 100,
+          'daisy:telemetry_Crosperf:octane:': 300
+      }, f)
+    try:
+      with mock.patch('benchmark_run.MockBenchmarkRun.ReadCache',
+                      new=MockReadCache), \
+           mock.patch.object(run_history, 'HISTORY_FILE', history_file):
+        self.exp = self._make_fake_experiment(EXPERIMENT_FILE_LONGEST_FIRST)
+        my_schedv2 = Schedv2(self.exp)
+    finally:
+      shutil.rmtree(tempdir)
+
+    # sunspider was never run, it is assumed to take the average time.
+    brl = my_schedv2.get_label_map()[self.exp.labels[0]]
+    self.assertEquals([br.name for br in brl], [
+        'image1: octane (1)', 'image1: octane (2)', 'image1: sunspider (1)',
+        'image1: kraken (1)', 'image1: kraken (2)'
+    ])
+
+    # Two idle duts, one busy for another 100 seconds.
+    workers = [mock.Mock(), mock.Mock(), mock.Mock()]
+    for w in workers:
+      w.active_benchmark_run.return_value = None
+    running_br = mock.Mock()
+    running_br.label.board = 'daisy'
+    running_br.benchmark.suite = 'telemetry_Crosperf'
+    running_br.benchmark.test_name = 'octane'
+    running_br.benchmark.test_args = ''
+    running_br.timeline.GetEventDict.return_value = {
+        benchmark_run.STATUS_RUNNING: time.time() - 200
+    }
+    workers[0].active_benchmark_run.return_value = running_br
+    my_schedv2._active_workers = workers
+    # octane and octane go to the idle duts, then sunspider (200) goes to the
+    # busy dut, and the krakens to the octane duts.
+    self.assertAlmostEqual(my_schedv2.get_estimated_makespan(), 400, delta=1)
+
 
 if __name__ == '__main__':
   test_flag.SetTestMode(True)
@@ -269,6 +269,22 @@ class GlobalSettings(Settings):
             'there is no guarantee that someone else might not '
             'hold a lock on the same machine in a different '
             'locks directory.'))
+    self.AddField(
+        IntegerField(
+            'image_parallelism',
+            default=4,
+            description='Maximum number of machines that are '
+            'imaged at the same time. Each image is staged in the '
+            'chromeos root only once, whatever the number of '
+            'machines it is pushed onto.'))
+    self.AddField(
+        TextField(
+            'schedv2_policy',
+            default='fifo',
+            description='How the new scheduler orders the benchmark '
+            "runs of a label. Options are 'fifo' (the order of the "
+            "experiment file) and 'longest_first' (the longest runs "
+            'first, according to the durations of previous runs).'))
     self.AddField(
         TextField(
             'chrome_src',
@@ -46,7 +46,7 @@ class GlobalSettingsTest(unittest.TestCase):
   def test_init(self):
     res = settings_factory.GlobalSettings('g_settings')
     self.assertIsNotNone(res)
-    self.assertEqual(len(res.fields), 25)
+    self.assertEqual(len(res.fields), 27)
     self.assertEqual(res.GetField('name'), '')
     self.assertEqual(res.GetField('board'), '')
     self.assertEqual(res.GetField('remote'), None)
@@ -67,6 +67,8 @@ class GlobalSettingsTest(unittest.TestCase):
     self.assertEqual(res.GetField('show_all_results'), False)
     self.assertEqual(res.GetField('share_cache'), '')
     self.assertEqual(res.GetField('results_dir'), '')
+    self.assertEqual(res.GetField('image_parallelism'), 4)
+    self.assertEqual(res.GetField('schedv2_policy'), 'fifo')
     self.assertEqual(res.GetField('chrome_src'), '')
 
 
@@ -90,7 +92,7 @@ class SettingsFactoryTest(unittest.TestCase):
     g_settings = settings_factory.SettingsFactory().GetSettings('global',
                                                                 'global')
     self.assertIsInstance(g_settings, settings_factory.GlobalSettings)
-    self.assertEqual(len(g_settings.fields), 25)
+    self.assertEqual(len(g_settings.fields), 27)
 
 
 if __name__ == '__main__':
@@ -51,8 +51,16 @@ def CheckForCrosFlash(chromeos_root, remote, log_level):
       'cros flash cannot work.'.format(remote))
 
 
-def DoImage(argv):
-  """Image ChromeOS."""
+def DoImage(argv, locate_image=None):
+  """Image ChromeOS.
+
+  Args:
+    argv: The command line arguments.
+    locate_image: Optional callable returning [found, image], like
+      LocateOrCopyImage. It is only called for a local image whose checksum
+      differs from the one on the device. The located image is deleted after
+      imaging unless found is True.
+  """
 
   parser = argparse.ArgumentParser()
   parser.add_argument('-c',
@@ -159,9 +167,12 @@ def DoImage(argv):
       l.LogOutput('Device checksum: ' + device_checksum)
 
       if image_checksum != device_checksum:
-        [found, located_image] = LocateOrCopyImage(options.chromeos_root,
-                                                   image,
-                                                   board=board)
+        if locate_image:
+          [found, located_image] = locate_image()
+        else:
+          [found, located_image] = LocateOrCopyImage(options.chromeos_root,
+                                                     image,
+                                                     board=board)
 
         reimage = True
         l.LogOutput('Checksums do not match. Re-imaging...')